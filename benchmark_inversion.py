@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+throughput harness of the Monte Carlo inversions (vprofile1d.mc_joint_inv_iso/mc_joint_inv_vti)
+
+The inversions are run serially under a fixed random seed and a fixed budget (numbrun, step4uwalk), with the stage timers
+and event counters enabled (see mcstats), so that the sampler/solver optimizations can be judged by the posterior quality
+per CPU second, not only by the raw speed.
+cases:
+    iso_sw          - isotropic, Rayleigh phase and group velocities, synthetic data of an ak135 model (crust 35 km, sediments 2 km),
+                        the inversion starts from the ak135 model with crust 40 km and sediments 1 km
+    iso_water       - isotropic with a water layer, Rayleigh phase and group velocities, synthetic data of the model in water.mod
+    iso_joint       - isotropic, joint inversion of receiver function and Rayleigh phase/group velocities (wdisp = 0.2),
+                        synthetic data of the iso_sw model
+    vti_fsurf       - VTI, Rayleigh and Love phase velocities of the grid point in test_working_vti, solver_type = 0 (fast_surf)
+    vti_kernel      - the same as vti_fsurf, solver_type = 1 (tcps, sensitivity kernels)
+The periods and the uncertainties of the synthetic data are those of the Rayleigh wave data in test_working_vti,
+Gaussian noise with the given uncertainties is added with the same seed.
+metrics (CPU time of the inversion call):
+    steps_per_sec   - steps of the sampling loop per second
+    forward_per_sec - forward computations of the proposals (runs with acceptance flag != 0) per second,
+                        for vti_kernel these are the kernel based predictions, the full solver calls for the reference model are
+                        counted separately as nreference
+    acceptance      - number of accepted models / number of runs
+    ess_min/median  - effective sample size of the least/median well mixed model parameter, each segment between two uniform
+                        random walks is treated as an independent chain, the first burnin fraction of each segment is discarded
+    ess_per_sec     - ess_min per second
+    time_to_nmodel  - time (sec, the time column of the chain) at which Nmodelthresh models are accepted with misfit <= misfit_thresh,
+                        the same criterion as the parallel drivers (mc_joint_inv_*_mp), None if not reached
+With the same seed, budget and code, the chains are identical, a different number of accepted models (nacc) in the comparison
+to a baseline means the optimization changed the chain, not only the speed.
+
+usage:
+    python benchmark_inversion.py [-o results.json] [-b baseline.json] [-k name] [-s seed] [--quick]
+        -o          - output JSON file of the results (default - benchmark_inversion.json)
+        -b          - JSON file of a previous run, the ratios to the baseline are printed
+        -k          - run only the cases whose names contain the given string (can be repeated)
+        -s          - random seed (default - 0)
+        --quick     - small budget for a quick check
+results (JSON):
+    meta        - date, host, python/numpy version, git revision, seed and budget
+    results     - one entry per case: name, mtype, status (ok/skipped/error), message, cpu/wall time, metrics above,
+                    stage time and event counts of the chain (stats)
+"""
+import numpy as np
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+from benchmark_kernels import get_git_revision
+
+NUMBRUN         = 15000
+STEP4UWALK      = 1500
+NUMBRUN_QUICK   = 3000
+STEP4UWALK_QUICK= 1000
+MISFIT_THRESH   = 2.0
+NMODELTHRESH    = 200
+SEED            = 0
+# fraction of each segment discarded before the effective sample size is computed
+BURNIN          = 0.25
+# grid point of test_working_vti (water depth, sediment and crustal thickness below the water, from MC_0.mod)
+VTI_DATADIR     = 'test_working_vti'
+VTI_TOPO        = -0.538
+VTI_SEDTHK      = 4.657
+VTI_CRTTHK      = 31.454
+# receiver function samples (fs = 40 Hz) and uncertainty
+RF_NPTS         = 400
+RF_FS           = 40.
+RF_STD          = 0.05
+
+#===============================
+# synthetic data
+#===============================
+def read_vti_data(datadir):
+    """
+    read the observed Rayleigh/Love phase velocities (mc_data.MC.npz) of test_working_vti
+    ::: output :::
+    disp_ray, disp_lov  - (3, N) arrays of period, phase velocity and uncertainty
+    """
+    indata      = np.load(datadir+'/mc_data.MC.npz')
+    disp_ray    = np.array([indata['arr_0'], indata['arr_1'], indata['arr_2']])
+    disp_lov    = np.array([indata['arr_3'], indata['arr_4'], indata['arr_5']])
+    return disp_ray, disp_lov
+
+def get_iso_vprofile(crtthk, sedthk, topovalue=1., vp_water=1.5, modfname=None):
+    """
+    get a vprofile1d object with the isotropic model parameterized from ak135 (or read from modfname)
+    """
+    import vprofile
+    vpr         = vprofile.vprofile1d()
+    if modfname is None:
+        vpr.model.isomod.parameterize_ak135(crtthk=crtthk, sedthk=sedthk, topovalue=topovalue, maxdepth=200., vp_water=vp_water)
+    else:
+        vpr.readmod(modfname)
+    vpr.getpara()
+    return vpr
+
+def get_iso_synthetic(vpr, per, rf=False):
+    """
+    compute the synthetic Rayleigh phase/group velocities (and receiver function) of the model in vpr
+    ::: output :::
+    pvel, gvel, rf (None if rf is False)
+    """
+    nper        = per.size
+    vpr.get_disp(np.array([per, 3.5*np.ones(nper), np.ones(nper)]), dtype='ph', wtype='ray')
+    vpr.get_disp(np.array([per, 3.2*np.ones(nper), np.ones(nper)]), dtype='gr', wtype='ray')
+    if rf:
+        time_rf = np.arange(RF_NPTS, dtype=np.float64)/RF_FS
+        vpr.get_rf(np.array([time_rf, np.zeros(RF_NPTS), RF_STD*np.ones(RF_NPTS)]))
+    vpr.get_period()
+    vpr.update_mod(mtype='iso')
+    vpr.get_vmodel(mtype='iso')
+    vpr.compute_fsurf()
+    rfpre       = None
+    if rf:
+        vpr.compute_rftheo()
+        rfpre   = vpr.data.rfr.rfp.copy()
+    return vpr.data.dispR.pvelp.copy(), vpr.data.dispR.gvelp.copy(), rfpre
+
+def add_iso_data(vpr, srcdir, truevpr, seed, rf=False):
+    """
+    assign the synthetic data of truevpr with Gaussian noise to vpr
+    """
+    disp_ray, disp_lov\
+                = read_vti_data(os.path.join(srcdir, VTI_DATADIR))
+    per         = disp_ray[0, :]
+    std_ph      = disp_ray[2, :]
+    std_gr      = 2.*std_ph
+    pvel, gvel, rfpre\
+                = get_iso_synthetic(truevpr, per, rf=rf)
+    rng         = np.random.RandomState(seed)
+    vpr.get_disp(np.array([per, pvel + rng.normal(0., std_ph), std_ph]), dtype='ph', wtype='ray')
+    vpr.get_disp(np.array([per, gvel + rng.normal(0., std_gr), std_gr]), dtype='gr', wtype='ray')
+    if rf:
+        time_rf = np.arange(RF_NPTS, dtype=np.float64)/RF_FS
+        vpr.get_rf(np.array([time_rf, rfpre + rng.normal(0., RF_STD, RF_NPTS), RF_STD*np.ones(RF_NPTS)]))
+    return
+
+#===============================
+# cases
+# each setup function returns the vprofile1d object, the model type and the keyword arguments of the inversion,
+# ImportError is reported as skipped (the solvers are not built)
+#===============================
+def setup_iso_sw(srcdir, seed):
+    vpr         = get_iso_vprofile(crtthk=40., sedthk=1.)
+    add_iso_data(vpr, srcdir, get_iso_vprofile(crtthk=35., sedthk=2.), seed)
+    return vpr, 'iso', {'dispdtype': 'both', 'wdisp': 1.}
+
+def setup_iso_water(srcdir, seed):
+    vpr         = get_iso_vprofile(crtthk=7., sedthk=0.5, topovalue=-2.9, vp_water=1.475)
+    add_iso_data(vpr, srcdir, get_iso_vprofile(crtthk=None, sedthk=None, modfname=os.path.join(srcdir, 'water.mod')), seed)
+    return vpr, 'iso', {'dispdtype': 'both', 'wdisp': 1.}
+
+def setup_iso_joint(srcdir, seed):
+    vpr         = get_iso_vprofile(crtthk=40., sedthk=1.)
+    add_iso_data(vpr, srcdir, get_iso_vprofile(crtthk=35., sedthk=2.), seed, rf=True)
+    return vpr, 'iso', {'dispdtype': 'both', 'wdisp': 0.2}
+
+def _setup_vti(srcdir):
+    import vprofile
+    disp_ray, disp_lov\
+                = read_vti_data(os.path.join(srcdir, VTI_DATADIR))
+    vpr         = vprofile.vprofile1d()
+    vpr.get_disp(disp_ray, dtype='ph', wtype='ray')
+    vpr.get_disp(disp_lov, dtype='ph', wtype='lov')
+    vpr.model.vtimod.parameterize_ak135(crtthk=VTI_CRTTHK, sedthk=VTI_SEDTHK, topovalue=VTI_TOPO, maxdepth=200., vp_water=1.5)
+    vpr.model.vtimod.get_paraind_gamma()
+    return vpr
+
+def setup_vti_fsurf(srcdir, seed):
+    return _setup_vti(srcdir), 'vti', {'run_inv': True, 'solver_type': 0}
+
+def setup_vti_kernel(srcdir, seed):
+    return _setup_vti(srcdir), 'vti', {'run_inv': True, 'solver_type': 1}
+
+CASES       = [
+    ('iso_sw',      setup_iso_sw),
+    ('iso_water',   setup_iso_water),
+    ('iso_joint',   setup_iso_joint),
+    ('vti_fsurf',   setup_vti_fsurf),
+    ('vti_kernel',  setup_vti_kernel)
+    ]
+
+#===============================
+# metrics
+#===============================
+def effective_sample_size(x):
+    """
+    effective sample size of a series, Geyer's initial monotone sequence estimator of the integrated autocorrelation time
+    """
+    n           = x.size
+    x           = x - x.mean()
+    if n < 4 or np.dot(x, x) <= 0.:
+        # a chain that does not move carries the information of one sample
+        return min(float(n), 1.)
+    nfft        = 2**int(np.ceil(np.log2(2*n)))
+    fx          = np.fft.rfft(x, nfft)
+    acov        = np.fft.irfft(fx*np.conjugate(fx), nfft)[:n]
+    rho         = acov/acov[0]
+    # sums of adjacent pairs, truncated at the first non-positive one and made monotone
+    npair       = n//2
+    gamma       = rho[0:2*npair:2] + rho[1:2*npair:2]
+    ind         = np.where(gamma <= 0.)[0]
+    if ind.size > 0:
+        gamma   = gamma[:ind[0]]
+    gamma       = np.minimum.accumulate(gamma)
+    tau         = -1. + 2.*gamma.sum()
+    return min(float(n), n/max(tau, 1e-12))
+
+def get_chain_ess(paraval, flag, step4uwalk, burnin=BURNIN):
+    """
+    effective sample size of each model parameter
+    the state of the chain is the last accepted model, the segments between two uniform random walks are independent chains
+    ::: output :::
+    ess         - (npara) effective sample size of each parameter, summed over the segments (nan for the fixed parameters)
+    nseg        - number of segments used
+    """
+    nrows, npara= paraval.shape
+    ess         = np.zeros(npara, dtype=np.float64)
+    nseg        = 0
+    for i0 in range(0, nrows, step4uwalk):
+        segflag = flag[i0:i0+step4uwalk]
+        iacc    = np.where(segflag == 1)[0]
+        if iacc.size == 0:
+            continue
+        # runs after the last run of the segment are skipped (misfit checking)
+        irun    = np.where(segflag != 0)[0]
+        ind     = np.where(segflag[:irun[-1]+1] == 1, np.arange(irun[-1]+1), -1)
+        ind     = np.maximum.accumulate(ind)
+        ind     = ind[ind >= 0]
+        ind     = ind[int(burnin*ind.size):]
+        if ind.size < 4:
+            continue
+        states  = paraval[i0 + ind, :]
+        for j in range(npara):
+            ess[j]  += effective_sample_size(states[:, j])
+        nseg    += 1
+    ess[paraval[flag == 1, :].std(axis=0) == 0.]  = np.nan
+    return ess, nseg
+
+def get_metrics(chain, cputime, step4uwalk, misfit_thresh=MISFIT_THRESH, Nmodelthresh=NMODELTHRESH, burnin=BURNIN):
+    """
+    get the throughput and sampling metrics of a chain (mcchain.chainfile), see the module docstring
+    """
+    flag        = np.asarray(chain['flag'])
+    misfit      = np.asarray(chain['misfit'])
+    runtime     = np.asarray(chain['time'])
+    stats       = chain.stats
+    nrun        = int((flag != 0).sum())
+    nacc        = int((flag == 1).sum())
+    nstep       = stats['count']['step'] if stats is not None else chain.nrows
+    nreference  = stats['count']['reference_update'] + stats['count']['reference_fail'] if stats is not None else None
+    igood       = np.where((flag == 1)*(misfit <= misfit_thresh))[0]
+    time_to_nmodel\
+                = float(runtime[igood[Nmodelthresh-1]]) if igood.size >= Nmodelthresh else None
+    ess, nseg   = get_chain_ess(np.asarray(chain['paraval']), flag, step4uwalk, burnin=burnin)
+    ess         = ess[np.logical_not(np.isnan(ess))]
+    ess_min     = float(ess.min()) if ess.size > 0 else 0.
+    cputime     = max(cputime, 1e-12)
+    return {'nstep': int(nstep), 'nrun': nrun, 'nacc': nacc, 'nreference': nreference, 'ngood': int(igood.size),\
+            'steps_per_sec': nstep/cputime, 'forward_per_sec': nrun/cputime, 'acceptance': float(nacc)/max(nrun, 1),\
+            'ess_min': ess_min, 'ess_median': float(np.median(ess)) if ess.size > 0 else 0., 'ess_per_sec': ess_min/cputime,\
+            'nsegment': nseg, 'time_to_nmodel': time_to_nmodel,\
+            'min_misfit': float(misfit[flag == 1].min()) if nacc > 0 else None}
+
+def run_case(name, setup, srcdir, numbrun, step4uwalk, seed=SEED, misfit_thresh=MISFIT_THRESH, Nmodelthresh=NMODELTHRESH,\
+             burnin=BURNIN):
+    result      = {'name': name, 'status': 'ok', 'message': ''}
+    outdir      = tempfile.mkdtemp(prefix='benchmark_inversion_')
+    try:
+        import mcchain
+        vpr, mtype, invkwargs\
+                = setup(srcdir, seed)
+        result['mtype'] = mtype
+        np.random.seed(seed)
+        random.seed(seed)
+        t0      = time.time()
+        c0      = os.times()
+        if mtype == 'iso':
+            vpr.mc_joint_inv_iso(outdir=outdir, misfit_thresh=misfit_thresh, pfx=name, step4uwalk=step4uwalk, numbrun=numbrun,\
+                    savedata=False, timing=True, **invkwargs)
+        else:
+            vpr.mc_joint_inv_vti(outdir=outdir, misfit_thresh=misfit_thresh, pfx=name, step4uwalk=step4uwalk, numbrun=numbrun,\
+                    savedata=False, timing=True, **invkwargs)
+        c1      = os.times()
+        walltime= time.time() - t0
+        cputime = (c1[0] + c1[1]) - (c0[0] + c0[1])
+        chain   = mcchain.chainfile(outdir+'/mc_inv.'+name+mcchain.SUFFIX)
+        result.update({'cputime': cputime, 'walltime': walltime, 'stats': chain.stats})
+        result.update(get_metrics(chain, cputime, step4uwalk, misfit_thresh=misfit_thresh, Nmodelthresh=Nmodelthresh, burnin=burnin))
+        chain.close()
+    except ImportError as err:
+        result['status']    = 'skipped'
+        result['message']   = 'ImportError: '+str(err)
+    except Exception as err:
+        result['status']    = 'error'
+        result['message']   = type(err).__name__+': '+str(err)
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+    return result
+
+def compare(results, baselinefname, tol=0.1):
+    """
+    print the ratios of the throughput metrics to the baseline, cases with ess_per_sec < (1-tol)*baseline are flagged as worse
+    """
+    baseline    = json.load(open(baselinefname, 'r'))
+    basedict    = dict([(result['name'], result) for result in baseline['results'] if result['status'] == 'ok'])
+    print '=== comparison to baseline: '+baselinefname+' (git revision: '+baseline['meta'].get('git', '')+')'
+    print '%-12s %10s %10s %10s %10s %10s %s' %('name', 'steps/s', 'fwd/s', 'ess/s', 'ess_min', 't_nmodel', 'chain')
+    nworse      = 0
+    for result in results:
+        if result['status'] != 'ok' or not result['name'] in basedict:
+            continue
+        base    = basedict[result['name']]
+        ratios  = []
+        for key in ['steps_per_sec', 'forward_per_sec', 'ess_per_sec', 'ess_min', 'time_to_nmodel']:
+            if result[key] is None or base[key] is None or base[key] == 0.:
+                ratios.append('%10s' %'-')
+            else:
+                ratios.append('%10.3f' %(result[key]/base[key]))
+        # the same seed and budget give the same chain unless the optimization changed the results
+        chainflag   = 'same' if result['nacc'] == base['nacc'] and result['nrun'] == base['nrun'] else 'DIFFERENT'
+        flag        = ''
+        if base['ess_per_sec'] > 0. and result['ess_per_sec'] < (1. - tol)*base['ess_per_sec']:
+            flag    = ' WORSE'
+            nworse  += 1
+        print '%-12s %s %s%s' %(result['name'], ' '.join(ratios), chainflag, flag)
+    print '--- '+str(nworse)+' case(s) with ess_per_sec lower than the baseline by more than '+str(int(100*tol))+' %'
+    return nworse
+
+def main(argv=None):
+    parser      = argparse.ArgumentParser(description='throughput harness of the Monte Carlo inversions')
+    parser.add_argument('-o', '--output', default='benchmark_inversion.json', help='output JSON file')
+    parser.add_argument('-b', '--baseline', default=None, help='baseline JSON file for comparison')
+    parser.add_argument('-k', '--keyword', action='append', default=[], help='run only the cases containing the keyword')
+    parser.add_argument('-s', '--seed', type=int, default=SEED, help='random seed')
+    parser.add_argument('--numbrun', type=int, default=None, help='total number of runs of each case')
+    parser.add_argument('--step4uwalk', type=int, default=None, help='step interval for uniform random walk')
+    parser.add_argument('--misfit-thresh', type=float, default=MISFIT_THRESH, help='misfit threshold of the good models')
+    parser.add_argument('--nmodel', type=int, default=NMODELTHRESH, help='number of good models (Nmodelthresh)')
+    parser.add_argument('--burnin', type=float, default=BURNIN, help='fraction of each segment discarded for ESS')
+    parser.add_argument('--tol', type=float, default=0.1, help='tolerance of the ratio to the baseline')
+    parser.add_argument('--quick', action='store_true', help='small budget for a quick check')
+    args        = parser.parse_args(argv)
+    numbrun     = args.numbrun if args.numbrun is not None else (NUMBRUN_QUICK if args.quick else NUMBRUN)
+    step4uwalk  = args.step4uwalk if args.step4uwalk is not None else (STEP4UWALK_QUICK if args.quick else STEP4UWALK)
+    # data and models are read from the files in the same directory as this script
+    srcdir      = os.path.dirname(os.path.abspath(__file__))
+    results     = []
+    for name, setup in CASES:
+        if len(args.keyword) > 0 and not any([keyword in name for keyword in args.keyword]):
+            continue
+        result  = run_case(name, setup, srcdir, numbrun, step4uwalk, seed=args.seed, misfit_thresh=args.misfit_thresh,\
+                    Nmodelthresh=args.nmodel, burnin=args.burnin)
+        results.append(result)
+        if result['status'] == 'ok':
+            print '%-12s cpu = %8.2f s, steps/s = %8.2f, fwd/s = %8.2f, acc = %6.3f, ess_min = %8.1f, ess/s = %8.3f, t_nmodel = %s'\
+                    %(name, result['cputime'], result['steps_per_sec'], result['forward_per_sec'], result['acceptance'],\
+                      result['ess_min'], result['ess_per_sec'], str(result['time_to_nmodel']))
+        else:
+            print '%-12s %s (%s)' %(name, result['status'], result['message'])
+    meta        = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'host': socket.gethostname(), 'python': platform.python_version(),\
+                    'numpy': np.__version__, 'git': get_git_revision(srcdir), 'seed': args.seed, 'numbrun': numbrun,\
+                    'step4uwalk': step4uwalk, 'misfit_thresh': args.misfit_thresh, 'Nmodelthresh': args.nmodel, 'burnin': args.burnin}
+    with open(args.output, 'w') as fid:
+        json.dump({'meta': meta, 'results': results}, fid, indent=1)
+    print '--- results are written to '+args.output
+    if args.baseline is not None:
+        compare(results, args.baseline, tol=args.tol)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
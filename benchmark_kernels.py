@@ -1,118 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark suite of the forward solvers and the python layers around them
 
-import surfdbase
-import copy
-
-
-dset = surfdbase.invhdf5('/work1/leon/ALASKA_work/mc_inv_files/inversion_alaska_surf_20190320_no_ocsi_vti.h5')
-
-
-# 
-# vpr1 = dset.mc_inv_vti(use_ref=True, outdir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20190325_150000_vti',
-#                 numbrun=150000, nprocess=35, verbose=False, group=False, outlon=-142., outlat = 60.)
-vpr2 = dset.mc_inv_vti(use_ref=True, outdir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20190325_150000_vti',
-                numbrun=150000, nprocess=35, verbose=False, group=False, outlon=-150., outlat = 65.)
-
-vpr2.model.vtimod.para2mod()
-vpr2.model.vtimod.get_paraind()
-vpr2.model.vtimod.update()
-vpr2.model.get_vti_vmodel()
-vpr2.model.vtimod.mod2para()
-vpr2.get_period()
-vpr2.compute_tcps_vti()
-vpr3 = copy.deepcopy(vpr2)
-    
-
-# # 
-# # # # # # #-------------------------
-# # # # # # # read inversion results
-# # # # # # #-------------------------
-# dset.read_inv(datadir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20190322_150000_both_crust1_ocsi', avgqc=False)
-# # # 
-# 
-# #-------------------------
-# # interpolation/smoothing
-# #-------------------------
-# # # # dset.get_raytomo_mask(inh5fname='/work1/leon/ALASKA_work/hdf5_files/ray_tomo_Alaska_LD.h5', runid=2)
-# # # # # # # OR
-# dset.get_hybrid_mask(inh5fname='/work1/leon/ALASKA_work/hdf5_files/eikonal_hybrid_20190318.h5', runid=0)
-# # # # # 
-# dset.get_topo_arr(infname='/home/leon/station_map/grd_dir/ETOPO2v2g_f4.nc')
-# # # # # # 
-# # # # # # 
-# # # # # # dset.paraval_arrays(dtype='min')
-# # # # # # dset.construct_3d(dtype='min')
-# # # # # # dset.construct_3d(dtype='min', is_smooth=True)
-# # # # # # 
-# dset.paraval_arrays(dtype='avg')
-# # # dset.construct_3d(dtype='avg')
-# dset.construct_3d(dtype='avg', is_smooth=True)
-
-# # # 
-# depth = 100.
-# # # dset.plot_horizontal(depth=depth, dtype='min', is_smooth=True, shpfx=None, clabel='Vs (km/s)', cmap='cv', title=str(int(depth))+' km', projection='lambert', hillshade=False,\
-# # #              geopolygons=None, vmin=4.2, vmax=4.6, showfig=True)
-# # # # 
-# dset.plot_horizontal(depth=depth, dtype='avg', is_smooth=True, shpfx=None, clabel='Vs (km/s)', cmap='cv', title=str(int(depth))+' km', projection='lambert', hillshade=False,\
-#              geopolygons=None, vmin=None, vmax=None, showfig=True)
-# # # 
-# dset.plot_horizontal(depth=depth, dtype='avg', is_smooth=True, shpfx=None, clabel='Vs (km/s)', cmap='cv', title=str(int(depth))+' km', projection='lambert', hillshade=False,\
-#              geopolygons=None, vmin=4.2, vmax=4.6, showfig=True)
-# # # # 
-# # # # dset.plot_horizontal(depth=10., dtype='avg', is_smooth=True, shpfx=None, clabel='Vs (km/s)', cmap='cv', title='4 km', projection='lambert', hillshade=False,\
-# # # #              geopolygons=None, vmin=None, vmax=None, showfig=True)
-# # # 
-# dset.plot_horizontal(depth=4., dtype='avg', is_smooth=True, shpfx=None, clabel='Vs (km/s)', cmap='cv', title='4 km', projection='lambert', hillshade=False,\
-#              geopolygons=None, vmin=2.5, vmax=3.5, showfig=True)
-# dset.plot_vertical_rel(lon1=-165+360, lon2=-150+360, lat1=65, lat2=55, maxdepth=100., dtype='avg', is_smooth=True)
-
-# dset.plot_vertical_rel(lon1=-170+360, lon2=-145+360, lat1=64, lat2=58, maxdepth=100., dtype='avg', is_smooth=True)
-# import obspy
-# cat     = obspy.read_events('alaska_events.xml')
-# dset.plot_vertical_rel(plottype=1, lon1=-160+360, lon2=-150+360, lat1=62, lat2=58, maxdepth=120.,\
-#                         dtype='avg', is_smooth=True, incat = cat, vmin2=-5., vmax2=5., vs_mantle=4.35)
-# dset.plot_vertical_rel(plottype=1, lon1=-151+360, lon2=-150+360, lat1=69, lat2=58, maxdepth=120.,\
-#                        dtype='avg', is_smooth=True, incat = -1, vmin2=-5., vmax2=5., vs_mantle=4.35)
-# dset.plot_vertical_rel(plottype=1, lon1=-130+360, lon2=-150+360, lat1=68, lat2=58, maxdepth=120.,\
-#                        dtype='avg', is_smooth=True, incat = -1, vmin2=-5., vmax2=5., vs_mantle=4.35)
-
-
-
-
-# vpr = dset.get_vpr(datadir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20181202_150000_both_miller', lon=-142., lat=62.)
-# vpr = dset.get_vpr(datadir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20181105_150000_both', lon=-147., lat=66.5)
-
-# vpr1 = dset.get_vpr(datadir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20181105_150000_both', lon=-155., lat=68., thresh=0.1)
-# vpr2 = dset.get_vpr(datadir='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20181202_150000_both_miller', lon=-155., lat=68., thresh=0.1)
-
-# vpr = dset.generate_disp_vs_figs(datadir ='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20181105_150000_both',\
-#                 outdir='/home/leon/ALASKA_disp_vs')
-
-# vpr = dset.generate_disp_vs_figs(datadir ='/work1/leon/ALASKA_work/mc_inv_files/mc_alaska_surf_20181202_150000_both_miller',\
-#                 outdir='/home/leon/ALASKA_disp_vs')
-
-# dset.plot_paraval(pindex='min_misfit', is_smooth=False, cmap='jet', vmin=0.2, vmax=2.0, outfname='min_misfit.txt')
-# dset.plot_paraval(pindex='avg_misfit', is_smooth=False, cmap='hot', vmin=0.2, vmax=2.0, outfname='avg_misfit.txt')
-# dset.plot_paraval(pindex='fitratio', is_smooth=False, cmap='jet', vmin=0.3, vmax=1.0, outfname='fitratio.txt')
-
-# dset.plot_paraval(pindex='moho', isthk=True, is_smooth=True, cmap='gist_ncar', vmin=20., vmax=60.0, clabel='Moho Depth (km)')
-# 
-# import matplotlib.pyplot as plt
-# import numpy as np
-# cmap = plt.cm.RdYlBu
-# # 
-# # # Transparent colours
-# # from matplotlib.colors import ListedColormap
-# # 
-# # colA = cmap(np.arange(cmap.N))
-# # colA[:,-1] = 0.25 + 0.5 * np.linspace(-1.0, 1.0, cmap.N)**2.0
-# # 
-# # # Create new colormap
-# cmap = ListedColormap(colA)
-# cmap = surfdbase.discrete_cmap(10, 'RdYlBu')
-# # # cmap = surfdbase.discrete_cmap(8, 'hot_r')
-# # # dset.plot_paraval(pindex='avg_misfit', is_smooth=False, cmap=cmap, vmin=0.0, vmax=2.0, outfname='avg_misfit.txt', clabel='Misfit')
-# # dset.plot_paraval(pindex='moho', isthk=False, is_smooth=True, cmap=cmap, vmin=25., vmax=45.0, clabel='Crustal thickness (km)')
-# # dset.plot_paraval(pindex='moho', isthk=True, dtype='std', is_smooth=True, cmap=cmap, vmin=0., vmax=10.0, clabel='Uncertainties of Crustal Thickness (km)')
-# # # dset.plot_paraval(pindex='vs_std', is_smooth=False, depth=10., depthavg = 0.)
-# # 
-# dset.plot_crust1( infname='crsthk.xyz', vmin=25., vmax=45., clabel='Crustal thickness (km)', cmap=cmap)
+solvers         - fast_surf, theo, rftheo.rfsolver, tdisp96.disprs, tregn96, tlegn96,
+                    aniprop.aniprop_interface/rf_aniso_interface, raysum.raysum_interface
+python layers   - vprofile1d.compute_fsurf, compute_rftheo, compute_disp_vti (solver_type = 0/1/2), perturb_from_kernel_vti
+
+The synthetic models are resampled from vti.mod (layerized VTI model) to the given number of layers,
+the water layer of water.mod is put on top for the water cases.
+Each benchmark is run for all the combinations of the number of layers, the number of periods and water/no-water
+that apply to it, the cases a solver does not support (e.g. water layer for receiver functions) are skipped.
+
+usage:
+    python benchmark_kernels.py [-o results.json] [-b baseline.json] [-k name] [--quick]
+        -o          - output JSON file of the results (default - benchmark_kernels.json)
+        -b          - JSON file of a previous run, the ratios of the median time to the baseline are printed
+        -k          - run only the benchmarks whose names contain the given string (can be repeated)
+        --quick     - small sweep for a quick check
+results (JSON):
+    meta        - date, host, python/numpy version, git revision and the sweep
+    results     - one entry per benchmark and case: name, group, nlay, nper, water, status (ok/skipped/error),
+                    message, nloop, nrepeat, best/median/mean time per call (sec)
+"""
+import numpy as np
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import platform
+import subprocess
+
+NLAY_LST        = [10, 20, 50, 100, 200]
+NPER_LST        = [10, 20, 40]
+NLAY_LST_QUICK  = [10, 50]
+NPER_LST_QUICK  = [20]
+# minimum time of one repeat (sec), the number of calls in one repeat is chosen accordingly
+MIN_TIME        = 0.1
+MAX_LOOP        = 1000
+NREPEAT         = 5
+# receiver function samples (fs = 40 Hz)
+RF_NPTS         = 400
+RF_FS           = 40.
+
+#===============================
+# synthetic models
+#===============================
+def read_vti_model(infname='vti.mod'):
+    """
+    read the layerized VTI model (depth vsv vsh vpv vph eta rho), two grid points for each layer
+    """
+    inarr       = np.loadtxt(infname, dtype=np.float64)
+    laydata     = inarr[1::2, :]
+    model       = {'h': np.diff(np.append(0., laydata[:, 0]))}
+    for i, name in enumerate(['vsv', 'vsh', 'vpv', 'vph', 'eta', 'rho']):
+        model[name]     = laydata[:, i+1]
+    return model
+
+def read_water_layer(infname='water.mod'):
+    """
+    get the thickness and P wave velocity of the water layer (the first group) of a model parameterization file
+    """
+    for line in open(infname, 'r'):
+        l2      = line.split()
+        if int(l2[1]) == 5:
+            return float(l2[2]), float(l2[4])
+    raise ValueError('No water layer in '+infname)
+
+def get_model(basemodel, nlay, water=False, waterlayer=(2.9, 1.475)):
+    """
+    resample the base model to nlay layers with the same total thickness, the last layer is the half-space
+    for the water cases, the water layer replaces the first layer (the total number of layers is still nlay)
+    """
+    zbot        = basemodel['h'].cumsum()
+    nsolid      = nlay - 1 if water else nlay
+    hsolid      = np.ones(nsolid, dtype=np.float64)*zbot[-1]/nsolid
+    zmid        = hsolid.cumsum() - hsolid/2.
+    ind         = np.minimum(np.searchsorted(zbot, zmid), zbot.size-1)
+    model       = {'h': hsolid}
+    for name in ['vsv', 'vsh', 'vpv', 'vph', 'eta', 'rho']:
+        model[name]     = basemodel[name][ind]
+    model['qs'] = 600.*np.ones(nsolid, dtype=np.float64)
+    model['qp'] = 1400.*np.ones(nsolid, dtype=np.float64)
+    if water:
+        # the same values as the water layer in modparam
+        waterval= {'h': waterlayer[0], 'vsv': 0., 'vsh': 0., 'vpv': waterlayer[1], 'vph': waterlayer[1], 'eta': 1.,\
+                    'rho': 1.02, 'qs': 10000., 'qp': 57822.}
+        for name in model:
+            model[name] = np.append(waterval[name], model[name])
+    model['A']  = model['rho']*model['vph']**2
+    model['C']  = model['rho']*model['vpv']**2
+    model['L']  = model['rho']*model['vsv']**2
+    model['F']  = model['eta']*(model['A'] - 2.*model['L'])
+    model['N']  = model['rho']*model['vsh']**2
+    return model
+
+def get_periods(nper):
+    return np.linspace(6., 60., nper)
+
+def get_vprofile(model, nper, rf=False):
+    """
+    get a vprofile1d object with the model and synthetic data arrays
+    """
+    import vprofile
+    vpr         = vprofile.vprofile1d()
+    per         = get_periods(nper)
+    for wtype in ['ray', 'lov']:
+        vpr.get_disp(np.array([per, 3.5*np.ones(nper), 0.01*np.ones(nper)]), dtype='ph', wtype=wtype)
+        vpr.get_disp(np.array([per, 3.2*np.ones(nper), 0.02*np.ones(nper)]), dtype='gr', wtype=wtype)
+    if rf:
+        time_rf = np.arange(RF_NPTS, dtype=np.float64)/RF_FS
+        vpr.get_rf(np.array([time_rf, np.zeros(RF_NPTS), 0.1*np.ones(RF_NPTS)]))
+        vpr.model.isomod.init_arr(1)
+    vpr.get_period()
+    for name in ['h', 'vsv', 'vsh', 'vpv', 'vph', 'eta', 'rho', 'qs', 'qp']:
+        setattr(vpr.model, name, model[name].copy())
+    vpr.model.nlay  = model['h'].size
+    vpr.model.vel2love()
+    return vpr
+
+#===============================
+# benchmarks
+# each setup function returns a function without arguments to be timed,
+# ImportError is reported as skipped (the solver is not built)
+#===============================
+def _fast_surf_args(model, nper, ilvry):
+    per         = np.zeros(200, dtype=np.float64)
+    per[:nper]  = get_periods(nper)
+    nlay        = model['h'].size
+    if ilvry == 2:
+        return (nlay, ilvry, model['vpv'], model['vsv'], model['rho'], model['h'], 1./model['qs'], per, nper)
+    return (nlay, ilvry, model['vph'], model['vsh'], model['rho'], model['h'], 1./model['qs'], per, nper)
+
+def setup_fast_surf_ray(model, nper):
+    import fast_surf
+    args        = _fast_surf_args(model, nper, 2)
+    return lambda: fast_surf.fast_surf(*args)
+
+def setup_fast_surf_lov(model, nper):
+    import fast_surf
+    args        = _fast_surf_args(model, nper, 1)
+    return lambda: fast_surf.fast_surf(*args)
+
+def _theo_args(model):
+    nl          = model['h'].size
+    hin         = np.zeros(100, dtype=np.float64)
+    vsin        = np.zeros(100, dtype=np.float64)
+    vpvs        = np.zeros(100, dtype=np.float64)
+    qsin        = 600.*np.ones(100, dtype=np.float64)
+    qpin        = 1400.*np.ones(100, dtype=np.float64)
+    hin[:nl]    = model['h']
+    vsin[:nl]   = model['vsv']
+    vpvs[:nl]   = model['vpv']/model['vsv']
+    qsin[:nl]   = model['qs']
+    qpin[:nl]   = model['qp']
+    din         = 180.*np.arcsin(vsin[nl-1]*vpvs[nl-1]*0.06)/np.pi
+    return nl, hin, vsin, vpvs, qsin, qpin, din
+
+def setup_theo(model, nper):
+    import theo
+    nl, hin, vsin, vpvs, qsin, qpin, din = _theo_args(model)
+    return lambda: theo.theo(nl, vsin, hin, vpvs, qpin, qsin, RF_FS, din, 2.5, 0.005, 0, RF_NPTS)
+
+def setup_rfsolver(model, nper):
+    import rftheo
+    nl, hin, vsin, vpvs, qsin, qpin, din = _theo_args(model)
+    solver      = rftheo.rfsolver(fs=RF_FS)
+    return lambda: solver.solve(vs=vsin[:nl], h=hin[:nl], vpvs=vpvs[:nl], qp=qpin[:nl], qs=qsin[:nl], npts=RF_NPTS, din=din)
+
+def _disprs_args(model, nper, ilvry):
+    per         = get_periods(nper)
+    vs          = model['vsv'][model['vsv'] > 0.]
+    cmin        = 0.8*vs.min()
+    cmax        = vs.max()
+    return (ilvry, 1., nper, 1, 0, nper, np.append(1./per, np.zeros(2049-nper)), cmin, cmax,\
+            model['h'], model['A'], model['C'], model['F'], model['L'], model['N'], model['rho'], model['h'].size, 1, 0., 1, 1., 1.)
+
+def setup_tdisp96_ray(model, nper):
+    import tdisp96
+    args        = _disprs_args(model, nper, 2)
+    return lambda: tdisp96.disprs(*args)
+
+def setup_tdisp96_lov(model, nper):
+    import tdisp96
+    args        = _disprs_args(model, nper, 1)
+    return lambda: tdisp96.disprs(*args)
+
+def _egn96_args(model, nper, ilvry):
+    import tdisp96
+    per         = get_periods(nper)
+    c_out       = tdisp96.disprs(*_disprs_args(model, nper, ilvry))[0]
+    nl_in       = model['h'].size
+    return (0., 0., 0., 0., 0., True, nl_in, 1, model['h'], model['A'], model['C'], model['F'], model['L'], model['N'], model['rho'],\
+            model['qp'], model['qs'], np.zeros(nl_in), np.zeros(nl_in), np.ones(nl_in), np.ones(nl_in), nper, per, c_out[:nper])
+
+def setup_tregn96(model, nper):
+    import tregn96
+    args        = _egn96_args(model, nper, 2)
+    return lambda: tregn96.tregn96(*args)
+
+def setup_tlegn96(model, nper):
+    import tlegn96
+    args        = _egn96_args(model, nper, 1)
+    return lambda: tlegn96.tlegn96(*args)
+
+def _aniprop_args(model):
+    """
+    aniprop model arrays (SI units) from the Love parameters, see layer_aniprop_model in numba_src/vmodel.py
+    """
+    A, C, F, L, N, rho  = model['A'], model['C'], model['F'], model['L'], model['N'], model['rho']
+    a           = (3.*A + 3.*C + 2.*F + 4.*L)/8.
+    b           = 0.5*(C - A)
+    c           = (A + C - 2.*F - 4.*L)/8.
+    d           = 0.5*(N + L)
+    e           = 0.5*(L - N)
+    z           = model['h'].cumsum()*1000.
+    nl          = z.size - 1
+    return (z, np.sqrt(a/rho)*1000., b/a, c/a, np.sqrt(d/rho)*1000., e/d, rho*1000., np.zeros(nl+1), np.zeros(nl+1), nl)
+
+def setup_aniprop(model, nper):
+    import aniprop
+    args        = _aniprop_args(model)
+    per         = get_periods(nper)
+    return lambda: aniprop.aniprop_interface(*(args + (0., nper, per[0], per[-1])))
+
+def setup_rf_aniso(model, nper):
+    import aniprop
+    args        = _aniprop_args(model)
+    return lambda: aniprop.rf_aniso_interface(*(args + (0., RF_NPTS)))
+
+def setup_raysum(model, nper):
+    import raysum
+    nlay        = model['h'].size
+    arrs        = dict([(name, np.zeros(15, dtype=np.float64)) for name in ['thick', 'rho', 'alpha', 'beta', 'zeros']])
+    arrs['thick'][:nlay-1]  = model['h'][:-1]*1000.
+    arrs['rho'][:nlay]      = model['rho']*1000.
+    arrs['alpha'][:nlay]    = model['vpv']*1000.
+    arrs['beta'][:nlay]     = model['vsv']*1000.
+    zeros       = arrs['zeros']
+    ntr         = 12
+    baz         = np.zeros(200, dtype=np.float64)
+    slow        = np.zeros(200, dtype=np.float64)
+    baz[:ntr]   = np.arange(ntr)*30.
+    slow[:ntr]  = 6e-5
+    return lambda: raysum.raysum_interface(nlay, arrs['thick'], arrs['rho'], arrs['alpha'], arrs['beta'], np.ones(15), zeros, zeros,\
+                    zeros, zeros, zeros, zeros, np.ones(15), 1, ntr, baz, slow, np.zeros(200), np.zeros(200),\
+                    1, RF_NPTS, 1./RF_FS, 1., 1, 5., 0, '')
+
+def setup_compute_fsurf(model, nper):
+    vpr         = get_vprofile(model, nper)
+    def run():
+        vpr.compute_fsurf(wtype='ray')
+        vpr.compute_fsurf(wtype='lov')
+    return run
+
+def setup_compute_rftheo(model, nper):
+    vpr         = get_vprofile(model, nper, rf=True)
+    return lambda: vpr.compute_rftheo()
+
+def setup_compute_rftheo_rfsolver(model, nper):
+    import rftheo
+    vpr         = get_vprofile(model, nper, rf=True)
+    vpr.rfsolver= rftheo.rfsolver(fs=RF_FS)
+    return lambda: vpr.compute_rftheo()
+
+def setup_compute_disp_vti_fsurf(model, nper):
+    vpr         = get_vprofile(model, nper)
+    return lambda: vpr.compute_disp_vti(wtype='both', solver_type=0)
+
+def setup_compute_disp_vti_tcps(model, nper):
+    vpr         = get_vprofile(model, nper)
+    return lambda: vpr.compute_disp_vti(wtype='both', solver_type=1)
+
+def _get_vprofile_ref(model, nper):
+    """
+    vprofile1d object with the reference dispersion/kernels computed, and a perturbed model
+    """
+    vpr         = get_vprofile(model, nper)
+    vpr.compute_disp_vti(wtype='both', solver_type=1)
+    isolid      = vpr.model.vsv > 0.
+    vpr.model.vsv[isolid]   *= 1.01
+    vpr.model.vsh[isolid]   *= 1.02
+    vpr.model.vel2love()
+    return vpr
+
+def setup_compute_disp_vti_kernel(model, nper):
+    vpr         = _get_vprofile_ref(model, nper)
+    return lambda: vpr.compute_disp_vti(wtype='both', solver_type=2)
+
+def setup_perturb_from_kernel_vti(model, nper):
+    vpr         = _get_vprofile_ref(model, nper)
+    def run():
+        vpr.perturb_from_kernel_vti(wtype='ray')
+        vpr.perturb_from_kernel_vti(wtype='lov')
+    return run
+
+# name, group, setup function, depends on the number of periods, supports water layer, maximum number of layers
+BENCHMARKS  = [
+    ('fast_surf_ray',               'solver', setup_fast_surf_ray,              True,   True,   200),
+    ('fast_surf_lov',               'solver', setup_fast_surf_lov,              True,   True,   200),
+    ('theo',                        'solver', setup_theo,                       False,  False,  100),
+    ('rftheo_rfsolver',             'solver', setup_rfsolver,                   False,  False,  None),
+    ('tdisp96_ray',                 'solver', setup_tdisp96_ray,                True,   True,   None),
+    ('tdisp96_lov',                 'solver', setup_tdisp96_lov,                True,   True,   None),
+    ('tregn96',                     'solver', setup_tregn96,                    True,   True,   None),
+    ('tlegn96',                     'solver', setup_tlegn96,                    True,   True,   None),
+    ('aniprop_interface',           'solver', setup_aniprop,                    True,   False,  None),
+    ('rf_aniso_interface',          'solver', setup_rf_aniso,                   False,  False,  None),
+    ('raysum_interface',            'solver', setup_raysum,                     False,  False,  15),
+    ('compute_fsurf',               'python', setup_compute_fsurf,              True,   True,   200),
+    ('compute_rftheo',              'python', setup_compute_rftheo,             False,  False,  100),
+    ('compute_rftheo_rfsolver',     'python', setup_compute_rftheo_rfsolver,    False,  False,  100),
+    ('compute_disp_vti_fsurf',      'python', setup_compute_disp_vti_fsurf,     True,   True,   200),
+    ('compute_disp_vti_tcps',       'python', setup_compute_disp_vti_tcps,      True,   True,   200),
+    ('compute_disp_vti_kernel',     'python', setup_compute_disp_vti_kernel,    True,   True,   200),
+    ('perturb_from_kernel_vti',     'python', setup_perturb_from_kernel_vti,    True,   True,   200)
+    ]
+
+def time_func(func, nrepeat=NREPEAT, min_time=MIN_TIME):
+    """
+    time a function, the number of calls in each repeat is chosen so that one repeat takes at least min_time
+    ::: output :::
+    nloop, times (time per call of each repeat, sec)
+    """
+    t0          = time.time()
+    func()
+    tcall       = time.time() - t0
+    nloop       = int(min(MAX_LOOP, max(1, np.ceil(min_time/max(tcall, 1e-9)))))
+    times       = []
+    for i in range(nrepeat):
+        t0      = time.time()
+        for j in range(nloop):
+            func()
+        times.append((time.time() - t0)/nloop)
+    return nloop, np.array(times)
+
+def run_benchmark(name, group, setup, nlay, nper, water, basemodel, waterlayer, nrepeat=NREPEAT):
+    result      = {'name': name, 'group': group, 'nlay': nlay, 'nper': nper, 'water': water, 'status': 'ok', 'message': ''}
+    try:
+        func    = setup(get_model(basemodel, nlay, water=water, waterlayer=waterlayer), nper)
+        nloop, times\
+                = time_func(func, nrepeat=nrepeat)
+    except ImportError as err:
+        result['status']    = 'skipped'
+        result['message']   = 'ImportError: '+str(err)
+        return result
+    except Exception as err:
+        result['status']    = 'error'
+        result['message']   = type(err).__name__+': '+str(err)
+        return result
+    result.update({'nloop': nloop, 'nrepeat': nrepeat, 'best': float(times.min()), 'median': float(np.median(times)),\
+                    'mean': float(times.mean())})
+    return result
+
+def get_cases(uses_nper, supports_water, maxlay, nlaylst, nperlst):
+    cases       = []
+    for nlay in nlaylst:
+        if maxlay is not None and nlay > maxlay:
+            continue
+        for nper in (nperlst if uses_nper else [None]):
+            for water in ([False, True] if supports_water else [False]):
+                cases.append((nlay, nper, water))
+    return cases
+
+def get_git_revision(srcdir):
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=srcdir, stderr=open(os.devnull, 'w')).strip()
+    except Exception:
+        return ''
+
+def result_key(result):
+    return (result['name'], result['nlay'], result['nper'], result['water'])
+
+def compare(results, baselinefname, tol=0.1):
+    """
+    print the ratios of the median time to the baseline, ratios > 1+tol are flagged as slower
+    """
+    baseline    = json.load(open(baselinefname, 'r'))
+    basedict    = dict([(result_key(result), result) for result in baseline['results'] if result['status'] == 'ok'])
+    print '=== comparison to baseline: '+baselinefname+' (git revision: '+baseline['meta'].get('git', '')+')'
+    print '%-28s %6s %6s %6s %12s %12s %8s' %('name', 'nlay', 'nper', 'water', 'base (ms)', 'new (ms)', 'ratio')
+    nslow       = 0
+    for result in results:
+        key     = result_key(result)
+        if result['status'] != 'ok' or not key in basedict:
+            continue
+        ratio   = result['median']/basedict[key]['median']
+        flag    = ''
+        if ratio > 1. + tol:
+            flag    = ' SLOWER'
+            nslow   += 1
+        elif ratio < 1. - tol:
+            flag    = ' faster'
+        print '%-28s %6d %6s %6s %12.4f %12.4f %8.3f%s' %(result['name'], result['nlay'], str(result['nper']), str(result['water']),\
+                1000.*basedict[key]['median'], 1000.*result['median'], ratio, flag)
+    print '--- '+str(nslow)+' case(s) slower than the baseline by more than '+str(int(100*tol))+' %'
+    return nslow
+
+def main(argv=None):
+    parser      = argparse.ArgumentParser(description='benchmark suite of the forward solvers')
+    parser.add_argument('-o', '--output', default='benchmark_kernels.json', help='output JSON file')
+    parser.add_argument('-b', '--baseline', default=None, help='baseline JSON file for comparison')
+    parser.add_argument('-k', '--keyword', action='append', default=[], help='run only the benchmarks containing the keyword')
+    parser.add_argument('-n', '--nrepeat', type=int, default=NREPEAT, help='number of repeats')
+    parser.add_argument('--tol', type=float, default=0.1, help='tolerance of the ratio to the baseline')
+    parser.add_argument('--quick', action='store_true', help='small sweep for a quick check')
+    args        = parser.parse_args(argv)
+    nlaylst     = NLAY_LST_QUICK if args.quick else NLAY_LST
+    nperlst     = NPER_LST_QUICK if args.quick else NPER_LST
+    # synthetic models are read from the files in the same directory as this script
+    srcdir      = os.path.dirname(os.path.abspath(__file__))
+    basemodel   = read_vti_model(os.path.join(srcdir, 'vti.mod'))
+    waterlayer  = read_water_layer(os.path.join(srcdir, 'water.mod'))
+    results     = []
+    for name, group, setup, uses_nper, supports_water, maxlay in BENCHMARKS:
+        if len(args.keyword) > 0 and not any([keyword in name for keyword in args.keyword]):
+            continue
+        for nlay, nper, water in get_cases(uses_nper, supports_water, maxlay, nlaylst, nperlst):
+            result  = run_benchmark(name, group, setup, nlay, nper, water, basemodel, waterlayer, nrepeat=args.nrepeat)
+            results.append(result)
+            if result['status'] == 'ok':
+                print '%-28s nlay = %4d nper = %4s water = %-5s %12.4f ms' %(name, nlay, str(nper), str(water), 1000.*result['median'])
+            else:
+                print '%-28s nlay = %4d nper = %4s water = %-5s %s (%s)' %(name, nlay, str(nper), str(water), result['status'],\
+                        result['message'])
+    meta        = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'host': socket.gethostname(), 'python': platform.python_version(),\
+                    'numpy': np.__version__, 'git': get_git_revision(srcdir), 'nlay': nlaylst, 'nper': nperlst, 'nrepeat': args.nrepeat,\
+                    'min_time': MIN_TIME}
+    with open(args.output, 'w') as fid:
+        json.dump({'meta': meta, 'results': results}, fid, indent=1)
+    print '--- results are written to '+args.output
+    if args.baseline is not None:
+        compare(results, args.baseline, tol=args.tol)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
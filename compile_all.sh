@@ -20,3 +20,7 @@ cd $cdir/fast_surf_src
 
 cd $cdir/raysum_src
 ./compile_raysum.sh
+
+# warm up the on-disk cache of the numba kernels
+cd $cdir
+python warmup_numba.py
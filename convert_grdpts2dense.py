@@ -0,0 +1,18 @@
+"""
+migrate the grid point data of an inversion database (surfdbase.invhdf5) to the dense array layout (grd_arr)
+the grd_pts groups are kept, grd_arr is a read-optimized copy, deleted when the grid point data are modified
+(run this script again after read_inv, read_etopo ...)
+usage:
+    python convert_grdpts2dense.py database.h5
+"""
+import sys
+import surfdbase
+
+if len(sys.argv) < 2:
+    print __doc__
+    sys.exit(1)
+inh5fname   = sys.argv[1]
+
+dset        = surfdbase.invhdf5(inh5fname)
+dset.migrate_grd_pts()
+dset.close()
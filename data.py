@@ -10,16 +10,17 @@ Module for handling input data for Bayesian Monte Carlo inversion.
     email: lili.feng@colorado.edu
 """
 import numpy as np
-import matplotlib.pyplot as plt
 import numba
 
-@numba.jit(numba.float64(numba.float64[:], numba.int64))
+@numba.jit(numba.float64(numba.float64[:], numba.int64), nopython=True, cache=True)
 def _fast_compute_expect_misfit(stdarr, N):
-    temp    = 0
+    temp    = 0.
     Ndata   = stdarr.size
     for i in range(N):
-        temp_misfit = np.sqrt(((np.random.normal(scale=stdarr))**2/stdarr**2).sum()/Ndata)
-        temp        +=temp_misfit
+        temp_misfit = 0.
+        for j in range(Ndata):
+            temp_misfit += (np.random.normal(0., stdarr[j])/stdarr[j])**2
+        temp        += np.sqrt(temp_misfit/Ndata)
     expected_misfit = temp/N
     return expected_misfit
 
@@ -183,6 +184,7 @@ class rf(object):
         return True
     
     def plot(self, showfig=True, prediction=False):
+        import matplotlib.pyplot as plt
         if self.npts == 0:
             print 'No data for plotting!'
             return
@@ -228,34 +228,32 @@ class eigkernel(object):
     def compute_love_kernels(self):
         """
         compute sensitivity kernels for Love paramters using chain rule
+        the chain rule is applied to all frequencies and layers at once, the kernels are written into the arrays from init_arr
+        layers with zero L/N (water) have zero vsv/vsh contributions
         """
+        rho             = self.rho[None, :]
+        # 0.5/sqrt(L*rho), 0.5/sqrt(N*rho), zero for water layers
+        isL             = self.L != 0.
+        isN             = self.N != 0.
+        fL              = np.zeros(self.nlay, dtype=np.float64)
+        fN              = np.zeros(self.nlay, dtype=np.float64)
+        fL[isL]         = 0.5/np.sqrt(self.L[isL]*self.rho[isL])
+        fN[isN]         = 0.5/np.sqrt(self.N[isN]*self.rho[isN])
         if self.ilvry == 2:
-            for i in xrange(self.nfreq):
-                for j in xrange(self.nlay):
-                    self.dcdA[i, j] = 0.5/np.sqrt(self.A[j]*self.rho[j]) * self.dcdah[i,j] - self.F[j]/((self.A[j]-2.*self.L[j])**2)*self.dcdn[i, j]
-                    self.dcdC[i, j] = 0.5/np.sqrt(self.C[j]*self.rho[j]) * self.dcdav[i,j]
-                    self.dcdF[i, j] = 1./(self.A[j]-2.*self.L[j])*self.dcdn[i,j]
-                    if self.L[j] == 0.:
-                        self.dcdL[i, j] = 0. + 2.*self.F[j]/((self.A[j]-2.*self.L[j])**2)*self.dcdn[i, j]
-                    else:
-                        self.dcdL[i, j] = 0.5/np.sqrt(self.L[j]*self.rho[j])*self.dcdbv[i,j] + 2.*self.F[j]/((self.A[j]-2.*self.L[j])**2)*self.dcdn[i, j]
-                    ### self.dcdN[i, j] = 0.5/np.sqrt(self.N[j]*self.rho[j])*self.dcdbh[i,j]
-                    self.dcdrl[i, j]= -0.5*self.dcdah[i, j]*np.sqrt(self.A[j]/(self.rho[j]**3)) - 0.5*self.dcdav[i, j]*np.sqrt(self.C[j]/(self.rho[j]**3))\
-                                        -0.5*self.dcdbh[i, j]*np.sqrt(self.N[j]/(self.rho[j]**3)) -0.5*self.dcdbv[i, j]*np.sqrt(self.L[j]/(self.rho[j]**3))\
-                                            + self.dcdr[i, j]
+            AL          = (self.A - 2.*self.L)[None, :]
+            self.dcdA[:, :] = 0.5/np.sqrt(self.A*self.rho)[None, :] * self.dcdah - self.F[None, :]/(AL**2)*self.dcdn
+            self.dcdC[:, :] = 0.5/np.sqrt(self.C*self.rho)[None, :] * self.dcdav
+            self.dcdF[:, :] = 1./AL*self.dcdn
+            self.dcdL[:, :] = fL[None, :]*self.dcdbv + 2.*self.F[None, :]/(AL**2)*self.dcdn
+            ### self.dcdN[:, :] = fN[None, :]*self.dcdbh
+            self.dcdrl[:, :]= -0.5*self.dcdah*np.sqrt(self.A[None, :]/(rho**3)) - 0.5*self.dcdav*np.sqrt(self.C[None, :]/(rho**3))\
+                                -0.5*self.dcdbh*np.sqrt(self.N[None, :]/(rho**3)) -0.5*self.dcdbv*np.sqrt(self.L[None, :]/(rho**3))\
+                                    + self.dcdr
         else:
-            for i in xrange(self.nfreq):
-                for j in xrange(self.nlay):
-                    if self.L[j] == 0.:
-                        self.dcdL[i, j] = 0.
-                    else:
-                        self.dcdL[i, j] = 0.5/np.sqrt(self.L[j]*self.rho[j])*self.dcdbv[i,j]
-                    if self.N[j] == 0.:
-                        self.dcdN[i, j] = 0.
-                    else:
-                        self.dcdN[i, j] = 0.5/np.sqrt(self.N[j]*self.rho[j])*self.dcdbh[i,j]
-                    self.dcdrl[i, j]= -0.5*self.dcdbh[i,j]*np.sqrt(self.N[j]/(self.rho[j]**3)) \
-                                        -0.5*self.dcdbv[i,j]*np.sqrt(self.L[j]/(self.rho[j]**3)) + self.dcdr[i,j]
+            self.dcdL[:, :] = fL[None, :]*self.dcdbv
+            self.dcdN[:, :] = fN[None, :]*self.dcdbh
+            self.dcdrl[:, :]= -0.5*self.dcdbh*np.sqrt(self.N[None, :]/(rho**3)) \
+                                -0.5*self.dcdbv*np.sqrt(self.L[None, :]/(rho**3)) + self.dcdr
         return
     
     def eti_perturb(self):
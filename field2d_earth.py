@@ -19,6 +19,7 @@ import colormaps
 import pyasdf
 import math
 import numba
+import gridsmooth
 
 lon_diff_weight_2   = np.array([[1., 0., -1.]])/2.
 lat_diff_weight_2   = lon_diff_weight_2.T
@@ -331,13 +332,17 @@ class Field2d(object):
         self._get_dlon_dlat_km()
         return
     
-    def interp_surface(self, workingdir, outfname, tension=0.0):
+    def interp_surface(self, workingdir, outfname, tension=0.0, engine='gmt'):
         """Interpolate input data to grid point with gmt surface command
         =======================================================================================
         ::: input parameters :::
         workingdir  - working directory
         outfname    - output file name for interpolation
         tension     - input tension for gmt surface(0.0-1.0)
+        engine      - 'gmt'     : gmt surface (default)
+                      'native'  : in-memory continuous curvature gridding (gridsmooth.surface), workingdir/outfname are not used
+                                    NOTE: agrees with gmt near the data, the extrapolation far from the data differs
+                                    (see test_scripts/test_gridsmooth.py)
         ---------------------------------------------------------------------------------------
         ::: output :::
         self.Zarr   - interpolated field data
@@ -346,6 +351,10 @@ class Field2d(object):
             - 2018/07/06    : added the capability of interpolation for dlon != dlat
         =======================================================================================
         """
+        if engine == 'native':
+            self.Zarr   = gridsmooth.surface(lonIn=self.lonArrIn, latIn=self.latArrIn, ZarrIn=self.ZarrIn,\
+                            lons=self.lon, lats=self.lat, tension=tension)
+            return
         if not os.path.isdir(workingdir):
             os.makedirs(workingdir)
         OutArr      = np.append(self.lonArrIn, self.latArrIn)
@@ -375,10 +384,29 @@ class Field2d(object):
         self.Zarr   = (ZarrIn.reshape(self.Nlat, self.Nlon))[::-1, :]
         return
     
-    def gauss_smoothing(self, workingdir, outfname, tension=0.0, sigma=50.):
+    def gauss_smoothing(self, workingdir, outfname, tension=0.0, sigma=50., engine='gmt'):
         """
         Perform a Gaussian smoothing
+        =======================================================================================
+        ::: input parameters :::
+        workingdir  - working directory
+        outfname    - output file name for smoothing
+        tension     - input tension for gmt surface(0.0-1.0)
+        sigma       - Gaussian smoothing length (unit - km)
+        engine      - 'gmt'     : gmt surface/grdfilter (default)
+                      'native'  : in-memory gridding and filtering (gridsmooth.surface/gauss_filter), workingdir/outfname are not used
+                                    NOTE: agrees with gmt near the data, the extrapolation far from the data differs
+                                    (see test_scripts/test_gridsmooth.py)
+        =======================================================================================
         """
+        # http://gmt.soest.hawaii.edu/doc/5.3.2/grdfilter.html
+        # Gaussian: Weights are given by the Gaussian function, where width is 6 times the conventional Gaussian sigma.
+        width       = 6.*(sigma/2.)
+        if engine == 'native':
+            Zarr        = gridsmooth.surface(lonIn=self.lonArrIn, latIn=self.latArrIn, ZarrIn=self.ZarrIn,\
+                            lons=self.lon, lats=self.lat, tension=tension)
+            self.Zarr   = gridsmooth.gauss_filter(Zarr=Zarr, lons=self.lon, lats=self.lat, width=width)
+            return
         if not os.path.isdir(workingdir):
             os.makedirs(workingdir)
         OutArr      = np.append(self.lonArrIn, self.latArrIn)
@@ -390,9 +418,6 @@ class Field2d(object):
         tempGMT     = workingdir+'/'+outfname+'_GMT.sh'
         grdfile     = workingdir+'/'+outfname+'.grd'
         outgrd      = workingdir+'/'+outfname+'_filtered.grd'
-        # http://gmt.soest.hawaii.edu/doc/5.3.2/grdfilter.html
-        # Gaussian: Weights are given by the Gaussian function, where width is 6 times the conventional Gaussian sigma.
-        width       = 6.*(sigma/2.)
         #
         with open(tempGMT,'wb') as f:
             REG     = '-R'+str(self.minlon)+'/'+str(self.maxlon)+'/'+str(self.minlat)+'/'+str(self.maxlat)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Module for in-memory gridding and Gaussian filtering of 2D geographic fields
+
+The functions are replacements of the GMT commands used by field2d_earth.Field2d:
+    surface         - gmt surface, gridding with continuous curvature splines in tension
+    gauss_filter    - gmt grdfilter -D4 -Fg, Gaussian filter with great circle distances
+Both functions work on a stack of fields defined on the same grid,
+the linear system (surface) and the filter weights (gauss_filter) are computed once and applied to all fields.
+The results agree with the GMT outputs near the data, the extrapolation far from the data (surface) differs,
+test_scripts/test_gridsmooth.py checks both functions against stored GMT outputs.
+
+:Copyright:
+    Author: Lili Feng
+    Graduate Research Assistant
+    CIEI, Department of Physics, University of Colorado Boulder
+    email: lili.feng@colorado.edu
+"""
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+from scipy.ndimage import correlate1d
+
+# mean radius of the Earth (km)
+R_EARTH     = 6371.0087714
+
+def _diff_mat(n, order, d):
+    """
+    finite difference matrix of first/second order derivative, (n-order, n)
+    """
+    if order == 1:
+        return scipy.sparse.diags([-np.ones(n-1), np.ones(n-1)], [0, 1], shape=(n-1, n))/d
+    else:
+        return scipy.sparse.diags([np.ones(n-2), -2.*np.ones(n-2), np.ones(n-2)], [0, 1, 2], shape=(n-2, n))/(d**2)
+
+def _surface_operator(Nlat, Nlon, dx, dy, tension):
+    """
+    quadratic form of the energy for continuous curvature splines in tension
+        (1 - T) * (z_xx^2 + 2*z_xy^2 + z_yy^2) + T * (z_x^2 + z_y^2)
+    the finite differences are only evaluated inside the grid, which gives natural boundary conditions at the edges
+    """
+    Ilon        = scipy.sparse.identity(Nlon)
+    Ilat        = scipy.sparse.identity(Nlat)
+    H           = scipy.sparse.csr_matrix((Nlat*Nlon, Nlat*Nlon))
+    if tension < 1.:
+        terms   = []
+        if Nlon >= 3:
+            terms.append((1., scipy.sparse.kron(Ilat, _diff_mat(Nlon, 2, dx))))
+        if Nlat >= 3:
+            terms.append((1., scipy.sparse.kron(_diff_mat(Nlat, 2, dy), Ilon)))
+        if Nlon >= 2 and Nlat >= 2:
+            terms.append((2., scipy.sparse.kron(_diff_mat(Nlat, 1, dy), _diff_mat(Nlon, 1, dx))))
+        for w, D in terms:
+            H   = H + (1. - tension)*w*(D.T).dot(D)
+    if tension > 0.:
+        for D in [scipy.sparse.kron(Ilat, _diff_mat(Nlon, 1, dx)), scipy.sparse.kron(_diff_mat(Nlat, 1, dy), Ilon)]:
+            H   = H + tension*(D.T).dot(D)
+    return H.tocsc()
+
+def surface(lonIn, latIn, ZarrIn, lons, lats, tension=0.):
+    """
+    gridding of scattered data with continuous curvature splines in tension (gmt surface)
+    Data points are assigned to the nearest grid node (averaged if more than one point falls on a node),
+    the remaining nodes minimize the curvature/tension energy.
+    ======================================================================================
+    ::: input :::
+    lonIn, latIn- input data location (Npts)
+    ZarrIn      - input data, (Npts) or (Nfield, Npts) for a stack of fields sharing the same locations
+    lons, lats  - longitude/latitude of the output grid (regular grid intervals)
+    tension     - tension factor (0.0 - 1.0)
+    ::: output :::
+    Zarr        - gridded data, (Nlat, Nlon) or (Nfield, Nlat, Nlon)
+    ======================================================================================
+    """
+    lonIn       = np.asarray(lonIn, dtype=np.float64).ravel()
+    latIn       = np.asarray(latIn, dtype=np.float64).ravel()
+    single      = (np.ndim(ZarrIn) == 1)
+    ZarrIn      = np.atleast_2d(np.asarray(ZarrIn, dtype=np.float64))
+    Nfield      = ZarrIn.shape[0]
+    Nlon        = lons.size
+    Nlat        = lats.size
+    dlon        = (lons[-1] - lons[0])/max(Nlon-1, 1)
+    dlat        = (lats[-1] - lats[0])/max(Nlat-1, 1)
+    # nearest grid node of each data point, points outside the region are discarded
+    ilon        = np.round((lonIn - lons[0])/dlon).astype(np.int64) if Nlon > 1 else np.zeros(lonIn.size, np.int64)
+    ilat        = np.round((latIn - lats[0])/dlat).astype(np.int64) if Nlat > 1 else np.zeros(latIn.size, np.int64)
+    valid       = (ilon >= 0)*(ilon < Nlon)*(ilat >= 0)*(ilat < Nlat)*np.all(np.isfinite(ZarrIn), axis=0)
+    inode       = ilat[valid]*Nlon + ilon[valid]
+    if inode.size == 0:
+        raise ValueError('No input data inside the grid!')
+    # block mean of data on each node
+    Nnode       = Nlat*Nlon
+    count       = np.bincount(inode, minlength=Nnode).astype(np.float64)
+    isdata      = count > 0.
+    zdata       = np.zeros((Nfield, Nnode), dtype=np.float64)
+    for i in range(Nfield):
+        zdata[i]= np.bincount(inode, weights=ZarrIn[i, valid], minlength=Nnode)
+    zdata[:, isdata]    /= count[isdata]
+    Zout        = zdata.copy()
+    ifree       = np.where(np.logical_not(isdata))[0]
+    ifix        = np.where(isdata)[0]
+    if ifree.size > 0:
+        # the grid spacing in longitude is scaled by cos(latitude) at the center of the region
+        dx      = dlon*np.cos(np.pi*(lats[0] + lats[-1])/360.)
+        H       = _surface_operator(Nlat, Nlon, dx, dlat, tension)
+        Hff     = H[ifree, :][:, ifree]
+        Hfc     = H[ifree, :][:, ifix]
+        rhs     = -Hfc.dot(zdata[:, ifix].T)
+        lu      = scipy.sparse.linalg.splu(Hff.tocsc())
+        Zout[:, ifree]  = lu.solve(np.asarray(rhs)).T
+    Zout        = Zout.reshape(Nfield, Nlat, Nlon)
+    if single:
+        return Zout[0]
+    return Zout
+
+def gauss_filter(Zarr, lons, lats, width):
+    """
+    Gaussian filter with great circle distances (gmt grdfilter -D4 -Fg)
+    The weights are exp(-0.5*(r/s)**2) for distance r within width/2, where the conventional sigma s = width/6.
+    Weights are normalized over the nodes inside the grid, NaN nodes are ignored.
+    ======================================================================================
+    ::: input :::
+    Zarr        - gridded data, (Nlat, Nlon) or (Nfield, Nlat, Nlon)
+    lons, lats  - longitude/latitude of the grid (regular grid intervals)
+    width       - full filter width (unit - km)
+    ::: output :::
+    Zout        - filtered data, the same shape as Zarr
+    ======================================================================================
+    """
+    single      = (np.ndim(Zarr) == 2)
+    Zarr        = np.asarray(Zarr, dtype=np.float64)
+    if single:
+        Zarr    = Zarr[None, :, :]
+    Nlon        = lons.size
+    Nlat        = lats.size
+    dlon        = (lons[-1] - lons[0])/max(Nlon-1, 1)
+    rmax        = width/2.
+    sigma       = width/6.
+    isvalid     = np.isfinite(Zarr)
+    Zin         = np.where(isvalid, Zarr, 0.)
+    wvalid      = isvalid.astype(np.float64)
+    # longitude offsets within the filter radius
+    latrad      = np.radians(lats)
+    coslat_min  = max(np.cos(latrad).min(), 1e-3)
+    if Nlon > 1:
+        K       = min(Nlon - 1, int(np.ceil(rmax/(R_EARTH*np.radians(dlon)*coslat_min))))
+    else:
+        K       = 0
+    dlonrad     = np.radians(np.arange(-K, K+1)*dlon)
+    Zout        = np.zeros(Zarr.shape, dtype=np.float64)
+    for i in range(Nlat):
+        num     = np.zeros((Zarr.shape[0], Nlon), dtype=np.float64)
+        den     = np.zeros((Zarr.shape[0], Nlon), dtype=np.float64)
+        for j in range(Nlat):
+            if abs(latrad[i] - latrad[j])*R_EARTH > rmax:
+                continue
+            # great circle distances between (lats[i], 0) and (lats[j], k*dlon)
+            cosd    = np.sin(latrad[i])*np.sin(latrad[j]) + np.cos(latrad[i])*np.cos(latrad[j])*np.cos(dlonrad)
+            dist    = R_EARTH*np.arccos(np.clip(cosd, -1., 1.))
+            weight  = np.exp(-0.5*(dist/sigma)**2)
+            weight[dist > rmax] = 0.
+            if not np.any(weight > 0.):
+                continue
+            num     += correlate1d(Zin[:, j, :], weight, axis=-1, mode='constant', cval=0.)
+            den     += correlate1d(wvalid[:, j, :], weight, axis=-1, mode='constant', cval=0.)
+        Zout[:, i, :]   = np.where(den > 0., num/np.where(den > 0., den, 1.), np.nan)
+    if single:
+        return Zout[0]
+    return Zout
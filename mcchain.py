@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+Module for reading/writing the Monte Carlo chain outputs (mc_inv.*) of vprofile.vprofile1d
+
+The chain file (suffix .mcc) is a versioned, uncompressed columnar format:
+    magic       - 8 bytes, b'MCCHAIN\\x00'
+    version     - uint32, little endian
+    hdrlen      - uint32, little endian, length of the header in bytes
+    header      - JSON string, number of rows, model type and the list of columns (name, dtype, shape, offset)
+    data        - the columns, each stored contiguously in row-major order starting at a 64-byte aligned offset
+Each column is a named array with the number of rows as the first dimension, e.g. the acceptance flag (nrows),
+the misfit (nrows), the model parameters (nrows, npara) or the predicted dispersion curves (nrows, nper).
+Columns are memory-mapped on access, so a reader only touches the columns (and rows) it actually uses.
+Besides the model and prediction columns, a chain file stores summary columns for the selection of the finally accepted models:
+    misfit_order    - indices of the runs sorted by misfit
+    maxdev_*        - maximum normalized deviation of the predicted dispersion curve from the observed data (see get_max_dev)
+The optional stage timers and event counters of the chain (see mcstats) are stored in the header as 'stats'.
+The old npz outputs (np.savez_compressed, arr_0 ... arr_3) can be read through the same interface (chainfile).
+
+The chains of many grid points can also be consolidated into one HDF5 store (chainstore):
+    /grd_pts/<grd_id>/chain/<column>    - the columns of the chain, uncompressed and chunked by row
+    /grd_pts/<grd_id>/files/<name>      - raw bytes of the small output files of the grid point (empty files as empty uint8 arrays)
+                                            (mc_data npz file, initial model and predicted data txt files)
+    /grd_pts/<grd_id>/chain.attrs['stats']
+                                        - stage timers and event counters of the chain (JSON string), if any
+    /index                              - index table, one row per grid point
+                                            (grd_id, mtype, nrows, npara, nacc, min_misfit, mean_misfit)
+A grid point is added to the index only after all its data are written, readers look up grid points in the index only.
+The store can not be read and appended at the same time (HDF5 file locking), see chainstore.
+
+:Copyright:
+    Author: Lili Feng
+    Graduate Research Assistant
+    CIEI, Department of Physics, University of Colorado Boulder
+    email: lili.feng@colorado.edu
+"""
+import numpy as np
+import os
+import json
+import struct
+import h5py
+import mcstats
+from io import BytesIO
+
+MAGIC           = b'MCCHAIN\x00'
+VERSION         = 1
+SUFFIX          = '.mcc'
+ALIGN           = 64
+# columns of the model array (outmodarr in vprofile), 'paraval' spans npara columns
+MODEL_COLUMNS   = {'iso': ['flag', 'iacc', 'paraval', 'L', 'misfit', 'rf_L', 'rf_misfit', 'disp_L', 'disp_misfit', 'time'],
+                   'vti': ['flag', 'iacc', 'paraval', 'L', 'misfit', 'ray_L', 'ray_misfit', 'lov_L', 'lov_misfit', 'time']}
+# prediction blocks, in the same order as arr_1, arr_2 ... of the npz outputs
+PRED_COLUMNS    = {'iso': ['disppre_ph', 'disppre_gr', 'rfpre'],
+                   'vti': ['disppre_ray', 'disppre_lov']}
+# summary columns, maxdev_* only exist if the corresponding data are used in the inversion
+SUMMARY_COLUMNS = {'iso': ['misfit_order', 'maxdev_ph', 'maxdev_gr'],
+                   'vti': ['misfit_order', 'maxdev_ray', 'maxdev_lov']}
+
+# index table of the consolidated store
+INDEX_DTYPE     = np.dtype([('grd_id', 'S32'), ('mtype', 'S4'), ('nrows', np.int64), ('npara', np.int64), ('nacc', np.int64),
+                    ('min_misfit', np.float64), ('mean_misfit', np.float64)])
+
+def _align(n):
+    return (n + ALIGN - 1)//ALIGN*ALIGN
+
+def _model_slices(mtype, npara):
+    """
+    get the column slices of the model array for each model column
+    """
+    slices      = {}
+    icol        = 0
+    for name in MODEL_COLUMNS[mtype]:
+        if name == 'paraval':
+            slices[name]    = slice(icol, icol+npara)
+            icol            += npara
+        else:
+            slices[name]    = icol
+            icol            += 1
+    return slices
+
+def get_inv_fname(datadir, pfx):
+    """
+    get the name of the chain file for a given prefix (grid point id/station id) in datadir
+    the chain file (.mcc) is preferred, the old npz file name is returned if it exists and the chain file does not
+    """
+    outfname    = datadir+'/mc_inv.'+pfx+SUFFIX
+    npzfname    = datadir+'/mc_inv.'+pfx+'.npz'
+    if not os.path.isfile(outfname) and os.path.isfile(npzfname):
+        return npzfname
+    return outfname
+
+def is_store(datadir):
+    """
+    check if datadir is a consolidated chain store (chainstore) instead of a directory
+    """
+    return os.path.isfile(datadir) and h5py.is_hdf5(datadir)
+
+def open_chain(infname):
+    """
+    open a chain, infname can be a file name or an opened chain (chainfile/chaingroup), which is returned directly
+    """
+    if isinstance(infname, chainfile):
+        return infname
+    return chainfile(infname)
+
+def get_grid_stats(datadir):
+    """
+    get the stage timers and event counters of each grid point, sum with mcstats.merge_stats for the campaign
+    ======================================================================================
+    ::: input :::
+    datadir     - directory of the chain files (mc_inv.<grd_id>.mcc) or a consolidated chain store
+    ::: output :::
+    statsdict   - dictionary of statistics (grd_id: stats), grid points without statistics are skipped
+    ======================================================================================
+    """
+    statsdict   = {}
+    if is_store(datadir):
+        with chainstore(datadir) as store:
+            for grd_id in store.keys():
+                stats   = store.get_chain(grd_id).stats
+                if stats is not None:
+                    statsdict[grd_id]   = stats
+        return statsdict
+    for fname in os.listdir(datadir):
+        if not (fname.startswith('mc_inv.') and fname.endswith(SUFFIX)):
+            continue
+        chain   = chainfile(datadir+'/'+fname)
+        if chain.stats is not None:
+            statsdict[fname[len('mc_inv.'):-len(SUFFIX)]]   = chain.stats
+        chain.close()
+    return statsdict
+
+def get_max_dev(predarr, obs, std):
+    """
+    get the maximum normalized deviation of the predicted data from the observed data for each model
+        max(|predarr - obs|/std) over all periods
+    a model satisfies obs - stdfactor*std <= predarr <= obs + stdfactor*std if and only if the deviation <= stdfactor,
+    the deviation is inf if any of the predicted data is NaN
+    ======================================================================================
+    ::: input :::
+    predarr     - predicted data (nrows, npts)
+    obs, std    - observed data and uncertainties (npts)
+    ::: output :::
+    maxdev      - maximum normalized deviation (nrows)
+    ======================================================================================
+    """
+    predarr     = np.asarray(predarr)
+    if predarr.shape[1] == 0:
+        return np.zeros(predarr.shape[0], dtype=np.float64)
+    obs         = np.asarray(obs)
+    std         = np.asarray(std)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dev     = np.abs(predarr - obs)/std
+    # zero uncertainty and exact prediction (0/0), accepted as obs - 0 <= predarr <= obs + 0
+    dev[(predarr == obs) & (std == 0.)] = 0.
+    # NaN predictions (failed forward computations) are always rejected
+    dev[np.isnan(dev)]  = np.inf
+    return dev.max(axis=1)
+
+def write_chain(outfname, modarr, predarrs, mtype='iso', summary={}, stats=None):
+    """
+    write the outputs of a Monte Carlo chain
+    ======================================================================================
+    ::: input :::
+    outfname    - output file name
+    modarr      - model array (nrows, npara+9), see MODEL_COLUMNS for the columns
+    predarrs    - list of prediction arrays (nrows, npts), see PRED_COLUMNS for the names
+    mtype       - model type ('iso' or 'vti')
+    summary     - dictionary of maxdev_* summary columns, misfit_order is always computed
+    stats       - stage timers and event counters of the chain (mcstats.chainstats.get_stats), None if not collected
+    ======================================================================================
+    """
+    nrows       = modarr.shape[0]
+    npara       = modarr.shape[1] - 9
+    slices      = _model_slices(mtype, npara)
+    columns     = []
+    for name in MODEL_COLUMNS[mtype]:
+        columns.append((name, modarr[:, slices[name]]))
+    if len(predarrs) != len(PRED_COLUMNS[mtype]):
+        raise ValueError('Number of prediction arrays should be '+str(len(PRED_COLUMNS[mtype]))+' for '+mtype+' model!')
+    for name, predarr in zip(PRED_COLUMNS[mtype], predarrs):
+        columns.append((name, predarr.reshape(nrows, -1)))
+    columns.append(('misfit_order', np.argsort(modarr[:, slices['misfit']], kind='mergesort')))
+    for name in SUMMARY_COLUMNS[mtype][1:]:
+        if name in summary:
+            columns.append((name, np.asarray(summary[name], dtype=np.float64)))
+    header      = {'nrows': nrows, 'npara': npara, 'mtype': mtype, 'columns': []}
+    if stats is not None:
+        header['stats'] = stats
+    offset      = 0
+    for name, arr in columns:
+        arr     = np.asarray(arr)
+        header['columns'].append({'name': name, 'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset})
+        offset  = _align(offset + arr.nbytes)
+    hdrstr      = json.dumps(header).encode('ascii')
+    datastart   = _align(len(MAGIC) + 8 + len(hdrstr))
+    # write to a temporary file first, readers never see a partially written chain file
+    tmpfname    = outfname+'.tmp'
+    with open(tmpfname, 'wb') as fid:
+        fid.write(MAGIC)
+        fid.write(struct.pack('<II', VERSION, len(hdrstr)))
+        fid.write(hdrstr)
+        for (name, arr), col in zip(columns, header['columns']):
+            fid.seek(datastart + col['offset'])
+            fid.write(np.ascontiguousarray(arr, dtype=np.dtype(col['dtype'])).tobytes())
+        # pad the last column so that all the columns are inside the file
+        fid.truncate(datastart + offset)
+    os.rename(tmpfname, outfname)
+    return
+
+def merge_chains(infnames, outfname, mtype='iso', remove=True):
+    """
+    merge the outputs of several chains into one chain file, the rows are concatenated in the order of infnames
+    """
+    modlst      = []
+    predlst     = [[] for name in PRED_COLUMNS[mtype]]
+    devlst      = dict([(name, []) for name in SUMMARY_COLUMNS[mtype][1:]])
+    statslst    = []
+    for infname in infnames:
+        chain   = chainfile(infname)
+        modlst.append(chain.get_model_array())
+        for i, name in enumerate(PRED_COLUMNS[mtype]):
+            predlst[i].append(np.array(chain[name]))
+        for name in devlst:
+            if name in chain:
+                devlst[name].append(np.array(chain[name]))
+        statslst.append(chain.stats)
+        chain.close()
+    # the summary columns are kept only if all the chains have them
+    summary     = dict([(name, np.concatenate(devlst[name])) for name in devlst if len(devlst[name]) == len(infnames)])
+    # the statistics are summed over the chains that have them
+    stats       = None
+    if any([instats is not None for instats in statslst]):
+        stats   = mcstats.merge_stats(statslst)
+    write_chain(outfname, np.concatenate(modlst, axis=0), [np.concatenate(predarrs, axis=0) for predarrs in predlst], mtype=mtype,\
+                summary=summary, stats=stats)
+    if remove:
+        for infname in infnames:
+            os.remove(infname)
+    return
+
+class chainfile(object):
+    """
+    An object for reading the outputs of a Monte Carlo chain, the columns are loaded lazily
+    =====================================================================================================================
+    ::: parameters :::
+    fname           - file name, a chain file (.mcc) or an old npz file
+    version         - format version (0 for npz files)
+    mtype           - model type ('iso' or 'vti')
+    nrows           - number of rows (runs)
+    npara           - number of model parameters
+    stats           - stage timers and event counters (see mcstats), None if not collected
+    =====================================================================================================================
+    ::: example :::
+    chain   = mcchain.chainfile('mc_inv.BOTH.mcc')
+    misfit  = chain['misfit']           # (nrows), memory-mapped
+    paraval = chain['paraval'][ind, :]  # only the rows in ind are read
+    """
+    def __init__(self, fname):
+        self.fname      = fname
+        self._npz       = None
+        self._modarr    = None
+        self._cache     = {}
+        with open(fname, 'rb') as fid:
+            magic       = fid.read(len(MAGIC))
+            if magic == MAGIC:
+                self.version, hdrlen\
+                        = struct.unpack('<II', fid.read(8))
+                if self.version > VERSION:
+                    raise ValueError('Unsupported chain file version: '+str(self.version)+', '+fname)
+                header  = json.loads(fid.read(hdrlen).decode('ascii'))
+        if magic == MAGIC:
+            self.mtype  = str(header['mtype'])
+            self.nrows  = int(header['nrows'])
+            self.npara  = int(header['npara'])
+            self.stats  = header.get('stats', None)
+            datastart   = _align(len(MAGIC) + 8 + hdrlen)
+            self._columns   = {}
+            for col in header['columns']:
+                self._columns[str(col['name'])] = (np.dtype(str(col['dtype'])), tuple(col['shape']), datastart + col['offset'])
+            self._keys      = [name for name in MODEL_COLUMNS[self.mtype] + PRED_COLUMNS[self.mtype] + SUMMARY_COLUMNS[self.mtype]\
+                                if name in self._columns]
+        else:
+            # old npz outputs
+            self.version    = 0
+            self._npz       = np.load(fname)
+            Narr            = len(self._npz.files)
+            self.mtype      = 'iso' if Narr == 4 else 'vti'
+            self._modarr    = self._npz['arr_0']
+            self.nrows      = self._modarr.shape[0]
+            self.npara      = self._modarr.shape[1] - 9
+            self.stats      = None
+            self._keys      = MODEL_COLUMNS[self.mtype] + PRED_COLUMNS[self.mtype]
+        return
+
+    def keys(self):
+        return list(self._keys)
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def __getitem__(self, name):
+        if not name in self._keys:
+            raise KeyError('No column named '+str(name)+' in '+self.fname)
+        if name in self._cache:
+            return self._cache[name]
+        if self._npz is not None:
+            if name in MODEL_COLUMNS[self.mtype]:
+                arr     = self._modarr[:, _model_slices(self.mtype, self.npara)[name]]
+            else:
+                arr     = self._npz['arr_'+str(PRED_COLUMNS[self.mtype].index(name)+1)]
+        else:
+            dtype, shape, offset\
+                        = self._columns[name]
+            if np.prod(shape) == 0:
+                arr     = np.zeros(shape, dtype=dtype)
+            else:
+                arr     = np.memmap(self.fname, dtype=dtype, mode='r', offset=offset, shape=shape)
+        self._cache[name]   = arr
+        return arr
+
+    def get_model_array(self):
+        """
+        get the full model array (nrows, npara+9), the same as arr_0 of the npz outputs
+        """
+        if self._modarr is not None:
+            return self._modarr
+        slices      = _model_slices(self.mtype, self.npara)
+        modarr      = np.zeros((self.nrows, self.npara+9), dtype=np.float64)
+        for name in MODEL_COLUMNS[self.mtype]:
+            modarr[:, slices[name]] = self[name]
+        return modarr
+
+    def close(self):
+        self._cache = {}
+        if self._npz is not None:
+            self._npz.close()
+        return
+
+class chaingroup(chainfile):
+    """
+    An object for reading a chain stored in a group of the consolidated store (chainstore)
+    A column is read as a whole on the first access, the columns that are never accessed are not read.
+    """
+    def __init__(self, grp):
+        self.fname      = grp.file.filename+':'+grp.name
+        self._grp       = grp
+        self._npz       = None
+        self._modarr    = None
+        self._cache     = {}
+        self.version    = int(grp.attrs['version'])
+        self.mtype      = str(grp.attrs['mtype'])
+        self.nrows      = int(grp.attrs['nrows'])
+        self.npara      = int(grp.attrs['npara'])
+        self.stats      = json.loads(grp.attrs['stats']) if 'stats' in grp.attrs else None
+        self._keys      = [name for name in MODEL_COLUMNS[self.mtype] + PRED_COLUMNS[self.mtype] + SUMMARY_COLUMNS[self.mtype]\
+                            if name in grp]
+        return
+
+    def __getitem__(self, name):
+        if not name in self._keys:
+            raise KeyError('No column named '+str(name)+' in '+self.fname)
+        if not name in self._cache:
+            self._cache[name]   = self._grp[name][()]
+        return self._cache[name]
+
+    def load(self):
+        """
+        read all the columns, the chain can then be used after the store is closed
+        """
+        for name in self._keys:
+            self[name]
+        return self
+
+    def close(self):
+        self._cache = {}
+        return
+
+class chainstore(object):
+    """
+    An object for the consolidated HDF5 store of the chains of many grid points
+    =====================================================================================================================
+    ::: parameters :::
+    fname           - file name of the store
+    mode            - 'r' for readers, 'a' for the writer
+    =====================================================================================================================
+    ::: NOTE :::
+    Only one process should open the store with mode = 'a'. The writer (the MC driver) opens the store for each append only.
+    With HDF5 file locking, the store can NOT be opened with mode = 'a' while it is opened by a reader (and vice versa),
+    the open raises IOError. The MC driver retries the append and leaves the outputs in its output directory if the store
+    stays locked (see surfdbase._store_mc_outputs), so readers should open the store briefly (with statement) during a campaign.
+    The chain returned by get_chain is only readable while the store is opened, unless it is loaded (chaingroup.load).
+    """
+    def __init__(self, fname, mode='r'):
+        self.fname      = fname
+        self.mode       = mode
+        self.h5file     = h5py.File(fname, mode)
+        self._keys      = None
+        if mode != 'r' and not 'index' in self.h5file:
+            self.h5file.create_dataset('index', shape=(0,), maxshape=(None,), dtype=INDEX_DTYPE, chunks=(1024,))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.h5file.close()
+        return
+
+    def get_index(self):
+        """
+        get the index table as a structured array, see INDEX_DTYPE
+        """
+        if not 'index' in self.h5file:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return self.h5file['index'][()]
+
+    def keys(self):
+        if self._keys is None:
+            self._keys  = [str(grd_id) for grd_id in self.get_index()['grd_id']]
+            self._keyset= set(self._keys)
+        return self._keys
+
+    def __contains__(self, grd_id):
+        self.keys()
+        return grd_id in self._keyset
+
+    def append(self, grd_id, chainfname, fnames=[], remove=True):
+        """
+        append the outputs of a grid point to the store
+        ======================================================================================
+        ::: input :::
+        grd_id      - grid point id
+        chainfname  - chain file name (.mcc or npz)
+        fnames      - other output files of the grid point, stored as raw bytes with their base names
+        remove      - remove the input files after they are stored
+        ======================================================================================
+        """
+        if self.mode == 'r':
+            raise ValueError('The chain store is opened as read-only: '+self.fname)
+        if grd_id in self:
+            raise KeyError('Grid point already exists in the store: '+grd_id)
+        if len(grd_id) > INDEX_DTYPE['grd_id'].itemsize:
+            raise ValueError('Grid point id is too long: '+grd_id)
+        # the group may be left by an interrupted append, it is not in the index
+        grdpath     = 'grd_pts/'+grd_id
+        if grdpath in self.h5file:
+            del self.h5file[grdpath]
+        grp         = self.h5file.create_group(grdpath)
+        chain       = chainfile(chainfname)
+        chain_grp   = grp.create_group('chain')
+        chain_grp.attrs.create(name='version', data=VERSION)
+        chain_grp.attrs.create(name='mtype', data=chain.mtype)
+        chain_grp.attrs.create(name='nrows', data=chain.nrows)
+        chain_grp.attrs.create(name='npara', data=chain.npara)
+        if chain.stats is not None:
+            chain_grp.attrs['stats']    = json.dumps(chain.stats)
+        for name in chain.keys():
+            arr     = np.asarray(chain[name])
+            if arr.size == 0:
+                chain_grp.create_dataset(name=name, data=arr)
+                continue
+            # about 1 MB for each chunk of rows
+            nchunk  = max(1, min(arr.shape[0], int(2**20/max(1, arr.nbytes/arr.shape[0]))))
+            chain_grp.create_dataset(name=name, data=arr, chunks=(nchunk,)+arr.shape[1:])
+        flag        = np.asarray(chain['flag'])
+        misfit      = np.asarray(chain['misfit'])
+        ind_acc     = flag == 1.
+        nacc        = np.where(ind_acc)[0].size
+        min_misfit  = misfit[ind_acc + (flag == -1.)].min() if np.any(flag != 0.) else np.nan
+        mean_misfit = misfit[ind_acc].mean() if nacc > 0 else np.nan
+        chain.close()
+        files_grp   = grp.create_group('files')
+        for fname in fnames:
+            with open(fname, 'rb') as fid:
+                content = fid.read()
+            # an empty opaque dtype is not allowed, empty files are stored as empty uint8 arrays
+            if len(content) == 0:
+                files_grp.create_dataset(name=os.path.basename(fname), data=np.zeros(0, dtype=np.uint8))
+            else:
+                files_grp.create_dataset(name=os.path.basename(fname), data=np.void(content))
+        # add the grid point to the index after all the data are written
+        index       = self.h5file['index']
+        Nindex      = index.shape[0]
+        index.resize((Nindex+1,))
+        index[Nindex]   = (grd_id, chain.mtype, chain.nrows, chain.npara, nacc, min_misfit, mean_misfit)
+        self.h5file.flush()
+        self._keys      = None
+        if remove:
+            for fname in [chainfname] + list(fnames):
+                os.remove(fname)
+        return
+
+    def get_chain(self, grd_id):
+        """
+        get the chain of a grid point, the returned object has the same interface as chainfile
+        """
+        if not grd_id in self:
+            raise KeyError('No grid point in the store: '+grd_id)
+        return chaingroup(self.h5file['grd_pts/'+grd_id+'/chain'])
+
+    def get_file(self, grd_id, name):
+        """
+        get a stored output file of a grid point as a file object, None if the file does not exist
+        """
+        if not grd_id in self:
+            raise KeyError('No grid point in the store: '+grd_id)
+        try:
+            dset    = self.h5file['grd_pts/'+grd_id+'/files/'+name]
+        except KeyError:
+            return None
+        # opaque scalar, or empty uint8 array for an empty file
+        return BytesIO(dset[()].tostring())
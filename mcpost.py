@@ -8,16 +8,15 @@ Module for results and postprocessing of MC inversion
     CIEI, Department of Physics, University of Colorado Boulder
     email: lili.feng@colorado.edu
 """
-import vmodel, modparam, data, vprofile
+import vmodel, modparam, data, vprofile, mcchain
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter
-import matplotlib
 import copy
+# numba is already loaded by data/modparam, it is used here for the cached _get_running_min kernel
 import numba
 import os
 
 def to_percent(y, position):
+    import matplotlib
     # Ignore the passed in position. This has the effect of scaling the default
     # tick locations.
     s = str(100. * y)
@@ -27,10 +26,10 @@ def to_percent(y, position):
     else:
         return s + '%'
     
-@numba.jit(numba.float64[:](numba.float64[:]))
+@numba.jit(numba.float64[:](numba.float64[:]), nopython=True, cache=True)
 def _get_running_min(data):
     N       = data.size
-    outdata = np.zeros(N, dtype=float)
+    outdata = np.zeros(N, dtype=np.float64)
     for i in range(N):
         outdata[i]  = data[:(i+1)].min()
     return outdata
@@ -51,6 +50,7 @@ class postvpr(object):
     ::: parameters :::
     : --- arrays --- :
     invdata         - data arrays storing inversion results
+    paraval_arr     - model parameters of all the runs (numbrun, npara), memory-mapped from the chain file
     disppre_ph/gr   - predicted phase/group dispersion
     rfpre           - object storing 1D model
     ind_acc         - index array indicating accepted models
@@ -102,19 +102,24 @@ class postvpr(object):
     
     def read_inv_data(self, infname, verbose=True, thresh_misfit=None, Nmax=None, Nmin=None):
         """
-        read inversion results from an input compressed npz file
+        read inversion results from an input chain file (mcchain, .mcc) or an old compressed npz file
+        infname can also be an opened chain, e.g. a chain in the consolidated store (mcchain.chainstore.get_chain)
+        only the acceptance flag and misfit columns are read here,
+        the model parameters and the predictions are memory-mapped and loaded on access
         """
-        inarr           = np.load(infname)
-        self.invdata    = inarr['arr_0']
-        self.disppre_ph = inarr['arr_1']
-        self.disppre_gr = inarr['arr_2']
-        self.rfpre      = inarr['arr_3']
+        self.chain      = mcchain.open_chain(infname)
+        self._invdata   = None
+        self.paraval_arr= self.chain['paraval']
+        self.disppre_ph = self.chain['disppre_ph']
+        self.disppre_gr = self.chain['disppre_gr']
+        self.rfpre      = self.chain['rfpre']
         # 
-        self.numbrun    = self.invdata.shape[0]
-        self.npara      = self.invdata.shape[1] - 9
-        self.ind_acc    = self.invdata[:, 0] == 1.
-        self.ind_rej    = self.invdata[:, 0] == -1.
-        self.misfit     = self.invdata[:, self.npara+3]
+        self.numbrun    = self.chain.nrows
+        self.npara      = self.chain.npara
+        flag            = np.asarray(self.chain['flag'])
+        self.ind_acc    = flag == 1.
+        self.ind_rej    = flag == -1.
+        self.misfit     = np.array(self.chain['misfit'])
         self.min_misfit = self.misfit[self.ind_acc + self.ind_rej].min()
         self.ind_min    = np.where(self.misfit == self.min_misfit)[0][0]
         self.get_thresh_model(thresh_misfit = thresh_misfit, Nmax = Nmax, Nmin = Nmin)
@@ -130,86 +135,97 @@ class postvpr(object):
             print 'minimum misfit = '+ str(self.min_misfit)
         return
     
+    @property
+    def invdata(self):
+        """
+        model array of all the runs (numbrun, npara+9), assembled from the chain columns on first access
+        """
+        if self._invdata is None:
+            self._invdata   = self.chain.get_model_array()
+        return self._invdata
+    
+    @invdata.setter
+    def invdata(self, value):
+        self._invdata   = value
+    
+    def get_misfit_order(self):
+        """
+        get the indices of the runs sorted by misfit, the summary column stored with the chain is used if available
+        """
+        if 'misfit_order' in self.chain:
+            return np.asarray(self.chain['misfit_order'])
+        return np.argsort(self.misfit, kind='mergesort')
+    
+    def get_maxdev(self):
+        """
+        get the maximum normalized deviation of the predicted dispersion from the observed data for each run
+            max(|C_predict - C_obs|/std) over all periods of the dispersion data in self.data
+        the summary columns stored with the chain are used if available, None is returned if there is no dispersion data
+        """
+        maxdev          = None
+        for name, npts, prename, obs, std in [
+                    ('maxdev_ph', self.data.dispR.npper, 'disppre_ph', self.data.dispR.pvelo, self.data.dispR.stdpvelo),
+                    ('maxdev_gr', self.data.dispR.ngper, 'disppre_gr', self.data.dispR.gvelo, self.data.dispR.stdgvelo)]:
+            if npts == 0:
+                continue
+            if name in self.chain:
+                dev     = np.asarray(self.chain[name])
+            else:
+                dev     = mcchain.get_max_dev(getattr(self, prename), obs, std)
+            maxdev      = dev if maxdev is None else np.maximum(maxdev, dev)
+        return maxdev
+    
     def get_thresh_model(self, thresh_misfit=None, Nmax=None, Nmin=None):
         """
         get the index for the finalized accepted model
         adaptively change thresh and stdfactor to make accpeted model around a specified value(Nmin ~ Nmax)
+        the number of models for a threshold value is found by binary search in the sorted misfits of the accepted models,
+        and C_predict within [C_obs - stdfactor*std, C_obs + stdfactor*std] is checked with the maximum normalized deviation
         """
         if thresh_misfit is None:
             thresh_val  = self.min_misfit*self.factor+ self.thresh
         else:
             thresh_val  = thresh_misfit
-        ind_thresh      = self.ind_acc*(self.misfit<= thresh_val)
-        # ind_thresh      = (self.misfit<= thresh_val)
+        # accepted models sorted by misfit
+        order           = self.get_misfit_order()
+        acc_order       = order[self.ind_acc[order]]
+        acc_misfit      = self.misfit[acc_order]
         # added 09/07/2018
         # while loop to adjust threshold misfit value according to Nmax/Nmin
         if Nmax is not None:
-            Nacc                = np.where(self.ind_acc)[0].size
+            Nacc                = acc_order.size
             if Nmax > Nacc:
                 print 'WARNING: Nmax is reset from '+str(Nmax)+' to '+str(Nacc)
                 Nmax            = Nacc
-            temp_ind            = np.where(ind_thresh)[0]
-            while (temp_ind.size > Nmax):
+            while (np.searchsorted(acc_misfit, thresh_val, side='right') > Nmax):
                 thresh_val      -= 0.05
-                ind_thresh      = self.ind_acc*(self.misfit<= thresh_val)
-                temp_ind        = np.where(ind_thresh)[0]
         if Nmin is not None:
-            temp_ind            = np.where(ind_thresh)[0]
-            while (temp_ind.size < Nmin):
+            while (np.searchsorted(acc_misfit, thresh_val, side='right') < Nmin):
                 thresh_val      += 0.05
-                ind_thresh      = self.ind_acc*(self.misfit<= thresh_val)
-                temp_ind        = np.where(ind_thresh)[0]
         self.thresh_val         = thresh_val
-        ind_thresh_temp         = ind_thresh.copy()
+        ind_thresh              = acc_order[:np.searchsorted(acc_misfit, thresh_val, side='right')]
         if self.stdfactor is not None:
-            if self.data.dispR.npper > 0:
-                cmax    = self.data.dispR.pvelo + self.stdfactor*self.data.dispR.stdpvelo
-                cmin    = self.data.dispR.pvelo - self.stdfactor*self.data.dispR.stdpvelo
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_ph <= cmax, axis=1)
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_ph >= cmin, axis=1)
-            if self.data.dispR.ngper > 0:
-                umax    = self.data.dispR.gvelo + self.stdfactor*self.data.dispR.stdgvelo
-                umin    = self.data.dispR.gvelo - self.stdfactor*self.data.dispR.stdgvelo
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_gr <= umax, axis=1)
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_gr >= umin, axis=1)
-            # added 09/07/2018
-            # while loop to adjust threshold misfit value according to Nmax/Nmin
-            if Nmin is not None:
-                temp_ind= np.where(ind_thresh)[0]
-                while (temp_ind.size < Nmin):
-                    self.stdfactor  += 0.5
-                    ind_thresh      = ind_thresh_temp.copy()
-                    if self.data.dispR.npper > 0:
-                        cmax    = self.data.dispR.pvelo + self.stdfactor*self.data.dispR.stdpvelo
-                        cmin    = self.data.dispR.pvelo - self.stdfactor*self.data.dispR.stdpvelo
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_ph <= cmax, axis=1)
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_ph >= cmin, axis=1)
-                    if self.data.dispR.ngper > 0:
-                        umax    = self.data.dispR.gvelo + self.stdfactor*self.data.dispR.stdgvelo
-                        umin    = self.data.dispR.gvelo - self.stdfactor*self.data.dispR.stdgvelo
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_gr <= umax, axis=1)
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_gr >= umin, axis=1)
-                    temp_ind        = np.where(ind_thresh)[0]
-        self.ind_thresh = np.where(ind_thresh)[0]
+            maxdev              = self.get_maxdev()
+            if maxdev is not None:
+                # added 09/07/2018
+                # while loop to adjust stdfactor according to Nmin
+                if Nmin is not None:
+                    dev_sorted  = np.sort(maxdev[ind_thresh])
+                    while (np.searchsorted(dev_sorted, self.stdfactor, side='right') < Nmin):
+                        self.stdfactor  += 0.5
+                ind_thresh      = ind_thresh[maxdev[ind_thresh] <= self.stdfactor]
+        self.ind_thresh = np.sort(ind_thresh)
         return
     
     def get_paraval(self):
         """
         get the parameter array for the minimum misfit model and the average of the accepted model
         """
-        self.min_paraval    = self.invdata[self.ind_min, 2:(self.npara+2)]
-        self.avg_paraval    = (self.invdata[self.ind_thresh, 2:(self.npara+2)]).mean(axis=0)
+        self.min_paraval    = np.array(self.paraval_arr[self.ind_min, :])
+        self.avg_paraval    = (self.paraval_arr[self.ind_thresh, :]).mean(axis=0)
         # uncertainties, note that crustal thickness is determined by the last two parameters
         # thus, the last element of the sem and std array is for crustal thickness, NOT the crustal thickness excluding sediments
-        temp_paraval        = self.invdata[self.ind_thresh, 2:(self.npara+2)]
+        temp_paraval        = np.array(self.paraval_arr[self.ind_thresh, :])
         temp_paraval[:, -1] += temp_paraval[:, -2]
         self.sem_paraval    = (temp_paraval).std(axis=0) / np.sqrt(temp_paraval.shape[0])
         self.std_paraval    = (temp_paraval).std(axis=0)
@@ -226,7 +242,7 @@ class postvpr(object):
         vs_ensemble = np.zeros([self.ind_thresh.size, Nz])
         i           = 0
         for index in self.ind_thresh:
-            paraval = self.invdata[index, 2:(self.npara+2)]
+            paraval = np.array(self.paraval_arr[index, :])
             vel_mod = vmodel.model1d()
             if self.waterdepth > 0.:
                 vel_mod.get_para_model(paraval = paraval, waterdepth=self.waterdepth, vpwater=self.vpwater, nmod=4, \
@@ -253,7 +269,7 @@ class postvpr(object):
         if lon < 0.:
             lon += 360.
         import mcpost_vti
-        infname     = pfx + '/mc_inv.'+str(lon)+'_'+str(lat)+'.npz'
+        infname     = mcchain.get_inv_fname(pfx, str(lon)+'_'+str(lat))
         vpr         = mcpost_vti.postvpr(waterdepth=-0., factor=1., thresh=0.5)
         vpr.read_inv_data(infname = infname, verbose=True)
         vpr.get_paraval()
@@ -367,7 +383,7 @@ class postvpr(object):
         
     def read_data(self, infname):
         """
-        read observed data from an input npz file
+        read observed data from an input npz file (file name or file object, e.g. mcchain.chainstore.get_file)
         """
         inarr           = np.load(infname)
         index           = inarr['arr_0']
@@ -457,15 +473,16 @@ class postvpr(object):
         self.avg_misfit = self.vprfwrd.data.misfit
         return
     
-    def run_prior_fwrd(self, workingdir = './prior_sampling', isconstrt=True,
-            step4uwalk=1500, numbrun=150000, subsize=1000, nprocess=None, overwrite=False):
+    def run_prior_fwrd(self, workingdir = './prior_sampling', isconstrt=True, numbrun=150000, nbatch=10000, overwrite=False):
         """
         run and store sampled models from prior distribution
+        the models are drawn directly from the prior distribution in batches (vprofile1d.mc_prior), no MC chain is run
         """
-        invfname        = workingdir+'/mc_inv.' + self.code+'.npz'
+        invfname        = mcchain.get_inv_fname(workingdir, self.code)
         if not os.path.isfile(invfname) or overwrite:
-            self.vprfwrd.mc_joint_inv_iso_mp(outdir = workingdir, wdisp=-1., pfx=self.code, isconstrt=isconstrt,\
-                step4uwalk = step4uwalk, numbrun = numbrun, savedata=True, subsize=subsize, nprocess=nprocess)
+            self.vprfwrd.mc_prior(outdir = workingdir, mtype='iso', isconstrt=isconstrt, pfx=self.code,\
+                numbrun = numbrun, nbatch = nbatch)
+            invfname    = mcchain.get_inv_fname(workingdir, self.code)
         vpr             = postvpr(waterdepth = self.waterdepth)
         vpr.read_inv_data(infname = invfname, verbose=False)
         vpr.get_paraval()
@@ -488,6 +505,7 @@ class postvpr(object):
         assemrf - plot the receiver functions corresponding to the assemble of accepted models or not 
         ==============================================================================================
         """
+        import matplotlib.pyplot as plt
         plt.figure()
         ax  = plt.subplot()
         if assemrf:
@@ -526,6 +544,7 @@ class postvpr(object):
         assemdisp   - plot the dispersion curves corresponding to the assemble of accepted models or not 
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[18, 9.6])
         ax  = plt.subplot()
         if assemdisp:
@@ -621,6 +640,7 @@ class postvpr(object):
         realvpr     - plot the real models or not, used for synthetic test only
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[8.6, 9.6])
         ax  = plt.subplot()
         if assemvpr:
@@ -677,6 +697,7 @@ class postvpr(object):
         return
     
     def plot_ensemble(self, title='Vs profile', savefig=False, showfig=True, aspectratio=2., xlabel='Vsv (km/sec)'):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[5.6, 9.6])
         ax  = plt.subplot()
         plt.plot(self.vs_upper_bound, self.zArr_ensemble, 'k-', lw=2)
@@ -709,6 +730,7 @@ class postvpr(object):
         return
     
     def plot_ensemble_2(self, title='Vs profile', savefig=False, showfig=True, aspectratio=2.):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[5.6, 9.6])
         ax  = plt.subplot()
         plt.plot(self.vs_upper_bound, self.zArr_ensemble, 'k-', lw=2, alpha = 0.5)
@@ -762,6 +784,8 @@ class postvpr(object):
         xlabel  - x axis label for the figure
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import FuncFormatter
         
         if pindex == -1:
             paraval = (self.invdata[self.ind_thresh, 2:(self.npara+2)])[:, pindex] + (self.invdata[self.ind_thresh, 2:(self.npara+2)])[:, -2]
@@ -821,6 +845,8 @@ class postvpr(object):
         depth       - depth of 
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import FuncFormatter
         if depth is None and depth_dis is None:
             raise ValueError('At least one of depth/depth_dis needs to be specified!')
         data            = np.zeros(self.ind_thresh.size)
@@ -916,6 +942,8 @@ class postvpr(object):
         xlabel  - x axis label for the figure
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import FuncFormatter
         ax      = plt.subplot()
         paraval0= (self.invdata[self.ind_thresh, 2:(self.npara+2)])[:, ind_p]
         index1  = np.where((self.invdata[self.ind_thresh, 2:(self.npara+2)][:, ind_s] >= x1min)\
@@ -960,6 +988,8 @@ class postvpr(object):
         xlabel  - x axis label for the figure
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import FuncFormatter
         ax      = plt.subplot()
         paraval0= (self.invdata[self.ind_thresh, 2:(self.npara+2)])[:, ind_p]
         index1  = np.where((self.invdata[self.ind_thresh, 2:(self.npara+2)][:, ind_s] >= x1min)\
@@ -996,6 +1026,7 @@ class postvpr(object):
     
     def plot_misfit_evolve(self, is_acc=False, is_runmin=False, step4uwalk=1500, Nplt=1e9, normed=False, \
                             mininitial=False, alpha=0.5, showfig=True):
+        import matplotlib.pyplot as plt
         Ntotal      = self.misfit.size
         Nuwalk      = int(Ntotal/step4uwalk)
         if (Nuwalk*step4uwalk - Ntotal) != 0.:
@@ -1053,6 +1084,7 @@ class postvpr(object):
             plt.show()
             
     def plot_num_threshmodel(self, thresh_misfit=None, step4uwalk=1500, Nplt=1e9, showfig=True):
+        import matplotlib.pyplot as plt
         Ntotal      = self.misfit.size
         Nuwalk      = int(Ntotal/step4uwalk)
         if thresh_misfit is None:
@@ -8,16 +8,15 @@ Module for results and postprocessing of MC inversion
     CIEI, Department of Physics, University of Colorado Boulder
     email: lili.feng@colorado.edu
 """
-import vmodel, modparam, data, vprofile
+import vmodel, modparam, data, vprofile, mcchain
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter
-import matplotlib
 import copy
+# numba is already loaded by data/modparam, it is used here for the cached _get_running_min kernel
 import numba
 import os
 
 def to_percent(y, position):
+    import matplotlib
     # Ignore the passed in position. This has the effect of scaling the default
     # tick locations.
     s = str(100. * y)
@@ -27,10 +26,10 @@ def to_percent(y, position):
     else:
         return s + '%'
     
-@numba.jit(numba.float64[:](numba.float64[:]))
+@numba.jit(numba.float64[:](numba.float64[:]), nopython=True, cache=True)
 def _get_running_min(data):
     N       = data.size
-    outdata = np.zeros(N, dtype=float)
+    outdata = np.zeros(N, dtype=np.float64)
     for i in range(N):
         outdata[i]  = data[:(i+1)].min()
     return outdata
@@ -51,6 +50,7 @@ class postvpr(object):
     ::: parameters :::
     : --- arrays --- :
     invdata         - data arrays storing inversion results
+    paraval_arr     - model parameters of all the runs (numbrun, npara), memory-mapped from the chain file
     disppre_ph/gr   - predicted phase/group dispersion
     rfpre           - object storing 1D model
     ind_acc         - index array indicating accepted models
@@ -104,18 +104,23 @@ class postvpr(object):
     
     def read_inv_data(self, infname, verbose=True, thresh_misfit=None, Nmax=None, Nmin=None):
         """
-        read inversion results from an input compressed npz file
+        read inversion results from an input chain file (mcchain, .mcc) or an old compressed npz file
+        infname can also be an opened chain, e.g. a chain in the consolidated store (mcchain.chainstore.get_chain)
+        only the acceptance flag and misfit columns are read here,
+        the model parameters and the predictions are memory-mapped and loaded on access
         """
-        inarr           = np.load(infname)
-        self.invdata    = inarr['arr_0']
-        self.disppre_ray= inarr['arr_1']
-        self.disppre_lov= inarr['arr_2']
+        self.chain      = mcchain.open_chain(infname)
+        self._invdata   = None
+        self.paraval_arr= self.chain['paraval']
+        self.disppre_ray= self.chain['disppre_ray']
+        self.disppre_lov= self.chain['disppre_lov']
         # 
-        self.numbrun    = self.invdata.shape[0]
-        self.npara      = self.invdata.shape[1] - 9
-        self.ind_acc    = self.invdata[:, 0] == 1.
-        self.ind_rej    = self.invdata[:, 0] == -1.
-        self.misfit     = self.invdata[:, self.npara+3]
+        self.numbrun    = self.chain.nrows
+        self.npara      = self.chain.npara
+        flag            = np.asarray(self.chain['flag'])
+        self.ind_acc    = flag == 1.
+        self.ind_rej    = flag == -1.
+        self.misfit     = np.array(self.chain['misfit'])
         self.min_misfit = self.misfit[self.ind_acc + self.ind_rej].min()
         self.ind_min    = np.where(self.misfit == self.min_misfit)[0][0]
         self.get_thresh_model(thresh_misfit = thresh_misfit, Nmax = Nmax, Nmin = Nmin)
@@ -131,75 +136,86 @@ class postvpr(object):
             print '--- minimum misfit                   = '+ str(self.min_misfit)
         return
     
+    @property
+    def invdata(self):
+        """
+        model array of all the runs (numbrun, npara+9), assembled from the chain columns on first access
+        """
+        if self._invdata is None:
+            self._invdata   = self.chain.get_model_array()
+        return self._invdata
+    
+    @invdata.setter
+    def invdata(self, value):
+        self._invdata   = value
+    
+    def get_misfit_order(self):
+        """
+        get the indices of the runs sorted by misfit, the summary column stored with the chain is used if available
+        """
+        if 'misfit_order' in self.chain:
+            return np.asarray(self.chain['misfit_order'])
+        return np.argsort(self.misfit, kind='mergesort')
+    
+    def get_maxdev(self):
+        """
+        get the maximum normalized deviation of the predicted dispersion from the observed data for each run
+            max(|C_predict - C_obs|/std) over all periods of the dispersion data in self.data
+        the summary columns stored with the chain are used if available, None is returned if there is no dispersion data
+        """
+        maxdev          = None
+        for name, npts, prename, obs, std in [
+                    ('maxdev_ray', self.data.dispR.npper, 'disppre_ray', self.data.dispR.pvelo, self.data.dispR.stdpvelo),
+                    ('maxdev_lov', self.data.dispL.npper, 'disppre_lov', self.data.dispL.pvelo, self.data.dispL.stdpvelo)]:
+            if npts == 0:
+                continue
+            if name in self.chain:
+                dev     = np.asarray(self.chain[name])
+            else:
+                dev     = mcchain.get_max_dev(getattr(self, prename), obs, std)
+            maxdev      = dev if maxdev is None else np.maximum(maxdev, dev)
+        return maxdev
+    
     def get_thresh_model(self, thresh_misfit=None, Nmax=None, Nmin=None):
         """
         get the index for the finalized accepted model
         adaptively change thresh and stdfactor to make accpeted model around a specified value(Nmin ~ Nmax)
+        the number of models for a threshold value is found by binary search in the sorted misfits of the accepted models,
+        and C_predict within [C_obs - stdfactor*std, C_obs + stdfactor*std] is checked with the maximum normalized deviation
         """
         if thresh_misfit is None:
             thresh_val  = self.min_misfit*self.factor+ self.thresh
         else:
             thresh_val  = thresh_misfit
-        ind_thresh      = self.ind_acc*(self.misfit<= thresh_val)
-        # ind_thresh      = (self.misfit<= thresh_val)
+        # accepted models sorted by misfit
+        order           = self.get_misfit_order()
+        acc_order       = order[self.ind_acc[order]]
+        acc_misfit      = self.misfit[acc_order]
         # added 09/07/2018
         # while loop to adjust threshold misfit value according to Nmax/Nmin
         if Nmax is not None:
-            Nacc                = np.where(self.ind_acc)[0].size
+            Nacc                = acc_order.size
             if Nmax > Nacc:
                 print 'WARNING: Nmax is reset from '+str(Nmax)+' to '+str(Nacc)
                 Nmax            = Nacc
-            temp_ind            = np.where(ind_thresh)[0]
-            while (temp_ind.size > Nmax):
+            while (np.searchsorted(acc_misfit, thresh_val, side='right') > Nmax):
                 thresh_val      -= 0.05
-                ind_thresh      = self.ind_acc*(self.misfit<= thresh_val)
-                temp_ind        = np.where(ind_thresh)[0]
         if Nmin is not None:
-            temp_ind            = np.where(ind_thresh)[0]
-            while (temp_ind.size < Nmin):
+            while (np.searchsorted(acc_misfit, thresh_val, side='right') < Nmin):
                 thresh_val      += 0.05
-                ind_thresh      = self.ind_acc*(self.misfit<= thresh_val)
-                temp_ind        = np.where(ind_thresh)[0]
         self.thresh_val         = thresh_val
-        ind_thresh_temp         = ind_thresh.copy()
+        ind_thresh              = acc_order[:np.searchsorted(acc_misfit, thresh_val, side='right')]
         if self.stdfactor is not None:
-            if self.data.dispR.npper > 0:
-                cmax    = self.data.dispR.pvelo + self.stdfactor*self.data.dispR.stdpvelo
-                cmin    = self.data.dispR.pvelo - self.stdfactor*self.data.dispR.stdpvelo
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_ray <= cmax, axis=1)
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_ray >= cmin, axis=1)
-            if self.data.dispL.npper > 0:
-                umax    = self.data.dispL.pvelo + self.stdfactor*self.data.dispL.stdpvelo
-                umin    = self.data.dispL.pvelo - self.stdfactor*self.data.dispL.stdpvelo
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_lov <= umax, axis=1)
-                ind_thresh   \
-                        =  ind_thresh * np.all(self.disppre_lov >= umin, axis=1)
-            # added 09/07/2018
-            # while loop to adjust threshold misfit value according to Nmax/Nmin
-            if Nmin is not None:
-                temp_ind= np.where(ind_thresh)[0]
-                while (temp_ind.size < Nmin):
-                    self.stdfactor  += 0.5
-                    ind_thresh      = ind_thresh_temp.copy()
-                    if self.data.dispR.npper > 0:
-                        cmax    = self.data.dispR.pvelo + self.stdfactor*self.data.dispR.stdpvelo
-                        cmin    = self.data.dispR.pvelo - self.stdfactor*self.data.dispR.stdpvelo
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_ray <= cmax, axis=1)
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_ray >= cmin, axis=1)
-                    if self.data.dispL.npper > 0:
-                        umax    = self.data.dispL.pvelo + self.stdfactor*self.data.dispL.stdpvelo
-                        umin    = self.data.dispL.pvelo - self.stdfactor*self.data.dispL.stdpvelo
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_lov <= umax, axis=1)
-                        ind_thresh   \
-                                =  ind_thresh * np.all(self.disppre_lov >= umin, axis=1)
-                    temp_ind        = np.where(ind_thresh)[0]
-        self.ind_thresh = np.where(ind_thresh)[0]
+            maxdev              = self.get_maxdev()
+            if maxdev is not None:
+                # added 09/07/2018
+                # while loop to adjust stdfactor according to Nmin
+                if Nmin is not None:
+                    dev_sorted  = np.sort(maxdev[ind_thresh])
+                    while (np.searchsorted(dev_sorted, self.stdfactor, side='right') < Nmin):
+                        self.stdfactor  += 0.5
+                ind_thresh      = ind_thresh[maxdev[ind_thresh] <= self.stdfactor]
+        self.ind_thresh = np.sort(ind_thresh)
         return
     
     def get_thresh_model_2(self, thresh_misfit=None, Nmax=None, Nmin=None):
@@ -219,11 +235,11 @@ class postvpr(object):
         """
         get the parameter array for the minimum misfit model and the average of the accepted model
         """
-        self.min_paraval    = self.invdata[self.ind_min, 2:(self.npara+2)]
-        self.avg_paraval    = (self.invdata[self.ind_thresh, 2:(self.npara+2)]).mean(axis=0)
+        self.min_paraval    = np.array(self.paraval_arr[self.ind_min, :])
+        self.avg_paraval    = (self.paraval_arr[self.ind_thresh, :]).mean(axis=0)
         # uncertainties, note that crustal thickness is determined by the last two parameters
         # thus, the last element of the sem and std array is for crustal thickness, NOT the crustal thickness excluding sediments
-        temp_paraval        = self.invdata[self.ind_thresh, 2:(self.npara+2)]
+        temp_paraval        = np.array(self.paraval_arr[self.ind_thresh, :])
         temp_paraval[:, -3] += temp_paraval[:, -4]
         self.sem_paraval    = (temp_paraval).std(axis=0) / np.sqrt(temp_paraval.shape[0])
         self.std_paraval    = (temp_paraval).std(axis=0)
@@ -260,10 +276,24 @@ class postvpr(object):
             self.real_model.vtimod.mod2para()
         return
     
-    def read_data(self, pfx):
+    def read_data(self, pfx, store=None):
         """
-        read observed and initial predicted data from an input npz file
+        read observed and initial predicted data from the txt files written by the initial run
+        pfx is the grid point id if the files are read from the consolidated chain store (store, mcchain.chainstore)
         """
+        if store is not None:
+            for sfx in ['_0', '']:
+                infname_ray = store.get_file(pfx, pfx+sfx+'.ph.ray.disp')
+                infname_lov = store.get_file(pfx, pfx+sfx+'.ph.lov.disp')
+                if infname_ray is not None and infname_lov is not None:
+                    break
+            if infname_ray is None or infname_lov is None:
+                raise KeyError('No initial predicted data in the store for '+pfx)
+            self.data.dispR.readdisptxt_predict(infname=infname_ray, dtype='ph')
+            self.data.dispL.readdisptxt_predict(infname=infname_lov, dtype='ph')
+            self.data.get_misfit_vti()
+            self.init_misfit    = self.data.misfit
+            return
         try:
             infname         = pfx+'_0.ph.ray.disp'
             self.data.dispR.readdisptxt_predict(infname=infname, dtype='ph')
@@ -324,21 +354,21 @@ class postvpr(object):
         self.avg_misfit     = self.vprfwrd.data.misfit
         return
     
-    def run_prior_fwrd(self, workingdir = './prior_sampling_vti',  isconstrt=False,
-            step4uwalk=1500, numbrun=15000, subsize=1000, nprocess=10, overwrite=False):
+    def run_prior_fwrd(self, workingdir = './prior_sampling_vti',  isconstrt=False, numbrun=15000, nbatch=10000, overwrite=False):
         """
         run and store sampled models from prior distribution
+        the models are drawn directly from the prior distribution in batches (vprofile1d.mc_prior), no MC chain is run
         """
-        invfname        = workingdir+'/mc_inv.' + self.code+'.npz'
+        invfname        = mcchain.get_inv_fname(workingdir, self.code)
         temp_vpr        = vprofile.vprofile1d()
         temp_vpr.data   = copy.deepcopy(self.data)
         temp_vpr.model.vtimod.parameterize_ray(paraval = self.prior_paraval, topovalue = - self.waterdepth,\
                                             maxdepth=200., vp_water=self.vpwater)
         temp_vpr.model.vtimod.get_paraind_gamma(std_paraval = self.std_prior)
         if not os.path.isfile(invfname) or overwrite:
-            temp_vpr.mc_joint_inv_vti_mp(outdir = workingdir, run_inv=False, solver_type=0, isconstrt=isconstrt, pfx=self.code,\
-                verbose=True, step4uwalk=step4uwalk, numbrun=numbrun, savedata=True, subsize=subsize, \
-                nprocess=nprocess )
+            temp_vpr.mc_prior(outdir = workingdir, mtype='vti', isconstrt=isconstrt, pfx=self.code,\
+                numbrun = numbrun, nbatch = nbatch, verbose=True)
+            invfname    = mcchain.get_inv_fname(workingdir, self.code)
         vpr             = postvpr(waterdepth = self.waterdepth)
         vpr.read_inv_data(infname = invfname, verbose=False)
         vpr.get_paraval()
@@ -404,6 +434,7 @@ class postvpr(object):
         assemdisp   - plot the dispersion curves corresponding to the assemble of accepted models or not 
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[18, 9.6])
         ax  = plt.subplot()
         if assemdisp:
@@ -514,6 +545,7 @@ class postvpr(object):
         assemdisp   - plot the dispersion curves corresponding to the assemble of accepted models or not 
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[18, 9.6])
         ax  = plt.subplot()
         ###
@@ -590,6 +622,7 @@ class postvpr(object):
         assemdisp   - plot the dispersion curves corresponding to the assemble of accepted models or not 
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
         plt.figure(figsize=[18, 9.6])
         ax  = plt.subplot()
         disp_minR    = self.vprfwrd.data.dispR.pvelp
@@ -829,6 +862,8 @@ class postvpr(object):
         xlabel  - x axis label for the figure
         =================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import FuncFormatter
         if pindex == -1:
             xlabel  = 'Mantle anisotropy (%)'
         elif pindex == -2:
@@ -882,6 +917,7 @@ class postvpr(object):
         return
     
     def plot_trade_off(self, title='Trade-off in anisotropy',plot_origin=True, savefig=False, fname=None, showfig=True):
+        import matplotlib.pyplot as plt
         gamma_crust     = (self.invdata[self.ind_thresh, 2:(self.npara+2)])[:, -2]
         gamma_mantle    = (self.invdata[self.ind_thresh, 2:(self.npara+2)])[:, -1]
         plt.figure(figsize=[18, 9.6])
@@ -905,6 +941,7 @@ class postvpr(object):
         return
     
     def plot_trade_off_2(self, title='',plot_origin=True, savefig=False, fname=None, showfig=True):
+        import matplotlib.pyplot as plt
         
         
         plt.figure(figsize=[10, 10])
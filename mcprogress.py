@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Module for the live status file of the Monte Carlo inversion campaigns (surfdbase.mc_inv_iso/mc_inv_vti)
+
+The campaign keeps one JSON file describing the state of each grid point, it is rewritten atomically
+(temporary file + os.rename) at most once every interval seconds, and at every change of the state of a grid point,
+so it can be read (or copied) at any time during the run, see summarize_mcprogress.py.
+Progress within a grid point comes from the sampler:
+    parallel        - the chain file of each process, read as soon as the chain finishes (vprofile.mc_joint_inv_*_mp)
+    serial          - the output array of the chain, every 500 steps (vprofile.mc_joint_inv_iso/mc_joint_inv_vti)
+A disabled campaign_status object returns immediately from all the methods and writes nothing.
+
+The status file:
+    campaign        - mtype, number of grid points in each state, start/updated time, estimated remaining time (eta)
+    grd_pts         - one entry per grid point:
+        state           - queued/running/done/skipped/failed
+        nstep           - number of steps completed (the steps skipped by the misfit check included)
+        nstep_target    - number of steps of the current total run (numbrun*i_totalrun)
+        nrun            - number of models evaluated (flag != 0)
+        nacc            - number of accepted models (flag == 1)
+        ngood           - number of accepted models with misfit <= misfit_thresh
+        acceptance      - nacc/nrun
+        min_misfit      - minimum misfit of the accepted models
+        steps_per_sec   - nstep/elapsed time of the grid point (all processes)
+        eta             - estimated remaining time of the current total run (sec)
+        start/end/updated
+                        - time (sec since the epoch) of the start/end/last update of the grid point
+        note            - reason for skipped/failed grid points
+All the times are given as time.time(), the estimates are None if they can not be computed yet.
+
+:Copyright:
+    Author: Lili Feng
+    Graduate Research Assistant
+    CIEI, Department of Physics, University of Colorado Boulder
+    email: lili.feng@colorado.edu
+"""
+import numpy as np
+import os
+import json
+import time
+import mcchain
+
+STATES      = ['queued', 'running', 'done', 'skipped', 'failed']
+# counts of a grid point, summed over the chains
+COUNTS      = ['nstep', 'nrun', 'nacc', 'ngood']
+
+def get_chain_counts(flag, misfit, misfit_thresh):
+    """
+    get the counts and the minimum misfit of a (partial) chain
+    ::: input :::
+    flag            - acceptance flag of each step (1 - accepted, -1 - rejected, 0 - not run)
+    misfit          - misfit of each step
+    misfit_thresh   - threshold misfit value to determine "good" models
+    """
+    flag        = np.asarray(flag)
+    misfit      = np.asarray(misfit)
+    ind_acc     = flag == 1
+    counts      = {'nstep': int(flag.size), 'nrun': int((flag != 0).sum()), 'nacc': int(ind_acc.sum()),
+                    'ngood': int((misfit[ind_acc] <= misfit_thresh).sum())}
+    min_misfit  = float(misfit[ind_acc].min()) if counts['nacc'] > 0 else None
+    return counts, min_misfit
+
+def _min(val1, val2):
+    if val1 is None:
+        return val2
+    if val2 is None:
+        return val1
+    return min(val1, val2)
+
+class campaign_status(object):
+    """
+    An object for the live status file of a Monte Carlo inversion campaign
+    =====================================================================================================================
+    ::: parameters :::
+    fname           - name of the status file (JSON)
+    grd_ids         - list of grid point ids of the campaign, all queued at start
+    mtype           - model type (iso/vti)
+    misfit_thresh   - threshold misfit value to determine "good" models
+    interval        - minimum time interval between two writes of the status file (sec)
+    enabled         - write the status file or not
+    =====================================================================================================================
+    ::: example :::
+    status  = mcprogress.campaign_status(outdir+'/mc_status.json', grdlst, mtype='iso')
+    for grd_id in grdlst:
+        status.start_grid(grd_id, nstep_target=numbrun)
+        vpr.mc_joint_inv_iso_mp(..., pfx=grd_id, status=status)
+        status.end_grid(grd_id)
+    """
+    def __init__(self, fname, grd_ids=[], mtype='iso', misfit_thresh=1., interval=10., enabled=True):
+        self.fname          = fname
+        self.mtype          = mtype
+        self.misfit_thresh  = misfit_thresh
+        self.interval       = interval
+        self.enabled        = enabled
+        self.start          = time.time()
+        self.grd_ids        = []
+        self.grids          = {}
+        # counts of the running (partial) chain of each grid point, replaced at each update
+        self._partial       = {}
+        self._twrite        = 0.
+        for grd_id in grd_ids:
+            self._get_grid(grd_id)
+        self.write(force=True)
+        return
+
+    def _get_grid(self, grd_id):
+        if not grd_id in self.grids:
+            self.grd_ids.append(grd_id)
+            self.grids[grd_id]  = {'state': 'queued', 'nstep_target': 0, 'min_misfit': None, 'start': None, 'end': None,
+                                    'updated': None, 'note': ''}
+            for name in COUNTS:
+                self.grids[grd_id][name]    = 0
+        return self.grids[grd_id]
+
+    def start_grid(self, grd_id, nstep_target=0):
+        """
+        mark a grid point as running
+        """
+        if not self.enabled:
+            return
+        grid                    = self._get_grid(grd_id)
+        grid['state']           = 'running'
+        grid['nstep_target']    = nstep_target
+        grid['start']           = time.time()
+        grid['updated']         = grid['start']
+        self.write(force=True)
+        return
+
+    def set_target(self, grd_id, nstep_target):
+        """
+        set the number of steps of the current total run of a grid point
+        """
+        if not self.enabled:
+            return
+        self._get_grid(grd_id)['nstep_target']  = nstep_target
+        self.write()
+        return
+
+    def update_chain(self, grd_id, flag, misfit):
+        """
+        update the progress of the running chain of a grid point (the previous update of the chain is replaced)
+        ::: input :::
+        flag/misfit     - acceptance flag/misfit of the steps completed so far
+        """
+        if not self.enabled:
+            return
+        self._get_grid(grd_id)['updated']   = time.time()
+        self._partial[grd_id]   = get_chain_counts(flag, misfit, self.misfit_thresh)
+        self.write()
+        return
+
+    def add_chain(self, grd_id, chain):
+        """
+        add a finished chain to the counts of a grid point
+        ::: input :::
+        chain           - chain file name or mcchain.chainfile object
+        """
+        if not self.enabled:
+            return
+        if isinstance(chain, basestring):
+            chain       = mcchain.chainfile(chain)
+            close       = True
+        else:
+            close       = False
+        counts, min_misfit  = get_chain_counts(chain['flag'], chain['misfit'], self.misfit_thresh)
+        if close:
+            chain.close()
+        grid                = self._get_grid(grd_id)
+        for name in COUNTS:
+            grid[name]      += counts[name]
+        grid['min_misfit']  = _min(grid['min_misfit'], min_misfit)
+        grid['updated']     = time.time()
+        self._partial.pop(grd_id, None)
+        self.write()
+        return
+
+    def end_grid(self, grd_id, state='done', note=''):
+        """
+        mark a grid point as done/skipped/failed
+        """
+        if not self.enabled:
+            return
+        if not state in STATES:
+            raise ValueError('Unexpected state: '+state)
+        grid            = self._get_grid(grd_id)
+        grid['state']   = state
+        grid['note']    = note
+        grid['end']     = time.time()
+        grid['updated'] = grid['end']
+        self._partial.pop(grd_id, None)
+        self.write(force=True)
+        return
+
+    def get_status(self, tnow=None):
+        """
+        get the status of the campaign as a dictionary, including the estimates (acceptance, speed, remaining time)
+        """
+        if tnow is None:
+            tnow        = time.time()
+        grd_pts         = {}
+        for grd_id in self.grd_ids:
+            grid        = dict(self.grids[grd_id])
+            if grd_id in self._partial:
+                counts, min_misfit  = self._partial[grd_id]
+                for name in COUNTS:
+                    grid[name]      += counts[name]
+                grid['min_misfit']  = _min(grid['min_misfit'], min_misfit)
+            grid['acceptance']      = float(grid['nacc'])/grid['nrun'] if grid['nrun'] > 0 else None
+            grid['steps_per_sec']   = None
+            grid['eta']             = None
+            if grid['start'] is not None:
+                elapsed             = (grid['end'] if grid['end'] is not None else tnow) - grid['start']
+                if elapsed > 0. and grid['nstep'] > 0:
+                    grid['steps_per_sec']   = grid['nstep']/elapsed
+                if grid['state'] == 'running' and grid['steps_per_sec'] is not None:
+                    grid['eta']     = max(grid['nstep_target'] - grid['nstep'], 0)/grid['steps_per_sec']
+            grd_pts[grd_id]         = grid
+        #-------------------------------
+        # campaign summary
+        #-------------------------------
+        campaign        = {'mtype': self.mtype, 'misfit_thresh': self.misfit_thresh, 'ngrid': len(self.grd_ids),
+                            'start': self.start, 'updated': tnow, 'eta': None}
+        for state in STATES:
+            campaign['n'+state] = len([ingrid for ingrid in grd_pts.values() if ingrid['state'] == state])
+        # remaining time, the mean time of the finished grid points (or the estimated time of the running ones)
+        # times the number of queued grid points, plus the remaining time of the running grid points
+        tgrid           = [ingrid['end'] - ingrid['start'] for ingrid in grd_pts.values() if ingrid['state'] == 'done' and\
+                            ingrid['start'] is not None]
+        running         = [ingrid for ingrid in grd_pts.values() if ingrid['state'] == 'running']
+        if len(tgrid) == 0:
+            tgrid       = [tnow - ingrid['start'] + ingrid['eta'] for ingrid in running if ingrid['eta'] is not None]
+        if len(tgrid) > 0 and len([ingrid for ingrid in running if ingrid['eta'] is None]) == 0:
+            campaign['eta'] = np.mean(tgrid)*campaign['nqueued'] + sum([ingrid['eta'] for ingrid in running])
+        return {'campaign': campaign, 'grd_pts': grd_pts}
+
+    def write(self, force=False):
+        """
+        write the status file atomically, skipped if the previous write is less than interval seconds ago (unless force=True)
+        NOTE: a failure to write the status file only prints a warning, it does NOT stop the inversion
+        """
+        if not self.enabled:
+            return
+        tnow            = time.time()
+        if not force and tnow - self._twrite < self.interval:
+            return
+        self._twrite    = tnow
+        tmpfname        = self.fname+'.tmp'
+        try:
+            with open(tmpfname, 'w') as fid:
+                json.dump(self.get_status(tnow), fid, indent=1, sort_keys=True)
+            os.rename(tmpfname, self.fname)
+        except (IOError, OSError) as err:
+            print 'WARNING: failed to write the status file '+self.fname+': '+str(err)
+        return
+
+def read_status(fname):
+    """
+    read a status file
+    """
+    with open(fname, 'r') as fid:
+        return json.load(fid)
+
+def check_grid(grid, tnow, stall=1800., min_acc=0.05, median_speed=None, slow=0.5):
+    """
+    check a running grid point for the signs of a stalled or pathological chain
+    ::: input :::
+    grid            - status of the grid point
+    tnow            - current time
+    stall           - the grid point is stalled if not updated within stall sec
+    min_acc         - minimum acceptance rate
+    median_speed    - median steps/sec of the grid points of the campaign(s)
+    slow            - the grid point is slow if its steps/sec is smaller than slow*median_speed
+    ::: output :::
+    list of warnings
+    """
+    warnings    = []
+    if grid['state'] != 'running':
+        return warnings
+    if grid['updated'] is not None and tnow - grid['updated'] > stall:
+        warnings.append('STALLED (no update for %d sec)' %(tnow - grid['updated']))
+    if grid['acceptance'] is not None and grid['acceptance'] < min_acc:
+        warnings.append('LOW ACCEPTANCE (%.3f)' %grid['acceptance'])
+    if median_speed is not None and grid['steps_per_sec'] is not None and grid['steps_per_sec'] < slow*median_speed:
+        warnings.append('SLOW (%.2f steps/sec, median = %.2f)' %(grid['steps_per_sec'], median_speed))
+    return warnings
+
+def format_time(sec):
+    """
+    format a time interval (sec) as a string, e.g. 1d02h03m
+    """
+    if sec is None:
+        return '-'
+    sec         = int(sec)
+    days, sec   = divmod(sec, 86400)
+    hours, sec  = divmod(sec, 3600)
+    minutes, sec= divmod(sec, 60)
+    if days > 0:
+        return '%dd%02dh%02dm' %(days, hours, minutes)
+    if hours > 0:
+        return '%dh%02dm' %(hours, minutes)
+    return '%dm%02ds' %(minutes, sec)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Module for the opt-in per-stage timing and event counting of the Monte Carlo chains (vprofile.vprofile1d)
+
+The sampling loop marks the end of each stage with chainstats.lap(stage), the time since the previous mark is
+added to the cumulative timer of that stage. Events (isgood retries, NaN misfits ...) are counted with chainstats.count(name).
+A disabled chainstats object (the default) returns immediately from lap/count, so the overhead is a method call per stage.
+
+The statistics of a chain are stored in the header of the chain file (mcchain.write_chain),
+they are summed when chains are merged (per grid point) and can be summed over many grid points (per campaign),
+see mcchain.get_grid_stats:
+    time    - cumulative time of each stage (sec), see STAGES
+    count   - number of events, see COUNTERS
+    total   - total time of the sampling loop (sec)
+
+:Copyright:
+    Author: Lili Feng
+    Graduate Research Assistant
+    CIEI, Department of Physics, University of Colorado Boulder
+    email: lili.feng@colorado.edu
+"""
+import numpy as np
+import time
+
+# stages of one step of the sampling loop
+#   propose             - new model parameters (iso), copy of the old model (vti)
+#   isgood              - model constraints, including the new proposals of the rejected ones
+#                           (vti, vtimod.new_paraval draws and checks the proposals together)
+#   vmodel              - velocity model from the model parameters (get_vmodel)
+#   forward             - forward computation of the predicted data
+#   misfit              - misfit and likelihood
+#   reference           - recomputes of the reference model/sensitivity kernels (vti)
+#   bookkeeping         - output arrays, acceptance test and the rest of the loop
+STAGES      = ['propose', 'isgood', 'vmodel', 'forward', 'misfit', 'reference', 'bookkeeping']
+# events
+#   step                - steps of the sampling loop
+#   accept              - accepted models
+#   isgood_retry        - rejected proposals of the model constraints (isgood)
+#   no_good_model       - steps with no good model after the maximum number of retries
+#   nan_misfit          - NaN misfits
+#   large_perturb       - large perturbations from the reference model of the sensitivity kernels (vti)
+#   reference_update    - recomputes of the reference model/sensitivity kernels (vti)
+#   reference_fail      - failed recomputes of the reference model (vti)
+#   uniform_walk        - uniform random walks in the parameter space
+COUNTERS    = ['step', 'accept', 'isgood_retry', 'no_good_model', 'nan_misfit', 'large_perturb', 'reference_update',\
+                'reference_fail', 'uniform_walk']
+
+def empty_stats():
+    """
+    get an empty statistics dictionary
+    """
+    return {'time': dict([(name, 0.) for name in STAGES]), 'count': dict([(name, 0) for name in COUNTERS]), 'total': 0.}
+
+def merge_stats(statslst):
+    """
+    sum a list of statistics dictionaries, None entries (chains without statistics) are skipped
+    """
+    stats       = empty_stats()
+    for instats in statslst:
+        if instats is None:
+            continue
+        for name, value in instats['time'].items():
+            stats['time'][name]     = stats['time'].get(name, 0.) + value
+        for name, value in instats['count'].items():
+            stats['count'][name]    = stats['count'].get(name, 0) + value
+        stats['total']  += instats['total']
+    return stats
+
+class chainstats(object):
+    """
+    An object for the cumulative stage timers and event counters of a Monte Carlo chain
+    =====================================================================================================================
+    ::: parameters :::
+    enabled         - collect the statistics or not
+    time            - cumulative time of each stage (sec)
+    count           - number of events
+    =====================================================================================================================
+    ::: example :::
+    stats   = mcstats.chainstats(enabled=True)
+    stats.start()
+    while run:
+        ...                             # proposal
+        stats.lap('propose')
+        ...                             # forward computation
+        stats.lap('forward')
+        stats.count('step')
+    stats.stop()
+    """
+    def __init__(self, enabled=False):
+        self.enabled    = enabled
+        self.time       = dict([(name, 0.) for name in STAGES])
+        self.count_dict = dict([(name, 0) for name in COUNTERS])
+        self._t0        = 0.
+        self._tlast     = 0.
+        self._total     = 0.
+        return
+
+    def start(self):
+        """
+        start (or restart) the timers, the time before start is not charged to any stage
+        """
+        if not self.enabled:
+            return
+        self._t0        = time.time()
+        self._tlast     = self._t0
+        return
+
+    def lap(self, stage):
+        """
+        charge the time since the previous mark to the given stage
+        """
+        if not self.enabled:
+            return
+        tnow                = time.time()
+        self.time[stage]    += tnow - self._tlast
+        self._tlast         = tnow
+        return
+
+    def count(self, name, n=1):
+        """
+        count n events
+        """
+        if not self.enabled:
+            return
+        self.count_dict[name]   += n
+        return
+
+    def stop(self):
+        """
+        stop the timers, the time since the previous mark is charged to bookkeeping
+        """
+        if not self.enabled:
+            return
+        self.lap('bookkeeping')
+        self._total     += self._tlast - self._t0
+        return
+
+    def get_stats(self):
+        """
+        get the statistics as a dictionary, None if disabled
+        """
+        if not self.enabled:
+            return None
+        return {'time': dict(self.time), 'count': dict(self.count_dict), 'total': self._total}
+
+def summarize(stats):
+    """
+    get a text summary of a statistics dictionary
+    """
+    lines       = []
+    total       = stats['total']
+    nstep       = stats['count'].get('step', 0)
+    lines.append('total time = %g sec, steps = %d, time per step = %g ms' %(total, nstep, 1000.*total/max(nstep, 1)))
+    lines.append('--- stage time:')
+    for name in STAGES + sorted(set(stats['time'].keys()) - set(STAGES)):
+        if not name in stats['time']:
+            continue
+        tstage  = stats['time'][name]
+        lines.append('%-20s %12.3f sec %6.1f %% %10.3f ms/step' %(name, tstage, 100.*tstage/max(total, 1e-12), 1000.*tstage/max(nstep, 1)))
+    lines.append('--- events:')
+    for name in COUNTERS + sorted(set(stats['count'].keys()) - set(COUNTERS)):
+        if not name in stats['count']:
+            continue
+        ncount  = stats['count'][name]
+        lines.append('%-20s %12d %10.4f /step' %(name, ncount, float(ncount)/max(nstep, 1)))
+    return '\n'.join(lines)
+
+def get_time_per_step(statsdict):
+    """
+    get the time per step (sec) of each grid point, useful to find the outliers of a campaign
+    """
+    grd_ids     = sorted(statsdict.keys())
+    tstep       = np.array([statsdict[grd_id]['total']/max(statsdict[grd_id]['count'].get('step', 0), 1) for grd_id in grd_ids])
+    return grd_ids, tstep
@@ -177,11 +177,30 @@ class para1d(object):
             raise ValueError('Unexpected perturbation type!')
         return True
     
+    def new_paraval_arr(self, nsample):
+        """
+        generate an array of uniform random parameters from the parameter space, fixed parameters keep the values in paraval
+        ===============================================================================
+        ::: input :::
+        nsample - number of parameter vectors
+        ::: output :::
+        paravalarr  - parameter array (nsample, npara)
+        ===============================================================================
+        """
+        if not self.isspace:
+            raise ValueError('Parameter space for perturbation has not been initialized yet!')
+        paravalarr      = np.random.uniform(self.space[0, :], self.space[1, :], size=(nsample, self.npara))
+        ind_fixed       = (self.paraindex[1, :]).astype(int) == 0
+        paravalarr[:, ind_fixed]\
+                        = self.paraval[ind_fixed]
+        return paravalarr
+    
 ####################################################
 # auxiliary functions
 ####################################################
 
-@numba.jit(numba.float64[:, :](numba.int64, numba.int64, numba.float64, numba.float64, numba.int64, numba.int64))
+@numba.jit(numba.types.Tuple((numba.float64[:, :], numba.float64[:]))(\
+        numba.int64, numba.int64, numba.float64, numba.float64, numba.int64, numba.int64), nopython=True, cache=True)
 def bspl_basis(nBs, degBs, zmin_Bs, zmax_Bs, disfacBs, npts):
     """
     function that generate B spline basis
@@ -231,6 +250,114 @@ def bspl_basis(nBs, degBs, zmin_Bs, zmax_Bs, disfacBs, npts):
     nbasis[nBs-1][npts-1]   = 1
     return nbasis, t
 
+def get_nlay_arr(mtype, numbp, nlay, thickness):
+    """
+    number of layers in each group for an array of models, the same rules as in update/bspline of isomod/vtimod
+    ===============================================================================
+    ::: input :::
+    mtype, numbp- model parameterization types/number of control points (nmod)
+    nlay        - number of layers of the reference model, used for other model types (nmod)
+    thickness   - thickness of each group (N, nmod)
+    ::: output :::
+    nlayarr     - number of layers (N, nmod)
+    ===============================================================================
+    """
+    N, nmod     = thickness.shape
+    nlayarr     = np.zeros((N, nmod), dtype=np.int64)
+    for i in range(nmod):
+        thk     = thickness[:, i]
+        # layered model
+        if mtype[i] == 1:
+            nlayarr[:, i]   = numbp[i]
+        # B spline model
+        elif mtype[i] == 2:
+            nlayarr[:, i]   = 30
+            nlayarr[thk < 20., i]\
+                            = 10
+            nlayarr[thk < 10., i]\
+                            = 5
+            nlayarr[thk >= 150., i]\
+                            = 60
+        # gradient layer
+        elif mtype[i] == 4:
+            tnlay           = np.ones(N, dtype=np.int64)*4
+            tnlay[thk >= 20.]\
+                            = 20
+            ind             = (thk > 10.)*(thk < 20.)
+            tnlay[ind]      = (thk[ind]/1.).astype(np.int64)
+            ind             = (thk > 2.)*(thk <= 10.)
+            tnlay[ind]      = (thk[ind]/0.5).astype(np.int64)
+            tnlay[thk < 0.5]= 2
+            nlayarr[:, i]   = tnlay
+        # water layer
+        elif mtype[i] == 5:
+            nlayarr[:, i]   = 1
+        else:
+            nlayarr[:, i]   = nlay[i]
+    return nlayarr
+
+def osci_mantle_arr(vs, dv_osci):
+    """
+    oscillation check of the mantle velocities in isgood for an array of models
+    the i-th local minimum is paired with the i-th local maximum (scipy.signal.argrelmin/argrelmax),
+    the check fails if any difference within the pairs exceeds dv_osci with three or more local extrema
+    ===============================================================================
+    ::: input :::
+    vs          - velocity array (N, nlay)
+    dv_osci     - threshold velocity difference
+    ::: output :::
+    isosci      - bool array (N), True if the model fails the check
+    ===============================================================================
+    """
+    N, nlay     = vs.shape
+    if nlay < 3:
+        return np.zeros(N, dtype=bool)
+    vmid        = vs[:, 1:-1]
+    ismax       = (vmid > vs[:, :-2])*(vmid > vs[:, 2:])
+    ismin       = (vmid < vs[:, :-2])*(vmid < vs[:, 2:])
+    Nmax        = ismax.sum(axis=1)
+    Nmin        = ismin.sum(axis=1)
+    Npair       = np.minimum(Nmax, Nmin)
+    # local extrema values sorted by their order of appearance
+    vmax        = np.zeros(vmid.shape, dtype=vs.dtype)
+    vmin        = np.zeros(vmid.shape, dtype=vs.dtype)
+    irow, icol  = np.nonzero(ismax)
+    vmax[irow, (np.cumsum(ismax, axis=1) - 1)[irow, icol]]\
+                = vmid[irow, icol]
+    irow, icol  = np.nonzero(ismin)
+    vmin[irow, (np.cumsum(ismin, axis=1) - 1)[irow, icol]]\
+                = vmid[irow, icol]
+    ispair      = np.arange(nlay-2)[None, :] < Npair[:, None]
+    dvmax       = (np.where(ispair, vmax - vmin, -np.inf).max(axis=1)).astype(vs.dtype)
+    return (Npair > 0)*(dvmax > dv_osci)*((Nmax + Nmin) >= 3)
+
+def osci_trim_arr(vs, depth, mindepth):
+    """
+    local extrema of the velocity profile below mindepth in isgood for an array of models
+    ===============================================================================
+    ::: input :::
+    vs          - velocity array (N, nlay)
+    depth       - depth array (N, nlay), non-decreasing along the profile
+    mindepth    - the profile is trimmed to depth > mindepth
+    ::: output :::
+    isextrema   - bool array (N), True if both local maxima and local minima exist
+    dv          - maximum of local maxima - minimum of local minima (N)
+    ===============================================================================
+    """
+    N, nlay     = vs.shape
+    if nlay < 3:
+        return np.zeros(N, dtype=bool), np.zeros(N, dtype=np.float64)
+    vmid        = vs[:, 1:-1]
+    # the neighbours of an extremum should both be in the trimmed profile
+    istrim      = depth[:, :-2] > mindepth
+    ismax       = istrim*(vmid > vs[:, :-2])*(vmid > vs[:, 2:])
+    ismin       = istrim*(vmid < vs[:, :-2])*(vmid < vs[:, 2:])
+    isextrema   = ismax.any(axis=1)*ismin.any(axis=1)
+    dv          = np.where(ismax, vmid, -np.inf).max(axis=1) - np.where(ismin, vmid, np.inf).min(axis=1)
+    dv[np.logical_not(isextrema)]\
+                = 0.
+    return isextrema, dv
+
 
 class isomod(object):
     """
@@ -1055,6 +1182,154 @@ class isomod(object):
         
         return True
     
+    def isgood_arr(self, paravalarr, m0, m1, g0, g1, dvs_thresh=0.05):
+        """
+        check an array of models are good or not, vectorized version of para2mod, update and isgood
+        the models are first screened with Vs at the top/bottom of each group,
+        the remaining ones with the same number of layers in each group are then checked together
+        the B spline basis is computed once for each group (it depends on the thickness only through the scaling of depth)
+        ==========================================================================
+        ::: input   :::
+        paravalarr  - parameter array (N, npara)
+        m0, m1      - index of group for monotonic change checking
+        g0, g1      - index of group for gradient change checking
+        ::: output  :::
+        isgoodarr   - bool array (N)
+        ==========================================================================
+        """
+        N           = paravalarr.shape[0]
+        # para2mod
+        cvel        = np.repeat(self.cvel[None, :self.numbp.max(), :], N, axis=0)
+        thickness   = np.repeat(self.thickness[None, :], N, axis=0)
+        for i in range(self.para.npara):
+            ig      = int(self.para.paraindex[4, i])
+            if int(self.para.paraindex[0, i]) == 0:
+                ip                  = int(self.para.paraindex[5, i])
+                cvel[:, ip, ig]     = paravalarr[:, i]
+            elif int(self.para.paraindex[0, i]) == 1:
+                thickness[:, ig]    = paravalarr[:, i]
+        thickness[:, -1]            = 200. - thickness[:, :-1].sum(axis=1)
+        if m1 >= self.nmod:
+            m1  = self.nmod -1
+        if m0 < 0:
+            m0  = 0
+        nlayarr     = get_nlay_arr(self.mtype, self.numbp, self.nlay, thickness)
+        # B spline basis
+        spl_basis   = {}
+        for i in range(self.nmod):
+            if self.mtype[i] != 2:
+                continue
+            nBs     = self.numbp[i]
+            if nBs < 4:
+                degBs   = 3
+            else:
+                degBs   = 4
+            zmax_Bs = self.thickness[i] if self.thickness[i] > 0. else 1.
+            for nlay in np.unique(nlayarr[:, i]):
+                nbasis, t               = bspl_basis(nBs, degBs, 0., zmax_Bs, 2., nlay)
+                spl_basis[(i, nlay)]    = nbasis[:nBs, :]
+        #-------------------------------
+        # screening with Vs at the top/bottom of each group, cheaper than the whole profile
+        #-------------------------------
+        vstop       = np.zeros((N, self.nmod), dtype=np.float64)
+        vsbot       = np.zeros((N, self.nmod), dtype=np.float64)
+        for i in range(self.nmod):
+            for nlay in np.unique(nlayarr[:, i]):
+                ind     = np.where(nlayarr[:, i] == nlay)[0]
+                if self.mtype[i] == 1:
+                    vstop[ind, i]   = cvel[ind, 0, i]
+                    vsbot[ind, i]   = cvel[ind, nlay-1, i]
+                elif self.mtype[i] == 2:
+                    vstop[ind, i]   = np.dot(cvel[ind, :self.numbp[i], i], spl_basis[(i, nlay)][:, 0])
+                    vsbot[ind, i]   = np.dot(cvel[ind, :self.numbp[i], i], spl_basis[(i, nlay)][:, -1])
+                elif self.mtype[i] == 4:
+                    dcvel           = (cvel[ind, 1, i] - cvel[ind, 0, i])/(nlay - 1.)
+                    vstop[ind, i]   = cvel[ind, 0, i]
+                    vsbot[ind, i]   = cvel[ind, 0, i] + dcvel*(nlay - 1.)
+                elif self.mtype[i] != 5:
+                    vstop[ind, i]   = self.vs[0, i]
+                    vsbot[ind, i]   = self.vs[nlay-1, i]
+        isgood      = np.ones(N, dtype=bool)
+        for i in range(self.nmod-1):
+            isgood  *= np.logical_not(vstop[:, i+1] < vsbot[:, i])
+        isgood      *= np.logical_not(vsbot[:, self.nmod-2] > 4.3)
+        isgood      *= np.logical_not(vstop[:, self.nmod-1] > 4.6)
+        isgood      *= np.logical_not(vstop[:, self.nmod-1] < 4.0)
+        isgood      *= np.logical_not(vsbot[:, self.nmod-1] < 4.3)
+        ind_screen  = np.where(isgood)[0]
+        isgoodarr   = np.zeros(N, dtype=bool)
+        if ind_screen.size == 0:
+            return isgoodarr
+        nlay_uniq, ind_uniq \
+                    = np.unique(nlayarr[ind_screen, :], axis=0, return_inverse=True)
+        for iuniq in range(nlay_uniq.shape[0]):
+            ind     = ind_screen[ind_uniq == iuniq]
+            nlay    = nlay_uniq[iuniq, :]
+            #-------------------------------
+            # update, vs and hArr of each group
+            #-------------------------------
+            vsarr   = []
+            harr    = []
+            for i in range(self.nmod):
+                thk     = thickness[ind, i]
+                # layered model
+                if self.mtype[i] == 1:
+                    vs  = cvel[ind, :nlay[i], i]
+                    h   = self.ratio[:nlay[i], i]*thk[:, None]
+                # B spline model
+                elif self.mtype[i] == 2:
+                    vs  = np.dot(cvel[ind, :self.numbp[i], i], spl_basis[(i, nlay[i])])
+                    h   = np.repeat((thk/nlay[i])[:, None], nlay[i], axis=1)
+                # gradient layer
+                elif self.mtype[i] == 4:
+                    dcvel   = (cvel[ind, 1, i] - cvel[ind, 0, i])/(nlay[i] - 1.)
+                    vs  = cvel[ind, 0, i][:, None] + dcvel[:, None]*np.arange(nlay[i], dtype=np.float64)
+                    h   = np.repeat((thk/float(nlay[i]))[:, None], nlay[i], axis=1)
+                # water layer
+                elif self.mtype[i] == 5:
+                    vs  = np.zeros((ind.size, 1), dtype=np.float64)
+                    h   = thk[:, None]
+                else:
+                    vs  = np.repeat(self.vs[None, :nlay[i], i], ind.size, axis=0)
+                    h   = np.repeat(self.hArr[None, :nlay[i], i], ind.size, axis=0)
+                vsarr.append(vs)
+                harr.append(h)
+            #-------------------------------
+            # isgood
+            #-------------------------------
+            isgood  = np.ones(ind.size, dtype=bool)
+            # velocity constrast, contraint (5) in 4.2 of Shen et al., 2012
+            for i in range(self.nmod-1):
+                isgood  *= np.logical_not(vsarr[i+1][:, 0] < vsarr[i][:, -1])
+            # Vs < 4.9 km/sec , contraint (6) in 4.2 of Shen et al., 2012
+            # values beyond nlay are kept from the reference model
+            for i in range(self.nmod):
+                isgood  *= np.logical_not(np.any(vsarr[i] > 4.9, axis=1))
+                if np.any(self.vs[nlay[i]:, i] > 4.9):
+                    isgood[:]   = False
+            # monotonic change
+            # contraint (3) and (4) in 4.2 of Shen et al., 2012
+            if m0 <= m1:
+                for j in range(m0, m1+1):
+                    isgood  *= np.logical_not(np.any(vsarr[j][:, :-1] > vsarr[j][:, 1:], axis=1))
+            # constrain the last layer Vs in crust
+            isgood  *= np.logical_not(vsarr[self.nmod-2][:, -1] > 4.3)
+            # constrain the first layer Vs in mantle
+            isgood  *= np.logical_not(vsarr[self.nmod-1][:, 0] > 4.6)
+            isgood  *= np.logical_not(vsarr[self.nmod-1][:, 0] < 4.0)
+            # constrain the bottom layer Vs in mantle
+            isgood  *= np.logical_not(vsarr[self.nmod-1][:, -1] < 4.3)
+            # penalize oscillations with differences in local/maximum extrema 
+            dv_osci = 0.01
+            isgood  *= np.logical_not(osci_mantle_arr(vsarr[self.nmod-1], dv_osci))
+            vsall   = np.concatenate(vsarr, axis=1)
+            depth   = np.concatenate(harr, axis=1).cumsum(axis=1)
+            isextrema, dv   = osci_trim_arr(vsall, depth, 60.)
+            isgood  *= np.logical_not(isextrema*(abs(dv) >= dv_osci))
+            isgood  *= np.logical_not(np.any((depth > 80.)*(vsall < 4.0), axis=1))
+            isgoodarr[ind]  = isgood
+        return isgoodarr
+    
     def get_vmodel(self):
         """
         get velocity models
@@ -1974,6 +2249,212 @@ class vtimod(object):
             if (vs_trim[local_indmax].max() - vs_trim[local_indmin].min())>= dv_osci:
                 return False
         return True
+    
+    def isgood_arr(self, paravalarr, m0, m1, g0, g1, dvs_thresh=0.05):
+        """
+        check an array of models are good or not, vectorized version of para2mod, update and isgood
+        the models are first screened with Vsh/Vsv at the top/bottom of each group,
+        the remaining ones with the same number of layers in each group are then checked together
+        the B spline basis is computed once for each group (it depends on the thickness only through the scaling of depth)
+        ==========================================================================
+        ::: input   :::
+        paravalarr  - parameter array (N, npara)
+        m0, m1      - index of group for monotonic change checking
+        g0, g1      - index of group for gradient change checking
+        ::: output  :::
+        isgoodarr   - bool array (N)
+        ==========================================================================
+        """
+        N           = paravalarr.shape[0]
+        # para2mod
+        cvsh        = np.repeat(self.cvsh[None, :self.numbp.max(), :], N, axis=0)
+        cvsv        = np.repeat(self.cvsv[None, :self.numbp.max(), :], N, axis=0)
+        thickness   = np.repeat(self.thickness[None, :], N, axis=0)
+        gamma       = np.repeat(self.gamma[None, :], N, axis=0)
+        for i in xrange(self.para.npara):
+            ig      = int(self.para.paraindex[4, i])
+            ip      = int(self.para.paraindex[5, i])
+            if int(self.para.paraindex[0, i]) == 0:
+                cvsh[:, ip, ig]     = paravalarr[:, i]
+            elif int(self.para.paraindex[0, i]) == 1:
+                cvsv[:, ip, ig]     = paravalarr[:, i]
+            elif int(self.para.paraindex[0, i]) == 2:
+                thickness[:, ig]    = paravalarr[:, i]
+            elif int(self.para.paraindex[0, i]) == 3:
+                gamma[:, ig]        = paravalarr[:, i]
+        thickness[:, -1]            = 200. - thickness[:, :-1].sum(axis=1)
+        # ratio of Vsh/Vsv
+        hv_ratio    = (1. + gamma/200.)/(1 - gamma/200.)
+        if m1 >= self.nmod:
+            m1  = self.nmod -1
+        if m0 < 0:
+            m0  = 0
+        nlayarr     = get_nlay_arr(self.mtype, self.numbp, self.nlay, thickness)
+        # B spline basis
+        spl_basis   = {}
+        for i in xrange(self.nmod):
+            if self.mtype[i] != 2:
+                continue
+            nBs     = self.numbp[i]
+            if nBs < 4:
+                degBs   = 3
+            else:
+                degBs   = 4
+            zmax_Bs = self.thickness[i] if self.thickness[i] > 0. else 1.
+            for nlay in np.unique(nlayarr[:, i]):
+                nbasis, t               = bspl_basis(nBs, degBs, 0., zmax_Bs, 2., nlay)
+                spl_basis[(i, nlay)]    = nbasis[:nBs, :].astype(self.spl.dtype)
+        #-------------------------------
+        # screening with Vsh/Vsv at the top/bottom of each group, cheaper than the whole profile
+        #-------------------------------
+        vshtop      = np.zeros((N, self.nmod), dtype=self.vsh.dtype)
+        vshbot      = np.zeros((N, self.nmod), dtype=self.vsh.dtype)
+        vsvtop      = np.zeros((N, self.nmod), dtype=self.vsv.dtype)
+        vsvbot      = np.zeros((N, self.nmod), dtype=self.vsv.dtype)
+        for i in xrange(self.nmod):
+            for nlay in np.unique(nlayarr[:, i]):
+                ind     = np.where(nlayarr[:, i] == nlay)[0]
+                if self.mtype[i] == 1:
+                    vsvtop[ind, i]  = cvsv[ind, 0, i]
+                    vsvbot[ind, i]  = cvsv[ind, nlay-1, i]
+                    if self.use_gamma:
+                        vshtop[ind, i]  = self.vsh[0, i]
+                        vshbot[ind, i]  = self.vsh[nlay-1, i]
+                    else:
+                        vshtop[ind, i]  = cvsh[ind, 0, i]
+                        vshbot[ind, i]  = cvsh[ind, nlay-1, i]
+                elif self.mtype[i] == 2:
+                    vsvtop[ind, i]  = np.dot(cvsv[ind, :self.numbp[i], i], spl_basis[(i, nlay)][:, 0])
+                    vsvbot[ind, i]  = np.dot(cvsv[ind, :self.numbp[i], i], spl_basis[(i, nlay)][:, -1])
+                    if self.use_gamma:
+                        vshtop[ind, i]  = hv_ratio[ind, i]*vsvtop[ind, i]
+                        vshbot[ind, i]  = hv_ratio[ind, i]*vsvbot[ind, i]
+                    else:
+                        vshtop[ind, i]  = np.dot(cvsh[ind, :self.numbp[i], i], spl_basis[(i, nlay)][:, 0])
+                        vshbot[ind, i]  = np.dot(cvsh[ind, :self.numbp[i], i], spl_basis[(i, nlay)][:, -1])
+                elif self.mtype[i] == 4:
+                    dcvsv           = (cvsv[ind, 1, i] - cvsv[ind, 0, i])/(nlay - 1.)
+                    vsvtop[ind, i]  = cvsv[ind, 0, i]
+                    vsvbot[ind, i]  = cvsv[ind, 0, i] + dcvsv.astype(np.float64)*(nlay - 1.)
+                    if self.use_gamma:
+                        vshtop[ind, i]  = hv_ratio[ind, i]*vsvtop[ind, i]
+                        vshbot[ind, i]  = hv_ratio[ind, i]*vsvbot[ind, i]
+                    else:
+                        dcvsh           = (cvsh[ind, 1, i] - cvsh[ind, 0, i])/(nlay - 1.)
+                        vshtop[ind, i]  = cvsh[ind, 0, i]
+                        vshbot[ind, i]  = cvsh[ind, 0, i] + dcvsh.astype(np.float64)*(nlay - 1.)
+                elif self.mtype[i] != 5:
+                    vsvtop[ind, i]  = self.vsv[0, i]
+                    vsvbot[ind, i]  = self.vsv[nlay-1, i]
+                    vshtop[ind, i]  = self.vsh[0, i]
+                    vshbot[ind, i]  = self.vsh[nlay-1, i]
+        isgood      = np.ones(N, dtype=bool)
+        for i in xrange(self.nmod-1):
+            isgood  *= np.logical_not(vshtop[:, i+1] < vshbot[:, i])
+            isgood  *= np.logical_not(vsvtop[:, i+1] < vsvbot[:, i])
+        isgood      *= np.logical_not((vshbot[:, self.nmod-2] > 4.3) + (vsvbot[:, self.nmod-2] > 4.3))
+        isgood      *= np.logical_not((vshtop[:, self.nmod-1] > 4.6) + (vsvtop[:, self.nmod-1] > 4.6))
+        isgood      *= np.logical_not(vsvtop[:, self.nmod-1] < 4.0)
+        isgood      *= np.logical_not((vshbot[:, self.nmod-1] < 4.3) + (vsvbot[:, self.nmod-1] < 4.3))
+        ind_screen  = np.where(isgood)[0]
+        isgoodarr   = np.zeros(N, dtype=bool)
+        if ind_screen.size == 0:
+            return isgoodarr
+        nlay_uniq, ind_uniq \
+                    = np.unique(nlayarr[ind_screen, :], axis=0, return_inverse=True)
+        for iuniq in range(nlay_uniq.shape[0]):
+            ind     = ind_screen[ind_uniq == iuniq]
+            nlay    = nlay_uniq[iuniq, :]
+            #-------------------------------
+            # update, vsh, vsv and hArr of each group
+            #-------------------------------
+            vsharr  = []
+            vsvarr  = []
+            harr    = []
+            for i in xrange(self.nmod):
+                thk     = thickness[ind, i]
+                # layered model
+                if self.mtype[i] == 1:
+                    vsv     = cvsv[ind, :nlay[i], i]
+                    if self.use_gamma:
+                        vsh = np.repeat(self.vsh[None, :nlay[i], i], ind.size, axis=0)
+                    else:
+                        vsh = cvsh[ind, :nlay[i], i]
+                    h       = self.ratio[:nlay[i], i]*thk[:, None]
+                # B spline model
+                elif self.mtype[i] == 2:
+                    vsv     = np.dot(cvsv[ind, :self.numbp[i], i], spl_basis[(i, nlay[i])])
+                    if self.use_gamma:
+                        vsh = hv_ratio[ind, i][:, None]*vsv
+                    else:
+                        vsh = np.dot(cvsh[ind, :self.numbp[i], i], spl_basis[(i, nlay[i])])
+                    h       = np.repeat((thk/nlay[i])[:, None], nlay[i], axis=1)
+                # gradient layer
+                elif self.mtype[i] == 4:
+                    dcvsv   = (cvsv[ind, 1, i] - cvsv[ind, 0, i])/(nlay[i] - 1.)
+                    vsv     = (cvsv[ind, 0, i][:, None] + dcvsv[:, None]*np.arange(nlay[i], dtype=np.float64)).astype(self.vsv.dtype)
+                    if self.use_gamma:
+                        vsh = hv_ratio[ind, i][:, None]*vsv
+                    else:
+                        dcvsh   = (cvsh[ind, 1, i] - cvsh[ind, 0, i])/(nlay[i] - 1.)
+                        vsh = (cvsh[ind, 0, i][:, None] + dcvsh[:, None]*np.arange(nlay[i], dtype=np.float64)).astype(self.vsh.dtype)
+                    h       = np.repeat((thk/float(nlay[i]))[:, None], nlay[i], axis=1)
+                # water layer
+                elif self.mtype[i] == 5:
+                    vsv     = np.zeros((ind.size, 1), dtype=self.vsv.dtype)
+                    vsh     = np.zeros((ind.size, 1), dtype=self.vsh.dtype)
+                    h       = thk[:, None]
+                else:
+                    vsv     = np.repeat(self.vsv[None, :nlay[i], i], ind.size, axis=0)
+                    vsh     = np.repeat(self.vsh[None, :nlay[i], i], ind.size, axis=0)
+                    h       = np.repeat(self.hArr[None, :nlay[i], i], ind.size, axis=0)
+                vsharr.append(vsh)
+                vsvarr.append(vsv)
+                harr.append(h)
+            #-------------------------------
+            # isgood
+            #-------------------------------
+            isgood  = np.ones(ind.size, dtype=bool)
+            # velocity constrast, contraint (5) in 4.2 of Shen et al., 2012
+            for i in xrange(self.nmod-1):
+                isgood  *= np.logical_not(vsharr[i+1][:, 0] < vsharr[i][:, -1])
+                isgood  *= np.logical_not(vsvarr[i+1][:, 0] < vsvarr[i][:, -1])
+            # upper limit of anisotropy (20 %), do not check sediments
+            for i in xrange(1, self.nmod):
+                isgood  *= np.logical_not(np.any(abs(vsvarr[i]-vsharr[i])/((vsvarr[i]+vsharr[i])/2.) > 0.2, axis=1))
+            # Vs < 4.9 km/sec , contraint (6) in 4.2 of Shen et al., 2012
+            # values beyond nlay are kept from the reference model
+            for i in xrange(self.nmod):
+                isgood  *= np.logical_not(np.any(vsvarr[i] > 4.9, axis=1) + np.any(vsharr[i] > 4.9, axis=1))
+                if np.any(self.vsv[nlay[i]:, i] > 4.9) or np.any(self.vsh[nlay[i]:, i] > 4.9):
+                    isgood[:]   = False
+            # monotonic change
+            # contraint (3) and (4) in 4.2 of Shen et al., 2012
+            if m0 <= m1:
+                for j in xrange(m0, m1+1):
+                    isgood  *= np.logical_not(np.any(vsharr[j][:, :-1] > vsharr[j][:, 1:], axis=1))
+                    isgood  *= np.logical_not(np.any(vsvarr[j][:, :-1] > vsvarr[j][:, 1:], axis=1))
+            # constrain the last layer Vs in crust
+            isgood  *= np.logical_not((vsharr[self.nmod-2][:, -1] > 4.3) + (vsvarr[self.nmod-2][:, -1] > 4.3))
+            # constrain the first layer Vs in mantle
+            isgood  *= np.logical_not((vsharr[self.nmod-1][:, 0] > 4.6) + (vsvarr[self.nmod-1][:, 0] > 4.6))
+            isgood  *= np.logical_not(vsvarr[self.nmod-1][:, 0] < 4.0)
+            # constrain the bottom layer Vs in mantle
+            isgood  *= np.logical_not((vsharr[self.nmod-1][:, -1] < 4.3) + (vsvarr[self.nmod-1][:, -1] < 4.3))
+            # penalize oscillations with differences in local/maximum extrema 
+            dv_osci = 0.05
+            depth   = np.concatenate(harr, axis=1).astype(np.float64).cumsum(axis=1)
+            if self.use_gamma:
+                vslst   = [vsvarr]
+            else:
+                vslst   = [vsharr, vsvarr]
+            for vsarr in vslst:
+                isgood  *= np.logical_not(osci_mantle_arr(vsarr[self.nmod-1], dv_osci))
+                vsall   = np.concatenate(vsarr, axis=1).astype(np.float64)
+                isextrema, dv   = osci_trim_arr(vsall, depth, 60.)
+                isgood  *= np.logical_not(isextrema*(dv >= dv_osci))
+            isgoodarr[ind]  = isgood
+        return isgoodarr
 
     def get_vmodel(self):
         """
@@ -2065,6 +2546,8 @@ class vtimod(object):
                     1   - Gauss random number generator given mu = oldval, sigma=step
         m0, m1  - index of group for monotonic change checking
         g0, g1  - index of group for gradient change checking
+        ::: output :::
+        self.ntry   - number of rejected proposals (isgood retries) of the last call
         ===============================================================================
         """
         if self.mtype[0] == 5:
@@ -2072,6 +2555,7 @@ class vtimod(object):
             m1      += 1
             g0      += 1
             g1      += 1
+        self.ntry   = 0
         temp_mod    = copy.deepcopy(self)
         temp_mod.para.new_paraval(ptype)
         temp_mod.para2mod()
@@ -2084,6 +2568,7 @@ class vtimod(object):
                 temp_mod.para2mod()
                 temp_mod.update()
                 i_try       += 1
+            self.ntry   = i_try
             if i_try > Nthresh:
                 return False
         self.para.paraval[:]    = temp_mod.para.paraval[:]
@@ -220,7 +220,7 @@ def read_paraval_txt(infname, inpara):
 ####################################################
 
 @numba.jit(numba.types.Tuple((numba.float32[:], numba.float32[:,:]))(\
-        numba.int32, numba.int32, numba.float32, numba.float32, numba.int32, numba.int32))
+        numba.int32, numba.int32, numba.float32, numba.float32, numba.int32, numba.int32), cache=True)
 def bspl_basis(nBs, degBs, zmin_Bs, zmax_Bs, disfacBs, npts):
     #-------------------------------- 
     # defining the knot vector
@@ -27,26 +27,26 @@ model_type.define(vmodel.model1d.class_type.instance_type)
 #--------------------------------------------------------------------------------------------------
 #- fundamental array manipulations
 #--------------------------------------------------------------------------------------------------
-@numba.jit(numba.float32[:](numba.float32, numba.float32, numba.float32))
+@numba.jit(numba.float32[:](numba.float32, numba.float32, numba.float32), cache=True)
 def _get_array(xmin, xmax, dx):
     xlst= []
     Nx  = int((xmax - xmin)/dx + 1)
     for i in xrange(Nx): xlst.append(dx*i+xmin)
     return np.array(xlst, dtype=np.float32)
 
-@numba.jit(numba.float32[:](numba.float32, numba.float32[:]))
+@numba.jit(numba.float32[:](numba.float32, numba.float32[:]), cache=True)
 def _value_divide_array(value, array):
     outArr  = np.zeros(array.size, dtype=np.float32)
     for i in xrange(array.size): outArr[i] = value/array[i]
     return outArr
 
-@numba.jit(numba.float32[:](numba.float32, numba.float32[:]))
+@numba.jit(numba.float32[:](numba.float32, numba.float32[:]), cache=True)
 def _array_divide_value(value, array):
     outArr  = np.zeros(array.size, dtype=np.float32)
     for i in xrange(array.size): outArr[i] = array[i]/value
     return outArr
 
-@numba.jit(numba.float32[:](numba.float32[:], numba.float32[:]))
+@numba.jit(numba.float32[:](numba.float32[:], numba.float32[:]), cache=True)
 def _merge_array(a1, a2):
     a3  = np.zeros(a1.size+a2.size, dtype=np.float32)
     Na1 = a1.size
@@ -57,7 +57,7 @@ def _merge_array(a1, a2):
             a3[i] = a2[i-Na1]
     return a3
 
-@numba.jit(numba.float32(numba.float32[:]))
+@numba.jit(numba.float32(numba.float32[:]), cache=True)
 def _abs_max_(array):
     mvalue=np.abs(array[0])
     for i in xrange(array.size):
@@ -16,7 +16,7 @@ import matplotlib.pyplot as plt
 import tdisp96
 import modparam
 
-@numba.jit(numba.float32[:](numba.float32, numba.float32, numba.float32))
+@numba.jit(numba.float32[:](numba.float32, numba.float32, numba.float32), cache=True)
 def _get_array(xmin, xmax, dx):
     xlst= []
     Nx  = int((xmax - xmin)/dx + 1)
@@ -431,7 +431,7 @@ def plot(model, dtype='vsv', unit='km', showfig=True):
     return
     
     
-@numba.jit(numba.float32[:, :](numba.float32[:], numba.float32, numba.boolean))
+@numba.jit(numba.float32[:, :](numba.float32[:], numba.float32, numba.boolean), cache=True)
 def _rot2mat(axis, angle, is_normalized):
     ''' Rotation matrix for rotation angle `angle` around `axis`
     ===============================================================================
@@ -473,7 +473,7 @@ def _rot2mat(axis, angle, is_normalized):
     #         [ zxC-ys,   yzC+xs,   z*zC+c ]], dtype=np.float32)
     return g
 
-@numba.jit(numba.float32[:,:](numba.float32[:], numba.float32))
+@numba.jit(numba.float32[:,:](numba.float32[:], numba.float32), cache=True)
 def _bondmat(axis, angle):
     """
     Compute Bond Matrix for rotation of Voigt matrix (eq. 8.9 in Bond, 1943; eq. 1.54 in Carcione, 2014)
@@ -2600,72 +2600,84 @@ class model1d(object):
         Note that the rotation is the inverse of rotation of a coordinate system,
         thus the rotation matrix used to construct Bond matrix is the inverse of the
         rotation matrix in Bond's book (p12-13)
-        """
-        for i in xrange(self.rArr.size):
-            if self.dipArr[i] == 0.: continue
-            if self.dipArr[i] >90. or self.dipArr[i] < 0.: raise ValueError('Dip should be within [0., 90.]!')
-            # rotation for dip, rotation axis is x (North)
-            Mdip        = _bondmat(np.array([1.,0.,0.], dtype=np.float32), self.dipArr[i])
-            Cvoigt      = np.dot(Mdip, self.CijArr[:,:, i])
-            Cvoigt      = np.dot(Cvoigt, Mdip.T)
-            # rotation for strike, rotation axis is z (downward)
-            Mstrike     = _bondmat(np.array([0.,0.,1.], dtype=np.float32), self.strikeArr[i])
-            Cvoigt      = np.dot(Mstrike, Cvoigt)
-            Cvoigt      = np.dot(Cvoigt, Mstrike.T)
-            self.CijArr[:,:, i] = Cvoigt
-            # print(i)
+        Consecutive points with the same (dip, strike) are rotated together: the Bond matrices are computed once
+        for each group and the (6, 6, n) stack of Voigt matrices is rotated by two matrix products
+        """
+        nr      = self.rArr.size
+        if np.any(self.dipArr > 90.) or np.any(self.dipArr < 0.):
+            raise ValueError('Dip should be within [0., 90.]!')
+        i0      = 0
+        while i0 < nr:
+            i1  = i0 + 1
+            while i1 < nr and self.dipArr[i1] == self.dipArr[i0] and self.strikeArr[i1] == self.strikeArr[i0]:
+                i1  += 1
+            if self.dipArr[i0] != 0.:
+                # rotation for dip, rotation axis is x (North); rotation for strike, rotation axis is z (downward)
+                Mdip        = _bondmat(np.array([1.,0.,0.], dtype=np.float32), self.dipArr[i0])
+                Mstrike     = _bondmat(np.array([0.,0.,1.], dtype=np.float32), self.strikeArr[i0])
+                M           = np.dot(Mstrike, Mdip)
+                n           = i1 - i0
+                # M*C, C is reshaped to (6, 6*n)
+                Cvoigt      = np.ascontiguousarray(self.CijArr[:, :, i0:i1]).reshape(6, 6*n)
+                MC          = np.dot(M, Cvoigt).reshape(6, 6, n)
+                # M*C*M^T = M*(M*C)^T, as C is symmetric
+                MCt         = np.ascontiguousarray(np.transpose(MC, (1, 0, 2))).reshape(6, 6*n)
+                self.CijArr[:, :, i0:i1]    = np.dot(M, MCt).reshape(6, 6, n)
+            i0  = i1
         return
     
     def decompose(self):
         """
         Decompose the tilted elastic tensor into ETI and AA components
-        """
-        # initialize effective Love parameters
-        self.AArrE  = self.AArr.copy()
-        self.CArrE  = self.CArr.copy()
-        self.FArrE  = self.FArr.copy()
-        self.LArrE  = self.LArr.copy()
-        self.NArrE  = self.NArr.copy()
-        # initialize 2-theta azimuthal terms
-        self.BcArr  = np.zeros(self.rArr.size, np.float32)
-        self.BsArr  = np.zeros(self.rArr.size, np.float32)
-        self.GcArr  = np.zeros(self.rArr.size, np.float32)
-        self.GsArr  = np.zeros(self.rArr.size, np.float32)
-        self.HcArr  = np.zeros(self.rArr.size, np.float32)
-        self.HsArr  = np.zeros(self.rArr.size, np.float32)
-        self.CcArr  = np.zeros(self.rArr.size, np.float32)
-        self.CsArr  = np.zeros(self.rArr.size, np.float32)
-        for i in xrange(self.rArr.size):
-            if self.dipArr[i] == 0.: continue
-            Cij             = self.CijArr[:,:, i]
-            A               = 3./8.*(Cij[0,0] + Cij[1,1]) + Cij[0,1]/4. + Cij[5,5]/2.
-            C               = Cij[2,2]
-            F               = (Cij[0,2] + Cij[1,2])/2.
-            L               = (Cij[3,3] + Cij[4,4])/2.
-            N               = (Cij[0,0] + Cij[1,1])/8. - Cij[0,1]/4. + Cij[5,5]/2.
-            CijETI          = np.zeros((6,6), np.float32)
-            CijETI[0,:]     = np.array([A, A-2.*N, F, 0., 0., 0.])
-            CijETI[1,:]     = np.array([A-2.*N, A, F, 0., 0., 0.])
-            CijETI[2,:]     = np.array([F, F, C, 0., 0., 0.])
-            CijETI[3,:]     = np.array([0., 0., 0., L, 0., 0.])
-            CijETI[4,:]     = np.array([0., 0., 0., 0., L, 0.])
-            CijETI[5,:]     = np.array([0., 0., 0., 0., 0., N])
-            self.CijAA[:,:,i]   = self.CijArr[:,:, i] - CijETI
-            CijAA               = self.CijAA[:,:,i]
-            # # # CijAA               = self.CijArr[:,:, i]
-            self.AArrE[i]       = A
-            self.CArrE[i]       = C
-            self.FArrE[i]       = F
-            self.LArrE[i]       = L
-            self.NArrE[i]       = N
-            self.BcArr[i]       = (CijAA[0,0] - CijAA[1,1])/2.
-            self.BsArr[i]       = CijAA[0,5] + CijAA[1,5]
-            self.GcArr[i]       = (CijAA[4,4] - CijAA[3,3])/2.
-            self.GsArr[i]       = CijAA[4,3]
-            self.HcArr[i]       = (CijAA[0,2] - CijAA[1,2])/2.
-            self.HsArr[i]       = CijAA[2,5]
-            self.CcArr[i]       = (CijAA[0,0] + CijAA[1,1])/8. - CijAA[0,1]/4. - CijAA[5,5]/2.
-            self.CsArr[i]       = (CijAA[0,5] - CijAA[1,5])/2.
+        All points are decomposed at once, the output arrays are reused if the number of points is unchanged
+        """
+        nr          = self.rArr.size
+        if self.BcArr.size != nr or self.AArrE.size != nr:
+            # initialize effective Love parameters
+            self.AArrE  = np.zeros(nr, np.float32)
+            self.CArrE  = np.zeros(nr, np.float32)
+            self.FArrE  = np.zeros(nr, np.float32)
+            self.LArrE  = np.zeros(nr, np.float32)
+            self.NArrE  = np.zeros(nr, np.float32)
+            # initialize 2-theta azimuthal terms
+            self.BcArr  = np.zeros(nr, np.float32)
+            self.BsArr  = np.zeros(nr, np.float32)
+            self.GcArr  = np.zeros(nr, np.float32)
+            self.GsArr  = np.zeros(nr, np.float32)
+            self.HcArr  = np.zeros(nr, np.float32)
+            self.HsArr  = np.zeros(nr, np.float32)
+            self.CcArr  = np.zeros(nr, np.float32)
+            self.CsArr  = np.zeros(nr, np.float32)
+        # only the tilted points are decomposed, 1. for tilted points, 0. otherwise
+        istilt      = self.dipArr != 0.
+        tiltf       = istilt.astype(np.float32)
+        Cij         = self.CijArr
+        A           = 3./8.*(Cij[0,0,:] + Cij[1,1,:]) + Cij[0,1,:]/4. + Cij[5,5,:]/2.
+        C           = Cij[2,2,:]
+        F           = (Cij[0,2,:] + Cij[1,2,:])/2.
+        L           = (Cij[3,3,:] + Cij[4,4,:])/2.
+        N           = (Cij[0,0,:] + Cij[1,1,:])/8. - Cij[0,1,:]/4. + Cij[5,5,:]/2.
+        # AA component, Cij - CijETI
+        CijAA       = Cij.copy()
+        CijAA[0,0,:]-= A;       CijAA[1,1,:]-= A;       CijAA[2,2,:]-= C
+        CijAA[0,1,:]-= A-2.*N;  CijAA[1,0,:]-= A-2.*N
+        CijAA[0,2,:]-= F;       CijAA[2,0,:]-= F;       CijAA[1,2,:]-= F;   CijAA[2,1,:]-= F
+        CijAA[3,3,:]-= L;       CijAA[4,4,:]-= L;       CijAA[5,5,:]-= N
+        CijAA       *= tiltf
+        self.CijAA  = CijAA
+        self.AArrE[:]   = np.where(istilt, A, self.AArr)
+        self.CArrE[:]   = np.where(istilt, C, self.CArr)
+        self.FArrE[:]   = np.where(istilt, F, self.FArr)
+        self.LArrE[:]   = np.where(istilt, L, self.LArr)
+        self.NArrE[:]   = np.where(istilt, N, self.NArr)
+        self.BcArr[:]   = (CijAA[0,0,:] - CijAA[1,1,:])/2.
+        self.BsArr[:]   = CijAA[0,5,:] + CijAA[1,5,:]
+        self.GcArr[:]   = (CijAA[4,4,:] - CijAA[3,3,:])/2.
+        self.GsArr[:]   = CijAA[4,3,:]
+        self.HcArr[:]   = (CijAA[0,2,:] - CijAA[1,2,:])/2.
+        self.HsArr[:]   = CijAA[2,5,:]
+        self.CcArr[:]   = (CijAA[0,0,:] + CijAA[1,1,:])/8. - CijAA[0,1,:]/4. - CijAA[5,5,:]/2.
+        self.CsArr[:]   = (CijAA[0,5,:] - CijAA[1,5,:])/2.
         return
 
     
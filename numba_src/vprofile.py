@@ -35,6 +35,195 @@ def to_percent(y, position):
     else:
         return s + '%'
 
+#--------------------------------------------------------------------------------------
+# analytic derivatives of the tilted TI parameterization, used by the kernel Jacobian
+#--------------------------------------------------------------------------------------
+# Voigt index pairs: 0 - 11, 1 - 22, 2 - 33, 3 - 23, 4 - 31, 5 - 12
+_VOIGT_I    = np.array([0, 1, 2, 1, 2, 0])
+_VOIGT_J    = np.array([0, 1, 2, 2, 0, 1])
+_VOIGT_W    = np.array([0.5, 0.5, 0.5, 1., 1., 1.])
+
+def _rotmat_arr(axis, angle):
+    """
+    rotation matrices and their derivatives with respect to the angle for an array of angles around a unit axis
+    the matrices are the same as vmodel._rot2mat
+    ======================================================================================
+    ::: input :::
+    axis        - 3 element unit vector of the rotation axis
+    angle       - array of rotation angles (degree)
+    ::: output :::
+    g, dg       - rotation matrices and derivatives (per degree), (nangle, 3, 3)
+    ======================================================================================
+    """
+    x, y, z     = axis
+    K           = np.array([[0., -z, y], [z, 0., -x], [-y, x, 0.]])
+    theta       = np.pi*np.asarray(angle, dtype=np.float64)/180.
+    s           = np.sin(theta)[:, None, None]
+    c           = np.cos(theta)[:, None, None]
+    g           = np.eye(3)[None, :, :] + s*K[None, :, :] + (1.-c)*np.dot(K, K)[None, :, :]
+    dg          = np.pi/180.*np.einsum('ij,njk->nik', K, g)
+    return g, dg
+
+def _bondmat_arr(axis, angle):
+    """
+    Bond matrices and their derivatives with respect to the angle for an array of angles, see vmodel._bondmat
+    ======================================================================================
+    ::: input :::
+    axis        - 3 element unit vector of the rotation axis
+    angle       - array of rotation angles (degree)
+    ::: output :::
+    M, dM       - Bond matrices and derivatives (per degree), (nangle, 6, 6)
+    ======================================================================================
+    """
+    g, dg       = _rotmat_arr(axis, angle)
+    gi          = g[:, _VOIGT_I, :]
+    gj          = g[:, _VOIGT_J, :]
+    dgi         = dg[:, _VOIGT_I, :]
+    dgj         = dg[:, _VOIGT_J, :]
+    # M[p, q] = w[q]*(g[i,k]*g[j,l] + g[i,l]*g[j,k]), (i, j) and (k, l) are the index pairs of p and q
+    M           = (gi[:, :, _VOIGT_I]*gj[:, :, _VOIGT_J] + gi[:, :, _VOIGT_J]*gj[:, :, _VOIGT_I])*_VOIGT_W
+    dM          = (dgi[:, :, _VOIGT_I]*gj[:, :, _VOIGT_J] + gi[:, :, _VOIGT_I]*dgj[:, :, _VOIGT_J]\
+                    + dgi[:, :, _VOIGT_J]*gj[:, :, _VOIGT_I] + gi[:, :, _VOIGT_J]*dgj[:, :, _VOIGT_I])*_VOIGT_W
+    return M, dM
+
+def _voigt2eti(Cij):
+    """
+    effective TI Love parameters (A, C, F, L, N) of Voigt matrices (..., 6, 6), see vmodel.model1d.decompose
+    """
+    A           = 3./8.*(Cij[..., 0, 0] + Cij[..., 1, 1]) + Cij[..., 0, 1]/4. + Cij[..., 5, 5]/2.
+    C           = Cij[..., 2, 2]
+    F           = (Cij[..., 0, 2] + Cij[..., 1, 2])/2.
+    L           = (Cij[..., 3, 3] + Cij[..., 4, 4])/2.
+    N           = (Cij[..., 0, 0] + Cij[..., 1, 1])/8. - Cij[..., 0, 1]/4. + Cij[..., 5, 5]/2.
+    return np.stack((A, C, F, L, N), axis=-1)
+
+def _ti_unit_voigt():
+    """
+    Voigt matrices of unit Love parameters (A, C, F, L, N), (5, 6, 6)
+    """
+    U           = np.zeros((5, 6, 6), dtype=np.float64)
+    U[0, 0, 0]  = 1.; U[0, 1, 1]  = 1.; U[0, 0, 1]  = 1.; U[0, 1, 0]  = 1.
+    U[1, 2, 2]  = 1.
+    U[2, 0, 2]  = 1.; U[2, 2, 0]  = 1.; U[2, 1, 2]  = 1.; U[2, 2, 1]  = 1.
+    U[3, 3, 3]  = 1.; U[3, 4, 4]  = 1.
+    U[4, 5, 5]  = 1.; U[4, 0, 1]  = -2.; U[4, 1, 0]  = -2.
+    return U
+
+def tti_eti_derivs(vph, vpv, vsh, vsv, eta, rho, dip, strike):
+    """
+    analytic derivatives of the effective TI Love parameters of each layer with respect to the layer parameters
+    The mapping follows vmodel.model1d.get_tti_vmodel, rot_dip_strike and decompose:
+        TI Love parameters      - A = rho*vph**2, C = rho*vpv**2, N = rho*vsh**2, L = rho*vsv**2, F = eta*(A-2L)
+        rotation                - Bond matrices for dip (axis x) and strike (axis z)
+        decomposition           - effective TI part of the rotated Voigt matrix
+    density is fixed, as in the model update of ttimod after initialization of the density array
+    ======================================================================================
+    ::: input :::
+    vph, vpv, vsh, vsv, eta, rho, dip, strike   - layer arrays from ttimod.get_vmodel (km/s, g/cm^3, degree)
+    ::: output :::
+    dvel        - derivatives with respect to vph, vpv, vsh, vsv, eta, (nlay, 5 (A, C, F, L, N), 5)
+    ddip        - derivatives with respect to dip (per degree), (nlay, 5 (A, C, F, L, N))
+    NOTE: effective TI Love parameters (unit - GPa) do not depend on strike
+    ======================================================================================
+    """
+    vph         = np.asarray(vph, dtype=np.float64)
+    vpv         = np.asarray(vpv, dtype=np.float64)
+    vsh         = np.asarray(vsh, dtype=np.float64)
+    vsv         = np.asarray(vsv, dtype=np.float64)
+    rho         = np.asarray(rho, dtype=np.float64)
+    eta         = np.array(eta, dtype=np.float64)
+    # eta of the half-space is set to 1 in get_tti_vmodel
+    eta[-1]     = 1.
+    nlay        = vph.size
+    A           = rho*vph**2
+    C           = rho*vpv**2
+    L           = rho*vsv**2
+    N           = rho*vsh**2
+    F           = eta*(A - 2.*L)
+    ti          = np.stack((A, C, F, L, N), axis=-1)
+    # derivatives of TI Love parameters with respect to vph, vpv, vsh, vsv, eta
+    dti         = np.zeros((nlay, 5, 5), dtype=np.float64)
+    dti[:, 0, 0]= 2.*rho*vph
+    dti[:, 2, 0]= 2.*eta*rho*vph
+    dti[:, 1, 1]= 2.*rho*vpv
+    dti[:, 4, 2]= 2.*rho*vsh
+    dti[:, 3, 3]= 2.*rho*vsv
+    dti[:, 2, 3]= -4.*eta*rho*vsv
+    dti[:-1, 2, 4]  = (A - 2.*L)[:-1]
+    # linear mapping from TI to effective TI Love parameters and its derivative with respect to dip
+    U           = _ti_unit_voigt()
+    Md, dMd     = _bondmat_arr(np.array([1., 0., 0.]), dip)
+    Ms, dMs     = _bondmat_arr(np.array([0., 0., 1.]), strike)
+    # layers with zero dip are not rotated in rot_dip_strike
+    Ms[np.asarray(dip) == 0.]   = np.eye(6)
+    MsMd        = np.einsum('nij,njk->nik', Ms, Md)
+    MsdMd       = np.einsum('nij,njk->nik', Ms, dMd)
+    CU          = np.einsum('nij,ujk,nlk->nuil', MsMd, U, MsMd)
+    dCU         = np.einsum('nij,ujk,nlk->nuil', MsdMd, U, MsMd)
+    T           = np.swapaxes(_voigt2eti(CU), 1, 2)
+    dT          = np.swapaxes(_voigt2eti(dCU + np.swapaxes(dCU, 2, 3)), 1, 2)
+    dvel        = np.einsum('nij,njk->nik', T, dti)
+    ddip        = np.einsum('nij,nj->ni', dT, ti)
+    return dvel, ddip
+
+def tti_para_weights(ttimod):
+    """
+    derivatives of layer parameters with respect to the inversion parameters of a tilted TI model
+    (spline basis, layer indicator or gradient layer weights)
+    ======================================================================================
+    ::: input :::
+    ttimod      - modparam.ttimod object, model arrays need to be updated
+    ::: output :::
+    W           - weight array, (npara, nlay)
+                    W[i, j] is the derivative of the layer parameter of the type paraindex[0, i] in layer j
+    ======================================================================================
+    """
+    nlay        = np.asarray(ttimod.nlay[:ttimod.nmod], dtype=np.int64)
+    ioff        = np.append(0, nlay.cumsum())
+    npara       = ttimod.para.npara
+    W           = np.zeros((npara, ioff[-1]), dtype=np.float64)
+    for i in xrange(npara):
+        ptype   = int(ttimod.para.paraindex[0, i])
+        ig      = int(ttimod.para.paraindex[4, i])
+        ip      = int(ttimod.para.paraindex[5, i])
+        tnlay   = nlay[ig]
+        w       = np.zeros(tnlay, dtype=np.float64)
+        if ptype <= 4:
+            # layered model
+            if ttimod.mtype[ig] == 1:
+                if ip < tnlay:
+                    w[ip]   = 1.
+            # B spline model
+            elif ttimod.mtype[ig] == 2:
+                w[:]        = ttimod.spl[ip, :tnlay, ig]
+            # gradient layer, eta is constant
+            elif ttimod.mtype[ig] == 4:
+                if ptype == 4:
+                    if ip == 0:
+                        w[:]= 1.
+                else:
+                    frac    = np.arange(tnlay, dtype=np.float64)/(tnlay - 1.)
+                    if ip == 0:
+                        w[:]= 1. - frac
+                    elif ip == 1:
+                        w[:]= frac
+        elif ptype == 5:
+            if ttimod.dipjump < 0.:
+                if ip == 0:
+                    w[:]    = 1.
+            else:
+                if ttimod.mtype[ig] == 1:
+                    ind     = int(np.where(ttimod.ratio.cumsum() <= ttimod.dipjump)[0][-1])
+                else:
+                    ind     = int(tnlay*ttimod.dipjump)
+                if ip == 0:
+                    w[:ind] = 1.
+                elif ip == 1:
+                    w[ind:] = 1.
+        # strike, effective TI Love parameters are independent of strike
+        W[i, ioff[ig]:ioff[ig+1]]   = w
+    return W
+
 class vprofile1d(object):
     """
     An object for 1D velocity profile inversion
@@ -1204,8 +1393,59 @@ class vprofile1d(object):
             self.jacobian[:, i] = (res1-res2)/dpara
         self.model.ttimod   = oldmod
         return
-            
-    def gauss_newton_tti_inv(self, outdir='./workingdir_tti_gn', pfx='GN'):
+
+    def compute_tti_jacobian_kernel(self):
+        """
+        compute the Jacobian of the Rayleigh/Love phase velocity residuals using the sensitivity kernels of the reference model
+        The stored Love parameter kernels (eigkR, eigkL) are chained with the analytic derivatives of the tilted TI
+        parameterization (spline basis, rotation and decomposition), which costs a single pass over the model,
+        instead of 2*npara forward evaluations in compute_tti_jacobian.
+        Since phase velocities are predicted from the kernels (perturb_from_kernel), the Jacobian is exact up to the
+        derivative of the parameterization.
+        =====================================================================================================================
+        ::: output :::
+        self.res        - residual array (Rayleigh and Love phase velocities)
+        self.jacobian   - Jacobian array (nres, npara-3)
+        =====================================================================================================================
+        """
+        if not (self.disprefR and self.disprefL):
+            raise ValueError('referennce dispersion and kernels not computed!')
+        r1, r2, r3, r4      = self.indata.get_res_tti()
+        self.res            = np.append(r1, r4)
+        npara               = self.model.ttimod.para.npara-3
+        hArr, vph, vpv, vsh, vsv, eta, rho, dip, strike, qs, qp = self.model.ttimod.get_vmodel()
+        if hArr.size != self.eigkR.nlay or hArr.size != self.eigkL.nlay:
+            raise ValueError('Inconsistent number of layers between the model and the sensitivity kernels!')
+        dvel, ddip          = tti_eti_derivs(vph, vpv, vsh, vsv, eta, rho, dip, strike)
+        W                   = tti_para_weights(self.model.ttimod)[:npara, :]
+        ptype               = self.model.ttimod.para.paraindex[0, :npara].astype(np.int64)
+        # derivatives of effective TI Love parameters with respect to the inversion parameters, (npara, nlay, 5)
+        deti                = np.zeros((npara, hArr.size, 5), dtype=np.float64)
+        ivel                = np.where(ptype <= 4)[0]
+        deti[ivel, :, :]    = W[ivel, :, None]*np.transpose(dvel[:, :, ptype[ivel]], (2, 0, 1))
+        idip                = np.where(ptype == 5)[0]
+        deti[idip, :, :]    = W[idip, :, None]*ddip[None, :, :]
+        # chain with Love parameter kernels, the same terms as eigkernel.eti_perturb
+        dpvelR              = np.dot(self.eigkR.dcdA, deti[:, :, 0].T) + np.dot(self.eigkR.dcdC, deti[:, :, 1].T)\
+                                + np.dot(self.eigkR.dcdF, deti[:, :, 2].T) + np.dot(self.eigkR.dcdL, deti[:, :, 3].T)
+        dpvelL              = np.dot(self.eigkL.dcdL, deti[:, :, 3].T) + np.dot(self.eigkL.dcdN, deti[:, :, 4].T)
+        self.jacobian       = np.zeros((self.res.size, npara))
+        self.jacobian[:r1.size, :]  = -dpvelR/self.indata.dispR.stdpvelo[:r1.size, None]
+        self.jacobian[r1.size:, :]  = -dpvelL/self.indata.dispL.stdpvelo[:r4.size, None]
+        return
+
+    def gauss_newton_tti_inv(self, outdir='./workingdir_tti_gn', pfx='GN', kerneljac=True):
+        """
+        Gauss-Newton inversion for tilted TI model
+        =====================================================================================================================
+        ::: input :::
+        outdir      - output directory
+        pfx         - prefix for output
+        kerneljac   - compute Jacobian by chaining the sensitivity kernels with the analytic derivatives of
+                        the parameterization (compute_tti_jacobian_kernel) or by finite differences (compute_tti_jacobian)
+                        the two Jacobians are compared column by column in test_scripts/test_tti_jacobian.py
+        =====================================================================================================================
+        """
         if not os.path.isdir(outdir):
             os.makedirs(outdir)
         # initializations
@@ -1255,7 +1495,10 @@ class vprofile1d(object):
             print inew, self.indata.dispR.pmisfit, self.indata.dispL.pmisfit
             paraArr     = self.model.ttimod.para.paraval.copy()
             newparaArr  = paraArr.copy()
-            self.compute_tti_jacobian()
+            if kerneljac:
+                self.compute_tti_jacobian_kernel()
+            else:
+                self.compute_tti_jacobian()
             jinv            = np.linalg.pinv(np.dot(self.jacobian.T, self.jacobian))
             newparaArr[:-3] = paraArr[:-3] - np.dot( np.dot(jinv, self.jacobian.T), self.res )
             self.model.ttimod.para.paraval[:]  = np.float32(newparaArr.copy())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Module for receiver function forward computation of isotropic layered models
+
+The code is a numpy re-implementation of theo.f/qlayer.f by T. Shibutani (P-SV response of a layered dissipative medium).
+Compared with the f2py wrapper theo.theo (fixed 1024 samples, 100 layers), the solver here
+    1. uses the smallest FFT length that covers the required time window at the given sampling rate;
+    2. caches the velocity independent frequency domain terms between calls;
+    3. computes a batch of models in one call.
+
+:Copyright:
+    Author: Lili Feng
+    Graduate Research Assistant
+    CIEI, Department of Physics, University of Colorado Boulder
+    email: lili.feng@colorado.edu
+"""
+import numpy as np
+
+def stack_models(vslst, hlst, vpvslst, qplst, qslst):
+    """
+    stack a list of layerized models with different number of layers into 2D arrays (nmod, nlay)
+    models are padded with zero-thickness layers on top of the half-space, which do not change the response
+    ======================================================================================
+    ::: input :::
+    vslst, hlst, vpvslst, qplst, qslst  - lists of 1D arrays, the last layer of each model is the half-space
+    ::: output :::
+    vs, h, vpvs, qp, qs                 - 2D arrays (nmod, nlay)
+    ======================================================================================
+    """
+    nmod    = len(vslst)
+    nlay    = max([vsin.size for vsin in vslst])
+    vs      = np.zeros((nmod, nlay), dtype=np.float64)
+    h       = np.zeros((nmod, nlay), dtype=np.float64)
+    vpvs    = np.zeros((nmod, nlay), dtype=np.float64)
+    qp      = np.zeros((nmod, nlay), dtype=np.float64)
+    qs      = np.zeros((nmod, nlay), dtype=np.float64)
+    for i in range(nmod):
+        nl                  = vslst[i].size
+        for outarr, inarr in zip([vs, vpvs, qp, qs], [vslst[i], vpvslst[i], qplst[i], qslst[i]]):
+            outarr[i, :nl-1]= inarr[:nl-1]
+            outarr[i, nl-1:]= inarr[nl-1]
+        h[i, :nl-1]         = hlst[i][:nl-1]
+    return vs, h, vpvs, qp, qs
+
+class rfsolver(object):
+    """
+    An object for receiver function forward computation
+    =====================================================================================================================
+    ::: parameters :::
+    fs              - sampling rate (Hz)
+    a0              - parameter of the gaussian high-cut filter
+    c0              - parameter of the minimum amplitude level (water level)
+    t0              - time shift (sec)
+    tpad            - extra time length beyond the output window used to choose the FFT length (sec)
+                        NOTE: reverberations later than the FFT length wrap around into the output window,
+                        the default value reproduces theo.theo (1024 points) for fs = 40 Hz and 10 sec window
+    nfft, fsw       - FFT length and sampling rate of the cached frequency terms
+    w, gau, shift   - cached angular frequency, gaussian filter and time shift arrays (size nfft/2+1)
+    h, wh           - cached layer thickness and w*h arrays, reused if the layer arrays do not change
+    =====================================================================================================================
+    """
+    def __init__(self, fs=40., a0=2.5, c0=0.005, t0=0., tpad=15.):
+        self.fs     = fs
+        self.a0     = a0
+        self.c0     = c0
+        self.t0     = t0
+        self.tpad   = tpad
+        self.nfft   = 0
+        self.fsw    = 0.
+        self.h      = None
+        return
+
+    def get_nfft(self, npts):
+        """
+        get the smallest power-of-two FFT length covering npts samples plus tpad seconds
+        """
+        nreq        = npts + int(np.ceil(self.tpad*self.fs))
+        nfft        = 2
+        while nfft < nreq:
+            nfft    *= 2
+        return nfft
+
+    def init_freq(self, nfft):
+        """
+        compute and cache the velocity independent frequency domain terms
+        """
+        if nfft == self.nfft and self.fs == self.fsw:
+            return
+        self.nfft   = nfft
+        self.fsw    = self.fs
+        self.w      = 2.*np.pi*np.arange(nfft/2+1, dtype=np.float64)*self.fs/nfft
+        self.gau    = np.exp(-(self.w/(2.*self.a0))**2)
+        self.shift  = np.exp(1j*self.w*self.t0)
+        self.h      = None
+        return
+
+    def _get_wh(self, h):
+        """
+        get the w*h array (nmod, nlay, nfreq), reused if the layer arrays are unchanged
+        """
+        if self.h is None or self.h.shape != h.shape or not np.array_equal(self.h, h):
+            self.h  = h.copy()
+            self.wh = h[:, :, None]*self.w[None, None, :]
+        return self.wh
+
+    def psv_response(self, vs, h, vpvs, qp, qs, din):
+        """
+        horizontal/vertical response of incident P wave in the frequency domain (qlayer.f, lc = 1)
+        ======================================================================================
+        ::: input :::
+        vs, h, vpvs, qp, qs - 2D model arrays (nmod, nlay), the last layer is the half-space
+        din                 - incident angle in degree (nmod)
+        ::: output :::
+        up, wp              - horizontal/vertical response (nmod, nfreq)
+        ======================================================================================
+        """
+        nmod, nl    = vs.shape
+        if nl < 2:
+            raise ValueError('At least one layer above the half-space is required!')
+        va          = vs*vpvs
+        rho         = 2.35 + 0.036*(va - 3.)**2
+        # complex velocity for dissipative medium
+        alpha       = va + 1j*va/(2.*qp) + va/(8.*qp**2)
+        beta        = vs + 1j*vs/(2.*qs) + vs/(8.*qs**2)
+        # apparent velocity
+        c           = alpha[:, -1]/np.sin(np.pi*din/180.)
+        c2d         = c[:, None]
+        cal         = (c2d/alpha)**2 - 1.
+        ralpha      = np.where(cal.real >= 0., np.sqrt(cal), -1j*np.sqrt(-cal))
+        cbe         = (c2d/beta)**2 - 1.
+        rbeta       = np.where(cbe.real >= 0., np.sqrt(cbe), -1j*np.sqrt(-cbe))
+        gamma       = 2.*(beta/c2d)**2
+        rc2         = rho*c2d**2
+        # matrix product over layers above the half-space
+        wh          = self._get_wh(h)
+        nfreq       = self.w.size
+        amat        = np.zeros((nmod, nfreq, 4, 4), dtype=np.complex128)
+        prod        = None
+        for m in range(nl-1):
+            gm      = gamma[:, m, None]
+            ram     = ralpha[:, m, None]
+            rbm     = rbeta[:, m, None]
+            rcm     = rc2[:, m, None]
+            p       = wh[:, m, :]*ram/c2d
+            q       = wh[:, m, :]*rbm/c2d
+            cp      = np.cos(p)
+            sp      = np.sin(p)
+            cq      = np.cos(q)
+            sq      = np.sin(q)
+            amat[:, :, 0, 0]= gm*cp - (gm-1.)*cq
+            amat[:, :, 0, 1]= 1j*((gm-1.)*sp/ram + gm*rbm*sq)
+            amat[:, :, 0, 2]= -(cp-cq)/rcm
+            amat[:, :, 0, 3]= 1j*(sp/ram + rbm*sq)/rcm
+            amat[:, :, 1, 0]= -1j*(gm*ram*sp + (gm-1.)*sq/rbm)
+            amat[:, :, 1, 1]= -(gm-1.)*cp + gm*cq
+            amat[:, :, 1, 2]= 1j*(ram*sp + sq/rbm)/rcm
+            amat[:, :, 1, 3]= amat[:, :, 0, 2]
+            amat[:, :, 2, 0]= rcm*gm*(gm-1.)*(cp-cq)
+            amat[:, :, 2, 1]= 1j*rcm*((gm-1.)**2*sp/ram + gm**2*rbm*sq)
+            amat[:, :, 2, 2]= amat[:, :, 1, 1]
+            amat[:, :, 2, 3]= amat[:, :, 0, 1]
+            amat[:, :, 3, 0]= 1j*rcm*(gm**2*ram*sp + (gm-1.)**2*sq/rbm)
+            amat[:, :, 3, 1]= amat[:, :, 2, 0]
+            amat[:, :, 3, 2]= amat[:, :, 1, 0]
+            amat[:, :, 3, 3]= amat[:, :, 0, 0]
+            if prod is None:
+                prod        = amat.copy()
+            else:
+                prod        = np.matmul(amat, prod)
+        # inverse matrix at the lowermost interface
+        an          = alpha[:, -1]
+        bn          = beta[:, -1]
+        ran         = ralpha[:, -1]
+        rbn         = rbeta[:, -1]
+        gn          = gamma[:, -1]
+        rhon        = rho[:, -1]
+        en          = np.zeros((nmod, 4, 4), dtype=np.complex128)
+        en[:, 0, 0] = -2.*(bn/an)**2
+        en[:, 0, 2] = 1./(rhon*an**2)
+        en[:, 1, 1] = c**2*(gn-1.)/(an**2*ran)
+        en[:, 1, 3] = 1./(rhon*an**2*ran)
+        en[:, 2, 0] = (gn-1.)/(gn*rbn)
+        en[:, 2, 2] = -1./(rhon*c**2*gn*rbn)
+        en[:, 3, 1] = 1.
+        en[:, 3, 3] = 1./(rhon*c**2*gn)
+        coef1       = 2.*c**2/an**2
+        coef2       = coef1/ran
+        aj          = np.matmul(en[:, None, :, :], prod)
+        da          = (aj[:, :, 0, 0] - aj[:, :, 1, 0])*(aj[:, :, 2, 1] - aj[:, :, 3, 1]) \
+                        - (aj[:, :, 0, 1] - aj[:, :, 1, 1])*(aj[:, :, 2, 0] - aj[:, :, 3, 0])
+        dc          = aj[:, :, 3, 1] - aj[:, :, 2, 1]
+        de          = aj[:, :, 3, 0] - aj[:, :, 2, 0]
+        up          = dc/da*(coef1*an/c)[:, None]
+        wp          = de/da*(coef2*an*ran/c)[:, None]
+        return up, wp
+
+    def solve(self, vs, h, vpvs, qp, qs, npts, din=None, slowness=0.06):
+        """
+        compute radial receiver functions (theo.f)
+        ======================================================================================
+        ::: input :::
+        vs, h, vpvs, qp, qs - model arrays, 1D (nlay) for a single model or 2D (nmod, nlay) for a batch of models
+                                the last layer is the half-space (see also stack_models)
+        npts                - number of output samples
+        din                 - incident angle in degree (default - None, din will be computed from slowness)
+        slowness            - reference horizontal slowness (s/km)
+        ::: output :::
+        rx                  - radial receiver functions, (npts) or (nmod, npts)
+        ======================================================================================
+        """
+        single      = (np.ndim(vs) == 1)
+        vs          = np.atleast_2d(np.asarray(vs, dtype=np.float64))
+        h           = np.atleast_2d(np.asarray(h, dtype=np.float64))
+        vpvs        = np.atleast_2d(np.asarray(vpvs, dtype=np.float64))
+        qp          = np.atleast_2d(np.asarray(qp, dtype=np.float64))
+        qs          = np.atleast_2d(np.asarray(qs, dtype=np.float64))
+        nmod        = vs.shape[0]
+        if din is None:
+            din     = 180.*np.arcsin(vs[:, -1]*vpvs[:, -1]*slowness)/np.pi
+        din         = np.ones(nmod, dtype=np.float64)*din
+        nfft        = self.get_nfft(npts)
+        self.init_freq(nfft)
+        up, wp      = self.psv_response(vs, h, vpvs, qp, qs, din)
+        # a minimum allowable amplitude level
+        wa          = (wp*np.conj(wp)).real
+        fai         = np.maximum(wa, self.c0*wa.max(axis=1)[:, None])
+        filt        = self.gau*self.shift/fai
+        # max amplitude of the vertical receiver function
+        rv          = np.fft.hfft(wa*filt, nfft, axis=1)[:, :npts]/nfft
+        rvmax       = abs(rv).max(axis=1)
+        # radial receiver function
+        rx          = np.fft.hfft(np.conj(up)*wp*filt, nfft, axis=1)[:, :npts]/nfft/rvmax[:, None]
+        if single:
+            return rx[0]
+        return rx
+
@@ -0,0 +1,68 @@
+"""
+summarize the live status file(s) of the Monte Carlo inversion campaigns (surfdbase.mc_inv_iso/mc_inv_vti, see mcprogress)
+usage:
+    python summarize_mcprogress.py status [status ...] [--stall SEC] [--min-acc ACC] [--all]
+        status      - status file, or an output directory (all the mc_status*.json files in it)
+        --stall     - flag the running grid points not updated within SEC sec (default - 1800)
+        --min-acc   - flag the running grid points with an acceptance rate below ACC (default - 0.05)
+        --all       - list all the grid points, not only the running/failed ones
+the running grid points slower than half of the median steps/sec (of all the given campaigns) are flagged as SLOW
+"""
+import sys
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import mcprogress
+
+def print_grid(grd_id, grid, flags=[]):
+    min_misfit  = '%8.3f' %grid['min_misfit'] if grid['min_misfit'] is not None else '%8s' %'-'
+    acceptance  = '%6.3f' %grid['acceptance'] if grid['acceptance'] is not None else '%6s' %'-'
+    speed       = '%8.2f' %grid['steps_per_sec'] if grid['steps_per_sec'] is not None else '%8s' %'-'
+    print '%-24s %-8s %9d/%-9d %s %s %6d %s %10s %s' %(grd_id, grid['state'], grid['nstep'], grid['nstep_target'], acceptance,\
+            min_misfit, grid['ngood'], speed, mcprogress.format_time(grid['eta']), ' '.join(flags+[grid['note']]).strip())
+
+def main(argv=None):
+    parser      = argparse.ArgumentParser(description='summarize the status files of the MC inversion campaigns')
+    parser.add_argument('status', nargs='+', help='status files or output directories')
+    parser.add_argument('--stall', type=float, default=1800., help='stall time (sec)')
+    parser.add_argument('--min-acc', type=float, default=0.05, help='minimum acceptance rate')
+    parser.add_argument('--all', action='store_true', help='list all the grid points')
+    args        = parser.parse_args(argv)
+    fnames      = []
+    for name in args.status:
+        if os.path.isdir(name):
+            fnames  += sorted(glob.glob(os.path.join(name, 'mc_status*.json')))
+        else:
+            fnames.append(name)
+    if len(fnames) == 0:
+        print 'No status file found'
+        return 1
+    statuslst   = [mcprogress.read_status(fname) for fname in fnames]
+    tnow        = time.time()
+    speeds      = [grid['steps_per_sec'] for status in statuslst for grid in status['grd_pts'].values()\
+                    if grid['steps_per_sec'] is not None]
+    median_speed= np.median(speeds) if len(speeds) > 0 else None
+    nflag       = 0
+    for fname, status in zip(fnames, statuslst):
+        campaign    = status['campaign']
+        print '=== '+fname+' ('+campaign['mtype']+'), last written '+mcprogress.format_time(tnow - campaign['updated'])+' ago'
+        print '--- %d grid points: %d done, %d running, %d queued, %d skipped, %d failed; elapsed = %s, eta = %s' \
+                %(campaign['ngrid'], campaign['ndone'], campaign['nrunning'], campaign['nqueued'], campaign['nskipped'],\
+                  campaign['nfailed'], mcprogress.format_time(campaign['updated'] - campaign['start']),\
+                  mcprogress.format_time(campaign['eta']))
+        print '%-24s %-8s %19s %6s %8s %6s %8s %10s' %('grd_id', 'state', 'steps/target', 'acc', 'misfit', 'ngood', 'steps/s', 'eta')
+        for grd_id in sorted(status['grd_pts'].keys()):
+            grid    = status['grd_pts'][grd_id]
+            flags   = mcprogress.check_grid(grid, tnow, stall=args.stall, min_acc=args.min_acc, median_speed=median_speed)
+            nflag   += len(flags) > 0
+            if args.all or len(flags) > 0 or grid['state'] in ['running', 'failed']:
+                print_grid(grd_id, grid, flags)
+    if median_speed is not None:
+        print '--- median steps/sec = %.2f' %median_speed
+    print '--- '+str(nflag)+' flagged grid point(s)'
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
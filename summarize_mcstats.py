@@ -0,0 +1,34 @@
+"""
+summarize the stage timers and event counters of the Monte Carlo chains (mc_joint_inv_iso/mc_joint_inv_vti with timing=True)
+usage:
+    python summarize_mcstats.py datadir                 - summary of the campaign and the slowest grid points
+    python summarize_mcstats.py datadir grd_id          - summary of one grid point
+datadir is a directory of chain files (mc_inv.<grd_id>.mcc) or a consolidated chain store
+"""
+import sys
+import numpy as np
+import mcchain, mcstats
+
+if len(sys.argv) < 2:
+    print __doc__
+    sys.exit(1)
+datadir     = sys.argv[1]
+statsdict   = mcchain.get_grid_stats(datadir)
+if len(statsdict) == 0:
+    print 'No statistics found in '+datadir+', run the inversion with timing=True'
+    sys.exit(1)
+if len(sys.argv) > 2:
+    grd_id  = sys.argv[2]
+    if not grd_id in statsdict:
+        print 'No statistics for grid point: '+grd_id
+        sys.exit(1)
+    print '=== grid point: '+grd_id
+    print mcstats.summarize(statsdict[grd_id])
+    sys.exit(0)
+print '=== campaign: '+str(len(statsdict))+' grid points'
+print mcstats.summarize(mcstats.merge_stats(statsdict.values()))
+grd_ids, tstep  = mcstats.get_time_per_step(statsdict)
+print '--- time per step (ms): min = %g, median = %g, max = %g' %(1000.*tstep.min(), 1000.*np.median(tstep), 1000.*tstep.max())
+print '--- slowest grid points:'
+for i in np.argsort(tstep)[::-1][:10]:
+    print '%-32s %10.3f ms/step' %(grd_ids[i], 1000.*tstep[i])
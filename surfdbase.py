@@ -11,6 +11,8 @@ A python module for inversion with only dispersion data based on hdf5 database
     pyproj
     Basemap
     pyfftw 0.10.3 (optional)
+    The plotting and geodesy packages (matplotlib, Basemap, ObsPy, pyproj, pycpt, field2d_earth, colormaps) are imported
+    in the methods that use them, the inversion path (vprofile, modparam, vmodel, data and the solvers) does not need them.
     
 :Copyright:
     Author: Lili Feng
@@ -20,24 +22,22 @@ A python module for inversion with only dispersion data based on hdf5 database
 """
 import h5py
 import numpy as np
-import matplotlib.pyplot as plt
-import obspy
 import warnings
 import copy
 import os, shutil
+import glob
 from functools import partial
 import multiprocessing
 from subprocess import call
-from mpl_toolkits.basemap import Basemap, shiftgrid, cm, interp
-import obspy
-import vprofile, mcpost, mcpost_vti, vmodel
+import vprofile, mcpost, mcpost_vti, vmodel, mcchain, mcprogress
+import socket
 import time
 import numpy.ma as ma
-import field2d_earth
-from pyproj import Geod
-import colormaps, pycpt
-import numba
+import gridsmooth
+from scipy.spatial import cKDTree
 import time
+# NOTE: do NOT import the plotting/geodesy packages here, they are imported in the methods that use them,
+#       keeping the start-up of the scripts and of the multiprocessing workers fast (see test_scripts/test_import_time.py)
 
 def _get_vs_2d(z0, z1, zArr, vs_3d):
     Nlat, Nlon, Nz  = vs_3d.shape
@@ -50,6 +50,300 @@ def _get_vs_2d(z0, z1, zArr, vs_3d):
                     = vs_temp
     return vs_out
 
+def _geo2xyz(lons, lats):
+    """
+    convert longitude/latitude (degree) to XYZ coordinates on the unit sphere, (N, 3)
+    """
+    lons        = np.radians(np.asarray(lons, dtype=np.float64).ravel())
+    lats        = np.radians(np.asarray(lats, dtype=np.float64).ravel())
+    return np.column_stack((np.cos(lats)*np.cos(lons), np.cos(lats)*np.sin(lons), np.sin(lats)))
+
+def _get_vs_profiles(paravals, topos, zArr):
+    """
+    compute vs profiles for a batch of grid points, used by invhdf5.construct_3d
+    ==================================================================================================================
+    ::: input :::
+    paravals    - parameter arrays (Npts, 13)
+    topos       - topography (Npts, unit - km)
+    zArr        - output depth array
+    ::: output :::
+    vs2d        - vs profiles (Npts, zArr.size)
+    ==================================================================================================================
+    """
+    Npts        = paravals.shape[0]
+    vs2d        = np.zeros((Npts, zArr.size))
+    for i in range(Npts):
+        vel_mod             = vmodel.model1d()
+        topovalue           = topos[i]
+        if topovalue < 0.:
+            vel_mod.get_para_model(paraval = paravals[i, :], waterdepth=-topovalue, vpwater=1.5, nmod=4, \
+                numbp=np.array([1, 2, 4, 5]), mtype = np.array([5, 4, 2, 2]), vpvs = np.array([0, 2., 1.75, 1.75]), maxdepth=200.)
+        else:
+            vel_mod.get_para_model(paraval = paravals[i, :])
+        zArr_in, VsvArr_in  = vel_mod.get_grid_mod()
+        if topovalue > 0.:
+            zArr_in         = zArr_in - topovalue
+        # # interpolation
+        vs2d[i, :]          = np.interp(zArr, xp = zArr_in, fp = VsvArr_in)
+    return vs2d
+
+def _get_vs_profiles4mp(inarr, zArr):
+    """
+    wrapper of _get_vs_profiles for multiprocessing, inarr is a tuple of (paravals, topos)
+    """
+    return _get_vs_profiles(paravals=inarr[0], topos=inarr[1], zArr=zArr)
+
+def _read_disp_stack(grp, pers, vname, uname=None, Tmin=-999, Tmax=999, verbose=False):
+    """
+    read the dispersion maps of all periods into stacks, each map is read only once
+    ==================================================================================================================
+    ::: input :::
+    grp         - tomography group in the input hdf5 file, including the '%g_sec' period groups
+    pers        - period array
+    vname       - name of the velocity map
+    uname       - name of the uncertainty map (default - None, not read)
+    Tmin, Tmax  - minimum and maximum period to extract
+    ::: output :::
+    T           - periods with data (Nper)
+    vel         - velocity maps (Nper, Nlat, Nlon)
+    un          - uncertainty maps (Nper, Nlat, Nlon), None if uname is None
+    pergrps     - list of the period groups (Nper)
+    ==================================================================================================================
+    """
+    T           = []
+    vlst        = []
+    ulst        = []
+    pergrps     = []
+    for per in pers:
+        if per < Tmin or per > Tmax:
+            continue
+        try:
+            pergrp  = grp['%g_sec'%( per )]
+            vel     = pergrp[vname].value
+            if uname is not None:
+                ulst.append(pergrp[uname].value)
+        except KeyError:
+            if verbose:
+                print 'No data for T = '+str(per)+' sec'
+            continue
+        T.append(per)
+        vlst.append(vel)
+        pergrps.append(pergrp)
+    T           = np.array(T, dtype=np.float64)
+    vel         = np.array(vlst, dtype=np.float64)
+    un          = np.array(ulst, dtype=np.float64) if uname is not None else None
+    return T, vel, un, pergrps
+
+def _open_etopo(infname, download=True, delete=True):
+    """
+    open the etopo2 netCDF file, download the data if the file does not exist
+    """
+    from netCDF4 import Dataset
+    try:
+        etopodbase      = Dataset(infname)
+    except IOError:
+        if download:
+            url         = 'https://www.ngdc.noaa.gov/mgg/global/relief/ETOPO2/ETOPO2v2-2006/ETOPO2v2g/netCDF/ETOPO2v2g_f4_netCDF.zip'
+            os.system('wget '+url)
+            os.system('unzip ETOPO2v2g_f4_netCDF.zip')
+            if delete:
+                os.remove('ETOPO2v2g_f4_netCDF.zip')
+            etopodbase  = Dataset('./ETOPO2v2g_f4.nc')
+        else:
+            print 'No etopo data!'
+            return None
+    return etopodbase
+
+def _sample_etopo(etopodbase, grd_lons, grd_lats, method='nearest', dlon=None, dlat=None):
+    """
+    sample the etopo data at grid points, only the window of the etopo array covering the grid points is read
+    ==================================================================================================================
+    ::: input :::
+    etopodbase  - etopo netCDF dataset (regular grid, increasing x/y)
+    grd_lons    - longitude of grid points (0 ~ 360 or -180 ~ 180)
+    grd_lats    - latitude of grid points
+    method      - 'nearest'     : etopo grid point within half of the etopo interval (1/60 deg)
+                  'bilinear'    : bilinear interpolation
+                  'average'     : average of the etopo grid points inside the cell of dlon x dlat centered at the grid point
+    dlon, dlat  - grid interval, only used for method = 'average'
+    ::: output :::
+    z           - topography (unit - km), the same shape as grd_lons
+    ==================================================================================================================
+    """
+    lons        = etopodbase.variables['x'][:]
+    lats        = etopodbase.variables['y'][:]
+    shape       = np.shape(grd_lons)
+    glons       = np.array(grd_lons, dtype=np.float64).ravel()
+    glats       = np.array(grd_lats, dtype=np.float64).ravel()
+    glons[glons > 180.] -= 360.
+    if method == 'nearest':
+        ind_lon = np.minimum(np.searchsorted(lons, glons, side='left'), lons.size - 1)
+        ind_lat = np.minimum(np.searchsorted(lats, glats, side='left'), lats.size - 1)
+        ind_lon[(lons[ind_lon] - glons) > (1./60.)] -= 1
+        ind_lat[(lats[ind_lat] - glats) > (1./60.)] -= 1
+        ind_lon = np.maximum(ind_lon, 0)
+        ind_lat = np.maximum(ind_lat, 0)
+        ind_err = (abs(lons[ind_lon] - glons) > 1./60.) + (abs(lats[ind_lat] - glats) > 1./60.)
+        for i in np.where(ind_err)[0]:
+            print 'ERROR!', lons[ind_lon[i]], lats[ind_lat[i]], glons[i], glats[i]
+        i0      = ind_lat.min()
+        j0      = ind_lon.min()
+        etopo   = etopodbase.variables['z'][i0:ind_lat.max()+1, j0:ind_lon.max()+1]
+        z       = np.asarray(etopo[ind_lat-i0, ind_lon-j0], dtype=np.float64)/1000. # convert to km
+    elif method == 'bilinear':
+        flon    = np.clip((glons - lons[0])/(lons[1] - lons[0]), 0., lons.size - 1.)
+        flat    = np.clip((glats - lats[0])/(lats[1] - lats[0]), 0., lats.size - 1.)
+        ind_lon = np.minimum(np.floor(flon).astype(np.int64), lons.size - 2)
+        ind_lat = np.minimum(np.floor(flat).astype(np.int64), lats.size - 2)
+        wlon    = flon - ind_lon
+        wlat    = flat - ind_lat
+        i0      = ind_lat.min()
+        j0      = ind_lon.min()
+        etopo   = np.asarray(etopodbase.variables['z'][i0:ind_lat.max()+2, j0:ind_lon.max()+2], dtype=np.float64)
+        il      = ind_lat - i0
+        jl      = ind_lon - j0
+        z       = ((1.-wlat)*(1.-wlon)*etopo[il, jl] + (1.-wlat)*wlon*etopo[il, jl+1] \
+                    + wlat*(1.-wlon)*etopo[il+1, jl] + wlat*wlon*etopo[il+1, jl+1])/1000.
+    elif method == 'average':
+        if dlon is None or dlat is None:
+            raise ValueError('dlon/dlat should be specified for average!')
+        jlo     = np.searchsorted(lons, glons - dlon/2., side='left')
+        jhi     = np.searchsorted(lons, glons + dlon/2., side='right')
+        ilo     = np.searchsorted(lats, glats - dlat/2., side='left')
+        ihi     = np.searchsorted(lats, glats + dlat/2., side='right')
+        # at least one etopo grid point in each cell
+        jlo     = np.clip(jlo, 0, lons.size - 1)
+        ilo     = np.clip(ilo, 0, lats.size - 1)
+        jhi     = np.clip(np.maximum(jhi, jlo + 1), 1, lons.size)
+        ihi     = np.clip(np.maximum(ihi, ilo + 1), 1, lats.size)
+        i0      = ilo.min()
+        j0      = jlo.min()
+        etopo   = np.asarray(etopodbase.variables['z'][i0:ihi.max(), j0:jhi.max()], dtype=np.float64)
+        # summed area table
+        S       = np.zeros((etopo.shape[0]+1, etopo.shape[1]+1), dtype=np.float64)
+        S[1:, 1:]   = etopo.cumsum(axis=0).cumsum(axis=1)
+        ilo     -= i0
+        ihi     -= i0
+        jlo     -= j0
+        jhi     -= j0
+        z       = (S[ihi, jhi] - S[ilo, jhi] - S[ihi, jlo] + S[ilo, jlo])/((ihi - ilo)*(jhi - jlo))/1000.
+    else:
+        raise ValueError('Unexpected sampling method: '+method)
+    return np.asarray(z).reshape(shape)
+
+def _store_mc_outputs(outstore, outdir, grd_ids, ntry=5, wait=10.):
+    """
+    move the outputs of the MC inversion of the grid points from outdir into the consolidated chain store
+    the store is only opened during the append, the main process is the only writer
+    ==================================================================================================================
+    ::: input :::
+    outstore    - consolidated chain store (mcchain.chainstore)
+    outdir      - output directory of the MC inversion
+    grd_ids     - list of grid point ids
+    ntry        - number of attempts to open the store
+    wait        - time interval between two attempts (sec)
+    ::: output :::
+    list of grid point ids NOT appended, their outputs are left in outdir
+    ==================================================================================================================
+    NOTE: the store can NOT be opened for writing while it is opened by a reader in another process (HDF5 file locking),
+        if it is still locked after ntry attempts, the append is given up and left to the caller (retried with the
+        next grid point), the inversion is NOT stopped
+    """
+    store       = None
+    for itry in xrange(ntry):
+        try:
+            store   = mcchain.chainstore(outstore, mode='a')
+            break
+        except IOError as err:
+            if itry < ntry - 1:
+                time.sleep(wait)
+    if store is None:
+        print 'WARNING: failed to open the chain store '+outstore+': '+str(err)+', '+str(len(grd_ids))+' grid point(s) left in '+outdir
+        return grd_ids
+    with store:
+        for grd_id in grd_ids:
+            fnames      = glob.glob(outdir+'/'+grd_id+'.*') + glob.glob(outdir+'/'+grd_id+'_*')
+            datafname   = outdir+'/mc_data.'+grd_id+'.npz'
+            if os.path.isfile(datafname):
+                fnames.append(datafname)
+            store.append(grd_id, mcchain.get_inv_fname(outdir, grd_id), fnames=fnames)
+    return []
+
+def _read_inv_grd(inarr, datadir, factor, thresh, stdfactor, avgqc, Nmax, Nmin, wtype):
+    """
+    compute the summary of the inversion results for a grid point, used by invhdf5.read_inv
+    Nothing is written to the database, the results are returned to the main process (the single writer)
+    ==================================================================================================================
+    ::: input :::
+    inarr       - (grd_id, topovalue, list of dataset names in the grid point group)
+    ::: output :::
+    grd_id      - grid point id
+    isstable    - the inversion result passes the quality control or not
+    dsets       - list of (name, data) for the datasets
+    attrs       - list of (name, value) for the attributes
+    ==================================================================================================================
+    """
+    grd_id, topovalue, grpkeys  = inarr
+    if mcchain.is_store(datadir):
+        with mcchain.chainstore(datadir) as store:
+            invfname    = store.get_chain(grd_id).load()
+            datafname   = store.get_file(grd_id, 'mc_data.'+grd_id+'.npz')
+    else:
+        invfname    = mcchain.get_inv_fname(datadir, grd_id)
+        datafname   = datadir+'/mc_data.'+grd_id+'.npz'
+    vpr         = mcpost.postvpr(waterdepth=-topovalue, factor=factor, thresh=thresh, stdfactor=stdfactor)
+    vpr.read_data(infname = datafname)
+    vpr.read_inv_data(infname = invfname, verbose=False, Nmax=Nmax, Nmin=Nmin)
+    vpr.get_paraval()
+    vpr.run_avg_fwrd(wdisp=1.)
+    vpr.get_ensemble()
+    vpr.get_vs_std()
+    if avgqc:
+        if vpr.avg_misfit > (vpr.min_misfit*vpr.factor + vpr.thresh)*3.:
+            return grd_id, False, [], []
+    dsets       = [('avg_paraval_'+wtype, vpr.avg_paraval), ('min_paraval_'+wtype, vpr.min_paraval),
+                   ('sem_paraval_'+wtype, vpr.sem_paraval), ('std_paraval_'+wtype, vpr.std_paraval),
+                   ('zArr_ensemble_'+wtype, vpr.zArr_ensemble), ('vs_upper_bound_'+wtype, vpr.vs_upper_bound),
+                   ('vs_lower_bound_'+wtype, vpr.vs_lower_bound), ('vs_std_'+wtype, vpr.vs_std),
+                   ('vs_mean_'+wtype, vpr.vs_mean)]
+    if ('disp_ph_'+wtype) in grpkeys:
+        dsets   += [('avg_ph_'+wtype, vpr.vprfwrd.data.dispR.pvelp), ('min_ph_'+wtype, vpr.disppre_ph[vpr.ind_min, :])]
+    if ('disp_gr_'+wtype) in grpkeys:
+        dsets   += [('avg_gr_'+wtype, vpr.vprfwrd.data.dispR.gvelp), ('min_gr_'+wtype, vpr.disppre_gr[vpr.ind_min, :])]
+    attrs       = [('avg_misfit_'+wtype, vpr.vprfwrd.data.misfit), ('min_misfit_'+wtype, vpr.min_misfit),
+                   ('mean_misfit_'+wtype, vpr.mean_misfit)]
+    return grd_id, True, dsets, attrs
+
+def _read_inv_vti_grd(inarr, datadir, factor, thresh, stdfactor, avgqc, Nmax, Nmin):
+    """
+    compute the summary of the VTI inversion results for a grid point, used by invhdf5.read_inv_vti
+    see _read_inv_grd for the input/output
+    """
+    grd_id, topovalue, grpkeys  = inarr
+    vpr         = mcpost_vti.postvpr(waterdepth=-topovalue, factor=factor, thresh=thresh, stdfactor=stdfactor)
+    if mcchain.is_store(datadir):
+        with mcchain.chainstore(datadir) as store:
+            invfname    = store.get_chain(grd_id).load()
+            vpr.read_data(pfx = grd_id, store = store)
+    else:
+        invfname    = mcchain.get_inv_fname(datadir, grd_id)
+        vpr.read_data(pfx = datadir+'/'+grd_id)
+    vpr.read_inv_data(infname = invfname, verbose=False, Nmax=Nmax, Nmin=Nmin)
+    vpr.get_paraval()
+    vpr.get_vmodel()
+    vpr.run_avg_fwrd()
+    if avgqc:
+        if vpr.avg_misfit > (vpr.min_misfit*vpr.factor + vpr.thresh)*3.:
+            return grd_id, False, [], []
+    dsets       = [('avg_paraval_vti', vpr.avg_paraval), ('min_paraval_vti', vpr.min_paraval),
+                   ('sem_paraval_vti', vpr.sem_paraval), ('std_paraval_vti', vpr.std_paraval),
+                   # Rayleigh/Love wave average and minimum dispersion curves
+                   ('avg_ph_ray_vti', vpr.vprfwrd.data.dispR.pvelp), ('min_ph_ray_vti', vpr.disppre_ray[vpr.ind_min, :]),
+                   ('avg_ph_lov_vti', vpr.vprfwrd.data.dispL.pvelp), ('min_ph_lov_vti', vpr.disppre_lov[vpr.ind_min, :])]
+    attrs       = [('avg_misfit_vti', vpr.vprfwrd.data.misfit), ('min_misfit_vti', vpr.min_misfit),
+                   ('mean_misfit_vti', vpr.mean_misfit), ('init_misfit_vti', vpr.init_misfit)]
+    return grd_id, True, dsets, attrs
+
 def read_slab_contour(infname, depth):
     ctrlst  = []
     lonlst  = []
@@ -78,6 +372,7 @@ def read_slab_contour(infname, depth):
     
 def discrete_cmap(N, base_cmap=None):
     """Create an N-bin discrete colormap from the specified input map"""
+    import matplotlib.pyplot as plt
     # Note that if base_cmap is a string or None, you can simply do
     #    return plt.cm.get_cmap(base_cmap, N)
     # The following works for string, None, or a colormap instance:
@@ -124,6 +419,12 @@ class invhdf5(h5py.File):
                                                     or mask_ray in the original hybrid tomography database
     self.attrs['mask_interp']       - mask array for interpolated finalized results, bool array
                                         this array is typically the "mask_inv" in the original ray tomography database
+    
+    --- NOTES: dense array layout (migrate_grd_pts) ---
+    self['grd_arr/dsets/<name>']    - data/valid/shape arrays of a grid point dataset for the (dlon, dlat) grid
+    self['grd_arr/attrs/<name>']    - data/valid arrays of a grid point attribute for the (dlon, dlat) grid
+                                        get_grd_map/get_grd_data read from either layout, grd_arr is a copy of grd_pts
+                                        deleted by the methods writing to grd_pts
     ===================================================================================================================
     """
     def print_info(self):
@@ -164,6 +465,12 @@ class invhdf5(h5py.File):
         except:
             outstr  += '--- mask_interp array NOT initialized  \n'
         outstr      += '---------------------------------------------------------- grid point data -----------------------------------------------------------------\n'
+        if 'grd_arr' in self.keys():
+            outstr  += '--- dense arrays (grd_arr, migrate_grd_pts)             - '+str(len(self['grd_arr/dsets'].keys()))+' datasets, '+\
+                            str(len(self['grd_arr/attrs'].keys()))+' attributes of '+str(self['grd_arr'].attrs['Ngrd'])+' grid points\n'
+        if not 'grd_pts' in self.keys():
+            print outstr
+            return
         grd_grp     = self['grd_pts']
         Ngrid       = len(grd_grp.keys())
         outstr      += '--- number of grid points                               - ' +str(Ngrid)+'\n'
@@ -346,9 +653,265 @@ class invhdf5(h5py.File):
         self.attrs.create(name = 'dlat_interp', data=dlat)
         return
     
+    def _grd_pts_modified(self):
+        """
+        delete the copies of the grid point data, called by every method writing to the grid point groups (grd_pts)
+            grd_arr     - dense array layout (migrate_grd_pts), run migrate_grd_pts again to restore it
+            topo        - topography array of the grid points cached by get_topo_arr (is_interp = False)
+            the cached grid point index (_get_grd_index) and cross-sections (get_cross_section)
+        """
+        if 'grd_arr' in self.keys():
+            print 'WARNING: grid point data modified, the dense array layout (grd_arr) is deleted, run migrate_grd_pts again!'
+            del self['grd_arr']
+        if 'topo' in self.keys() and self['topo'].attrs.get('method') == 'grd_pts':
+            del self['topo']
+        self._grd_index_cache   = {}
+        self._xsec_cache        = {}
+        return
+    
+    #==================================================================
+    # dense array layout of the grid point data
+    #==================================================================
+    def _gather_grd_pts(self, names=None, attrnames=None):
+        """
+        read the datasets/attributes of all grid point groups (grd_pts) into dense arrays in a single pass
+        ==================================================================================================================
+        ::: input :::
+        names       - names of the datasets to read (default - None, all numerical datasets)
+        attrnames   - names of the attributes to read (default - None, all numerical scalar attributes)
+        ::: output :::
+        dsets       - dictionary of datasets, name -> (data, valid, shape)
+                        data    : (Nlat, Nlon, *maxshape), padded with NaN (zero for integer data)
+                        valid   : (Nlat, Nlon), True for the grid points with data
+                        shape   : (Nlat, Nlon, ndim), shape of the data at each grid point
+        attrs       - dictionary of attributes, name -> (data (Nlat, Nlon), valid (Nlat, Nlon))
+        Ngrd        - number of grid point groups in the (dlon, dlat) grid
+        ==================================================================================================================
+        """
+        grdlst, ind_lat, ind_lon\
+                    = self._get_grd_index()
+        grd_grp     = self['grd_pts']
+        dlst        = {}
+        alst        = {}
+        for igrd in xrange(len(grdlst)):
+            grp     = grd_grp[grdlst[igrd]]
+            for name in (grp.keys() if names is None else names):
+                if not name in grp:
+                    continue
+                value   = np.asarray(grp[name].value)
+                if value.dtype.kind not in 'biuf':
+                    continue
+                if not name in dlst:
+                    dlst[name]  = []
+                dlst[name].append((igrd, value))
+            for name in (grp.attrs.keys() if attrnames is None else attrnames):
+                if not name in grp.attrs:
+                    continue
+                value   = np.asarray(grp.attrs[name])
+                if value.dtype.kind not in 'biuf' or value.ndim != 0:
+                    continue
+                if not name in alst:
+                    alst[name]  = []
+                alst[name].append((igrd, value))
+        dsets       = {}
+        for name in dlst:
+            values  = [value for igrd, value in dlst[name]]
+            ndim    = values[0].ndim
+            if np.any([value.ndim != ndim for value in values]):
+                print 'WARNING: inconsistent dimension of '+name+', skipped!'
+                continue
+            maxshape= tuple([max([value.shape[k] for value in values]) for k in range(ndim)])
+            dtype   = np.result_type(*values)
+            if dtype.kind == 'f':
+                data= np.full((self.Nlat, self.Nlon)+maxshape, np.nan, dtype=dtype)
+            else:
+                data= np.zeros((self.Nlat, self.Nlon)+maxshape, dtype=dtype)
+            valid   = np.zeros((self.Nlat, self.Nlon), dtype=bool)
+            shape   = np.zeros((self.Nlat, self.Nlon, ndim), dtype=np.int32)
+            for igrd, value in dlst[name]:
+                ilat            = ind_lat[igrd]
+                ilon            = ind_lon[igrd]
+                data[(ilat, ilon)+tuple([slice(0, n) for n in value.shape])]\
+                                = value
+                valid[ilat, ilon]   = True
+                shape[ilat, ilon]   = value.shape
+            dsets[name] = (data, valid, shape)
+        attrs       = {}
+        for name in alst:
+            dtype   = np.result_type(*[value for igrd, value in alst[name]])
+            if dtype.kind == 'f':
+                data= np.full((self.Nlat, self.Nlon), np.nan, dtype=dtype)
+            else:
+                data= np.zeros((self.Nlat, self.Nlon), dtype=dtype)
+            valid   = np.zeros((self.Nlat, self.Nlon), dtype=bool)
+            for igrd, value in alst[name]:
+                data[ind_lat[igrd], ind_lon[igrd]]  = value
+                valid[ind_lat[igrd], ind_lon[igrd]] = True
+            attrs[name] = (data, valid)
+        return dsets, attrs, len(grdlst)
+    
+    def migrate_grd_pts(self, compression='gzip', verbose=True):
+        """
+        migrate the grid point data (one group per grid point in grd_pts) to the dense array layout (grd_arr)
+        ==================================================================================================================
+        ::: input :::
+        compression - compression filter of the dense arrays (default - gzip, None for no compression)
+        ::: output :::
+        grd_arr/dsets/<name>/data   - dataset of all grid points (Nlat, Nlon, ...), the trailing axes (e.g. period axis of
+                                        the dispersion data) are padded to the maximum size with NaN
+        grd_arr/dsets/<name>/valid  - validity mask (Nlat, Nlon)
+        grd_arr/dsets/<name>/shape  - shape of the dataset at each grid point (Nlat, Nlon, ndim)
+        grd_arr/attrs/<name>/data   - attribute of all grid points (Nlat, Nlon)
+        grd_arr/attrs/<name>/valid  - validity mask (Nlat, Nlon)
+        ------------------------------------------------------------------------------------------------------------------
+        The dense layout is only a read-optimized copy of grd_pts, grd_pts is kept as the primary storage (the methods reading
+        single grid points and all the writers use it). The copy is deleted by the methods writing to grd_pts
+        (see _grd_pts_modified), the migration should then be run again.
+        ==================================================================================================================
+        """
+        dsets, attrs, Ngrd  = self._gather_grd_pts()
+        Nskip       = len(self['grd_pts'].keys()) - Ngrd
+        if Nskip > 0:
+            print 'WARNING: '+str(Nskip)+' grid point groups are NOT in the (dlon, dlat) grid and are NOT migrated!'
+        if 'grd_arr' in self.keys():
+            del self['grd_arr']
+        arr_grp     = self.create_group(name='grd_arr')
+        arr_grp.attrs.create(name='Ngrd', data=Ngrd)
+        dset_grp    = arr_grp.create_group(name='dsets')
+        for name in dsets:
+            data, valid, shape  = dsets[name]
+            grp     = dset_grp.create_group(name=name)
+            grp.create_dataset(name='data', data=data, compression=compression)
+            grp.create_dataset(name='valid', data=valid)
+            grp.create_dataset(name='shape', data=shape)
+            if verbose:
+                print '--- dataset: '+name+', shape = '+str(data.shape)+', '+str(valid.sum())+' grid points'
+        attr_grp    = arr_grp.create_group(name='attrs')
+        for name in attrs:
+            data, valid = attrs[name]
+            grp     = attr_grp.create_group(name=name)
+            grp.create_dataset(name='data', data=data)
+            grp.create_dataset(name='valid', data=valid)
+            if verbose:
+                print '--- attribute: '+name+', '+str(valid.sum())+' grid points'
+        return
+    
+    def _in_grd_arr(self, name, isattr=False):
+        """
+        check if a dataset/attribute of the grid points is in the dense layout (grd_arr)
+        """
+        return 'grd_arr' in self.keys() and name in self['grd_arr/'+('attrs' if isattr else 'dsets')].keys()
+    
+    def get_grd_map(self, name, isattr=False):
+        """
+        get the data of all grid points for a dataset/attribute of the grid points
+        the dense layout (grd_arr) is used if it contains the dataset/attribute, otherwise the data is gathered from grd_pts
+        ==================================================================================================================
+        ::: input :::
+        name        - name of the dataset/attribute
+        isattr      - the name is an attribute or not
+        ::: output :::
+        data        - (Nlat, Nlon, ...) data array, padded with NaN
+        valid       - (Nlat, Nlon) validity mask
+        ==================================================================================================================
+        """
+        self._get_lon_lat_arr(is_interp=False)
+        subgrp      = 'attrs' if isattr else 'dsets'
+        if self._in_grd_arr(name, isattr=isattr):
+            grp     = self['grd_arr/'+subgrp+'/'+name]
+            return grp['data'].value, grp['valid'].value
+        if isattr:
+            dsets, attrs, Ngrd  = self._gather_grd_pts(names=[], attrnames=[name])
+            return attrs[name]
+        else:
+            dsets, attrs, Ngrd  = self._gather_grd_pts(names=[name], attrnames=[])
+            return dsets[name][:2]
+    
+    def get_grd_data(self, lon, lat, name, isattr=False):
+        """
+        get a dataset/attribute of a grid point, from the dense layout (grd_arr) if it contains the dataset/attribute or grd_pts
+        KeyError is raised if there is no data at the grid point
+        ==================================================================================================================
+        ::: input :::
+        lon, lat    - location of the grid point
+        name        - name of the dataset/attribute
+        isattr      - the name is an attribute or not
+        ::: output :::
+        data        - the same as grd_pts[grd_id][name].value or grd_pts[grd_id].attrs[name]
+        ==================================================================================================================
+        """
+        if lon < 0.:
+            lon     += 360.
+        if not self._in_grd_arr(name, isattr=isattr):
+            grp     = self['grd_pts'][str(lon)+'_'+str(lat)]
+            if isattr:
+                return grp.attrs[name]
+            return grp[name].value
+        self._get_lon_lat_arr(is_interp=False)
+        try:
+            ilon    = np.where(lon==self.lons)[0][0]
+            ilat    = np.where(lat==self.lats)[0][0]
+        except IndexError:
+            raise KeyError('No grid point at: lon = '+str(lon)+', lat = '+str(lat))
+        subgrp      = 'attrs' if isattr else 'dsets'
+        grp         = self['grd_arr/'+subgrp+'/'+name]
+        if not grp['valid'][ilat, ilon]:
+            raise KeyError('No '+name+' at: lon = '+str(lon)+', lat = '+str(lat))
+        if isattr:
+            return grp['data'][ilat, ilon]
+        shape       = grp['shape'][ilat, ilon, :]
+        return grp['data'][(ilat, ilon)+tuple([slice(0, n) for n in shape])]
+    
     #==================================================================
     # functions before MC inversion runs
     #==================================================================
+    def _write_disp_arrays(self, name, mask, T, vel, un, isvalid=None, create_grp=True):
+        """
+        write the dispersion arrays (3, Nper) of all grid points that are not masked
+        ==================================================================================================================
+        ::: input :::
+        name        - output dataset name in each grid point group (e.g. disp_ph_ray)
+        mask        - mask array (Nlat, Nlon), True for the grid points to be skipped
+        T           - period array (Nper)
+        vel, un     - velocity/uncertainty maps (Nper, Nlat, Nlon), or (Nper, Npts) values of the unmasked grid points
+        isvalid     - flag array (Nper, Nlat, Nlon) for the valid data (default - None, all periods are valid)
+        create_grp  - True  : create the grid point groups
+                      False : only write to the existing grid point groups
+        ==================================================================================================================
+        """
+        self._get_lon_lat_arr()
+        ind_lat, ind_lon    = np.where(np.logical_not(np.asarray(mask, dtype=bool)))
+        if T.size == 0:
+            # no period in the period range, empty (3, 0) arrays are written as before
+            print 'WARNING: no period found for '+name+', empty dispersion arrays are written'
+            vel     = np.zeros((0, ind_lat.size), dtype=np.float64)
+            un      = np.zeros((0, ind_lat.size), dtype=np.float64)
+            isvalid = None
+        if vel.ndim == 3:
+            vel     = vel[:, ind_lat, ind_lon]
+        if un.ndim == 3:
+            un      = un[:, ind_lat, ind_lon]
+        if isvalid is not None:
+            isvalid = isvalid[:, ind_lat, ind_lon]
+        self._grd_pts_modified()
+        grd_grp     = self.require_group('grd_pts')
+        for i in xrange(ind_lat.size):
+            data_str    = str(self.lons[ind_lon[i]])+'_'+str(self.lats[ind_lat[i]])
+            if create_grp:
+                group   = grd_grp.require_group( name = data_str )
+            else:
+                try:
+                    group   = grd_grp[data_str]
+                except KeyError:
+                    continue
+            if isvalid is None:
+                data    = np.array([T, vel[:, i], un[:, i]], dtype=np.float64)
+            else:
+                iper    = isvalid[:, i]
+                data    = np.array([T[iper], vel[iper, i], un[iper, i]], dtype=np.float64)
+            group.create_dataset(name=name, data=data)
+        return
+    
     def read_hybridtomo_dbase(self, inh5fname, runid, dtype='ph', wtype='ray', create_header=True, \
                 Tmin=-999, Tmax=999, verbose=False, semfactor=2.):
         """
@@ -397,39 +960,15 @@ class invhdf5(h5py.File):
         self.attrs.create(name='mask_inv', data = mask_ray)
         Traymax             = grp.attrs['T_ray_max']
         # added on 2019-03-17
-        grd_grp             = self.require_group('grd_pts')
-        for ilat in range(self.Nlat):
-            for ilon in range(self.Nlon):
-                if mask_ray[ilat, ilon]:
-                    continue
-                data_str    = str(self.lons[ilon])+'_'+str(self.lats[ilat])
-                group       = grd_grp.require_group( name = data_str )
-                disp_v      = np.array([])
-                disp_un     = np.array([])
-                T           = np.array([])
-                for per in pers:
-                    if per < Tmin or per > Tmax:
-                        continue
-                    try:
-                        pergrp      = grp['%g_sec'%( per )]
-                        vel         = pergrp['vel_iso_interp'].value
-                        vel_sem     = pergrp['vel_sem_interp'].value
-                    except KeyError:
-                        if verbose:
-                            print 'No data for T = '+str(per)+' sec'
-                        continue
-                    if per > Traymax:
-                        mask_interp = pergrp['mask_interp'].value
-                        if mask_interp[ilat, ilon]:
-                            continue
-                    T               = np.append(T, per)
-                    disp_v          = np.append(disp_v, vel[ilat, ilon])
-                    disp_un         = np.append(disp_un, vel_sem[ilat, ilon])
-                data                = np.zeros((3, T.size))
-                data[0, :]          = T[:]
-                data[1, :]          = disp_v[:]
-                data[2, :]          = disp_un[:] * semfactor
-                group.create_dataset(name='disp_'+dtype+'_'+wtype, data=data)
+        # read the maps of each period once, (Nper, Nlat, Nlon)
+        T, vel, vel_sem, pergrps    = _read_disp_stack(grp=grp, pers=pers, vname='vel_iso_interp', uname='vel_sem_interp',\
+                                        Tmin=Tmin, Tmax=Tmax, verbose=verbose)
+        # periods longer than Traymax are only valid inside mask_interp of the period
+        isvalid             = np.ones(vel.shape, dtype=bool)
+        for iper in xrange(T.size):
+            if T[iper] > Traymax:
+                isvalid[iper]   = np.logical_not(pergrps[iper]['mask_interp'].value)
+        self._write_disp_arrays(name='disp_'+dtype+'_'+wtype, mask=mask_ray, T=T, vel=vel, un=vel_sem*semfactor, isvalid=isvalid)
         indset.close()
         return
     
@@ -499,35 +1038,10 @@ class invhdf5(h5py.File):
             self.attrs.create(name='mask_inv', data = mask_inv)
         else:
             self.attrs.create(name='mask_inv', data = mask)
-        grd_grp             = self.require_group('grd_pts')
-        for ilat in range(self.Nlat):
-            for ilon in range(self.Nlon):
-                if mask[ilat, ilon]:
-                    continue
-                data_str    = str(self.lons[ilon])+'_'+str(self.lats[ilat])
-                group       = grd_grp.create_group( name = data_str )
-                disp_v      = np.array([])
-                disp_un     = np.array([])
-                T           = np.array([])
-                for per in pers:
-                    if per < Tmin or per > Tmax:
-                        continue
-                    try:
-                        pergrp      = grp['%g_sec'%( per )]
-                        vel         = pergrp['vel_iso'+sfx].value
-                        vel_sem     = pergrp['vel_sem'+sfx].value
-                    except KeyError:
-                        if verbose:
-                            print 'No data for T = '+str(per)+' sec'
-                        continue
-                    T               = np.append(T, per)
-                    disp_v          = np.append(disp_v, vel[ilat, ilon])
-                    disp_un         = np.append(disp_un, vel_sem[ilat, ilon])
-                data                = np.zeros((3, T.size))
-                data[0, :]          = T[:]
-                data[1, :]          = disp_v[:]
-                data[2, :]          = disp_un[:] * semfactor
-                group.create_dataset(name='disp_'+dtype+'_'+wtype, data=data)
+        # read the maps of each period once, (Nper, Nlat, Nlon)
+        T, vel, vel_sem, pergrps    = _read_disp_stack(grp=grp, pers=pers, vname='vel_iso'+sfx, uname='vel_sem'+sfx,\
+                                        Tmin=Tmin, Tmax=Tmax, verbose=verbose)
+        self._write_disp_arrays(name='disp_'+dtype+'_'+wtype, mask=mask, T=T, vel=vel, un=vel_sem*semfactor)
         indset.close()
         return
     
@@ -573,6 +1087,12 @@ class invhdf5(h5py.File):
         mask            = mask_org + mask_new
         self.attrs.create(name='mask_inv', data = mask)
         self._get_lon_lat_arr()
+        # read the maps of each period once, (Nper, Nlat, Nlon)
+        T, vel, vel_sem, pergrps    = _read_disp_stack(grp=grp, pers=pers, vname='vel_iso'+sfx, Tmin=Tmin, Tmax=Tmax, verbose=verbose)
+        if T.size == 0:
+            print 'WARNING: no period found for disp_gr_'+wtype+', empty dispersion arrays are written'
+            vel     = np.zeros((0, self.Nlat, self.Nlon), dtype=np.float64)
+        self._grd_pts_modified()
         grd_grp         = self.require_group('grd_pts')
         for ilat in range(self.Nlat):
             for ilon in range(self.Nlon):
@@ -587,20 +1107,7 @@ class invhdf5(h5py.File):
                             = grd_grp.create_group( name = data_str )
                     else:
                         continue
-                disp_v      = np.array([])
-                T           = np.array([])
-                for per in pers:
-                    if per < Tmin or per > Tmax:
-                        continue
-                    try:
-                        pergrp      = grp['%g_sec'%( per )]
-                        vel         = pergrp['vel_iso'+sfx].value
-                    except KeyError:
-                        if verbose:
-                            print 'No data for T = '+str(per)+' sec'
-                        continue
-                    T               = np.append(T, per)
-                    disp_v          = np.append(disp_v, vel[ilat, ilon])
+                disp_v      = vel[:, ilat, ilon]
                 # get sem from phase for group
                 per_phase           = group['disp_ph_ray'].value[0, :]
                 disp_un             = group['disp_ph_ray'].value[2, :]
@@ -637,6 +1144,7 @@ class invhdf5(h5py.File):
                     -= 360.
         else:
             replace_moho    = None
+        self._grd_pts_modified()
         grd_grp     = self.require_group('grd_pts')
         for grp_id in grd_grp.keys():
             grp     = grd_grp[grp_id]
@@ -684,6 +1192,7 @@ class invhdf5(h5py.File):
         latArr      = latArr.reshape(latArr.size/360, 360)
         depthArr    = inArr[:, 2]
         depthArr    = depthArr.reshape(depthArr.size/360, 360)
+        self._grd_pts_modified()
         grd_grp     = self.require_group('grd_pts')
         for grp_id in grd_grp.keys():
             grp     = grd_grp[grp_id]
@@ -712,6 +1221,7 @@ class invhdf5(h5py.File):
         indset      = h5py.File(infname)
         lons        = np.mgrid[0.:359.:2.]
         lats        = np.mgrid[-88.:89.:2.]
+        self._grd_pts_modified()
         grd_grp     = self.require_group('grd_pts')
         for grp_id in grd_grp.keys():
             grp         = grd_grp[grp_id]
@@ -742,7 +1252,7 @@ class invhdf5(h5py.File):
         indset.close()
         return
     
-    def read_etopo(self, infname='../ETOPO2v2g_f4.nc', download=True, delete=True, source='etopo2'):
+    def read_etopo(self, infname='../ETOPO2v2g_f4.nc', download=True, delete=True, source='etopo2', method='nearest'):
         """
         read topography data from etopo2
         ============================================================================
@@ -751,53 +1261,40 @@ class invhdf5(h5py.File):
         download    - download the data or not, if the etopo file does not exist
         delete      - delete the downloaded etopo file or not
         source      - source name (default - etopo2)
+        method      - sampling method (nearest/bilinear/average, see _sample_etopo)
         ============================================================================
         """
-        from netCDF4 import Dataset
-        try:
-            etopodbase      = Dataset(infname)
-        except IOError:
-            if download:
-                url         = 'https://www.ngdc.noaa.gov/mgg/global/relief/ETOPO2/ETOPO2v2-2006/ETOPO2v2g/netCDF/ETOPO2v2g_f4_netCDF.zip'
-                os.system('wget '+url)
-                os.system('unzip ETOPO2v2g_f4_netCDF.zip')
-                if delete:
-                    os.remove('ETOPO2v2g_f4_netCDF.zip')
-                etopodbase  = Dataset('./ETOPO2v2g_f4.nc')
-            else:
-                print 'No etopo data!'
-                return
-        etopo       = etopodbase.variables['z'][:]
-        lons        = etopodbase.variables['x'][:]
-        lats        = etopodbase.variables['y'][:]
+        etopodbase  = _open_etopo(infname, download=download, delete=delete)
+        if etopodbase is None:
+            return
+        self._grd_pts_modified()
         grd_grp     = self['grd_pts']
+        grdlst      = []
+        grd_lons    = []
+        grd_lats    = []
         for grp_id in grd_grp.keys():
-            grp     = grd_grp[grp_id]
             split_id= grp_id.split('_')
             try:
                 grd_lon     = float(split_id[0])
             except ValueError:
                 continue
-            if grd_lon > 180.:
-                grd_lon     -= 360.
-            grd_lat = float(split_id[1])
-            try:
-                ind_lon         = np.where(lons>=grd_lon)[0][0]
-            except:
-                ind_lon         = lons.size - 1
-            try:
-                ind_lat         = np.where(lats>=grd_lat)[0][0]
-            except:
-                ind_lat         = lats.size - 1
-            if lons[ind_lon] - grd_lon > (1./60.):
-                ind_lon         -= 1
-            if lats[ind_lat] - grd_lat > (1./60.):
-                ind_lat         -= 1
-            if abs(lons[ind_lon] - grd_lon) > 1./60. or abs(lats[ind_lat] - grd_lat) > 1./60.:
-                print 'ERROR!', lons[ind_lon], lats[ind_lat] , grd_lon, grd_lat
-            z                   = etopo[ind_lat, ind_lon]/1000. # convert to km
-            grp.attrs.create(name='topo', data=z)
+            grdlst.append(grp_id)
+            grd_lons.append(grd_lon)
+            grd_lats.append(float(split_id[1]))
+        # sample all grid points at once, the grid interval is only needed for method = 'average'
+        if method == 'average':
+            dlon    = self.attrs['dlon']
+            dlat    = self.attrs['dlat']
+        else:
+            dlon    = None
+            dlat    = None
+        if len(grdlst) > 0:
+            topos   = _sample_etopo(etopodbase, grd_lons, grd_lats, method=method, dlon=dlon, dlat=dlat)
+        for igrd in xrange(len(grdlst)):
+            grp     = grd_grp[grdlst[igrd]]
+            grp.attrs.create(name='topo', data=topos[igrd])
             grp.attrs.create(name='etopo_source', data=source)
+        etopodbase.close()
         if delete and os.path.isfile('./ETOPO2v2g_f4.nc'):
             os.remove('./ETOPO2v2g_f4.nc')
         return
@@ -863,21 +1360,19 @@ class invhdf5(h5py.File):
     def get_disp(self, lon, lat, wtype='ray'):
         if lon < 0.:
             lon     += 360.
-        data_str    = str(lon)+'_'+str(lat)
-        grd_grp     = self['grd_pts']
-        try:
-            grp     = grd_grp[data_str]
-        except:
-            print 'No data at longitude =',lon,' lattitude =',lat
-            return
+        disp_ph     = None
+        disp_gr     = None
         try:
-            disp_ph = grp['disp_ph_'+wtype]
-        except:
+            disp_ph = self.get_grd_data(lon, lat, 'disp_ph_'+wtype)
+        except KeyError:
             pass
         try:
-            disp_gr = grp['disp_gr_'+wtype]
-        except:
+            disp_gr = self.get_grd_data(lon, lat, 'disp_gr_'+wtype)
+        except KeyError:
             pass
+        if disp_ph is None and disp_gr is None:
+            print 'No data at longitude =',lon,' lattitude =',lat
+            return
         return disp_ph, disp_gr
     
     def plot_disp(self, lon, lat, wtype='ray', derivegr=False, ploterror=False, showfig=True):
@@ -892,6 +1387,7 @@ class invhdf5(h5py.File):
         showfig     - show the figure or not
         ==========================================================================================
         """
+        import matplotlib.pyplot as plt
         if lon < 0.:
             lon     += 360.
         data_str    = str(lon)+'_'+str(lat)
@@ -974,6 +1470,7 @@ class invhdf5(h5py.File):
         showfig     - show the figure or not
         ==========================================================================================
         """
+        import matplotlib.pyplot as plt
         if lon < 0.:
             lon     += 360.
         data_str    = str(lon)+'_'+str(lat)
@@ -1027,7 +1524,8 @@ class invhdf5(h5py.File):
     
     def mc_inv_iso(self, use_ref=False, ingrdfname=None, phase=True, group=False, outdir='./workingdir', vp_water=1.5, isconstrt=True,
             verbose=False, step4uwalk=1500, numbrun=15000, subsize=1000, nprocess=None, parallel=True, skipmask=True,\
-            Ntotalruns=10, misfit_thresh=1.0, Nmodelthresh=200, outlon=None, outlat=None):
+            Ntotalruns=10, misfit_thresh=1.0, Nmodelthresh=200, outlon=None, outlat=None, outstore=None, statusfname=None, timing=False,\
+            truncate=False):
         """
         Bayesian Monte Carlo inversion of surface wave data for an isotropic model
         ==================================================================================================================
@@ -1048,6 +1546,14 @@ class invhdf5(h5py.File):
         misfit_thresh   - threshold misfit value to determine "good" models
         Nmodelthresh    - required number of "good" models
         outlon/outlat   - output a vprofile object given longitude and latitude
+        outstore        - consolidated chain store (mcchain.chainstore, HDF5 file), if given, the outputs of each grid point
+                            are moved from outdir into the store after its inversion and the grid points in the store are skipped
+                            NOTE: do NOT keep the store opened (e.g. read_inv, get_vpr) during the campaign, the appends wait
+                            for the readers, see _store_mc_outputs
+        statusfname     - live status file of the campaign (see mcprogress and summarize_mcprogress.py),
+                            default - outdir/mc_status.<hostname>.json
+        timing          - collect the stage timers and event counters of the chains (see mcstats and summarize_mcstats.py) or not
+        truncate        - truncate the forward model at the sensitivity depth of the dispersion data (vprofile1d.get_sens_depth) or not
         ---
         version history:
                     - Added the functionality of adding addtional runs if not enough good models found, Sep 28th, 2018
@@ -1077,6 +1583,14 @@ class invhdf5(h5py.File):
             dispdtype   = 'ph'
         else:
             dispdtype   = 'gr'
+        stored      = set()
+        pending     = []
+        if outstore is not None and mcchain.is_store(outstore):
+            with mcchain.chainstore(outstore) as store:
+                stored  = set(store.keys())
+        if statusfname is None:
+            statusfname = outdir+'/mc_status.'+socket.gethostname()+'.json'
+        status      = mcprogress.campaign_status(statusfname, grdlst, mtype='iso', misfit_thresh=misfit_thresh, enabled=outlon is None)
         igrd        = 0
         Ngrd        = len(grdlst)
         for grd_id in grdlst:
@@ -1084,11 +1598,16 @@ class invhdf5(h5py.File):
             try:
                 grd_lon     = float(split_id[0])
             except ValueError:
+                status.end_grid(grd_id, 'skipped', note='invalid grid id')
                 continue
             if grd_lon > 180.:
                 grd_lon     -= 360.
             grd_lat = float(split_id[1])
             igrd    += 1
+            if grd_id in stored and outlon is None:
+                print '--- Inversion results already in the store for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)
+                status.end_grid(grd_id, 'done', note='in the store')
+                continue
             #-----------------------------
             # get data
             #-----------------------------
@@ -1106,6 +1625,7 @@ class invhdf5(h5py.File):
                 except KeyError:
                     print 'WARNING: No group dispersion data for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)
             if vpr.data.dispR.npper == 0 and vpr.data.dispR.ngper == 0:
+                status.end_grid(grd_id, 'skipped', note='no dispersion data')
                 print 'WARNING: No dispersion data for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)
                 continue
             #-----------------------------
@@ -1129,21 +1649,36 @@ class invhdf5(h5py.File):
                     return vpr
             start_time_grd  = time.time()
             print '=== MC inversion for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
-            if parallel:
-                vpr.mc_joint_inv_iso_mp(outdir=outdir, dispdtype=dispdtype, wdisp=1., Ntotalruns=Ntotalruns, \
-                    misfit_thresh=misfit_thresh, Nmodelthresh=Nmodelthresh, isconstrt=isconstrt, pfx=grd_id, verbose=verbose,\
-                        step4uwalk=step4uwalk, numbrun=numbrun, subsize=subsize, nprocess=nprocess)
-            else:
-                vpr.mc_joint_inv_iso(outdir=outdir, dispdtype=dispdtype, wdisp=1., \
-                   isconstrt=isconstrt, pfx=grd_id, verbose=verbose, step4uwalk=step4uwalk, numbrun=numbrun)
+            status.start_grid(grd_id, nstep_target=numbrun)
+            try:
+                if parallel:
+                    vpr.mc_joint_inv_iso_mp(outdir=outdir, dispdtype=dispdtype, wdisp=1., Ntotalruns=Ntotalruns, \
+                        misfit_thresh=misfit_thresh, Nmodelthresh=Nmodelthresh, isconstrt=isconstrt, pfx=grd_id, verbose=verbose,\
+                            step4uwalk=step4uwalk, numbrun=numbrun, subsize=subsize, nprocess=nprocess, timing=timing, status=status,\
+                            truncate=truncate)
+                else:
+                    vpr.mc_joint_inv_iso(outdir=outdir, dispdtype=dispdtype, wdisp=1., \
+                       isconstrt=isconstrt, pfx=grd_id, verbose=verbose, step4uwalk=step4uwalk, numbrun=numbrun, timing=timing,\
+                            status=status, truncate=truncate)
+                if outstore is not None:
+                    pending = _store_mc_outputs(outstore=outstore, outdir=outdir, grd_ids=pending+[grd_id])
+            except BaseException as err:
+                # the grid point is marked as failed, and the campaign is stopped as before
+                status.end_grid(grd_id, 'failed', note=err.__class__.__name__+': '+str(err))
+                raise
+            status.end_grid(grd_id)
             # end_time_grd    = time.time()
             end_time    = time.time()
             print '--- Elasped time = '+str(end_time - start_time_grd) + ' sec; total elasped time = '+str(end_time - start_time_total)
+        if len(pending) > 0:
+            pending     = _store_mc_outputs(outstore=outstore, outdir=outdir, grd_ids=pending, ntry=60)
+            if len(pending) > 0:
+                print 'WARNING: outputs NOT moved into the chain store, left in '+outdir+': '+' '.join(pending)
         return
     
     def mc_inv_vti(self, solver_type=1, use_ref=True, ingrdfname=None, phase=True, group=False, outdir='./workingdir', vp_water=1.5,\
             isconstrt=True, verbose=False, step4uwalk=1500, numbrun=15000, subsize=1000, nprocess=None, parallel=True, skipmask=True,\
-            Ntotalruns=10, misfit_thresh=1.0, Nmodelthresh=200, outlon=None, outlat=None):
+            Ntotalruns=10, misfit_thresh=1.0, Nmodelthresh=200, outlon=None, outlat=None, outstore=None, statusfname=None, timing=False):
         """
         Bayesian Monte Carlo inversion of VTI model
         ==================================================================================================================
@@ -1167,6 +1702,13 @@ class invhdf5(h5py.File):
         misfit_thresh   - threshold misfit value to determine "good" models
         Nmodelthresh    - required number of "good" models
         outlon/outlat   - output a vprofile object given longitude and latitude
+        outstore        - consolidated chain store (mcchain.chainstore, HDF5 file), if given, the outputs of each grid point
+                            are moved from outdir into the store after its inversion and the grid points in the store are skipped
+                            NOTE: do NOT keep the store opened (e.g. read_inv, get_vpr) during the campaign, the appends wait
+                            for the readers, see _store_mc_outputs
+        statusfname     - live status file of the campaign (see mcprogress and summarize_mcprogress.py),
+                            default - outdir/mc_status.<hostname>.json
+        timing          - collect the stage timers and event counters of the chains (see mcstats and summarize_mcstats.py) or not
         ---
         version history:
                     - first version (2019-03-28)
@@ -1195,6 +1737,14 @@ class invhdf5(h5py.File):
             dispdtype   = 'ph'
         else:
             dispdtype   = 'gr'
+        stored      = set()
+        pending     = []
+        if outstore is not None and mcchain.is_store(outstore):
+            with mcchain.chainstore(outstore) as store:
+                stored  = set(store.keys())
+        if statusfname is None:
+            statusfname = outdir+'/mc_status.'+socket.gethostname()+'.json'
+        status      = mcprogress.campaign_status(statusfname, grdlst, mtype='vti', misfit_thresh=misfit_thresh, enabled=outlon is None)
         igrd        = 0
         Ngrd        = len(grdlst)
         for grd_id in grdlst:
@@ -1202,11 +1752,16 @@ class invhdf5(h5py.File):
             try:
                 grd_lon     = float(split_id[0])
             except ValueError:
+                status.end_grid(grd_id, 'skipped', note='invalid grid id')
                 continue
             if grd_lon > 180.:
                 grd_lon     -= 360.
             grd_lat = float(split_id[1])
             igrd    += 1
+            if grd_id in stored and outlon is None:
+                print '--- Inversion results already in the store for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)
+                status.end_grid(grd_id, 'done', note='in the store')
+                continue
             #-----------------------------
             # get data
             #-----------------------------
@@ -1236,6 +1791,7 @@ class invhdf5(h5py.File):
                 except KeyError:
                     print 'WARNING: No Rayleigh wave  group dispersion data for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)
             if vpr.data.dispL.npper == 0 or vpr.data.dispR.npper  == 0:
+                status.end_grid(grd_id, 'skipped', note='no dispersion data')
                 print 'WARNING: No dispersion data for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
                 continue
             #-----------------------------
@@ -1247,6 +1803,7 @@ class invhdf5(h5py.File):
                     avg_paraval_ray = grd_grp[grd_id+'/avg_paraval_ray'].value
                     std_paraval_ray = grd_grp[grd_id+'/std_paraval_ray'].value
                 except KeyError:
+                    status.end_grid(grd_id, 'skipped', note='no reference model')
                     continue
                 vpr.model.vtimod.parameterize_ray(paraval = avg_paraval_ray, topovalue = topovalue, maxdepth=200., vp_water=vp_water)
                 vpr.model.vtimod.get_paraind_gamma(std_paraval = std_paraval_ray)
@@ -1263,131 +1820,178 @@ class invhdf5(h5py.File):
                     return vpr
             start_time_grd  = time.time()
             print '=== MC VTI inversion for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
-            if parallel:
-                vpr.mc_joint_inv_vti_mp(outdir=outdir, run_inv=True, solver_type=solver_type, isconstrt=isconstrt, pfx=grd_id,\
-                        verbose=verbose, step4uwalk=step4uwalk, numbrun=numbrun, savedata=True, subsize=subsize, \
-                        nprocess=nprocess, merge=True, Ntotalruns=Ntotalruns, misfit_thresh=misfit_thresh, Nmodelthresh=Nmodelthresh)
-            else:
-                vpr.mc_joint_inv_vti(outdir=outdir, run_inv=True, solver_type=solver_type, numbcheck=None, misfit_thresh=misfit_thresh, \
-                    isconstrt=isconstrt, pfx=grd_id, verbose=verbose, step4uwalk=step4uwalk, numbrun=numbrun, init_run=True, savedata=True)
+            status.start_grid(grd_id, nstep_target=numbrun)
+            try:
+                if parallel:
+                    vpr.mc_joint_inv_vti_mp(outdir=outdir, run_inv=True, solver_type=solver_type, isconstrt=isconstrt, pfx=grd_id,\
+                            verbose=verbose, step4uwalk=step4uwalk, numbrun=numbrun, savedata=True, subsize=subsize, \
+                            nprocess=nprocess, merge=True, Ntotalruns=Ntotalruns, misfit_thresh=misfit_thresh, Nmodelthresh=Nmodelthresh, \
+                            timing=timing, status=status)
+                else:
+                    vpr.mc_joint_inv_vti(outdir=outdir, run_inv=True, solver_type=solver_type, numbcheck=None, misfit_thresh=misfit_thresh, \
+                        isconstrt=isconstrt, pfx=grd_id, verbose=verbose, step4uwalk=step4uwalk, numbrun=numbrun, init_run=True, savedata=True,\
+                            timing=timing, status=status)
+                if outstore is not None:
+                    pending = _store_mc_outputs(outstore=outstore, outdir=outdir, grd_ids=pending+[grd_id])
+            except BaseException as err:
+                # the grid point is marked as failed, and the campaign is stopped as before
+                status.end_grid(grd_id, 'failed', note=err.__class__.__name__+': '+str(err))
+                raise
+            status.end_grid(grd_id)
             # end_time_grd    = time.time()
             end_time    = time.time()
             print '--- Elasped time = '+str(end_time - start_time_grd) + ' sec; total elasped time = '+str(end_time - start_time_total)
+        if len(pending) > 0:
+            pending     = _store_mc_outputs(outstore=outstore, outdir=outdir, grd_ids=pending, ntry=60)
+            if len(pending) > 0:
+                print 'WARNING: outputs NOT moved into the chain store, left in '+outdir+': '+' '.join(pending)
         return
     #==================================================================
     # function to read MC inversion results
     #==================================================================
-    def read_inv(self, datadir, ingrdfname=None, factor=1., thresh=0.5, stdfactor=2, avgqc=True, \
-                 Nmax=None, Nmin=500, wtype='ray'):
+    def _ingest_inv(self, grdlst, worker, invsfx, check_data, mask_unstable, skip_ingested, parallel, nprocess, subsize):
         """
-        read the inversion results in to data base
+        ingest the inversion results of grid points, used by read_inv/read_inv_vti
+        The summaries are computed by worker (in parallel if required), the main process is the only one writing to the database
         ==================================================================================================================
         ::: input :::
-        datadir     - data directory
-        ingrdfname  - input grid point list file indicating the grid points for surface wave inversion
-        factor      - factor to determine the threshhold value for selectingthe finalized model
-        thresh      - threshhold value for selecting the finalized model
-                        misfit < min_misfit*factor + thresh
-        avgqc       - turn on quality control for average model or not
-        Nmax        - required maximum number of accepted model
-        Nmin        - required minimum number of accepted model
-        ::: NOTE :::
-        mask_inv array will be updated according to the existence of inversion results
+        grdlst          - list of grid point ids
+        worker          - function computing the summary of a grid point (_read_inv_grd/_read_inv_vti_grd with partial)
+        invsfx          - suffix of the ingested paraval dataset (ray/vti), used to skip the ingested grid points
+        check_data      - function of grd_id, True if the inversion result files exist
+        mask_unstable   - mask the grid points failing the quality control or not
+        skip_ingested   - skip the grid points with ingested inversion results
+        parallel        - compute the summaries in parallel or not
+        nprocess        - number of process
+        subsize         - number of grid points in each batch
         ==================================================================================================================
         """
+        self._grd_pts_modified()
         grd_grp     = self['grd_pts']
-        if ingrdfname is None:
-            grdlst  = grd_grp.keys()
-        else:
-            grdlst  = []
-            with open(ingrdfname, 'r') as fid:
-                for line in fid.readlines():
-                    sline   = line.split()
-                    lon     = float(sline[0])
-                    if lon < 0.:
-                        lon += 360.
-                    if sline[2] == '1':
-                        grdlst.append(str(lon)+'_'+sline[1])
-        igrd        = 0
         Ngrd        = len(grdlst)
         temp_mask   = self.attrs['mask_inv']
         self._get_lon_lat_arr(is_interp=False)
+        inlst       = []
+        grd_index   = {}
+        igrd        = 0
         for grd_id in grdlst:
             split_id= grd_id.split('_')
             try:
                 grd_lon     = float(split_id[0])
             except ValueError:
                 continue
-            if grd_lon > 180.:
-                grd_lon     -= 360.
             grd_lat     = float(split_id[1])
             igrd        += 1
             grp         = grd_grp[grd_id]
             ilat        = np.where(grd_lat == self.lats)[0]
             ilon        = np.where(grd_lon == self.lons)[0]
-            invfname    = datadir+'/mc_inv.'+ grd_id+'.npz'
-            datafname   = datadir+'/mc_data.'+grd_id+'.npz'
-            if not (os.path.isfile(invfname) and os.path.isfile(datafname)):
+            if grd_lon > 180.:
+                grd_lon -= 360.
+            grd_index[grd_id]   = (ilat, ilon, grd_lon, grd_lat, igrd)
+            if not check_data(grd_id):
                 print '--- No inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
                 grp.attrs.create(name='mask', data = True)
                 temp_mask[ilat, ilon]\
                         = True
                 continue
-            print '--- Reading inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
             temp_mask[ilat, ilon]\
                         = False
-            topovalue   = grp.attrs['topo']
-            vpr         = mcpost.postvpr(waterdepth=-topovalue, factor=factor, thresh=thresh, stdfactor=stdfactor)
-            vpr.read_data(infname = datafname)
-            vpr.read_inv_data(infname = invfname, verbose=False, Nmax=Nmax, Nmin=Nmin)
-            # --- added Sep 7th, 2018
-            vpr.get_paraval()
-            vpr.run_avg_fwrd(wdisp=1.)
-            # # # return vpr
-            # --- added 2019/01/16
-            vpr.get_ensemble()
-            vpr.get_vs_std()
-            if avgqc:
-                if vpr.avg_misfit > (vpr.min_misfit*vpr.factor + vpr.thresh)*3.:
+            if skip_ingested and ('avg_paraval_'+invsfx) in grp.keys():
+                print '--- Skipping ingested grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
+                continue
+            inlst.append((grd_id, grp.attrs['topo'], grp.keys()))
+        Ninv        = len(inlst)
+        print '--- Reading inversion results: '+str(Ninv)+' grid points'
+        if parallel and Ninv > 1:
+            pool    = multiprocessing.Pool(processes=nprocess)
+        Ndone       = 0
+        for i0 in range(0, Ninv, subsize):
+            if parallel and Ninv > 1:
+                outlst  = pool.map(worker, inlst[i0:i0+subsize])
+            else:
+                outlst  = map(worker, inlst[i0:i0+subsize])
+            # the single writer
+            for grd_id, isstable, dsets, attrs in outlst:
+                ilat, ilon, grd_lon, grd_lat, igrd  = grd_index[grd_id]
+                Ndone   += 1
+                if not isstable:
                     print '--- Unstable inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
+                    if mask_unstable:
+                        temp_mask[ilat, ilon]\
+                                = True
                     continue
-            #------------------------------------------
-            # store inversion results in the database
-            #------------------------------------------
-            grp.create_dataset(name = 'avg_paraval_'+wtype, data = vpr.avg_paraval)
-            grp.create_dataset(name = 'min_paraval_'+wtype, data = vpr.min_paraval)
-            grp.create_dataset(name = 'sem_paraval_'+wtype, data = vpr.sem_paraval)
-            grp.create_dataset(name = 'std_paraval_'+wtype, data = vpr.std_paraval)
-            # --- added 2019/01/16
-            grp.create_dataset(name = 'zArr_ensemble_'+wtype, data = vpr.zArr_ensemble)
-            grp.create_dataset(name = 'vs_upper_bound_'+wtype, data = vpr.vs_upper_bound)
-            grp.create_dataset(name = 'vs_lower_bound_'+wtype, data = vpr.vs_lower_bound)
-            grp.create_dataset(name = 'vs_std_'+wtype, data = vpr.vs_std)
-            grp.create_dataset(name = 'vs_mean_'+wtype, data = vpr.vs_mean)
-            if ('disp_ph_'+wtype) in grp.keys():
-                grp.create_dataset(name = 'avg_ph_'+wtype, data = vpr.vprfwrd.data.dispR.pvelp)
-                disp_min                = vpr.disppre_ph[vpr.ind_min, :]
-                grp.create_dataset(name = 'min_ph_'+wtype, data = disp_min)
-            if ('disp_gr_'+wtype) in grp.keys():
-                grp.create_dataset(name = 'avg_gr_'+wtype, data = vpr.vprfwrd.data.dispR.gvelp)
-                disp_min                = vpr.disppre_gr[vpr.ind_min, :]
-                grp.create_dataset(name = 'min_gr_'+wtype, data = disp_min)
-            # grp.create_dataset(name = 'min_paraval', data = vpr.sem_paraval)
-            grp.attrs.create(name = 'avg_misfit_'+wtype, data = vpr.vprfwrd.data.misfit)
-            grp.attrs.create(name = 'min_misfit_'+wtype, data = vpr.min_misfit)
-            grp.attrs.create(name = 'mean_misfit_'+wtype, data = vpr.mean_misfit)
+                print '--- Read inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
+                grp     = grd_grp[grd_id]
+                for name, data in dsets:
+                    grp.create_dataset(name = name, data = data)
+                for name, value in attrs:
+                    grp.attrs.create(name = name, data = value)
+            print '=== Progress: '+str(Ndone)+'/'+str(Ninv)+' grid points ingested'
+            self.flush()
+        if parallel and Ninv > 1:
+            pool.close()
+            pool.join()
         # set the is_interp as False (default)
         self.attrs.create(name = 'is_interp', data=False, dtype=bool)
         self.attrs.create(name='mask_inv', data = temp_mask)
         return
     
+    def read_inv(self, datadir, ingrdfname=None, factor=1., thresh=0.5, stdfactor=2, avgqc=True, \
+                 Nmax=None, Nmin=500, wtype='ray', parallel=False, nprocess=None, subsize=100, skip_ingested=False):
+        """
+        read the inversion results in to data base
+        ==================================================================================================================
+        ::: input :::
+        datadir     - data directory, or the consolidated chain store (mcchain.chainstore) written by the MC inversion
+        ingrdfname  - input grid point list file indicating the grid points for surface wave inversion
+        factor      - factor to determine the threshhold value for selectingthe finalized model
+        thresh      - threshhold value for selecting the finalized model
+                        misfit < min_misfit*factor + thresh
+        avgqc       - turn on quality control for average model or not
+        Nmax        - required maximum number of accepted model
+        Nmin        - required minimum number of accepted model
+        parallel    - compute the summaries of grid points in parallel or not
+                        the main process is the only one writing to the database
+        nprocess    - number of process
+        subsize     - number of grid points in each batch, the database is flushed after each batch
+        skip_ingested
+                    - skip the grid points that already have inversion results in the database
+        ::: NOTE :::
+        mask_inv array will be updated according to the existence of inversion results
+        ==================================================================================================================
+        """
+        grd_grp     = self['grd_pts']
+        if ingrdfname is None:
+            grdlst  = grd_grp.keys()
+        else:
+            grdlst  = []
+            with open(ingrdfname, 'r') as fid:
+                for line in fid.readlines():
+                    sline   = line.split()
+                    lon     = float(sline[0])
+                    if lon < 0.:
+                        lon += 360.
+                    if sline[2] == '1':
+                        grdlst.append(str(lon)+'_'+sline[1])
+        READINV     = partial(_read_inv_grd, datadir=datadir, factor=factor, thresh=thresh, stdfactor=stdfactor, avgqc=avgqc,\
+                        Nmax=Nmax, Nmin=Nmin, wtype=wtype)
+        if mcchain.is_store(datadir):
+            with mcchain.chainstore(datadir) as store:
+                stored  = set(store.keys())
+            check_data  = lambda grd_id: grd_id in stored
+        else:
+            check_data  = lambda grd_id: os.path.isfile(mcchain.get_inv_fname(datadir, grd_id)) and os.path.isfile(datadir+'/mc_data.'+grd_id+'.npz')
+        self._ingest_inv(grdlst=grdlst, worker=READINV, invsfx=wtype, check_data=check_data, mask_unstable=False,\
+                        skip_ingested=skip_ingested, parallel=parallel, nprocess=nprocess, subsize=subsize)
+        return
+    
     def read_inv_vti(self, datadir, ingrdfname=None, factor=1., thresh=0.5, stdfactor=2, avgqc=True, \
-                 Nmax=None, Nmin=500):
+                 Nmax=None, Nmin=500, parallel=False, nprocess=None, subsize=100, skip_ingested=False):
         """
         read the inversion results in to data base
         ==================================================================================================================
         ::: input :::
-        datadir     - data directory
+        datadir     - data directory, or the consolidated chain store (mcchain.chainstore) written by the MC inversion
         ingrdfname  - input grid point list file indicating the grid points for surface wave inversion
         factor      - factor to determine the threshhold value for selectingthe finalized model
         thresh      - threshhold value for selecting the finalized model
@@ -1395,6 +1999,12 @@ class invhdf5(h5py.File):
         avgqc       - turn on quality control for average model or not
         Nmax        - required maximum number of accepted model
         Nmin        - required minimum number of accepted model
+        parallel    - compute the summaries of grid points in parallel or not
+                        the main process is the only one writing to the database
+        nprocess    - number of process
+        subsize     - number of grid points in each batch, the database is flushed after each batch
+        skip_ingested
+                    - skip the grid points that already have inversion results in the database
         ::: NOTE :::
         mask_inv array will be updated according to the existence of inversion results
         ==================================================================================================================
@@ -1412,81 +2022,16 @@ class invhdf5(h5py.File):
                         lon += 360.
                     if sline[2] == '1':
                         grdlst.append(str(lon)+'_'+sline[1])
-        igrd        = 0
-        Ngrd        = len(grdlst)
-        temp_mask   = self.attrs['mask_inv']
-        self._get_lon_lat_arr(is_interp=False)
-        for grd_id in grdlst:
-            split_id= grd_id.split('_')
-            try:
-                grd_lon     = float(split_id[0])
-            except ValueError:
-                continue
-            if grd_lon > 180.:
-                grd_lon     -= 360.
-            grd_lat     = float(split_id[1])
-            igrd        += 1
-            grp         = grd_grp[grd_id]
-            ilat        = np.where(grd_lat == self.lats)[0]
-            ilon        = np.where(grd_lon == self.lons)[0]
-            invfname    = datadir+'/mc_inv.'+ grd_id+'.npz'
-            datapfx     = datadir+'/'+grd_id
-            if not (os.path.isfile(invfname)):
-                print '--- No inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
-                grp.attrs.create(name='mask', data = True)
-                temp_mask[ilat, ilon]\
-                        = True
-                continue
-            print '--- Reading inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
-            temp_mask[ilat, ilon]\
-                        = False
-            topovalue   = grp.attrs['topo']
-            vpr         = mcpost_vti.postvpr(waterdepth=-topovalue, factor=factor, thresh=thresh, stdfactor=stdfactor)
-            vpr.read_data(pfx = datapfx)
-            vpr.read_inv_data(infname = invfname, verbose=False, Nmax=Nmax, Nmin=Nmin)
-            vpr.get_paraval()
-            vpr.get_vmodel()
-            vpr.run_avg_fwrd()
-            # # # return vpr
-            # --- added 2019/01/16
-            # # # vpr.get_ensemble()
-            # # # vpr.get_vs_std()
-            if avgqc:
-                if vpr.avg_misfit > (vpr.min_misfit*vpr.factor + vpr.thresh)*3.:
-                    print '--- Unstable inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
-                    temp_mask[ilat, ilon]\
-                        = True
-                    continue
-            #------------------------------------------
-            # store inversion results in the database
-            #------------------------------------------
-            # continue here
-            grp.create_dataset(name = 'avg_paraval_vti', data = vpr.avg_paraval)
-            grp.create_dataset(name = 'min_paraval_vti', data = vpr.min_paraval)
-            grp.create_dataset(name = 'sem_paraval_vti', data = vpr.sem_paraval)
-            grp.create_dataset(name = 'std_paraval_vti', data = vpr.std_paraval)
-            # --- added 2019/01/16
-            # # # grp.create_dataset(name = 'zArr_ensemble_'+wtype, data = vpr.zArr_ensemble)
-            # # # grp.create_dataset(name = 'vs_upper_bound_'+wtype, data = vpr.vs_upper_bound)
-            # # # grp.create_dataset(name = 'vs_lower_bound_'+wtype, data = vpr.vs_lower_bound)
-            # # # grp.create_dataset(name = 'vs_std_'+wtype, data = vpr.vs_std)
-            # # # grp.create_dataset(name = 'vs_mean_'+wtype, data = vpr.vs_mean)
-            # store Rayleigh wave average and minimum dispersion curves
-            grp.create_dataset(name = 'avg_ph_ray_vti', data = vpr.vprfwrd.data.dispR.pvelp)
-            disp_min                = vpr.disppre_ray[vpr.ind_min, :]
-            grp.create_dataset(name = 'min_ph_ray_vti', data = disp_min)
-            # store Love wave average and minimum dispersion curves
-            grp.create_dataset(name = 'avg_ph_lov_vti', data = vpr.vprfwrd.data.dispL.pvelp)
-            disp_min                = vpr.disppre_lov[vpr.ind_min, :]
-            grp.create_dataset(name = 'min_ph_lov_vti', data = disp_min)
-            # store misfit
-            grp.attrs.create(name = 'avg_misfit_vti', data = vpr.vprfwrd.data.misfit)
-            grp.attrs.create(name = 'min_misfit_vti', data = vpr.min_misfit)
-            grp.attrs.create(name = 'mean_misfit_vti', data = vpr.mean_misfit)
-            grp.attrs.create(name = 'init_misfit_vti', data = vpr.init_misfit)
-        # set the is_interp as False (default)
-        self.attrs.create(name = 'is_interp', data=False, dtype=bool)
-        self.attrs.create(name='mask_inv', data = temp_mask)
+        READINV     = partial(_read_inv_vti_grd, datadir=datadir, factor=factor, thresh=thresh, stdfactor=stdfactor, avgqc=avgqc,\
+                        Nmax=Nmax, Nmin=Nmin)
+        if mcchain.is_store(datadir):
+            with mcchain.chainstore(datadir) as store:
+                stored  = set(store.keys())
+            check_data  = lambda grd_id: grd_id in stored
+        else:
+            check_data  = lambda grd_id: os.path.isfile(mcchain.get_inv_fname(datadir, grd_id))
+        self._ingest_inv(grdlst=grdlst, worker=READINV, invsfx='vti', check_data=check_data, mask_unstable=True,\
+                        skip_ingested=skip_ingested, parallel=parallel, nprocess=nprocess, subsize=subsize)
         return
     
     def read_inv_vti_2(self, datadir, ingrdfname=None, factor=1., thresh=0.5, stdfactor=2, avgqc=True, \
@@ -1507,6 +2052,7 @@ class invhdf5(h5py.File):
         mask_inv array will be updated according to the existence of inversion results
         ==================================================================================================================
         """
+        self._grd_pts_modified()
         grd_grp     = self['grd_pts']
         if ingrdfname is None:
             grdlst  = grd_grp.keys()
@@ -1537,7 +2083,7 @@ class invhdf5(h5py.File):
             grp         = grd_grp[grd_id]
             ilat        = np.where(grd_lat == self.lats)[0]
             ilon        = np.where(grd_lon == self.lons)[0]
-            invfname    = datadir+'/mc_inv.'+ grd_id+'.npz'
+            invfname    = mcchain.get_inv_fname(datadir, grd_id)
             datapfx     = datadir+'/'+grd_id
             if not (os.path.isfile(invfname)):
                 print '--- No inversion results for grid: lon = '+str(grd_lon)+', lat = '+str(grd_lat)+', '+str(igrd)+'/'+str(Ngrd)
@@ -1620,8 +2166,13 @@ class invhdf5(h5py.File):
         except:
             print 'No data at longitude =',lon,' lattitude =',lat
             return 
-        invfname    = datadir+'/mc_inv.'+ grd_id+'.npz'
-        datafname   = datadir+'/mc_data.'+grd_id+'.npz'
+        if mcchain.is_store(datadir):
+            with mcchain.chainstore(datadir) as store:
+                invfname    = store.get_chain(grd_id).load()
+                datafname   = store.get_file(grd_id, 'mc_data.'+grd_id+'.npz')
+        else:
+            invfname    = mcchain.get_inv_fname(datadir, grd_id)
+            datafname   = datadir+'/mc_data.'+grd_id+'.npz'
         topovalue   = grp.attrs['topo']
         vpr         = mcpost.postvpr(waterdepth=-topovalue, factor=factor, thresh=thresh)
         vpr.read_inv_data(infname = invfname, verbose=True, Nmax=Nmax, Nmin=Nmin)
@@ -1648,12 +2199,15 @@ class invhdf5(h5py.File):
         except:
             print 'No data at longitude =',lon,' lattitude =',lat
             return 
-        invfname    = datadir+'/mc_inv.'+ grd_id+'.npz'
-        datapfx     = datadir+'/'+grd_id
         topovalue   = grp.attrs['topo']
         vpr         = mcpost_vti.postvpr(waterdepth=-topovalue, factor=factor, thresh=thresh)
-        vpr.read_inv_data(infname = invfname, verbose=True, Nmax=Nmax, Nmin=Nmin)
-        vpr.read_data(pfx = datapfx)
+        if mcchain.is_store(datadir):
+            with mcchain.chainstore(datadir) as store:
+                vpr.read_inv_data(infname = store.get_chain(grd_id).load(), verbose=True, Nmax=Nmax, Nmin=Nmin)
+                vpr.read_data(pfx = grd_id, store = store)
+        else:
+            vpr.read_inv_data(infname = mcchain.get_inv_fname(datadir, grd_id), verbose=True, Nmax=Nmax, Nmin=Nmin)
+            vpr.read_data(pfx = datadir+'/'+grd_id)
         # group speed
         vpr.data.dispR.gper     = grd_grp[grd_id+'/disp_gr_ray'].value[0, :]
         vpr.data.dispR.gvelo    = grd_grp[grd_id+'/disp_gr_ray'].value[1, :]
@@ -1787,6 +2341,150 @@ class invhdf5(h5py.File):
                 data[ind_lat, ind_lon]      = data[ind_lat, ind_lon] - topovalue
         return data
     
+    def _get_grd_index(self, ingrdfname=None):
+        """
+        get the grid point ids and their (ilat, ilon) indices in the (dlon, dlat) grid
+        The lookup is done once and cached for the grid point list and the grid (self.lons/self.lats)
+        ==================================================================================================================
+        ::: input :::
+        ingrdfname  - input grid point list file indicating the grid points for surface wave inversion
+        ::: output :::
+        grdlst      - list of grid point ids
+        ind_lat     - latitude indices of the grid points
+        ind_lon     - longitude indices of the grid points
+        ==================================================================================================================
+        """
+        self._get_lon_lat_arr(is_interp=False)
+        key         = (ingrdfname, self.lons.tostring(), self.lats.tostring())
+        try:
+            cache   = self._grd_index_cache
+        except AttributeError:
+            cache   = {}
+            self._grd_index_cache   = cache
+        if key in cache:
+            return cache[key]
+        grd_grp     = self['grd_pts']
+        if ingrdfname is None:
+            grdlst_in   = grd_grp.keys()
+        else:
+            grdlst_in   = []
+            with open(ingrdfname, 'r') as fid:
+                for line in fid.readlines():
+                    sline   = line.split()
+                    lon     = float(sline[0])
+                    if lon < 0.:
+                        lon += 360.
+                    if sline[2] == '1':
+                        grdlst_in.append(str(lon)+'_'+sline[1])
+        lon_index   = dict([(lon, ilon) for ilon, lon in enumerate(self.lons)])
+        lat_index   = dict([(lat, ilat) for ilat, lat in enumerate(self.lats)])
+        grdlst      = []
+        ind_lat     = []
+        ind_lon     = []
+        for grd_id in grdlst_in:
+            split_id    = grd_id.split('_')
+            try:
+                grd_lon = float(split_id[0])
+            except ValueError:
+                continue
+            grd_lat     = float(split_id[1])
+            if not (grd_lon in lon_index and grd_lat in lat_index):
+                continue
+            grdlst.append(grd_id)
+            ind_lat.append(lat_index[grd_lat])
+            ind_lon.append(lon_index[grd_lon])
+        cache[key]  = (grdlst, np.array(ind_lat, dtype=np.int64), np.array(ind_lon, dtype=np.int64))
+        return cache[key]
+    
+    def get_paraval_cube(self, dtype='min', itype='ray', ingrdfname=None):
+        """
+        read the paraval arrays of all grid points in a single pass over the grid point groups
+        ==================================================================================================================
+        ::: input :::
+        dtype       - data type:
+                        avg - average model
+                        min - minimum misfit model
+                        sem - uncertainties (standard error of the mean)
+        itype       - inversion type
+                        'ray'   - isotropic inversion using Rayleigh wave
+                        'vti'   - VTI intersion using Rayleigh and Love waves
+        ingrdfname  - input grid point list file indicating the grid points for surface wave inversion
+        ::: output :::
+        paracube    - paraval arrays (Nlat, Nlon, npara), one for the grid points without data (as in get_paraval)
+        topo        - topography of the grid points (Nlat, Nlon), zero for the grid points without data
+        isdata      - flag array (Nlat, Nlon) indicating the grid points with data
+        ==================================================================================================================
+        """
+        if ingrdfname is None and self._in_grd_arr(dtype+'_paraval_'+itype):
+            # dense layout, one read for each array
+            paracube, isdata    = self.get_grd_map(name=dtype+'_paraval_'+itype)
+            topo, istopo        = self.get_grd_map(name='topo', isattr=True)
+            paracube[np.logical_not(isdata), :] = 1.
+            topo[np.logical_not(isdata)]        = 0.
+            return paracube.astype(np.float64), topo.astype(np.float64), isdata
+        grdlst, ind_lat, ind_lon\
+                    = self._get_grd_index(ingrdfname=ingrdfname)
+        grd_grp     = self['grd_pts']
+        paralst     = []
+        topolst     = []
+        ilatlst     = []
+        ilonlst     = []
+        for igrd in xrange(len(grdlst)):
+            grp     = grd_grp[grdlst[igrd]]
+            try:
+                paraval = grp[dtype+'_paraval_'+itype].value
+            except KeyError:
+                continue
+            paralst.append(paraval)
+            topolst.append(grp.attrs['topo'])
+            ilatlst.append(ind_lat[igrd])
+            ilonlst.append(ind_lon[igrd])
+        npara       = 13 if len(paralst) == 0 else paralst[0].size
+        paracube    = np.ones((self.Nlat, self.Nlon, npara), dtype=np.float64)
+        topo        = np.zeros((self.Nlat, self.Nlon), dtype=np.float64)
+        isdata      = np.zeros((self.Nlat, self.Nlon), dtype=bool)
+        if len(paralst) > 0:
+            paracube[ilatlst, ilonlst, :]   = np.array(paralst)
+            topo[ilatlst, ilonlst]          = np.array(topolst)
+            isdata[ilatlst, ilonlst]        = True
+        return paracube, topo, isdata
+    
+    def _get_fill_index(self, mask):
+        """
+        get the nearest valid grid point for each masked grid point
+        A KD-tree of the valid grid points (XYZ on the unit sphere) is queried once for all masked grid points,
+        the result is cached for the mask and grid (self.lonArr/self.latArr)
+        ==================================================================================================================
+        ::: input :::
+        mask        - mask array, True for the grid points to be filled
+        ::: output :::
+        ind_fill    - indices (tuple of index arrays) of the masked grid points
+        ind_near    - indices of the nearest valid grid points in the array of valid grid points (data[~mask])
+        ValueError is raised if all the grid points are masked (nothing to fill from)
+        ==================================================================================================================
+        """
+        key         = (mask.shape, mask.tostring(), self.lonArr.tostring(), self.latArr.tostring())
+        try:
+            cache   = self._fill_index_cache
+        except AttributeError:
+            cache   = {}
+            self._fill_index_cache  = cache
+        if key in cache:
+            return cache[key]
+        ind_valid   = np.logical_not(mask)
+        ind_fill    = np.where(mask)
+        if not np.any(ind_valid):
+            raise ValueError('No valid grid point, all the '+str(mask.size)+' grid points are masked, check the mask (mask_inv)')
+        if ind_fill[0].size == 0:
+            ind_near= np.array([], dtype=np.int64)
+            ind_fill= (ind_near, ind_near)
+        else:
+            tree    = cKDTree(_geo2xyz(self.lonArr[ind_valid], self.latArr[ind_valid]))
+            dist, ind_near  \
+                    = tree.query(_geo2xyz(self.lonArr[ind_fill], self.latArr[ind_fill]))
+        cache[key]  = (ind_fill, ind_near)
+        return ind_fill, ind_near
+    
     def get_filled_paraval(self, pindex, dtype='min', itype='ray', ingrdfname=None, isthk=False, do_interp=False, \
                            workingdir='working_interpolation', depth=5., depthavg=0.):
         """
@@ -1809,6 +2507,7 @@ class invhdf5(h5py.File):
         workingdir  - working directory for interpolation
         ==================================================================================================================
         """
+        import field2d_earth
         minlon      = self.attrs['minlon']
         maxlon      = self.attrs['maxlon']
         minlat      = self.attrs['minlat']
@@ -1817,24 +2516,14 @@ class invhdf5(h5py.File):
         mask_inv    = self.attrs['mask_inv']
         ind_valid   = np.logical_not(mask_inv)
         data_out    = data.copy()
-        g           = Geod(ellps='WGS84')
         vlonArr     = self.lonArr[ind_valid]
         vlatArr     = self.latArr[ind_valid]
         vdata       = data[ind_valid]
-        L           = vlonArr.size
         #------------------------------
         # filling the data_out array
         #------------------------------
-        for ilat in range(self.Nlat):
-            for ilon in range(self.Nlon):
-                if not mask_inv[ilat, ilon]:
-                    continue
-                clonArr         = np.ones(L, dtype=float)*self.lons[ilon]
-                clatArr         = np.ones(L, dtype=float)*self.lats[ilat]
-                az, baz, dist   = g.inv(clonArr, clatArr, vlonArr, vlatArr)
-                ind_min         = dist.argmin()
-                data_out[ilat, ilon] \
-                                = vdata[ind_min]
+        ind_fill, ind_near  = self._get_fill_index(mask_inv)
+        data_out[ind_fill]  = vdata[ind_near]
         if do_interp:
             #----------------------------------------------------
             # interpolation for data to dlon_interp/dlat_interp
@@ -1872,6 +2561,7 @@ class invhdf5(h5py.File):
         isthk       - flag indicating if the parameter is thickness or not
         ==================================================================================================================
         """
+        import field2d_earth
         data            = self.get_filled_paraval(pindex=pindex, dtype=dtype, itype=itype, ingrdfname=ingrdfname, isthk=isthk, do_interp=do_interp, \
                                 depth=depth, depthavg=depthavg)
         if smooth_type is 'nearneighbor':
@@ -1906,7 +2596,7 @@ class invhdf5(h5py.File):
             data_smooth     = field.Zarr
         return data, data_smooth
     
-    def paraval_arrays(self, dtype='min', itype='ray', sigma=1, gsigma = 50., verbose=False, depth=5., depthavg=0.):
+    def paraval_arrays(self, dtype='min', itype='ray', sigma=1, gsigma = 50., verbose=False, depth=5., depthavg=0., engine='gmt'):
         """
         get the paraval arrays and store them in the database
         =============================================================================
@@ -1918,11 +2608,15 @@ class invhdf5(h5py.File):
         itype       - inversion type
                         'ray'   - isotropic inversion using Rayleigh wave
                         'vti'   - VTI intersion using Rayleigh and Love waves
-        sigma       - total number of smooth iterations
+        sigma       - total number of smooth iterations (passed to get_smooth_paraval, engine = 'gmt' only)
         gsigma      - sigma for Gaussian smoothing (unit - km)
-        dlon/dlat   - longitude/latitude interval for interpolation
+        depth/depthavg
+                    - passed to get_smooth_paraval (engine = 'gmt' only)
+        engine      - 'gmt'     - call get_smooth_paraval for each parameter (gmt surface/grdfilter, default)
+                      'native'  - in-memory gridding/filtering of all the parameters at once (gridsmooth)
         -----------------------------------------------------------------------------
         ::: procedures :::
+        engine = 'gmt'
         1.  get_paraval
                     - get the paraval for each grid point in the inversion
         2.  get_filled_paraval
@@ -1930,45 +2624,112 @@ class invhdf5(h5py.File):
                       b. perform interpolation if needed
         3.  get_smooth_paraval
                     - perform spatial smoothing of the paraval in each grid point
+        engine = 'native'
+        1.  get_paraval_cube
+                    - read the paraval of all grid points in a single pass
+        2.  fill the grid points that are NOT included in the inversion,
+                perform interpolation if needed
+        3.  perform spatial smoothing of the paraval arrays
+        steps 2 and 3 are done for the stack of 13 parameter maps at once (no temporary files),
+        NOTE: sigma, depth and depthavg have no effect with engine = 'native', as with engine = 'gmt' they only
+            matter for smooth_type = 'nearneighbor' and pindex = 'vs_std_ray' in get_smooth_paraval, which are
+            not used here. See test_scripts/test_gridsmooth.py for the agreement of the two engines.
         
         =============================================================================
         """
+        if engine != 'gmt' and engine != 'native':
+            raise ValueError('Unexpected engine: '+engine)
+        # cross-sections of the previous paraval arrays
+        self._xsec_cache    = {}
         grp                 = self.require_group( name = dtype+'_paraval' )
         do_interp           = self.attrs['is_interp']
         if do_interp:
             topo            = self['topo_interp'].value
         else:
             topo            = self['topo'].value
+        if engine == 'gmt':
+            #  20181203
+            for pindex in range(13):
+                if pindex == 11:
+                    data, data_smooth   = self.get_smooth_paraval(pindex=pindex, dtype=dtype, itype=itype, \
+                            sigma=sigma, gsigma = gsigma, isthk=True, do_interp=do_interp, depth=depth, depthavg=depthavg)
+                    # convert sediment depth to sediment thickness
+                    data        += topo
+                    data_smooth += topo
+                    sedi        = data.copy()
+                    sedi_smooth = data_smooth.copy()
+                elif pindex == 12:
+                    data, data_smooth   = self.get_smooth_paraval(pindex='moho', dtype=dtype, itype=itype, \
+                            sigma=sigma, gsigma = gsigma, isthk=True, do_interp=do_interp, depth=depth, depthavg=depthavg)
+                    # convert moho depth to crustal thickness (excluding sediments)
+                    data        += topo
+                    data_smooth += topo
+                    data        -= sedi
+                    data_smooth -= sedi_smooth
+                else:
+                    data, data_smooth   = self.get_smooth_paraval(pindex=pindex, dtype=dtype, itype=itype, \
+                            sigma=sigma, gsigma = gsigma, isthk=False, do_interp=do_interp, depth=depth, depthavg=depthavg)
+                grp.create_dataset(name = str(pindex)+'_org', data = data)
+                grp.create_dataset(name = str(pindex)+'_smooth', data = data_smooth)
+            return
+        #--------------------------------------------------------------
+        # 1. gather, stack of 13 parameter maps (13, Nlat, Nlon)
+        #--------------------------------------------------------------
+        paracube, topo_grd, isdata  \
+                            = self.get_paraval_cube(dtype=dtype, itype=itype)
+        data                = np.ones((13, self.Nlat, self.Nlon), dtype=np.float64)
+        data[:11]           = np.rollaxis(paracube[:, :, :11], 2)
+        # sediment depth
+        data[11]            = paracube[:, :, 11] - topo_grd
+        # moho depth
         #  20181203
+        if dtype != 'std' and dtype != 'sem':
+            data[12]        = paracube[:, :, -1] + paracube[:, :, -2] - topo_grd
+        else:
+            data[12]        = paracube[:, :, -1] * 1.5 - topo_grd
+        data[11:, np.logical_not(isdata)]   = 1.
+        #--------------------------------------------------------------
+        # 2. filling/interpolation
+        #--------------------------------------------------------------
+        mask_inv            = self.attrs['mask_inv']
+        ind_valid           = np.logical_not(mask_inv)
+        vlonArr             = self.lonArr[ind_valid]
+        vlatArr             = self.latArr[ind_valid]
+        vdata               = data[:, ind_valid]
+        ind_fill, ind_near  = self._get_fill_index(mask_inv)
+        data[:, ind_fill[0], ind_fill[1]]   = vdata[:, ind_near]
+        if do_interp:
+            self._get_lon_lat_arr(is_interp=True)
+            data            = gridsmooth.surface(lonIn=vlonArr, latIn=vlatArr, ZarrIn=vdata, lons=self.lons, lats=self.lats)
+            # change mask array if interpolation is performed
+            mask            = self.attrs['mask_interp']
+        else:
+            mask            = mask_inv
+        #--------------------------------------------------------------
+        # 3. Gaussian smoothing
+        #--------------------------------------------------------------
+        index               = np.logical_not(mask)
+        # width is 6 times the conventional Gaussian sigma, see field2d_earth.Field2d.gauss_smoothing
+        data_smooth         = gridsmooth.surface(lonIn=self.lonArr[index], latIn=self.latArr[index], ZarrIn=data[:, index],\
+                                lons=self.lons, lats=self.lats)
+        data_smooth         = gridsmooth.gauss_filter(Zarr=data_smooth, lons=self.lons, lats=self.lats, width=6.*(gsigma/2.))
+        # convert sediment depth to sediment thickness
+        data[11]            += topo
+        data_smooth[11]     += topo
+        # convert moho depth to crustal thickness (excluding sediments)
+        data[12]            += topo - data[11]
+        data_smooth[12]     += topo - data_smooth[11]
         for pindex in range(13):
-            if pindex == 11:
-                data, data_smooth   = self.get_smooth_paraval(pindex=pindex, dtype=dtype, itype=itype, \
-                        sigma=sigma, gsigma = gsigma, isthk=True, do_interp=do_interp, depth=depth, depthavg=depthavg)
-                # convert sediment depth to sediment thickness
-                data        += topo
-                data_smooth += topo
-                sedi        = data.copy()
-                sedi_smooth = data_smooth.copy()
-            elif pindex == 12:
-                data, data_smooth   = self.get_smooth_paraval(pindex='moho', dtype=dtype, itype=itype, \
-                        sigma=sigma, gsigma = gsigma, isthk=True, do_interp=do_interp, depth=depth, depthavg=depthavg)
-                # convert moho depth to crustal thickness (excluding sediments)
-                data        += topo
-                data_smooth += topo
-                data        -= sedi
-                data_smooth -= sedi_smooth
-            else:
-                data, data_smooth   = self.get_smooth_paraval(pindex=pindex, dtype=dtype, itype=itype, \
-                        sigma=sigma, gsigma = gsigma, isthk=False, do_interp=do_interp, depth=depth, depthavg=depthavg)
-            grp.create_dataset(name = str(pindex)+'_org', data = data)
-            grp.create_dataset(name = str(pindex)+'_smooth', data = data_smooth)
+            grp.create_dataset(name = str(pindex)+'_org', data = data[pindex])
+            grp.create_dataset(name = str(pindex)+'_smooth', data = data_smooth[pindex])
         return 
     
     #==================================================================
     # postprocessing, functions for 3D model
     #==================================================================
     
-    def construct_3d(self, dtype='min', is_smooth=False, maxdepth=200., dz=0.1):
+    def construct_3d(self, dtype='min', is_smooth=False, maxdepth=200., dz=0.1, parallel=True, nprocess=None, subsize=500,\
+            dz_coarse=1., compression='gzip'):
         """
         construct 3D vs array
         =================================================================
@@ -1980,117 +2741,321 @@ class invhdf5(h5py.File):
         is_smooth   - use the smoothed array or not
         maxdepth    - maximum depth (default - 200 km)
         dz          - depth interval (default - 0.1 km)
+        parallel    - compute the vs profiles in parallel or not
+        nprocess    - number of process
+        subsize     - number of grid points in each batch
+        dz_coarse   - depth interval of the coarse 3D vs array for map browsing (default - 1 km, None for no coarse array)
+        compression - compression filter of the 3D vs array (default - gzip, None for no compression)
+        -----------------------------------------------------------------
+        ::: output :::
+        vs_smooth/vs_org    - 3D vs array, chunked in tiles of 32 x 32 grid points x 64 depths,
+                                read by get_vs_slice/get_vs_cube/get_vs_profiles
+        vs_smooth_coarse/vs_org_coarse
+                            - 3D vs array subsampled with dz_coarse, chunked in single depth slices
         =================================================================
         """
         is_interp   = self.attrs['is_interp']
         grp         = self[dtype+'_paraval']
+        # cross-sections of the previous 3D vs array
+        self._xsec_cache    = {}
         self._get_lon_lat_arr(is_interp=is_interp)
-        if self.latArr.shape != grp['0_org'].value.shape:
+        if is_smooth:
+            sfx     = '_smooth'
+        else:
+            sfx     = '_org'
+        if self.latArr.shape != grp['0'+sfx].shape:
             raise ValueError('incompatible paraval data with lonArr/latArr !')
         Nz          = int(maxdepth/dz) + 1
         zArr        = np.arange(Nz)*dz
         vs3d        = np.zeros((self.latArr.shape[0], self.latArr.shape[1], Nz))
-        Ntotal      = self.Nlat*self.Nlon
-        N0          = int(Ntotal/100.)
-        i           = 0
-        j           = 0
+        # load the paraval cube and topography once
+        paracube    = np.zeros((self.Nlat, self.Nlon, 13), dtype=np.float64)
+        for pindex in range(13):
+            paracube[:, :, pindex]  = grp[str(pindex)+sfx].value
+        if is_interp:
+            topo    = self['topo_interp'].value
+        elif 'topo' in self.keys():
+            topo    = self['topo'].value
+        else:
+            # no topo array (e.g. no etopo data), use the topography of the grid points as before
+            topo, valid = self.get_grd_map(name='topo', isattr=True)
         mask_interp = self.attrs['mask_interp']
-        for ilat in range(self.Nlat):
-            for ilon in range(self.Nlon):
-                i                   += 1
-                if np.floor(i/N0) > j:
-                    print 'Constructing 3d model:',j,' % finished'
-                    j               += 1
-                paraval             = np.zeros(13, dtype=np.float64)
-                if is_interp:
-                    topovalue       = self['topo_interp'].value[ilat, ilon]
-                else:
-                    grd_id          = str(self.lons[ilon])+'_'+str(self.lats[ilat])
-                    topovalue       = self[grd_id].attrs['topo']
-                for pindex in range(13):
-                    if is_smooth:
-                        data        = grp[str(pindex)+'_smooth'].value
-                    else:
-                        data        = grp[str(pindex)+'_org'].value
-                    paraval[pindex] = data[ilat, ilon]
-                vel_mod             = vmodel.model1d()
-                if mask_interp[ilat, ilon]:
-                    continue
-                if topovalue < 0.:
-                    vel_mod.get_para_model(paraval = paraval, waterdepth=-topovalue, vpwater=1.5, nmod=4, \
-                        numbp=np.array([1, 2, 4, 5]), mtype = np.array([5, 4, 2, 2]), vpvs = np.array([0, 2., 1.75, 1.75]), maxdepth=200.)
-                else:
-                    vel_mod.get_para_model(paraval = paraval)
-                zArr_in, VsvArr_in  = vel_mod.get_grid_mod()
-                if topovalue > 0.:
-                    zArr_in         = zArr_in - topovalue
-                # # interpolation
-                vs_interp           = np.interp(zArr, xp = zArr_in, fp = VsvArr_in)
-                vs3d[ilat, ilon, :] = vs_interp[:]                
-        if is_smooth:
-            grp.create_dataset(name = 'vs_smooth', data = vs3d)
-            grp.create_dataset(name = 'z_smooth', data = zArr)
+        ind_lat, ind_lon    \
+                    = np.where(np.logical_not(mask_interp))
+        paravals    = paracube[ind_lat, ind_lon, :]
+        topos       = topo[ind_lat, ind_lon]
+        if np.any(np.isnan(topos)):
+            raise KeyError('No topography for '+str(np.isnan(topos).sum())+' grid points in the inversion')
+        Npts        = topos.size
+        # batches of grid points
+        inlst       = []
+        for i0 in range(0, Npts, subsize):
+            inlst.append((paravals[i0:i0+subsize, :], topos[i0:i0+subsize]))
+        print 'Constructing 3d model: '+str(Npts)+' grid points, '+str(len(inlst))+' batches'
+        if parallel and len(inlst) > 1:
+            VSPROF  = partial(_get_vs_profiles4mp, zArr=zArr)
+            pool    = multiprocessing.Pool(processes=nprocess)
+            outlst  = pool.map(VSPROF, inlst) #make our results with a map call
+            pool.close() #we are not adding any more processes
+            pool.join() #tell it to wait until all threads are done before going on
         else:
-            grp.create_dataset(name = 'vs_org', data = vs3d)
-            grp.create_dataset(name = 'z_org', data = zArr)
+            outlst  = []
+            for inarr in inlst:
+                outlst.append(_get_vs_profiles4mp(inarr, zArr=zArr))
+        if Npts > 0:
+            vs3d[ind_lat, ind_lon, :]   = np.concatenate(outlst, axis=0)
+        # chunks of 32 x 32 grid points x 64 depths (512 kB), depth slices and profiles are read without loading the whole array
+        chunks      = (min(self.Nlat, 32), min(self.Nlon, 32), min(Nz, 64))
+        grp.create_dataset(name = 'vs'+sfx, data = vs3d, chunks=chunks, compression=compression, shuffle=(compression is not None))
+        grp.create_dataset(name = 'z'+sfx, data = zArr)
+        # coarse depth array, one chunk for each depth slice
+        if dz_coarse is not None:
+            step    = max(1, int(round(dz_coarse/dz)))
+            vs_coarse   = vs3d[:, :, ::step]
+            grp.create_dataset(name = 'vs'+sfx+'_coarse', data = vs_coarse, chunks=(self.Nlat, self.Nlon, 1),\
+                            compression=compression, shuffle=(compression is not None))
+            grp.create_dataset(name = 'z'+sfx+'_coarse', data = zArr[::step])
         return
+    
+    def _get_vs_dset(self, dtype='avg', is_smooth=True, coarse=False):
+        """
+        get the 3D vs dataset (NOT loaded into memory) and the depth array
+        """
+        grp         = self[dtype+'_paraval']
+        sfx         = '_smooth' if is_smooth else '_org'
+        if coarse:
+            sfx     += '_coarse'
+        return grp['vs'+sfx], grp['z'+sfx].value
+    
+    def get_vs_cube(self, depth0, depth1, dtype='avg', is_smooth=True):
+        """
+        get the 3D vs array in a depth range, only the chunks in the depth range are read
+        ==================================================================================================================
+        ::: input :::
+        depth0, depth1  - depth range (depth0 <= z <= depth1)
+        dtype           - data type (avg/min/sem)
+        is_smooth       - use the smoothed array or not
+        ::: output :::
+        vs3d            - vs array (Nlat, Nlon, Nz_sub)
+        zArr            - depth array (Nz_sub)
+        ==================================================================================================================
+        """
+        dset, zArr  = self._get_vs_dset(dtype=dtype, is_smooth=is_smooth)
+        i0          = np.searchsorted(zArr, depth0, side='left')
+        i1          = np.searchsorted(zArr, depth1, side='right')
+        return dset[:, :, i0:i1], zArr[i0:i1]
+    
+    def get_vs_slice(self, depth, depthb=None, depthavg=None, dtype='avg', is_smooth=True, use_coarse=True):
+        """
+        get a horizontal slice of the 3D vs array
+        ==================================================================================================================
+        ::: input :::
+        depth       - depth of the slice
+        depthb      - depth of bottom grid, vs will be averaged for depth ~ depthb (default: None)
+        depthavg    - depth range for average, vs will be averaged for depth +/- depthavg (default: None)
+        dtype       - data type (avg/min/sem)
+        is_smooth   - use the smoothed array or not
+        use_coarse  - read the slice from the coarse depth array (see construct_3d) if the depth is available
+        ::: output :::
+        vs2d        - vs slice (Nlat, Nlon), None if the depth is out of bound
+        depth       - depth of the slice (the first depth grid >= input depth if no average is performed)
+        ==================================================================================================================
+        """
+        if depthb is not None:
+            if depthb < depth:
+                raise ValueError('depthb should be larger than depth!')
+            vs3d, zArr  = self.get_vs_cube(depth0=depth, depth1=depthb, dtype=dtype, is_smooth=is_smooth)
+            return vs3d.mean(axis=2), depth
+        if depthavg is not None:
+            vs3d, zArr  = self.get_vs_cube(depth0=max(0., depth-depthavg), depth1=depth+depthavg, dtype=dtype, is_smooth=is_smooth)
+            return vs3d.mean(axis=2), depth
+        dset, zArr  = self._get_vs_dset(dtype=dtype, is_smooth=is_smooth)
+        index       = np.searchsorted(zArr, depth, side='left')
+        if index >= zArr.size:
+            print 'depth slice required is out of bound, maximum depth = '+str(zArr.max())+' km'
+            return None, depth
+        depth       = zArr[index]
+        sfx         = '_smooth' if is_smooth else '_org'
+        if use_coarse and ('vs'+sfx+'_coarse') in self[dtype+'_paraval'].keys():
+            cdset, zcoarse  = self._get_vs_dset(dtype=dtype, is_smooth=is_smooth, coarse=True)
+            icoarse = np.where(zcoarse == depth)[0]
+            if icoarse.size > 0:
+                return cdset[:, :, icoarse[0]], depth
+        return dset[:, :, index], depth
+    
+    def get_vs_profiles(self, ind_lat, ind_lon, maxdepth=None, dtype='avg', is_smooth=True):
+        """
+        get vs profiles at grid points, the profiles are read tile by tile (chunks of the 3D vs array)
+        ==================================================================================================================
+        ::: input :::
+        ind_lat, ind_lon- latitude/longitude indices of the grid points
+        maxdepth        - maximum depth (default - None, all depths)
+        dtype           - data type (avg/min/sem)
+        is_smooth       - use the smoothed array or not
+        ::: output :::
+        vs2d            - vs profiles (Npts, Nz_sub)
+        zArr            - depth array (Nz_sub)
+        ==================================================================================================================
+        """
+        dset, zArr  = self._get_vs_dset(dtype=dtype, is_smooth=is_smooth)
+        ind_lat     = np.asarray(ind_lat, dtype=np.int64).ravel()
+        ind_lon     = np.asarray(ind_lon, dtype=np.int64).ravel()
+        if maxdepth is None:
+            iz      = zArr.size
+        else:
+            iz      = np.searchsorted(zArr, maxdepth, side='right')
+        if dset.chunks is None:
+            clat    = 1
+            clon    = 1
+        else:
+            clat    = dset.chunks[0]
+            clon    = dset.chunks[1]
+        vs2d        = np.zeros((ind_lat.size, iz), dtype=dset.dtype)
+        itiles      = (ind_lat//clat)*(dset.shape[1]//clon + 1) + ind_lon//clon
+        for itile in np.unique(itiles):
+            ind     = np.where(itiles == itile)[0]
+            lat0    = (ind_lat[ind[0]]//clat)*clat
+            lon0    = (ind_lon[ind[0]]//clon)*clon
+            tile    = dset[lat0:lat0+clat, lon0:lon0+clon, :iz]
+            vs2d[ind, :]    = tile[ind_lat[ind]-lat0, ind_lon[ind]-lon0, :]
+        return vs2d, zArr[:iz]
+    
+    def get_cross_section(self, lon1, lat1, lon2, lat2, maxdepth, d=10., dtype='avg', is_smooth=True):
+        """
+        get a vertical cross-section along the great circle path between two points
+        The vs profiles, topography and moho depth of all sample points are bilinearly interpolated from the grid,
+        the profiles of the grid points around the path are read in one call (get_vs_profiles).
+        The results are cached for the same input parameters, the cache is cleared when the data are rewritten
+        (paraval_arrays, construct_3d, writes to the grid point groups).
+        ==================================================================================================================
+        ::: input :::
+        lon1, lat1      - start point
+        lon2, lat2      - end point
+        maxdepth        - maximum depth
+        d               - approximate interval of the sample points (unit - km)
+        dtype           - data type (avg/min/sem)
+        is_smooth       - use the smoothed array or not
+        ::: output :::
+        plons, plats    - location of the sample points (Npts), longitude is converted to 0 ~ 360
+        zplot           - depth array (Nz)
+        data            - vs (Npts, Nz)
+        topo1d          - topography (Npts)
+        moho1d          - moho depth (Npts)
+        mask1d          - mask (Npts), True if any of the grid points used for interpolation is masked
+        ==================================================================================================================
+        """
+        from pyproj import Geod
+        is_interp   = self.attrs['is_interp']
+        key         = (lon1, lat1, lon2, lat2, maxdepth, d, dtype, is_smooth, is_interp)
+        try:
+            cache   = self._xsec_cache
+        except AttributeError:
+            cache   = {}
+            self._xsec_cache    = cache
+        if key in cache:
+            return cache[key]
+        if lon1 == lon2 and lat1 == lat2:
+            raise ValueError('The start and end points are the same!')
+        self._get_lon_lat_arr(is_interp=is_interp)
+        if is_interp:
+            topoArr = self['topo_interp'].value
+            mask    = self.attrs['mask_interp']
+        else:
+            topoArr = self['topo'].value
+            mask    = self.attrs['mask_inv']
+        sfx         = '_smooth' if is_smooth else '_org'
+        mohoArr     = self[dtype+'_paraval/12'+sfx].value + self[dtype+'_paraval/11'+sfx].value - topoArr
+        #---------------------------------
+        # sample points along the path
+        #---------------------------------
+        g           = Geod(ellps='WGS84')
+        az, baz, dist   = g.inv(lon1, lat1, lon2, lat2)
+        dist        = dist/1000.
+        Nd          = max(int(dist/d), 1)
+        lonlats     = np.array([(lon1, lat1)] + g.npts(lon1, lat1, lon2, lat2, npts=Nd-1) + [(lon2, lat2)], dtype=np.float64)
+        plons       = lonlats[:, 0]
+        plats       = lonlats[:, 1]
+        plons[plons < 0.]   += 360.
+        #---------------------------------
+        # bilinear interpolation weights
+        #---------------------------------
+        dlon        = self.lons[1] - self.lons[0] if self.Nlon > 1 else 1.
+        dlat        = self.lats[1] - self.lats[0] if self.Nlat > 1 else 1.
+        flon        = np.clip((plons - self.lons[0])/dlon, 0., self.Nlon - 1.)
+        flat        = np.clip((plats - self.lats[0])/dlat, 0., self.Nlat - 1.)
+        ilon0       = np.minimum(np.floor(flon).astype(np.int64), max(self.Nlon - 2, 0))
+        ilat0       = np.minimum(np.floor(flat).astype(np.int64), max(self.Nlat - 2, 0))
+        ilon1       = np.minimum(ilon0 + 1, self.Nlon - 1)
+        ilat1       = np.minimum(ilat0 + 1, self.Nlat - 1)
+        wlon        = flon - ilon0
+        wlat        = flat - ilat0
+        # corners (4, Npts)
+        ind_lat     = np.array([ilat0, ilat0, ilat1, ilat1])
+        ind_lon     = np.array([ilon0, ilon1, ilon0, ilon1])
+        weight      = np.array([(1.-wlat)*(1.-wlon), (1.-wlat)*wlon, wlat*(1.-wlon), wlat*wlon])
+        #---------------------------------
+        # gather the profiles of the corner grid points once
+        #---------------------------------
+        ind_grd     = ind_lat*self.Nlon + ind_lon
+        ugrd, inv   = np.unique(ind_grd, return_inverse=True)
+        vs2d, zplot = self.get_vs_profiles(ind_lat=ugrd//self.Nlon, ind_lon=ugrd%self.Nlon, maxdepth=maxdepth,\
+                        dtype=dtype, is_smooth=is_smooth)
+        inv         = inv.reshape(ind_grd.shape)
+        data        = (weight[:, :, None]*vs2d[inv, :]).sum(axis=0)
+        topo1d      = (weight*topoArr[ind_lat, ind_lon]).sum(axis=0)
+        moho1d      = (weight*mohoArr[ind_lat, ind_lon]).sum(axis=0)
+        mask1d      = np.any(mask[ind_lat, ind_lon]*(weight > 0.), axis=0)
+        cache[key]  = (plons, plats, zplot, data, topo1d, moho1d, mask1d)
+        return cache[key]
         
-    def get_topo_arr(self, infname='../ETOPO2v2g_f4.nc'):
+    def get_topo_arr(self, infname='../ETOPO2v2g_f4.nc', method='nearest', download=True, delete=False):
         """
         get the topography array
+        The array is cached in the database (topo/topo_interp) with the grid specification and the sampling method,
+        repeated calls with the same grid and method do not read the etopo data again.
+        ============================================================================
+        ::: input :::
+        infname     - input etopo file name, used if is_interp = True
+        method      - sampling method (nearest/bilinear/average, see _sample_etopo), used if is_interp = True
+        download    - download the data or not, if the etopo file does not exist
+        delete      - delete the downloaded etopo file or not
+        ::: output :::
+        topoarr     - topography array (Nlat, Nlon), also stored as topo_interp (is_interp = True)
+                        or topo (is_interp = False, from the grid point attributes)
+        ============================================================================
         """
         is_interp   = self.attrs['is_interp']
         self._get_lon_lat_arr(is_interp=is_interp)
-        topoarr     = np.zeros(self.lonArr.shape)
         if is_interp:
-            from netCDF4 import Dataset
-            try:
-                etopodbase  = Dataset(infname)
-            except IOError:
-                if download:
-                    url     = 'https://www.ngdc.noaa.gov/mgg/global/relief/ETOPO2/ETOPO2v2-2006/ETOPO2v2g/netCDF/ETOPO2v2g_f4_netCDF.zip'
-                    os.system('wget '+url)
-                    os.system('unzip ETOPO2v2g_f4_netCDF.zip')
-                    if delete:
-                        os.remove('ETOPO2v2g_f4_netCDF.zip')
-                    etopodbase  = Dataset('./ETOPO2v2g_f4.nc')
-                else:
-                    print 'No etopo data!'
-                    return
-            etopo       = etopodbase.variables['z'][:]
-            lons        = etopodbase.variables['x'][:]
-            lats        = etopodbase.variables['y'][:]
-            for ilat in range(self.Nlat):
-                for ilon in range(self.Nlon):
-                    grd_lon             = self.lons[ilon]
-                    grd_lat             = self.lats[ilat]
-                    if grd_lon > 180.:
-                        grd_lon         -= 360.
-                    try:
-                        ind_lon         = np.where(lons>=grd_lon)[0][0]
-                    except:
-                        ind_lon         = lons.size - 1
-                    try:
-                        ind_lat         = np.where(lats>=grd_lat)[0][0]
-                    except:
-                        ind_lat         = lats.size - 1
-                    if lons[ind_lon] - grd_lon > (1./60.):
-                        ind_lon         -= 1
-                    if lats[ind_lat] - grd_lat > (1./60.):
-                        ind_lat         -= 1
-                    if abs(lons[ind_lon] - grd_lon) > 1./60. or abs(lats[ind_lat] - grd_lat) > 1./60.:
-                        print 'ERROR!', lons[ind_lon], lats[ind_lat] , grd_lon, grd_lat
-                    z                   = etopo[ind_lat, ind_lon]/1000. # convert to km
-                    topoarr[ilat, ilon] = z
-            self.create_dataset(name='topo_interp', data = topoarr)
-        else:
-            for ilat in range(self.Nlat):
-                for ilon in range(self.Nlon):
-                    grd_id              = str(self.lons[ilon])+'_'+str(self.lats[ilat])
-                    topovalue           = self[grd_id].attrs['topo']
-                    topoarr[ilat, ilon] = topovalue
-            self.create_dataset(name='topo', data = topoarr)
-        return
+            dname   = 'topo_interp'
+            dlon    = self.attrs['dlon_interp']
+            dlat    = self.attrs['dlat_interp']
+        else:
+            dname   = 'topo'
+            method  = 'grd_pts'
+            dlon    = self.attrs['dlon']
+            dlat    = self.attrs['dlat']
+        grid_spec   = np.array([self.attrs['minlon'], self.attrs['maxlon'], self.attrs['minlat'], self.attrs['maxlat'], dlon, dlat],\
+                        dtype=np.float64)
+        if dname in self.keys():
+            dset    = self[dname]
+            if dset.attrs.get('method') == method and dset.attrs.get('grid_spec') is not None \
+                    and np.allclose(dset.attrs['grid_spec'], grid_spec):
+                return dset.value
+            del self[dname]
+        if is_interp:
+            etopodbase  = _open_etopo(infname, download=download, delete=delete)
+            if etopodbase is None:
+                return
+            topoarr     = _sample_etopo(etopodbase, self.lonArr, self.latArr, method=method, dlon=dlon, dlat=dlat)
+            etopodbase.close()
+        else:
+            topoarr, valid  = self.get_grd_map(name='topo', isattr=True)
+            topoarr         = topoarr.astype(np.float64)
+        dset        = self.create_dataset(name=dname, data = topoarr)
+        dset.attrs.create(name='grid_spec', data=grid_spec)
+        dset.attrs.create(name='method', data=method)
+        return topoarr
     
     def convert_to_vts(self, outdir, dtype='min', is_smooth=False, pfx='', verbose=False, unit=True):
         """ Convert Vs model to vts format for plotting with Paraview, VisIt
@@ -2166,6 +3131,9 @@ class invhdf5(h5py.File):
     
     def generate_disp_vs_figs(self, datadir, outdir, dlon=4., dlat=2.,projection='lambert',\
                             Nmax=None, Nmin=None, hillshade=True):
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.basemap import shiftgrid
+        import pycpt
         minlon          = self.attrs['minlon']
         maxlon          = self.attrs['maxlon']
         minlat          = self.attrs['minlat']
@@ -2253,6 +3221,9 @@ class invhdf5(h5py.File):
     def _get_basemap(self, projection='lambert', geopolygons=None, resolution='i'):
         """Get basemap for plotting results
         """
+        import matplotlib.pyplot as plt
+        import obspy
+        from mpl_toolkits.basemap import Basemap
         # fig=plt.figure(num=None, figsize=(12, 12), dpi=80, facecolor='w', edgecolor='k')
         # plt.figure()
         plt.figure(figsize=[18, 9.6])
@@ -2335,6 +3306,9 @@ class invhdf5(h5py.File):
         showfig     - show figure or not
         ===================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.basemap import shiftgrid
+        import colormaps
         is_interp       = self.attrs['is_interp']
         if pindex is 'min_misfit' or pindex is 'avg_misfit' or pindex is 'fitratio' or pindex is 'mean_misfit':
             is_interp   = False
@@ -2507,6 +3481,8 @@ class invhdf5(h5py.File):
         showfig     - show figure or not
         ===================================================================================================
         """
+        import matplotlib.pyplot as plt
+        import colormaps
         is_interp       = self.attrs['is_interp']
         if icrtmtl == 1:
             data, data_smooth\
@@ -2624,33 +3600,17 @@ class invhdf5(h5py.File):
         showfig     - show figure or not
         =================================================================================================================
         """
+        import matplotlib.pyplot as plt
+        import obspy
+        from mpl_toolkits.basemap import shiftgrid
+        from pyproj import Geod
+        import colormaps
         is_interp   = self.attrs['is_interp']
         self._get_lon_lat_arr(is_interp=is_interp)
-        grp         = self[dtype+'_paraval']
-        if is_smooth:
-            vs3d    = grp['vs_smooth'].value
-            zArr    = grp['z_smooth'].value
-        else:
-            vs3d    = grp['vs_org'].value
-            zArr    = grp['z_org'].value
-        if depthb is not None:
-            if depthb < depth:
-                raise ValueError('depthb should be larger than depth!')
-            index   = np.where((zArr >= depth)*(zArr <= depthb) )[0]
-            vs_plt  = (vs3d[:, :, index]).mean(axis=2)
-        elif depthavg is not None:
-            depth0  = max(0., depth-depthavg)
-            depth1  = depth+depthavg
-            index   = np.where((zArr >= depth0)*(zArr <= depth1) )[0]
-            vs_plt  = (vs3d[:, :, index]).mean(axis=2)
-        else:
-            try:
-                index   = np.where(zArr >= depth )[0][0]
-            except IndexError:
-                print 'depth slice required is out of bound, maximum depth = '+str(zArr.max())+' km'
-                return
-            depth       = zArr[index]
-            vs_plt      = vs3d[:, :, index]
+        # only the chunks of the depth slice are read
+        vs_plt, depth   = self.get_vs_slice(depth=depth, depthb=depthb, depthavg=depthavg, dtype=dtype, is_smooth=is_smooth)
+        if vs_plt is None:
+            return
         if is_interp:
             mask    = self.attrs['mask_interp']
         else:
@@ -2890,6 +3850,9 @@ class invhdf5(h5py.File):
         showfig     - show figure or not
         =================================================================================================================
         """
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.basemap import shiftgrid
+        import colormaps
         is_interp       = self.attrs['is_interp']
         if is_interp:
             topoArr     = self['topo_interp'].value
@@ -2908,19 +3871,14 @@ class invhdf5(h5py.File):
         else:
             raise ValueError('Unexpected type of discontinuity:'+distype)
         self._get_lon_lat_arr(is_interp=is_interp)
-        grp         = self[dtype+'_paraval']
-        if is_smooth:
-            vs3d    = grp['vs_smooth'].value
-            zArr    = grp['z_smooth'].value
-        else:
-            vs3d    = grp['vs_org'].value
-            zArr    = grp['z_org'].value
         if depthrange < 0.:
             depth0  = disArr + depthrange
             depth1  = disArr.copy()
         else:
             depth0  = disArr 
             depth1  = disArr + depthrange
+        # only the depth range around the discontinuity is read
+        vs3d, zArr  = self.get_vs_cube(depth0=depth0.min(), depth1=depth1.max(), dtype=dtype, is_smooth=is_smooth)
         vs_plt      = _get_vs_2d(z0=depth0, z1=depth1, zArr=zArr, vs_3d=vs3d)
         if is_interp:
             mask    = self.attrs['mask_interp']
@@ -3040,6 +3998,11 @@ class invhdf5(h5py.File):
     
     def plot_vertical_rel(self, lon1, lat1, lon2, lat2, maxdepth, vs_mantle=4.4, plottype = 0, d = 10., dtype='avg', is_smooth=True,\
                       clabel='', cmap='cv', vmin1=3.0, vmax1=4.2, vmin2=-10., vmax2=10., incat=None, dist_thresh=20., showfig=True):
+        import matplotlib.pyplot as plt
+        import obspy
+        from pyproj import Geod
+        import colormaps
+        import pycpt
         is_interp   = self.attrs['is_interp']
         if is_interp:
             topoArr = self['topo_interp'].value
@@ -3052,13 +4015,8 @@ class invhdf5(h5py.File):
         if lon1 == lon2 and lat1 == lat2:
             raise ValueError('The start and end points are the same!')
         self._get_lon_lat_arr(is_interp=is_interp)
-        grp         = self[dtype+'_paraval']
-        if is_smooth:
-            vs3d    = grp['vs_smooth'].value
-            zArr    = grp['z_smooth'].value
-        else:
-            vs3d    = grp['vs_org'].value
-            zArr    = grp['z_org'].value
+        # the 3D vs array is NOT loaded, profiles are read by get_vs_profiles
+        dset, zArr  = self._get_vs_dset(dtype=dtype, is_smooth=is_smooth)
         if is_interp:
             mask    = self.attrs['mask_interp']
         else:
@@ -3074,8 +4032,9 @@ class invhdf5(h5py.File):
                 ind_lon = np.where((self.lons<=max(lon1, lon2))*(self.lons>=min(lon1, lon2)))[0]
                 ind_lat = np.where(self.lats == lat1)[0]
                 # data    = np.zeros((len(ind_lon), ind_z.size))
-            data_temp   = vs3d[ind_lat, ind_lon, :]
-            data        = data_temp[:, ind_z]
+            ind_lat, ind_lon\
+                        = np.broadcast_arrays(ind_lat, ind_lon)
+            data, zplot = self.get_vs_profiles(ind_lat=ind_lat, ind_lon=ind_lon, maxdepth=maxdepth, dtype=dtype, is_smooth=is_smooth)
             if lon1 == lon2:
                 xplot       = self.lats[ind_lat]
                 xlabel      = 'latitude (deg)'
@@ -3087,73 +4046,23 @@ class invhdf5(h5py.File):
             moho1d          = mohoArr[ind_lat, ind_lon]
             #
             data_moho       = data.copy()
-            mask_moho       = np.ones(data.shape, dtype=bool)
-            data_mantle     = data.copy()
-            mask_mantle     = np.ones(data.shape, dtype=bool)
-            for ix in range(data.shape[0]):
-                ind_moho    = zplot <= moho1d[ix]
-                ind_mantle  = np.logical_not(ind_moho)
-                mask_moho[ix, ind_moho] \
-                            = False
-                mask_mantle[ix, ind_mantle] \
-                            = False
-                data_mantle[ix, :] \
-                            = (data_mantle[ix, :] - vs_mantle)/vs_mantle*100.
+            mask_moho       = np.logical_not(zplot[None, :] <= moho1d[:, None])
+            data_mantle     = (data - vs_mantle)/vs_mantle*100.
+            mask_mantle     = np.logical_not(mask_moho)
         else:
             g               = Geod(ellps='WGS84')
-            az, baz, dist   = g.inv(lon1, lat1, lon2, lat2)
-            dist            = dist/1000.
-            d               = dist/float(int(dist/d))
-            Nd              = int(dist/d)
-            lonlats         = g.npts(lon1, lat1, lon2, lat2, npts=Nd-1)
-            lonlats         = [(lon1, lat1)] + lonlats
-            lonlats.append((lon2, lat2))
-            data            = np.zeros((len(lonlats), ind_z.size))
-            mask1d          = np.ones((len(lonlats), ind_z.size), dtype=bool)
-            L               = self.lonArr.size
-            vlonArr         = self.lonArr.reshape(L)
-            vlatArr         = self.latArr.reshape(L)
-            ind_data        = 0
-            plons           = np.zeros(len(lonlats))
-            plats           = np.zeros(len(lonlats))
-            topo1d          = np.zeros(len(lonlats))
-            moho1d          = np.zeros(len(lonlats))
-            for lon,lat in lonlats:
-                if lon < 0.:
-                    lon     += 360.
-                clonArr         = np.ones(L, dtype=float)*lon
-                clatArr         = np.ones(L, dtype=float)*lat
-                az, baz, dist   = g.inv(clonArr, clatArr, vlonArr, vlatArr)
-                ind_min         = dist.argmin()
-                ind_lat         = int(np.floor(ind_min/self.Nlon))
-                ind_lon         = ind_min - self.Nlon*ind_lat
-                azmin, bazmin, distmin = g.inv(lon, lat, self.lons[ind_lon], self.lats[ind_lat])
-                if distmin != dist[ind_min]:
-                    raise ValueError('DEBUG!')
-                data[ind_data, :]   \
-                                = vs3d[ind_lat, ind_lon, ind_z]
-                plons[ind_data] = lon
-                plats[ind_data] = lat
-                topo1d[ind_data]= topoArr[ind_lat, ind_lon]
-                moho1d[ind_data]= mohoArr[ind_lat, ind_lon]
-                mask1d[ind_data, :]\
-                                = mask[ind_lat, ind_lon]
-                ind_data        += 1
+            # vectorized sampling along the great circle path (cached)
+            plons, plats, zplot, data, topo1d, moho1d, mask1d   \
+                                = self.get_cross_section(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2, maxdepth=maxdepth, d=d,\
+                                    dtype=dtype, is_smooth=is_smooth)
+            topo1d              = topo1d.copy()
+            lonlats             = zip(plons, plats)
             data_moho           = data.copy()
-            mask_moho           = np.ones(data.shape, dtype=bool)
-            data_mantle         = data.copy()
-            mask_mantle         = np.ones(data.shape, dtype=bool)
-            for ix in range(data.shape[0]):
-                ind_moho        = zplot <= moho1d[ix]
-                ind_mantle      = np.logical_not(ind_moho)
-                mask_moho[ix, ind_moho] \
-                                = False
-                mask_mantle[ix, ind_mantle] \
-                                = False
-                data_mantle[ix, :] \
-                                = (data_mantle[ix, :] - vs_mantle)/vs_mantle*100.
-            mask_moho           += mask1d
-            mask_mantle         += mask1d
+            mask_moho           = np.logical_not(zplot[None, :] <= moho1d[:, None])
+            data_mantle         = (data - vs_mantle)/vs_mantle*100.
+            mask_mantle         = np.logical_not(mask_moho)
+            mask_moho           += mask1d[:, None]
+            mask_mantle         += mask1d[:, None]
             if plottype == 0:
                 xplot   = plons
                 xlabel  = 'longitude (deg)'
@@ -3322,16 +4231,13 @@ class invhdf5(h5py.File):
                     
     def plot_vertical_abs(self, lon1, lat1, lon2, lat2, maxdepth, plottype = 0, d = 10., dtype='min', is_smooth=False,\
                       clabel='', cmap='cv', vmin=None, vmax=None, showfig=True):        
+        import matplotlib.pyplot as plt
+        import colormaps
         if lon1 == lon2 and lat1 == lat2:
             raise ValueError('The start and end points are the same!')
         self._get_lon_lat_arr()
-        grp         = self[dtype+'_paraval']
-        if is_smooth:
-            vs3d    = grp['vs_smooth'].value
-            zArr    = grp['z_smooth'].value
-        else:
-            vs3d    = grp['vs_org'].value
-            zArr    = grp['z_org'].value
+        # the 3D vs array is NOT loaded, profiles are read by get_vs_profiles
+        dset, zArr  = self._get_vs_dset(dtype=dtype, is_smooth=is_smooth)
         ind_z       = np.where(zArr <= maxdepth )[0]
         zplot       = zArr[ind_z]
         if lon1 == lon2 or lat1 == lat2:
@@ -3343,8 +4249,9 @@ class invhdf5(h5py.File):
                 ind_lon = np.where((self.lons<=max(lon1, lon2))*(self.lons>=min(lon1, lon2)))[0]
                 ind_lat = np.where(self.lats == lat1)[0]
                 # data    = np.zeros((len(ind_lon), ind_z.size))
-            data_temp   = vs3d[ind_lat, ind_lon, :]
-            data        = data_temp[:, ind_z]
+            ind_lat, ind_lon\
+                        = np.broadcast_arrays(ind_lat, ind_lon)
+            data, zplot = self.get_vs_profiles(ind_lat=ind_lat, ind_lon=ind_lon, maxdepth=maxdepth, dtype=dtype, is_smooth=is_smooth)
             # return data, data_temp
             if lon1 == lon2:
                 xplot       = self.lats[ind_lat]
@@ -3353,42 +4260,10 @@ class invhdf5(h5py.File):
                 xplot       = self.lons[ind_lon]
                 xlabel      = 'longitude (deg)'            
         else:
-            g               = Geod(ellps='WGS84')
-            az, baz, dist   = g.inv(lon1, lat1, lon2, lat2)
-            dist            = dist/1000.
-            d               = dist/float(int(dist/d))
-            Nd              = int(dist/d)
-            lonlats         = g.npts(lon1, lat1, lon2, lat2, npts=Nd-1)
-            lonlats         = [(lon1, lat1)] + lonlats
-            lonlats.append((lon2, lat2))
-            data            = np.zeros((len(lonlats), ind_z.size))
-            L               = self.lonArr.size
-            vlonArr         = self.lonArr.reshape(L)
-            vlatArr         = self.latArr.reshape(L)
-            ind_data        = 0
-            plons           = np.zeros(len(lonlats))
-            plats           = np.zeros(len(lonlats))
-            for lon,lat in lonlats:
-                if lon < 0.:
-                    lon     += 360.
-                # if lat <
-                # print lon, lat
-                clonArr         = np.ones(L, dtype=float)*lon
-                clatArr         = np.ones(L, dtype=float)*lat
-                az, baz, dist   = g.inv(clonArr, clatArr, vlonArr, vlatArr)
-                ind_min         = dist.argmin()
-                ind_lat         = int(np.floor(ind_min/self.Nlon))
-                ind_lon         = ind_min - self.Nlon*ind_lat
-                # 
-                azmin, bazmin, distmin = g.inv(lon, lat, self.lons[ind_lon], self.lats[ind_lat])
-                if distmin != dist[ind_min]:
-                    raise ValueError('DEBUG!')
-                #
-                data[ind_data, :]   \
-                                = vs3d[ind_lat, ind_lon, ind_z]
-                plons[ind_data] = lon
-                plats[ind_data] = lat
-                ind_data        += 1
+            # vectorized sampling along the great circle path (cached)
+            plons, plats, zplot, data, topo1d, moho1d, mask1d   \
+                                = self.get_cross_section(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2, maxdepth=maxdepth, d=d,\
+                                    dtype=dtype, is_smooth=is_smooth)
             # data[0, :]          = 
             if plottype == 0:
                 xplot   = plons
@@ -3427,6 +4302,8 @@ class invhdf5(h5py.File):
 # quick and dirty functions
     def plot_miller_moho(self, vmin=20., vmax=60., clabel='Crustal thickness (km)', cmap='gist_ncar',showfig=True, projection='lambert', \
                          infname='/home/leon/miller_alaskamoho_srl2018-1.2.2/miller_alaskamoho_srl2018/Models/AlaskaMoho.npz'):
+        import matplotlib.pyplot as plt
+        import colormaps
         inarr   = np.load(infname)['alaska_moho']
         mohoarr = []
         lonarr  = []
@@ -3481,6 +4358,8 @@ class invhdf5(h5py.File):
             
     def plot_miller_moho_finer(self, vmin=20., vmax=60., clabel='Crustal thickness (km)', cmap='gist_ncar',showfig=True, projection='lambert', \
                          infname='/home/leon/miller_alaskamoho_srl2018-1.2.2/miller_alaskamoho_srl2018/Models/AlaskaMoHiErrs-AlaskaMohoFineGrid.npz'):
+        import matplotlib.pyplot as plt
+        import colormaps
         inarr   = np.load(infname)
         mohoarr = inarr['gridded_data_1']
         lonarr  = np.degrees(inarr['gridlons'])
@@ -3528,6 +4407,8 @@ class invhdf5(h5py.File):
             
     def plot_crust1(self, infname='crsthk.xyz', vmin=20., vmax=60., clabel='Crustal thickness (km)',
                     cmap='gist_ncar',showfig=True, projection='lambert'):
+        import matplotlib.pyplot as plt
+        import colormaps
         inArr       = np.loadtxt(infname)
         lonArr      = inArr[:, 0]
         lonArr      = lonArr.reshape(lonArr.size/360, 360)
@@ -0,0 +1,55 @@
+"""
+regression check of the in-memory gridding/Gaussian filtering (gridsmooth) against stored GMT outputs
+the reference (test_scripts/data/gridsmooth_gmt_ref.npz) holds the input points and the GMT output grids of
+    surface     - gmt surface -T0 -I0.2/0.1 (surfdbase.get_filled_paraval with do_interp=True, working_interpolation)
+    gauss       - gmt surface -T0 -I0.2/0.1 + grdfilter -D4 -Fg150 (surfdbase.get_smooth_paraval with gsigma=50., working_gauss_smooth)
+The grids are compared at the nodes within MAXDIST deg of the input points, away from the data the two engines extrapolate
+differently (the differences there are only printed). The script exits with 1 if a tolerance is exceeded.
+usage:
+    python test_scripts/test_gridsmooth.py
+"""
+import os
+import sys
+import numpy as np
+from scipy.spatial import cKDTree
+
+srcdir  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, srcdir)
+import gridsmooth
+
+REFFNAME    = os.path.join(srcdir, 'test_scripts', 'data', 'gridsmooth_gmt_ref.npz')
+MAXDIST     = 0.5
+# maximum/rms absolute difference allowed near the data
+TOLERANCE   = {'surface': (1.5, 0.1), 'gauss': (1., 0.05)}
+
+def get_near_mask(points, lons, lats, maxdist):
+    """
+    mask of the grid nodes within maxdist (deg) of the input points
+    """
+    lonArr, latArr  = np.meshgrid(lons, lats)
+    dist, ind       = cKDTree(points[:, :2]).query(np.c_[lonArr.ravel(), latArr.ravel()])
+    return (dist <= maxdist).reshape(lonArr.shape)
+
+ref     = np.load(REFFNAME)
+nfail   = 0
+for name in ['surface', 'gauss']:
+    points  = ref[name+'_in']
+    lons    = ref[name+'_lons']
+    lats    = ref[name+'_lats']
+    z_gmt   = ref[name+'_gmt'].astype(np.float64)
+    z_native= gridsmooth.surface(lonIn=points[:, 0], latIn=points[:, 1], ZarrIn=points[:, 2], lons=lons, lats=lats, tension=0.)
+    if name == 'gauss':
+        z_native= gridsmooth.gauss_filter(Zarr=z_native, lons=lons, lats=lats, width=6.*(50./2.))
+    diff    = abs(z_native - z_gmt)
+    near    = get_near_mask(points, lons, lats, MAXDIST)
+    maxdiff = diff[near].max()
+    rmsdiff = np.sqrt((diff[near]**2).mean())
+    maxtol, rmstol  = TOLERANCE[name]
+    status  = 'ok'
+    if maxdiff > maxtol or rmsdiff > rmstol:
+        status  = 'FAIL (tolerance: max = %g, rms = %g)' %(maxtol, rmstol)
+        nfail   += 1
+    print '%-8s near data (%d nodes): max diff = %8.4f, rms diff = %8.4f %s' %(name, near.sum(), maxdiff, rmsdiff, status)
+    print '%-8s all nodes (%d nodes): max diff = %8.4f, rms diff = %8.4f' %(name, near.size, diff.max(), np.sqrt((diff**2).mean()))
+print '--- '+str(nfail)+' failure(s)'
+sys.exit(1 if nfail > 0 else 0)
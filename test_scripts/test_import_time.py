@@ -0,0 +1,62 @@
+"""
+measure the import time of the inversion modules, each module is imported in a fresh interpreter
+the inversion path must not load any plotting/geodesy package, and must be imported within MAX_TIME sec
+a module that can not be imported (e.g. missing compiled solvers or packages) is counted as a failure
+NOTE: numba is NOT a heavy package here, it is required by the inversion path (data, modparam), and mcpost/mcpost_vti
+    also import it at module level for the cached _get_running_min kernel (see warmup_numba.py), so the import time
+    includes the loading of numba and of the cached kernels
+usage:
+    python test_scripts/test_import_time.py
+"""
+import os
+import sys
+import subprocess
+
+# modules of the inversion path (including the multiprocessing workers) and the database modules used by the run scripts
+COMPUTE_MODULES = ['data', 'eigenkernel', 'rftheo', 'mcstats', 'mcchain', 'modparam', 'vmodel', 'vprofile']
+DBASE_MODULES   = ['mcpost', 'mcpost_vti', 'surfdbase']
+HEAVY_PACKAGES  = ['matplotlib', 'mpl_toolkits', 'obspy', 'pyproj', 'pycpt', 'field2d_earth', 'colormaps', 'pyasdf', 'netCDF4']
+MAX_TIME        = 1.
+
+CODE            = """
+import sys, time
+t0  = time.time()
+import %s
+t1  = time.time()
+heavy   = [name for name in %r if name in sys.modules]
+print t1 - t0
+print ' '.join(heavy)
+"""
+
+def measure(modname, srcdir):
+    """
+    import a module in a fresh interpreter
+    ::: output :::
+    import time (sec), list of the heavy packages loaded, error message (None if the import succeeded)
+    """
+    proc    = subprocess.Popen([sys.executable, '-c', CODE %(modname, HEAVY_PACKAGES)], cwd=srcdir,\
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err= proc.communicate()
+    if proc.returncode != 0:
+        return None, [], err.strip().split('\n')[-1]
+    lines   = out.split('\n')
+    return float(lines[0]), lines[1].split(), None
+
+srcdir  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+nfail   = 0
+for modname in COMPUTE_MODULES + DBASE_MODULES:
+    tmod, heavy, err= measure(modname, srcdir)
+    if err is not None:
+        print '%-14s FAIL (import failed: %s)' %(modname, err)
+        nfail   += 1
+        continue
+    status  = 'ok'
+    if len(heavy) > 0:
+        status  = 'FAIL (loads '+', '.join(heavy)+')'
+        nfail   += 1
+    elif modname in COMPUTE_MODULES and tmod > MAX_TIME:
+        status  = 'FAIL (slower than '+str(MAX_TIME)+' sec)'
+        nfail   += 1
+    print '%-14s %8.3f sec %s' %(modname, tmod, status)
+print '--- '+str(nfail)+' failure(s)'
+sys.exit(1 if nfail > 0 else 0)
@@ -0,0 +1,74 @@
+"""
+randomized check of the vectorized model constraints (modparam.isomod.isgood_arr/vtimod.isgood_arr, used by vprofile1d.mc_prior)
+against the per-model para2mod + update + isgood, for iso and vti (with and without gamma) models, with and without water
+the models are drawn uniformly from the parameter space (new_paraval_arr) and around the initial model,
+so that both good and bad models are checked
+The script exits with 1 if any model is classified differently.
+usage:
+    python test_scripts/test_isgood_arr.py [N]
+        N   - number of models of each case (default - 2000)
+"""
+import os
+import sys
+import copy
+import numpy as np
+
+srcdir  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, srcdir)
+import modparam
+
+def get_model(mtype, topovalue, gamma=False):
+    """
+    model parameterized with ak135, crustal thickness = 35 km, sediment thickness = 2 km
+    """
+    if mtype == 'iso':
+        mod     = modparam.isomod()
+        mod.parameterize_ak135(crtthk=35., sedthk=2., topovalue=topovalue)
+        mod.get_paraind()
+    else:
+        mod     = modparam.vtimod()
+        mod.parameterize_ak135(crtthk=35., sedthk=2., topovalue=topovalue)
+        if gamma:
+            mod.get_paraind_gamma(perturb_thk=True)
+        else:
+            mod.get_paraind()
+    mod.update()
+    mod.mod2para()
+    return mod
+
+def get_isgood(mod, paravalarr, m0, m1, g0, g1):
+    """
+    per-model check, the same as in the sampling loops
+    """
+    isgoodarr   = np.zeros(paravalarr.shape[0], dtype=bool)
+    for i in xrange(paravalarr.shape[0]):
+        newmod  = copy.deepcopy(mod)
+        newmod.para.paraval[:]  = paravalarr[i, :]
+        newmod.para2mod()
+        newmod.update()
+        isgoodarr[i]    = newmod.isgood(m0, m1, g0, g1)
+    return isgoodarr
+
+N       = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+np.random.seed(44)
+nfail   = 0
+for mtype, gamma in [('iso', False), ('vti', False), ('vti', True)]:
+    for topovalue in [1., -1.5]:
+        mod         = get_model(mtype, topovalue, gamma=gamma)
+        # group indices, see vprofile1d.mc_prior
+        m0, m1, g0, g1  = (1, 2, 2, 1) if topovalue < 0. else (0, 1, 1, 0)
+        paraval0    = mod.para.paraval[:mod.para.npara].copy()
+        paravalarr  = np.concatenate([mod.para.new_paraval_arr(N/2), \
+                        paraval0 + 0.02*np.abs(paraval0)*np.random.randn(N - N/2, paraval0.size)], axis=0)
+        isgoodarr   = mod.isgood_arr(paravalarr, m0, m1, g0, g1)
+        isgoodref   = get_isgood(mod, paravalarr, m0, m1, g0, g1)
+        Ndiff       = (isgoodarr != isgoodref).sum()
+        status      = 'ok'
+        if Ndiff > 0:
+            status  = 'FAIL'
+            nfail   += 1
+        name        = mtype+(' gamma' if gamma else '')+(' water' if topovalue < 0. else '')
+        print '%-16s %d models, %5d good (isgood), %5d good (isgood_arr), %d different %s' \
+                %(name, N, isgoodref.sum(), isgoodarr.sum(), Ndiff, status)
+print '--- '+str(nfail)+' failure(s)'
+sys.exit(1 if nfail > 0 else 0)
@@ -0,0 +1,138 @@
+"""
+write/read round-trip check of the Monte Carlo chain outputs (mcchain)
+    chain       - write_chain/chainfile/merge_chains, iso and vti chains, with an empty prediction block,
+                    against the same arrays saved in the old npz format
+    store       - chainstore append/get_chain/get_file, including an empty output file, index table and get_grid_stats
+The script exits with 1 if a check fails.
+usage:
+    python test_scripts/test_mcchain.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+srcdir  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, srcdir)
+import mcchain, mcstats
+
+nfail   = 0
+
+def check(name, ok):
+    global nfail
+    if not ok:
+        nfail   += 1
+    print '%-56s %s' %(name, 'ok' if ok else 'FAIL')
+
+def get_random_chain(mtype, nrows, npara, npts):
+    """
+    random model array and prediction arrays of a chain
+    npts    - number of points of each prediction block, see mcchain.PRED_COLUMNS
+    """
+    modarr          = np.random.rand(nrows, npara+9)
+    modarr[:, 0]    = np.random.choice([-1., 0., 1.], size=nrows)
+    predarrs        = [np.random.rand(nrows, n) for n in npts]
+    return modarr, predarrs
+
+def get_stats(total):
+    return {'time': {'forward': total}, 'count': {'nrun': int(total)}, 'total': total}
+
+def check_chain(name, chain, modarr, predarrs, mtype):
+    """
+    compare a chain (chainfile/chaingroup) with the arrays it was written from
+    """
+    check(name+': header', chain.mtype == mtype and chain.nrows == modarr.shape[0] and chain.npara == modarr.shape[1]-9)
+    check(name+': model array', np.array_equal(chain.get_model_array(), modarr))
+    check(name+': model columns', np.array_equal(chain['paraval'], modarr[:, 2:-7]) and \
+            np.array_equal(chain['flag'], modarr[:, 0]) and np.array_equal(chain['time'], modarr[:, -1]))
+    ok      = True
+    for pname, predarr in zip(mcchain.PRED_COLUMNS[mtype], predarrs):
+        ok  = ok and np.array_equal(np.asarray(chain[pname]), predarr)
+    check(name+': prediction columns', ok)
+    if chain.version > 0:
+        misfit  = modarr[:, -6]
+        check(name+': misfit_order', np.array_equal(chain['misfit_order'], np.argsort(misfit, kind='mergesort')))
+
+workdir = tempfile.mkdtemp()
+try:
+    np.random.seed(43)
+    #--------------------------------------------
+    # chain file, iso (empty group velocity block) and vti
+    #--------------------------------------------
+    for mtype, npara, npts in [('iso', 13, [17, 0, 512]), ('vti', 24, [20, 18])]:
+        modarr, predarrs    = get_random_chain(mtype, 101, npara, npts)
+        dev                 = np.random.rand(101)
+        summary             = {mcchain.SUMMARY_COLUMNS[mtype][1]: dev}
+        fname               = workdir+'/mc_inv.'+mtype+mcchain.SUFFIX
+        mcchain.write_chain(fname, modarr, predarrs, mtype=mtype, summary=summary, stats=get_stats(1.))
+        chain               = mcchain.chainfile(fname)
+        check_chain(mtype+' chain file', chain, modarr, predarrs, mtype)
+        check(mtype+' chain file: summary/stats', np.array_equal(chain[mcchain.SUMMARY_COLUMNS[mtype][1]], dev) and \
+                not mcchain.SUMMARY_COLUMNS[mtype][2] in chain and chain.stats == get_stats(1.))
+        chain.close()
+        # old npz outputs
+        npzfname            = workdir+'/mc_inv.'+mtype+'.npz'
+        np.savez_compressed(npzfname, modarr, *predarrs)
+        chain               = mcchain.chainfile(npzfname)
+        check_chain(mtype+' npz file', chain, modarr, predarrs, mtype)
+        chain.close()
+        # merged chains
+        modarr2, predarrs2  = get_random_chain(mtype, 37, npara, npts)
+        fname2              = workdir+'/mc_inv.'+mtype+'_2'+mcchain.SUFFIX
+        mcchain.write_chain(fname2, modarr2, predarrs2, mtype=mtype, stats=get_stats(2.))
+        outfname            = workdir+'/mc_inv.'+mtype+'_merged'+mcchain.SUFFIX
+        mcchain.merge_chains([fname, fname2], outfname, mtype=mtype, remove=False)
+        chain               = mcchain.chainfile(outfname)
+        check_chain(mtype+' merged chain', chain, np.concatenate([modarr, modarr2]), \
+                [np.concatenate([arr1, arr2]) for arr1, arr2 in zip(predarrs, predarrs2)], mtype)
+        # the summary column is dropped as the second chain does not have it, the statistics are summed
+        check(mtype+' merged chain: summary/stats', not mcchain.SUMMARY_COLUMNS[mtype][1] in chain and \
+                chain.stats == mcstats.merge_stats([get_stats(1.), get_stats(2.)]))
+        chain.close()
+    #--------------------------------------------
+    # consolidated store
+    #--------------------------------------------
+    storefname  = workdir+'/mc_store.h5'
+    outdir      = workdir+'/out'
+    os.makedirs(outdir)
+    chains      = {}
+    contents    = {'mod': 'layer model\n', 'disp': '10. 3.5 0.01\n', 'empty': ''}
+    for grd_id, mtype, npara, npts in [('200.0_60.0', 'iso', 13, [17, 0, 512]), ('201.0_60.5', 'vti', 24, [20, 18])]:
+        modarr, predarrs    = get_random_chain(mtype, 53, npara, npts)
+        chains[grd_id]      = (mtype, modarr, predarrs)
+        chainfname          = mcchain.get_inv_fname(outdir, grd_id)
+        mcchain.write_chain(chainfname, modarr, predarrs, mtype=mtype, stats=get_stats(1.) if mtype == 'iso' else None)
+        fnames              = []
+        for sfx in contents:
+            fnames.append(outdir+'/'+grd_id+'.'+sfx)
+            with open(fnames[-1], 'wb') as fid:
+                fid.write(contents[sfx])
+        with mcchain.chainstore(storefname, mode='a') as store:
+            store.append(grd_id, chainfname, fnames=fnames)
+    check('store: input files removed', len(os.listdir(outdir)) == 0)
+    check('store: is_store', mcchain.is_store(storefname) and not mcchain.is_store(outdir))
+    with mcchain.chainstore(storefname) as store:
+        check('store: keys', sorted(store.keys()) == sorted(chains.keys()))
+        index   = store.get_index()
+        for grd_id in sorted(chains.keys()):
+            mtype, modarr, predarrs = chains[grd_id]
+            chain   = store.get_chain(grd_id)
+            check_chain('store '+grd_id, chain, modarr, predarrs, mtype)
+            row     = index[index['grd_id'] == grd_id][0]
+            flag    = modarr[:, 0]
+            check('store '+grd_id+': index', row['mtype'] == mtype and row['nrows'] == modarr.shape[0] and \
+                    row['nacc'] == (flag == 1.).sum() and row['min_misfit'] == modarr[flag != 0., -6].min())
+            ok      = True
+            for sfx in contents:
+                ok  = ok and store.get_file(grd_id, grd_id+'.'+sfx).read() == contents[sfx]
+            check('store '+grd_id+': files (one empty)', ok and store.get_file(grd_id, 'no_such_file') is None)
+        # the loaded chain is readable after the store is closed
+        chain   = store.get_chain('201.0_60.5').load()
+    check_chain('store loaded chain (closed store)', chain, chains['201.0_60.5'][1], chains['201.0_60.5'][2], 'vti')
+    statsdict   = mcchain.get_grid_stats(storefname)
+    check('store: get_grid_stats', statsdict == {'200.0_60.0': get_stats(1.)})
+finally:
+    shutil.rmtree(workdir)
+print '--- '+str(nfail)+' failure(s)'
+sys.exit(1 if nfail > 0 else 0)
@@ -0,0 +1,101 @@
+"""
+check of the kernel Jacobian of the tilted TI Gauss-Newton inversion (numba_src/vprofile.py)
+vprofile1d.compute_tti_jacobian_kernel (sensitivity kernels chained with the analytic derivatives of the parameterization)
+is compared column by column with the finite difference Jacobian vprofile1d.compute_tti_jacobian, on a small dipping model
+    group 0     - sediment, gradient layer (not perturbed)
+    group 1     - crust, B-splines, dip = 35 deg
+    group 2     - mantle, gradient layer, dip = 20 deg
+Both Jacobians predict the phase velocities from the kernels of the same reference model (perturb_from_kernel),
+so they differ only by the finite difference error (central difference, 0.05 km/s for velocities, 5 deg for dip).
+The script exits with 1 if a column differs by more than TOLERANCE (relative to the norm of the finite difference column).
+usage:
+    python test_scripts/test_tti_jacobian.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+srcdir  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(srcdir, 'numba_src'))
+import vprofile
+
+TOLERANCE   = 0.02
+PERIODS     = np.array([8., 10., 14., 18., 22., 26., 30., 35., 40.])
+PTYPES      = ['vph', 'vpv', 'vsh', 'vsv', 'eta', 'dip', 'strike']
+
+# group id, flag, thickness, control points (vsv, vsh, vpv, vph, eta, dip, strike), vpvs
+MODEL       = [
+    (0, 4, 2.,   [(1.8, 1.85, 3.1, 3.2, 1., 0., 0.), (2.2, 2.25, 3.8, 3.9, 1., 0., 0.)], 2.),
+    (1, 2, 35.,  [(3.3, 3.45, 5.8, 6.0, 0.9, 35., 40.), (3.45, 3.6, 6.0, 6.3, 0.85, 35., 40.),\
+                  (3.6, 3.7, 6.3, 6.5, 0.9, 35., 40.), (3.75, 3.85, 6.6, 6.8, 0.95, 35., 40.)], 1.75),
+    (2, 4, 150., [(4.3, 4.45, 7.8, 8.0, 0.95, 20., 60.), (4.5, 4.6, 8.1, 8.2, 0.95, 20., 60.)], 1.75)
+    ]
+
+def write_inputs(workdir):
+    """
+    write the model and (arbitrary) observed dispersion/azimuthal anisotropy files
+    """
+    with open(workdir+'/tti.mod', 'w') as fid:
+        for iid, flag, thickness, cpts, vpvs in MODEL:
+            vals    = ' '.join(['%g' %val for cpt in cpts for val in cpt])
+            fid.write('%d %d 7 0 %g %d %s %g\n' %(iid, flag, thickness, len(cpts), vals, vpvs))
+    ones        = np.ones(PERIODS.size)
+    np.savetxt(workdir+'/disp_ray.txt', np.c_[PERIODS, 3.5*ones, 0.01*ones], fmt='%g')
+    np.savetxt(workdir+'/disp_lov.txt', np.c_[PERIODS, 3.8*ones, 0.01*ones], fmt='%g')
+    np.savetxt(workdir+'/aziamp.ray.txt', np.c_[PERIODS, 1.*ones, 0.2*ones], fmt='%g')
+    np.savetxt(workdir+'/aziphi.ray.txt', np.c_[PERIODS, 40.*ones, 5.*ones], fmt='%g')
+    return
+
+workdir = tempfile.mkdtemp()
+try:
+    write_inputs(workdir)
+    vpr     = vprofile.vprofile1d()
+    vpr.readdisp(infname=workdir+'/disp_lov.txt', wtype='l')
+    vpr.readdisp(infname=workdir+'/disp_ray.txt', wtype='r')
+    vpr.readaziamp(infname=workdir+'/aziamp.ray.txt', wtype='r')
+    vpr.readaziphi(infname=workdir+'/aziphi.ray.txt', wtype='r')
+    vpr.readmod(infname=workdir+'/tti.mod', mtype='tti')
+finally:
+    shutil.rmtree(workdir)
+vpr.getpara(mtype='tti')
+# reference model and kernels, the same as the initialization in gauss_newton_tti_inv
+vpr.get_period(dtype='ph')
+vpr.update_mod(mtype='tti')
+vpr.model.ttimod.get_rho()
+vpr.get_vmodel(mtype='tti')
+if not (vpr.compute_tcps(wtype='ray') and vpr.compute_tcps(wtype='love')):
+    print 'ERROR: reference dispersion of the test model is erroneous!'
+    sys.exit(1)
+vpr.perturb_from_kernel(wtype='ray')
+vpr.perturb_from_kernel(wtype='love')
+vpr.model.ttimod.mod2para()
+
+vpr.compute_tti_jacobian_kernel()
+jac_kernel  = vpr.jacobian.copy()
+res_kernel  = vpr.res.copy()
+vpr.compute_tti_jacobian()
+jac_fd      = vpr.jacobian.copy()
+nfail       = 0
+if not np.allclose(res_kernel, vpr.res):
+    print 'residual arrays differ'
+    nfail   += 1
+if jac_kernel.shape != jac_fd.shape:
+    print 'inconsistent Jacobian shapes:', jac_kernel.shape, jac_fd.shape
+    sys.exit(1)
+paraindex   = vpr.model.ttimod.para.paraindex
+normmax     = np.sqrt((jac_fd**2).sum(axis=0)).max()
+for i in xrange(jac_fd.shape[1]):
+    norm    = np.sqrt((jac_fd[:, i]**2).sum())
+    diff    = np.sqrt(((jac_kernel[:, i] - jac_fd[:, i])**2).sum())
+    # columns without sensitivity (eta of the bottom control point of a gradient layer) are compared to the largest column
+    reldiff = diff/norm if norm > 1e-6*normmax else diff/normmax
+    status  = 'ok'
+    if reldiff > TOLERANCE:
+        status  = 'FAIL'
+        nfail   += 1
+    print 'para %2d (%-6s group %d, index %d): |J_fd| = %10.4g, relative difference = %.2e %s' \
+            %(i, PTYPES[int(paraindex[0, i])], int(paraindex[4, i]), int(paraindex[5, i]), norm, reldiff, status)
+print '--- '+str(nfail)+' failure(s)'
+sys.exit(1 if nfail > 0 else 0)
@@ -11,7 +11,7 @@ Module for inversion of 1d models
 
 import numpy as np
 import os
-import vmodel, modparam, data, eigenkernel
+import vmodel, modparam, data, eigenkernel, rftheo, mcchain, mcstats
 import copy
 import fast_surf, theo, tdisp96, tregn96, tlegn96
 import multiprocessing
@@ -28,6 +28,9 @@ class vprofile1d(object):
     model               - object storing 1D model
     eigkR, eigkL        - eigenkernel objects storing Rayleigh/Love eigenfunctions and sensitivity kernels
     disprefR, disprefL  - flags indicating existence of sensitivity kernels for reference model
+    sens_depth          - effective sensitivity depth of dispersion data, used for depth truncation of the
+                            forward model (default - -1., no truncation)
+    rfsolver            - receiver function solver (rftheo.rfsolver), theo.theo will be used if None
     =====================================================================================================================
     """
     def __init__(self):
@@ -44,6 +47,8 @@ class vprofile1d(object):
         self.amplevel   = 0.005
         self.t0         = 0.
         self.code       = ''
+        self.sens_depth = -1.
+        self.rfsolver   = None
         return
     
     def readdisp(self, infname, dtype='ph', wtype='ray'):
@@ -258,6 +263,71 @@ class vprofile1d(object):
             if not np.allclose(self.TLp[:self.data.dispL.ngper], self.TLg):
                 raise ValueError('incompatible phase/group periods!')
         return
+    
+    def get_sens_depth(self, wtype='both', factor=1.5, use_kernel=False, tol=0.01, mindepth=0.):
+        """
+        get the effective sensitivity depth of the dispersion data
+        the forward model will be truncated at this depth (see get_trunc_nlay)
+        =====================================================================================================
+        ::: input :::
+        wtype       - wave type (Rayleigh/Love/both)
+        factor      - ratio of the sensitivity depth to the longest wavelength, used if use_kernel = False
+        use_kernel  - derive the sensitivity depth from kernels of the reference model (eigkR/eigkL) or not
+        tol         - fraction of the integrated shear velocity kernel allowed below the sensitivity depth
+        mindepth    - minimum sensitivity depth (unit - km)
+        ::: output :::
+        self.sens_depth
+        =====================================================================================================
+        """
+        wtype       = wtype.lower()
+        depth       = 0.
+        if use_kernel:
+            eigklst = []
+            if wtype=='r' or wtype == 'rayleigh' or wtype=='ray' or wtype == 'both':
+                if not self.disprefR:
+                    raise ValueError('referennce dispersion and kernels for Rayleigh wave not computed!')
+                eigklst.append(self.eigkR)
+            if wtype=='l' or wtype == 'love' or wtype=='lov' or wtype == 'both':
+                if not self.disprefL:
+                    raise ValueError('referennce dispersion and kernels for Love wave not computed!')
+                eigklst.append(self.eigkL)
+            zbot            = self.ref_hArr.cumsum()
+            for eigk in eigklst:
+                kernel      = abs(eigk.dcdbv) + abs(eigk.dcdbh)
+                cumkernel   = kernel.cumsum(axis=1)
+                # for each period, the first layer above which (1-tol) of the kernel is accumulated
+                ind         = (cumkernel < (1.-tol)*cumkernel[:, -1:]).sum(axis=1)
+                ind[ind >= zbot.size]\
+                            = zbot.size - 1
+                depth       = max(depth, zbot[ind].max())
+        else:
+            displst = []
+            if wtype=='r' or wtype == 'rayleigh' or wtype=='ray' or wtype == 'both':
+                displst.append(self.data.dispR)
+            if wtype=='l' or wtype == 'love' or wtype=='lov' or wtype == 'both':
+                displst.append(self.data.dispL)
+            for disp in displst:
+                # longest wavelength of the data
+                if disp.npper > 0:
+                    depth   = max(depth, factor*(disp.pper*disp.pvelo).max())
+                if disp.ngper > 0:
+                    depth   = max(depth, factor*(disp.gper*disp.gvelo).max())
+        if depth == 0.:
+            raise ValueError('No dispersion data for sensitivity depth estimation!')
+        self.sens_depth     = max(depth, mindepth)
+        return
+    
+    def get_trunc_nlay(self):
+        """
+        get the number of layers of the truncated model used by the surface wave forward solver
+        the layer containing self.sens_depth is used as the equivalent half-space,
+        all layers are used if self.sens_depth <= 0.
+        """
+        if self.sens_depth <= 0.:
+            return self.model.nlay
+        ztop        = self.model.h.cumsum() - self.model.h
+        nlay        = np.where(ztop < self.sens_depth)[0].size
+        return max(min(nlay, self.model.nlay), 1)
     #-------------------------------------
     # forward solver for isotropic model
     #-------------------------------------
@@ -265,6 +335,7 @@ class vprofile1d(object):
     def compute_fsurf(self, wtype='ray'):
         """
         compute surface wave dispersion of isotropic model using fast_surf
+        the model is truncated at self.sens_depth if it is positive
         =====================================================================
         ::: input :::
         wtype       - wave type (Rayleigh or Love)
@@ -273,14 +344,15 @@ class vprofile1d(object):
         wtype   = wtype.lower()
         if self.model.nlay == 0:
             raise ValueError('No layerized model stored!')
+        nlay    = self.get_trunc_nlay()
         if wtype=='r' or wtype == 'rayleigh' or wtype=='ray':
             ilvry                   = 2
             nper                    = self.TRp.size
             per                     = np.zeros(200, dtype=np.float64)
             per[:nper]              = self.TRp[:]
-            qsinv                   = 1./self.model.qs
-            (ur0,ul0,cr0,cl0)       = fast_surf.fast_surf(self.model.nlay, ilvry, \
-                                        self.model.vpv, self.model.vsv, self.model.rho, self.model.h, qsinv, per, nper)
+            qsinv                   = 1./self.model.qs[:nlay]
+            (ur0,ul0,cr0,cl0)       = fast_surf.fast_surf(nlay, ilvry, self.model.vpv[:nlay], self.model.vsv[:nlay],\
+                                        self.model.rho[:nlay], self.model.h[:nlay], qsinv, per, nper)
             self.data.dispR.pvelp   = cr0[:nper]
             # modified 11/05/2018
             self.data.dispR.gvelp   = ur0[:self.data.dispR.ngper]
@@ -295,9 +367,9 @@ class vprofile1d(object):
             nper                    = self.TLp.size
             per                     = np.zeros(200, dtype=np.float64)
             per[:nper]              = self.TLp[:]
-            qsinv                   = 1./self.model.qs
-            (ur0,ul0,cr0,cl0)       = fast_surf.fast_surf(self.model.nlay, ilvry, \
-                                        self.model.vph, self.model.vsh, self.model.rho, self.model.h, qsinv, per, nper)
+            qsinv                   = 1./self.model.qs[:nlay]
+            (ur0,ul0,cr0,cl0)       = fast_surf.fast_surf(nlay, ilvry, self.model.vph[:nlay], self.model.vsh[:nlay],\
+                                        self.model.rho[:nlay], self.model.h[:nlay], qsinv, per, nper)
             self.data.dispL.pvelp   = cl0[:nper]
             self.data.dispL.gvelp   = ul0[:self.data.dispL.ngper]
         return
@@ -646,7 +718,7 @@ class vprofile1d(object):
     
     def compute_rftheo(self, slowness = 0.06, din=None, npts=None):
         """
-        compute receiver function of isotropic model using theo
+        compute receiver function of isotropic model using theo, or self.rfsolver if it is specified
         =============================================================================================
         ::: input :::
         slowness- reference horizontal slowness (default - 0.06 s/km, 1./0.06=16.6667)
@@ -685,7 +757,13 @@ class vprofile1d(object):
         if din is None:
             din     = 180.*np.arcsin(vsin[nl-1]*vpvs[nl-1]*slowness)/np.pi
         # solve for receiver function using theo
-        rx 	        = theo.theo(nl, vsin, hin, vpvs, qpin, qsin, fs, din, 2.5, 0.005, 0, ntimes)
+        if self.rfsolver is None:
+            rx 	    = theo.theo(nl, vsin, hin, vpvs, qpin, qsin, fs, din, 2.5, 0.005, 0, ntimes)
+        else:
+            self.rfsolver.fs\
+                    = fs
+            rx      = self.rfsolver.solve(vs=vsin[:nl], h=hin[:nl], vpvs=vpvs[:nl], qp=qpin[:nl], qs=qsin[:nl],\
+                        npts=ntimes, din=din)
         # store the predicted receiver function (ONLY radial component) to the data object
         self.data.rfr.rfp   = rx[:self.data.rfr.npts]
         self.data.rfr.tp    = np.arange(self.data.rfr.npts, dtype=np.float64)*1./self.fs
@@ -713,7 +791,8 @@ class vprofile1d(object):
     #==========================================
     
     def mc_joint_inv_iso(self, outdir='./workingdir', dispdtype='ph', wdisp=0.2, rffactor=40., numbcheck=None, misfit_thresh=1., \
-                   isconstrt=True, pfx='MC', verbose=False, step4uwalk=1500, numbrun=15000, init_run=True, savedata=True):
+                   isconstrt=True, pfx='MC', verbose=False, step4uwalk=1500, numbrun=15000, init_run=True, savedata=True, timing=False, status=None,\
+                   truncate=False):
         """
         Bayesian Monte Carlo joint inversion of receiver function and surface wave data for an isotropic model
         =================================================================================================================
@@ -731,6 +810,9 @@ class vprofile1d(object):
         init_run        - run and output prediction for inital model or not
                         IMPORTANT NOTE: if False, no uniform random walk will perform !
         savedata        - save data to npz binary file or not
+        timing          - collect the stage timers and event counters of the chain (see mcstats) or not
+        status          - campaign status (mcprogress.campaign_status), updated every 500 steps and with the final chain
+        truncate        - truncate the forward model at the sensitivity depth of the dispersion data (get_sens_depth) or not
         ---
         version history:
                     - Added the functionality of stop running if a targe misfit value is not acheived after numbcheck runs
@@ -745,6 +827,8 @@ class vprofile1d(object):
         # initializations
         #-------------------------------
         self.get_period()
+        if truncate:
+            self.get_sens_depth(wtype='ray')
         self.update_mod(mtype = 'iso')
         self.get_vmodel(mtype = 'iso')
         # output arrays
@@ -827,10 +911,14 @@ class vprofile1d(object):
         start       = time.time()
         misfitchecked \
                     = False
+        stats       = mcstats.chainstats(enabled=timing)
+        stats.start()
         while ( run ):
+            stats.lap('bookkeeping')
             inew    += 1
             if ( inew > numbrun ):
                 break
+            stats.count('step')
             #-----------------------------------------
             # checking misfit after numbcheck runs
             # added Sep 27th, 2018
@@ -850,14 +938,18 @@ class vprofile1d(object):
                     misfitchecked   = True
             if (np.fmod(inew, 500) == 0) and verbose:
                 print pfx, 'step =',inew, 'elasped time =', time.time()-start,' sec'
+            if (np.fmod(inew, 500) == 0) and status is not None:
+                status.update_chain(pfx, outmodarr[:inew-1, 0], outmodarr[:inew-1, self.model.isomod.para.npara+3])
             #------------------------------------------------------------------------------------------
             # every step4uwalk step, perform a random walk with uniform random value in the paramerter space
             #------------------------------------------------------------------------------------------
             if ( np.fmod(inew, step4uwalk+1) == step4uwalk and init_run ):
+                stats.count('uniform_walk')
                 newmod      = copy.deepcopy(self.model.isomod)
                 newmod.para.new_paraval(0)
                 newmod.para2mod()
                 newmod.update()
+                stats.lap('propose')
                 # loop to find the "good" model,
                 # satisfying the constraint (3), (4) and (5) in Shen et al., 2012
                 m0      = 0
@@ -877,19 +969,24 @@ class vprofile1d(object):
                 igood       = 0
                 while ( not newmod.isgood(m0, m1, g0, g1)):
                     igood   += igood + 1
+                    stats.count('isgood_retry')
                     newmod  = copy.deepcopy(self.model.isomod)
                     newmod.para.new_paraval(0)
                     newmod.para2mod()
                     newmod.update()
+                stats.lap('isgood')
                 # assign new model to old ones
                 self.model.isomod   = newmod
                 self.get_vmodel()
+                stats.lap('vmodel')
                 # forward computation
                 if wdisp > 0. and wdisp <= 1.:
                     self.compute_fsurf()
                 if wdisp < 1. and wdisp >= 1.:
                     self.compute_rftheo()
+                stats.lap('forward')
                 self.get_misfit(wdisp=wdisp, rffactor=rffactor)
+                stats.lap('misfit')
                 oldL                = self.data.L
                 oldmisfit           = self.data.misfit
                 if verbose:
@@ -905,6 +1002,7 @@ class vprofile1d(object):
                 newmod.para.new_paraval(1)
                 newmod.para2mod()
                 newmod.update()
+                stats.lap('propose')
                 if isconstrt:
                     # satisfying the constraint (3), (4) and (5) in Shen et al., 2012 
                     # loop to find the "good" model, added on May 3rd, 2018
@@ -929,13 +1027,18 @@ class vprofile1d(object):
                         newmod.para.new_paraval(1)
                         newmod.para2mod()
                         newmod.update()
+                    stats.count('isgood_retry', itemp)
                     if not newmod.isgood(m0, m1, g0, g1):
                         print 'No good model found!'
+                        stats.count('no_good_model')
+                        stats.lap('isgood')
                         continue
+                stats.lap('isgood')
                 # assign new model to old ones
                 oldmod              = copy.deepcopy(self.model.isomod)
                 self.model.isomod   = newmod
                 self.get_vmodel()
+                stats.lap('vmodel')
                 #--------------------------------
                 # forward computation
                 #--------------------------------
@@ -943,12 +1046,15 @@ class vprofile1d(object):
                     self.compute_fsurf()
                 if wdisp < 1.:
                     self.compute_rftheo()
+                stats.lap('forward')
                 self.get_misfit(wdisp=wdisp, rffactor=rffactor)
+                stats.lap('misfit')
                 newL                = self.data.L
                 newmisfit           = self.data.misfit
                 # reject model if NaN misfit 
                 if np.isnan(newmisfit):
                     print 'WARNING: '+pfx+', NaN misfit!'
+                    stats.count('nan_misfit')
                     outmodarr[inew-1, 0]                        = -1 # index for acceptance
                     outmodarr[inew-1, 1]                        = iacc
                     outmodarr[inew-1, 2:(newmod.para.npara+2)]  = newmod.para.paraval[:]
@@ -1002,6 +1108,7 @@ class vprofile1d(object):
                 oldL        = newL
                 oldmisfit   = newmisfit
                 iacc        += 1
+                stats.count('accept')
                 continue
             #----------------------------------
             # sample the prior distribution
@@ -1011,6 +1118,7 @@ class vprofile1d(object):
                 newmod.para.new_paraval(1)
                 newmod.para2mod()
                 newmod.update()
+                stats.lap('propose')
                 if isconstrt:
                     # satisfying the constraint (3), (4) and (5) in Shen et al., 2012 
                     # loop to find the "good" model, added on May 3rd, 2018
@@ -1035,9 +1143,13 @@ class vprofile1d(object):
                         newmod.para.new_paraval(1)
                         newmod.para2mod()
                         newmod.update()
+                    stats.count('isgood_retry', itemp)
                     if not newmod.isgood(m0, m1, g0, g1):
                         print 'No good model found!'
+                        stats.count('no_good_model')
+                        stats.lap('isgood')
                         continue
+                stats.lap('isgood')
                 self.model.isomod   = newmod
                 # accept the new model
                 outmodarr[inew-1, 0]                        = 1 # index for acceptance
@@ -1051,11 +1163,21 @@ class vprofile1d(object):
                 outmodarr[inew-1, newmod.para.npara+7]      = self.data.dispR.misfit
                 outmodarr[inew-1, newmod.para.npara+8]      = time.time() - start
                 continue
+        stats.stop()
         #-----------------------------------
-        # write results to binary npz files
+        # write results to the chain file
         #-----------------------------------
-        outfname    = outdir+'/mc_inv.'+pfx+'.npz'
-        np.savez_compressed(outfname, outmodarr, outdisparr_ph, outdisparr_gr, outrfarr)
+        # maximum normalized deviation of the predicted dispersion, used for the selection of the finally accepted models
+        summary     = {}
+        if self.data.dispR.npper > 0:
+            summary['maxdev_ph']    = mcchain.get_max_dev(outdisparr_ph, self.data.dispR.pvelo, self.data.dispR.stdpvelo)
+        if self.data.dispR.ngper > 0:
+            summary['maxdev_gr']    = mcchain.get_max_dev(outdisparr_gr, self.data.dispR.gvelo, self.data.dispR.stdgvelo)
+        outfname    = outdir+'/mc_inv.'+pfx+mcchain.SUFFIX
+        mcchain.write_chain(outfname, outmodarr, [outdisparr_ph, outdisparr_gr, outrfarr], mtype='iso', summary=summary,\
+                            stats=stats.get_stats())
+        if status is not None:
+            status.add_chain(pfx, outfname)
         if savedata:
             outdatafname\
                     = outdir+'/mc_data.'+pfx+'.npz'
@@ -1098,7 +1220,7 @@ class vprofile1d(object):
     
     def mc_joint_inv_iso_mp(self, outdir='./workingdir', dispdtype='ph', wdisp=0.2, rffactor=40., isconstrt=True, pfx='MC', \
             verbose=False, step4uwalk=1500, numbrun=15000, savedata=True, subsize=1000, nprocess=None, merge=True, \
-                Ntotalruns=10, misfit_thresh=2.0, Nmodelthresh=200):
+                Ntotalruns=10, misfit_thresh=2.0, Nmodelthresh=200, timing=False, status=None, truncate=False):
         """
         Parallelized version of mc_joint_inv_iso
         ==================================================================================================================
@@ -1114,10 +1236,15 @@ class vprofile1d(object):
         savedata        - save data to npz binary file or not
         subsize         - size of subsets, used if the number of elements in the parallel list is too large to avoid deadlock
         nprocess        - number of process
-        merge           - merge data into one single npz file or not
+        merge           - merge data into one single chain file (mcchain) or not
         Ntotalruns      - number of times of total runs, the code would run at most numbrun*Ntotalruns iterations
         misfit_thresh   - threshold misfit value to determine "good" models
         Nmodelthresh    - required number of "good" models
+        timing          - collect the stage timers and event counters of the chains (see mcstats) or not,
+                            the statistics of all the chains are summed in the merged chain file
+        status          - campaign status (mcprogress.campaign_status), updated with each chain as soon as it finishes
+        truncate        - truncate the forward model at the sensitivity depth of the dispersion data (get_sens_depth) or not,
+                            the depth is computed once and shared by all the chains
         ---
         version history:
                     - Added the functionality of adding addtional runs if not enough good models found, Sep 27th, 2018
@@ -1133,6 +1260,9 @@ class vprofile1d(object):
         if Nvpr*step4uwalk != numbrun:
             print 'WARNING: number of runs changes: '+str(numbrun)+' --> '+str(Nvpr*step4uwalk)
             numbrun     = Nvpr*step4uwalk
+        # the copies keep the sensitivity depth
+        if truncate:
+            self.get_sens_depth(wtype='ray')
         for i in range(Nvpr):
             temp_vpr            = copy.deepcopy(self)
             temp_vpr.process_id = i
@@ -1148,60 +1278,49 @@ class vprofile1d(object):
         imodels     = 0
         while (run):
             i_totalrun              += 1
+            if status is not None:
+                status.set_target(pfx, numbrun*i_totalrun)
             if Nvpr > subsize:
                 Nsub                = int(len(vpr_lst)/subsize)
                 for isub in xrange(Nsub):
                     print 'Subset:', isub,'in',Nsub,'sets'
                     cvpr_lst        = vpr_lst[isub*subsize:(isub+1)*subsize]
                     MCINV           = partial(mc4mp, outdir=outdir, dispdtype=dispdtype, wdisp=wdisp, rffactor=rffactor,\
-                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk)
+                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, timing=timing)
                     pool            = multiprocessing.Pool(processes=nprocess)
-                    pool.map(MCINV, cvpr_lst) #make our results with a map call
+                    _map_chains(pool, MCINV, cvpr_lst, outdir, pfx, status) #make our results with a map call
                     pool.close() #we are not adding any more processes
                     pool.join() #tell it to wait until all threads are done before going on
                 cvpr_lst            = vpr_lst[(isub+1)*subsize:]
                 MCINV               = partial(mc4mp, outdir=outdir, dispdtype=dispdtype, wdisp=wdisp, rffactor=rffactor,\
-                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh)
+                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh,\
+                                        timing=timing)
                 pool                = multiprocessing.Pool(processes=nprocess)
-                pool.map(MCINV, cvpr_lst) #make our results with a map call
+                _map_chains(pool, MCINV, cvpr_lst, outdir, pfx, status) #make our results with a map call
                 pool.close() #we are not adding any more processes
                 pool.join() #tell it to wait until all threads are done before going on
             else:
                 MCINV               = partial(mc4mp, outdir=outdir, dispdtype=dispdtype, wdisp=wdisp, rffactor=rffactor,\
-                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh)
+                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh,\
+                                        timing=timing)
                 pool                = multiprocessing.Pool(processes=nprocess)
-                pool.map(MCINV, vpr_lst) #make our results with a map call
+                _map_chains(pool, MCINV, vpr_lst, outdir, pfx, status) #make our results with a map call
                 pool.close() #we are not adding any more processes
                 pool.join() #tell it to wait until all threads are done before going on
             #----------------------------------------
             # Merge inversion results for each process
             #----------------------------------------
             if merge:
-                outmodarr           = np.array([])
-                outdisparr_ph       = np.array([])
-                outdisparr_gr       = np.array([])
-                outrfarr            = np.array([])
-                for i in range(Nvpr):
-                    invfname        = outdir+'/mc_inv.'+pfx+'_'+str(i)+'.npz'
-                    inarr           = np.load(invfname)
-                    outmodarr       = np.append(outmodarr, inarr['arr_0'])
-                    outdisparr_ph   = np.append(outdisparr_ph, inarr['arr_1'])
-                    outdisparr_gr   = np.append(outdisparr_gr, inarr['arr_2'])
-                    outrfarr        = np.append(outrfarr, inarr['arr_3'])
-                    os.remove(invfname)
-                outmodarr           = outmodarr.reshape(numbrun, outmodarr.size/numbrun)
-                outdisparr_ph       = outdisparr_ph.reshape(numbrun, outdisparr_ph.size/numbrun)
-                outdisparr_gr       = outdisparr_gr.reshape(numbrun, outdisparr_gr.size/numbrun)
-                outrfarr            = outrfarr.reshape(numbrun, outrfarr.size/numbrun)
+                invfnames           = [outdir+'/mc_inv.'+pfx+'_'+str(i)+mcchain.SUFFIX for i in range(Nvpr)]
+                outinvfname         = outdir+'/mc_inv.merged.'+str(i_totalrun)+'.'+pfx+mcchain.SUFFIX
+                mcchain.merge_chains(invfnames, outinvfname, mtype='iso')
                 # added Sep 27th, 2018
-                ind_valid           = outmodarr[:, 0] == 1.
-                imodels             += np.where(outmodarr[ind_valid, temp_vpr.model.isomod.para.npara+3] <= misfit_thresh )[0].size
+                chain               = mcchain.chainfile(outinvfname)
+                ind_valid           = chain['flag'] == 1.
+                imodels             += np.where(chain['misfit'][ind_valid] <= misfit_thresh )[0].size
+                chain.close()
                 if imodels >= Nmodelthresh and i_totalrun == 1:
-                    outinvfname     = outdir+'/mc_inv.'+pfx+'.npz'
-                    np.savez_compressed(outinvfname, outmodarr, outdisparr_ph, outdisparr_gr, outrfarr)
-                else:
-                    outinvfname     = outdir+'/mc_inv.merged.'+str(i_totalrun)+'.'+pfx+'.npz'
-                    np.savez_compressed(outinvfname, outmodarr, outdisparr_ph, outdisparr_gr, outrfarr)
+                    os.rename(outinvfname, outdir+'/mc_inv.'+pfx+mcchain.SUFFIX)
                 # stop the loop if enough good models are found OR, number of total-runs is equal to the given threhold number
                 print '== Number of good models = '+str(imodels)+', number of total runs = '+str(i_totalrun)
                 if imodels >= Nmodelthresh or i_totalrun >= Ntotalruns:
@@ -1210,25 +1329,9 @@ class vprofile1d(object):
         # Merge inversion results for each additional total runs
         #--------------------------------------------------------
         if i_totalrun > 1:
-            outmodarr           = np.array([])
-            outdisparr_ph       = np.array([])
-            outdisparr_gr       = np.array([])
-            outrfarr            = np.array([])
-            for i in range(i_totalrun):
-                invfname        = outdir+'/mc_inv.merged.'+str(i+1)+'.'+pfx+'.npz'
-                inarr           = np.load(invfname)
-                outmodarr       = np.append(outmodarr, inarr['arr_0'])
-                outdisparr_ph   = np.append(outdisparr_ph, inarr['arr_1'])
-                outdisparr_gr   = np.append(outdisparr_gr, inarr['arr_2'])
-                outrfarr        = np.append(outrfarr, inarr['arr_3'])
-                os.remove(invfname)
-            Nfinal_total_runs   = i_totalrun*numbrun
-            outmodarr           = outmodarr.reshape(Nfinal_total_runs, outmodarr.size/Nfinal_total_runs)
-            outdisparr_ph       = outdisparr_ph.reshape(Nfinal_total_runs, outdisparr_ph.size/Nfinal_total_runs)
-            outdisparr_gr       = outdisparr_gr.reshape(Nfinal_total_runs, outdisparr_gr.size/Nfinal_total_runs)
-            outrfarr            = outrfarr.reshape(Nfinal_total_runs, outrfarr.size/Nfinal_total_runs)
-            outinvfname         = outdir+'/mc_inv.'+pfx+'.npz'
-            np.savez_compressed(outinvfname, outmodarr, outdisparr_ph, outdisparr_gr, outrfarr)
+            invfnames           = [outdir+'/mc_inv.merged.'+str(i+1)+'.'+pfx+mcchain.SUFFIX for i in range(i_totalrun)]
+            outinvfname         = outdir+'/mc_inv.'+pfx+mcchain.SUFFIX
+            mcchain.merge_chains(invfnames, outinvfname, mtype='iso')
         if imodels < Nmodelthresh:
             print 'WARNING: Not enough good models, '+str(imodels)
         #----------------------------------------
@@ -1265,7 +1368,7 @@ class vprofile1d(object):
     # functions for VTI inversions
     #==========================================
     def mc_joint_inv_vti(self, outdir='./workingdir', run_inv=True, solver_type=1, numbcheck=None, misfit_thresh=1., \
-                isconstrt=True, pfx='MC', verbose=False, step4uwalk=1500, numbrun=15000, init_run=True, savedata=True):
+                isconstrt=True, pfx='MC', verbose=False, step4uwalk=1500, numbrun=15000, init_run=True, savedata=True, timing=False, status=None):
         """
         Bayesian Monte Carlo joint inversion of receiver function and surface wave data for an isotropic model
         =================================================================================================================
@@ -1284,6 +1387,8 @@ class vprofile1d(object):
         init_run        - run and output prediction for inital model or not
                         IMPORTANT NOTE: if False, no uniform random walk will perform !
         savedata        - save data to npz binary file or not
+        timing          - collect the stage timers and event counters of the chain (see mcstats) or not
+        status          - campaign status (mcprogress.campaign_status), updated every 500 steps and with the final chain
         ---
         version history:
                     - Added the functionality of stop running if a targe misfit value is not acheived after numbcheck runs
@@ -1350,10 +1455,14 @@ class vprofile1d(object):
         start       = time.time()
         misfitchecked \
                     = False
+        stats       = mcstats.chainstats(enabled=timing)
+        stats.start()
         while ( run ):
+            stats.lap('bookkeeping')
             inew    += 1
             if ( inew > numbrun ):
                 break
+            stats.count('step')
             #-----------------------------------------
             # checking misfit after numbcheck runs
             # added Sep 27th, 2018
@@ -1372,21 +1481,34 @@ class vprofile1d(object):
                     misfitchecked   = True
             if (np.fmod(inew, 500) == 0) and verbose:
                 print pfx, 'step =',inew, 'elasped time =', time.time()-start,' sec'
+            if (np.fmod(inew, 500) == 0) and status is not None:
+                status.update_chain(pfx, outmodarr[:inew-1, 0], outmodarr[:inew-1, npara+3])
             #------------------------------------------------------------------------------------------
             # every step4uwalk step, perform a random walk with uniform random value in the paramerter space
             #------------------------------------------------------------------------------------------
             if ( np.fmod(inew, step4uwalk+1) == step4uwalk and init_run ):
+                stats.count('uniform_walk')
                 self.model.vtimod.mod2para()
+                stats.lap('propose')
                 self.model.vtimod.new_paraval(ptype = 0)
+                stats.count('isgood_retry', self.model.vtimod.ntry)
+                stats.lap('isgood')
                 self.get_vmodel(mtype = 'vti')
+                stats.lap('vmodel')
                 # forward computation
                 if solver_type == 0:
                     self.compute_disp_vti(wtype='both', solver_type = 0)
+                    stats.lap('forward')
                 else:
+                    # new reference model for the sensitivity kernels
+                    stats.count('reference_update')
                     while not self.compute_disp_vti(wtype='both', solver_type = 1):
+                        stats.count('reference_fail')
                         self.model.vtimod.new_paraval(ptype = 0)
                         self.get_vmodel(mtype = 'vti')
+                    stats.lap('reference')
                 self.get_misfit(mtype='vti')
+                stats.lap('misfit')
                 oldL                = self.data.L
                 oldmisfit           = self.data.misfit
                 if verbose:
@@ -1400,10 +1522,17 @@ class vprofile1d(object):
             if run_inv:
                 self.model.vtimod.mod2para()
                 oldmod      = copy.deepcopy(self.model.vtimod)
+                stats.lap('propose')
                 if not self.model.vtimod.new_paraval(ptype = 1):
                     print 'No good model found!'
+                    stats.count('isgood_retry', self.model.vtimod.ntry)
+                    stats.count('no_good_model')
+                    stats.lap('isgood')
                     continue
+                stats.count('isgood_retry', self.model.vtimod.ntry)
+                stats.lap('isgood')
                 self.get_vmodel(mtype = 'vti')
+                stats.lap('vmodel')
                 #--------------------------------
                 # forward computation
                 #--------------------------------
@@ -1414,12 +1543,17 @@ class vprofile1d(object):
                     # compute dispersion curves based on sensitivity kernels
                     self.compute_disp_vti(wtype='both', solver_type = 2)
                     is_large_perturb= (self.data.dispR.check_large_perturb() or self.data.dispL.check_large_perturb())
+                    if is_large_perturb:
+                        stats.count('large_perturb')
+                stats.lap('forward')
                 self.get_misfit(mtype='vti')
+                stats.lap('misfit')
                 newL                = self.data.L
                 newmisfit           = self.data.misfit
                 # reject model if NaN misfit 
                 if np.isnan(newmisfit):
                     print 'WARNING: '+pfx+', NaN misfit!'
+                    stats.count('nan_misfit')
                     outmodarr[inew-1, 0]                = -1 # index for acceptance
                     outmodarr[inew-1, 1]                = iacc
                     outmodarr[inew-1, 2:(npara+2)]      = self.model.vtimod.para.paraval[:]
@@ -1452,8 +1586,11 @@ class vprofile1d(object):
                 # update the kernels for the new reference model
                 if is_large_perturb and solver_type == 1:
                     # # # print 'Update reference!'
+                    stats.count('reference_update')
                     oldvpr                              = copy.deepcopy(self)
                     if not self.compute_disp_vti(wtype='both', solver_type = 1):
+                        stats.count('reference_fail')
+                        stats.lap('reference')
                         self                            = oldvpr # reverse to be original vpr with old kernels
                         outmodarr[inew-1, 0]            = -1 # index for acceptance
                         outmodarr[inew-1, 1]            = iacc
@@ -1467,7 +1604,9 @@ class vprofile1d(object):
                         outmodarr[inew-1, npara+8]      = time.time()-start
                         self.model.vtimod               = oldmod
                         continue
+                    stats.lap('reference')
                     self.get_misfit(mtype='vti')
+                    stats.lap('misfit')
                     newL                                = self.data.L
                     newmisfit                           = self.data.misfit
                 # accept the new model
@@ -1488,6 +1627,7 @@ class vprofile1d(object):
                 oldL        = newL
                 oldmisfit   = newmisfit
                 iacc        += 1
+                stats.count('accept')
                 # # # print inew, oldmisfit
                 continue
             #----------------------------------
@@ -1495,6 +1635,8 @@ class vprofile1d(object):
             #----------------------------------
             else:
                 self.model.vtimod.new_paraval(ptype = 0, isconstrt=isconstrt)
+                stats.count('isgood_retry', self.model.vtimod.ntry)
+                stats.lap('isgood')
                 # accept the new model
                 outmodarr[inew-1, 0]                    = 1 # index for acceptance
                 outmodarr[inew-1, 1]                    = iacc
@@ -1507,11 +1649,21 @@ class vprofile1d(object):
                 outmodarr[inew-1, npara+7]              = self.data.dispL.misfit
                 outmodarr[inew-1, npara+8]              = time.time() - start
                 continue
+        stats.stop()
         #-----------------------------------
-        # write results to binary npz files
+        # write results to the chain file
         #-----------------------------------
-        outfname    = outdir+'/mc_inv.'+pfx+'.npz'
-        np.savez_compressed(outfname, outmodarr, outdisparr_ray, outdisparr_lov)
+        # maximum normalized deviation of the predicted dispersion, used for the selection of the finally accepted models
+        summary     = {}
+        if self.data.dispR.npper > 0:
+            summary['maxdev_ray']   = mcchain.get_max_dev(outdisparr_ray, self.data.dispR.pvelo, self.data.dispR.stdpvelo)
+        if self.data.dispL.npper > 0:
+            summary['maxdev_lov']   = mcchain.get_max_dev(outdisparr_lov, self.data.dispL.pvelo, self.data.dispL.stdpvelo)
+        outfname    = outdir+'/mc_inv.'+pfx+mcchain.SUFFIX
+        mcchain.write_chain(outfname, outmodarr, [outdisparr_ray, outdisparr_lov], mtype='vti', summary=summary,\
+                            stats=stats.get_stats())
+        if status is not None:
+            status.add_chain(pfx, outfname)
         if savedata:
             outdatafname\
                     = outdir+'/mc_data.'+pfx+'.npz'
@@ -1524,7 +1676,7 @@ class vprofile1d(object):
     
     def mc_joint_inv_vti_mp(self, outdir='./workingdir', run_inv=True, solver_type=1, isconstrt=True, pfx='MC',\
                 verbose=False, step4uwalk=1500, numbrun=15000, savedata=True, subsize=1000,
-                nprocess=None, merge=True, Ntotalruns=2, misfit_thresh=2.0, Nmodelthresh=200):
+                nprocess=None, merge=True, Ntotalruns=2, misfit_thresh=2.0, Nmodelthresh=200, timing=False, status=None):
         """
         Parallelized version of mc_joint_inv_iso
         ==================================================================================================================
@@ -1541,10 +1693,13 @@ class vprofile1d(object):
         savedata        - save data to npz binary file or not
         subsize         - size of subsets, used if the number of elements in the parallel list is too large to avoid deadlock
         nprocess        - number of process
-        merge           - merge data into one single npz file or not
+        merge           - merge data into one single chain file (mcchain) or not
         Ntotalruns      - number of times of total runs, the code would run at most numbrun*Ntotalruns iterations
         misfit_thresh   - threshold misfit value to determine "good" models
         Nmodelthresh    - required number of "good" models
+        timing          - collect the stage timers and event counters of the chains (see mcstats) or not,
+                            the statistics of all the chains are summed in the merged chain file
+        status          - campaign status (mcprogress.campaign_status), updated with each chain as soon as it finishes
         ---
         version history:
                     - Added the functionality of adding addtional runs if not enough good models found, Sep 27th, 2018
@@ -1577,57 +1732,51 @@ class vprofile1d(object):
         need_to_merge   = False
         while (run):
             i_totalrun              += 1
+            if status is not None:
+                status.set_target(pfx, numbrun*i_totalrun)
             if Nvpr > subsize:
                 Nsub                = int(len(vpr_lst)/subsize)
                 for isub in xrange(Nsub):
                     print 'Subset:', isub,'in',Nsub,'sets'
                     cvpr_lst        = vpr_lst[isub*subsize:(isub+1)*subsize]
                     MCINV           = partial(mc4mp_vti, outdir=outdir, run_inv=run_inv, solver_type=solver_type,
-                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh)
+                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh,\
+                                        timing=timing)
                     pool            = multiprocessing.Pool(processes=nprocess)
-                    pool.map(MCINV, cvpr_lst) #make our results with a map call
+                    _map_chains(pool, MCINV, cvpr_lst, outdir, pfx, status) #make our results with a map call
                     pool.close() #we are not adding any more processes
                     pool.join() #tell it to wait until all threads are done before going on
                 cvpr_lst            = vpr_lst[(isub+1)*subsize:]
                 MCINV               = partial(mc4mp_vti, outdir=outdir, run_inv=run_inv, solver_type=solver_type,
-                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh)
+                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh,\
+                                        timing=timing)
                 pool                = multiprocessing.Pool(processes=nprocess)
-                pool.map(MCINV, cvpr_lst) #make our results with a map call
+                _map_chains(pool, MCINV, cvpr_lst, outdir, pfx, status) #make our results with a map call
                 pool.close() #we are not adding any more processes
                 pool.join() #tell it to wait until all threads are done before going on
             else:
                 MCINV               = partial(mc4mp_vti, outdir=outdir, run_inv=run_inv, solver_type=solver_type,
-                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh)
+                                        isconstrt=isconstrt, pfx=pfx, verbose=verbose, numbrun=step4uwalk, misfit_thresh=misfit_thresh,\
+                                        timing=timing)
                 pool                = multiprocessing.Pool(processes=nprocess)
-                pool.map(MCINV, vpr_lst) #make our results with a map call
+                _map_chains(pool, MCINV, vpr_lst, outdir, pfx, status) #make our results with a map call
                 pool.close() #we are not adding any more processes
                 pool.join() #tell it to wait until all threads are done before going on
             #----------------------------------------
             # Merge inversion results for each process
             #----------------------------------------
             if merge:
-                outmodarr           = np.array([])
-                outdisparr_ray      = np.array([])
-                outdisparr_lov      = np.array([])
-                for i in range(Nvpr):
-                    invfname        = outdir+'/mc_inv.'+pfx+'_'+str(i)+'.npz'
-                    inarr           = np.load(invfname)
-                    outmodarr       = np.append(outmodarr, inarr['arr_0'])
-                    outdisparr_ray  = np.append(outdisparr_ray, inarr['arr_1'])
-                    outdisparr_lov  = np.append(outdisparr_lov, inarr['arr_2'])
-                    os.remove(invfname)
-                outmodarr           = outmodarr.reshape(numbrun, outmodarr.size/numbrun)
-                outdisparr_ray      = outdisparr_ray.reshape(numbrun, outdisparr_ray.size/numbrun)
-                outdisparr_lov      = outdisparr_lov.reshape(numbrun, outdisparr_lov.size/numbrun)
+                invfnames           = [outdir+'/mc_inv.'+pfx+'_'+str(i)+mcchain.SUFFIX for i in range(Nvpr)]
+                outinvfname         = outdir+'/mc_inv.merged.'+str(i_totalrun)+'.'+pfx+mcchain.SUFFIX
+                mcchain.merge_chains(invfnames, outinvfname, mtype='vti')
                 # added Sep 27th, 2018
-                ind_valid           = outmodarr[:, 0] == 1.
-                imodels             += np.where(outmodarr[ind_valid, npara+3] <= misfit_thresh )[0].size
+                chain               = mcchain.chainfile(outinvfname)
+                ind_valid           = chain['flag'] == 1.
+                imodels             += np.where(chain['misfit'][ind_valid] <= misfit_thresh )[0].size
+                chain.close()
                 if imodels >= Nmodelthresh and i_totalrun == 1:
-                    outinvfname     = outdir+'/mc_inv.'+pfx+'.npz'
-                    np.savez_compressed(outinvfname, outmodarr, outdisparr_ray, outdisparr_lov)
+                    os.rename(outinvfname, outdir+'/mc_inv.'+pfx+mcchain.SUFFIX)
                 else:
-                    outinvfname     = outdir+'/mc_inv.merged.'+str(i_totalrun)+'.'+pfx+'.npz'
-                    np.savez_compressed(outinvfname, outmodarr, outdisparr_ray, outdisparr_lov)
                     need_to_merge   = True
                 # stop the loop if enough good models are found OR, number of total-runs is equal to the given threhold number
                 print '== Number of good models = '+str(imodels)+', number of total runs = '+str(i_totalrun)
@@ -1637,22 +1786,9 @@ class vprofile1d(object):
         # Merge inversion results for each additional total runs
         #--------------------------------------------------------
         if need_to_merge:
-            outmodarr           = np.array([])
-            outdisparr_ray      = np.array([])
-            outdisparr_lov      = np.array([])
-            for i in range(i_totalrun):
-                invfname        = outdir+'/mc_inv.merged.'+str(i+1)+'.'+pfx+'.npz'
-                inarr           = np.load(invfname)
-                outmodarr       = np.append(outmodarr, inarr['arr_0'])
-                outdisparr_ray  = np.append(outdisparr_ray, inarr['arr_1'])
-                outdisparr_lov  = np.append(outdisparr_lov, inarr['arr_2'])
-                os.remove(invfname)
-            Nfinal_total_runs   = i_totalrun*numbrun
-            outmodarr           = outmodarr.reshape(Nfinal_total_runs, outmodarr.size/Nfinal_total_runs)
-            outdisparr_ray      = outdisparr_ray.reshape(Nfinal_total_runs, outdisparr_ray.size/Nfinal_total_runs)
-            outdisparr_lov      = outdisparr_lov.reshape(Nfinal_total_runs, outdisparr_lov.size/Nfinal_total_runs)
-            outinvfname         = outdir+'/mc_inv.'+pfx+'.npz'
-            np.savez_compressed(outinvfname, outmodarr, outdisparr_ray, outdisparr_lov)
+            invfnames           = [outdir+'/mc_inv.merged.'+str(i+1)+'.'+pfx+mcchain.SUFFIX for i in range(i_totalrun)]
+            outinvfname         = outdir+'/mc_inv.'+pfx+mcchain.SUFFIX
+            mcchain.merge_chains(invfnames, outinvfname, mtype='vti')
         if imodels < Nmodelthresh:
             print 'WARNING: Not enough good models, '+str(imodels)
         #----------------------------------------
@@ -1669,25 +1805,111 @@ class vprofile1d(object):
             print 'Elapsed time: '+str(etime-stime)+' secs'
         return
     
-        
-def mc4mp(invpr, outdir, dispdtype, wdisp, rffactor, isconstrt, pfx, verbose, numbrun, misfit_thresh):
+    def mc_prior(self, outdir='./workingdir', mtype='iso', isconstrt=True, pfx='MC', numbrun=150000, nbatch=10000, \
+                Nthresh=10000000, verbose=False):
+        """
+        sample the prior distribution directly, no forward computation is performed
+        uniform random models are drawn from the parameter space in batches and screened by the model constraints,
+        the accepted ones are written to the chain file in the same format as mc_joint_inv_iso/mc_joint_inv_vti
+        =================================================================================================================
+        ::: input :::
+        outdir          - output directory
+        mtype           - model type (iso/vti)
+        isconstrt       - require model constraints or not
+        pfx             - prefix for output, typically station id
+        numbrun         - number of sampled models
+        nbatch          - number of models drawn in each batch
+        Nthresh         - stop if no model satisfies the constraints after Nthresh draws
+        =================================================================================================================
+        """
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        mtype   = mtype.lower()
+        if mtype == 'iso' or mtype == 'isotropic':
+            mtype   = 'iso'
+            mod     = self.model.isomod
+        elif mtype == 'vti':
+            mod     = self.model.vtimod
+        else:
+            raise ValueError('Unexpected model type: '+ mtype)
+        self.update_mod(mtype = mtype)
+        self.get_vmodel(mtype = mtype)
+        mod.mod2para()
+        # satisfying the constraint (3), (4) and (5) in Shen et al., 2012
+        m0      = 0
+        m1      = 1
+        g0      = 1
+        g1      = 0
+        if mod.mtype[0] == 5: # water layer
+            m0  += 1
+            m1  += 1
+            g0  += 1
+            g1  += 1
+        npara       = mod.para.npara
+        outmodarr   = np.zeros((numbrun, npara+9))
+        inew        = 0     # count sampled models
+        itry        = 0     # count drawn models
+        start       = time.time()
+        while ( inew < numbrun ):
+            if inew == 0 and itry >= Nthresh:
+                print 'WARNING: '+pfx+', no good model found after '+str(itry)+' draws!'
+                break
+            paravalarr  = mod.para.new_paraval_arr(nbatch)
+            itry        += nbatch
+            if isconstrt:
+                paravalarr  = paravalarr[mod.isgood_arr(paravalarr, m0, m1, g0, g1), :]
+            Nnew        = min(paravalarr.shape[0], numbrun - inew)
+            # accept the new models
+            outmodarr[inew:(inew+Nnew), 0]          = 1 # index for acceptance
+            outmodarr[inew:(inew+Nnew), 2:(npara+2)]= paravalarr[:Nnew, :]
+            outmodarr[inew:(inew+Nnew), npara+2]    = 1.
+            outmodarr[inew:(inew+Nnew), npara+8]    = time.time() - start
+            inew        += Nnew
+            if verbose:
+                print pfx+', prior sampling: '+str(inew)+' models from '+str(itry)+' draws, elasped time = '+str(time.time()-start)+' sec'
+        #-----------------------------------
+        # write results to the chain file
+        #-----------------------------------
+        outmodarr   = outmodarr[:inew, :]
+        if mtype == 'iso':
+            predarrs= [np.zeros((inew, 0)), np.zeros((inew, 0)), np.zeros((inew, 0))]
+        else:
+            predarrs= [np.zeros((inew, 0)), np.zeros((inew, 0))]
+        outfname    = outdir+'/mc_inv.'+pfx+mcchain.SUFFIX
+        mcchain.write_chain(outfname, outmodarr, predarrs, mtype=mtype)
+        return
+    
+
+def _map_chains(pool, MCINV, vpr_lst, outdir, pfx, status=None):
+    """
+    run the chains of vpr_lst in the pool, the campaign status (mcprogress.campaign_status) is updated
+    with the chain file of each process as soon as it finishes
+    """
+    if status is None:
+        pool.map(MCINV, vpr_lst)
+        return
+    for process_id in pool.imap_unordered(MCINV, vpr_lst):
+        status.add_chain(pfx, outdir+'/mc_inv.'+pfx+'_'+str(process_id)+mcchain.SUFFIX)
+    return
+
+def mc4mp(invpr, outdir, dispdtype, wdisp, rffactor, isconstrt, pfx, verbose, numbrun, misfit_thresh, timing=False):
     # print '--- MC inversion for station/grid: '+pfx+', process id: '+str(invpr.process_id)
     pfx     = pfx +'_'+str(invpr.process_id)
     if invpr.process_id == 0 or wdisp < 0.:
         invpr.mc_joint_inv_iso(outdir=outdir, dispdtype=dispdtype, wdisp=wdisp, rffactor=rffactor, misfit_thresh=misfit_thresh, \
-                       isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=True, savedata=False)
+                       isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=True, savedata=False, timing=timing)
     else:
         invpr.mc_joint_inv_iso(outdir=outdir, dispdtype=dispdtype, wdisp=wdisp, rffactor=rffactor, misfit_thresh=misfit_thresh, \
-                       isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=False, savedata=False)
-    return
+                       isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=False, savedata=False, timing=timing)
+    return invpr.process_id
 
-def mc4mp_vti(invpr, outdir, run_inv, solver_type, isconstrt, pfx, verbose, numbrun, misfit_thresh):
+def mc4mp_vti(invpr, outdir, run_inv, solver_type, isconstrt, pfx, verbose, numbrun, misfit_thresh, timing=False):
     # print '--- MC inversion for station/grid: '+pfx+', process id: '+str(invpr.process_id)
     pfx     = pfx +'_'+str(invpr.process_id)
     if invpr.process_id == 0:
         invpr.mc_joint_inv_vti(outdir=outdir, run_inv=run_inv, misfit_thresh=misfit_thresh, \
-            isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=True, savedata=False)
+            isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=True, savedata=False, timing=timing)
     else:
         invpr.mc_joint_inv_vti(outdir=outdir, run_inv=run_inv, misfit_thresh=misfit_thresh, \
-            isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=False, savedata=False)
-    return
\ No newline at end of file
+            isconstrt=isconstrt, pfx=pfx, verbose=False, step4uwalk=numbrun, numbrun=numbrun, init_run=False, savedata=False, timing=timing)
+    return invpr.process_id
\ No newline at end of file
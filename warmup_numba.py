@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+warm up and verify the on-disk cache of the numba kernels
+
+The eager-signature numba functions are compiled with cache=True, the compiled code is written to __pycache__ next to
+the source file (or to NUMBA_CACHE_DIR if it is set, e.g. for a read-only installation) at the first import,
+later processes (scripts, multiprocessing workers) load it instead of compiling again.
+This script imports the modules (compiling the kernels if the cache is cold), runs each kernel on a small input,
+checks the result against a numpy reference and reports whether the kernel was loaded from the cache.
+Run it once after installing/updating the code (compile_all.sh does), and again to verify that the cache is hit.
+NOTE: the jitclasses in numba_src can NOT be cached by numba, they are compiled at the first instantiation in each process.
+
+usage:
+    python warmup_numba.py [--numba-src]
+        --numba-src - also import the numba_src modules (in a separate interpreter), warming up their cached functions
+"""
+import numpy as np
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+#===============================
+# checks of the kernels
+# each check function runs the kernel on a small input and returns None if the result is correct, or an error message
+#===============================
+def check_expect_misfit(func):
+    # the expected misfit of noise with the given uncertainties is close to 1
+    misfit      = func(0.5*np.ones(20, dtype=np.float64), 20000)
+    if abs(misfit - 1.) > 0.05:
+        return 'expected misfit = %g, should be close to 1' %misfit
+    return None
+
+def check_bspl_basis(func):
+    nbasis, t   = func(5, 4, 0., 20., 2, 100)
+    if nbasis.shape != (8, 100) or t.size != 9:
+        return 'unexpected shapes: '+str(nbasis.shape)+', '+str(t.shape)
+    # partition of unity
+    if not np.allclose(nbasis[:5, :].sum(axis=0), 1.):
+        return 'the basis functions do not sum to 1'
+    return None
+
+def check_running_min(func):
+    data        = np.random.RandomState(0).rand(1000)
+    if not np.allclose(func(data), np.minimum.accumulate(data)):
+        return 'running minimum differs from numpy.minimum.accumulate'
+    return None
+
+# module, function, check function
+KERNELS     = [
+    ('data',        '_fast_compute_expect_misfit',  check_expect_misfit),
+    ('modparam',    'bspl_basis',                   check_bspl_basis),
+    ('mcpost',      '_get_running_min',             check_running_min),
+    ('mcpost_vti',  '_get_running_min',             check_running_min)
+    ]
+
+NUMBA_SRC_MODULES   = ['modparam', 'vmodel', 'tcps']
+
+def get_cache_status(func):
+    """
+    get the cache hits/misses and the compilation mode of a numba dispatcher
+    """
+    stats       = getattr(func, 'stats', None)
+    if stats is None:
+        return 'unknown', 0, 0
+    mode        = 'nopython' if len(func.nopython_signatures) > 0 else 'object'
+    return mode, sum(stats.cache_hits.values()), sum(stats.cache_misses.values())
+
+def warmup(modname, funcname, check):
+    result      = {'name': modname+'.'+funcname, 'status': 'ok', 'message': ''}
+    t0          = time.time()
+    try:
+        module  = __import__(modname)
+    except ImportError as err:
+        result['status']    = 'skipped'
+        result['message']   = 'ImportError: '+str(err)
+        return result
+    result['import']        = time.time() - t0
+    func        = getattr(module, funcname)
+    result['mode'], result['hits'], result['misses']\
+                = get_cache_status(func)
+    message     = check(func)
+    if message is not None:
+        result['status']    = 'FAIL'
+        result['message']   = message
+    elif result['mode'] == 'object':
+        # object mode functions (type inference failed) are NOT cached
+        result['status']    = 'FAIL'
+        result['message']   = 'compiled in object mode, not cacheable'
+    return result
+
+def main(argv=None):
+    parser      = argparse.ArgumentParser(description='warm up and verify the numba cache')
+    parser.add_argument('--numba-src', action='store_true', help='also warm up the numba_src modules')
+    args        = parser.parse_args(argv)
+    srcdir      = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, srcdir)
+    print 'numba cache directory: '+os.environ.get('NUMBA_CACHE_DIR', '__pycache__ next to the source files')
+    nfail       = 0
+    for modname, funcname, check in KERNELS:
+        result  = warmup(modname, funcname, check)
+        if result['status'] == 'skipped':
+            print '%-40s skipped (%s)' %(result['name'], result['message'])
+            continue
+        source  = 'cache' if result['hits'] > 0 else 'compiled'
+        print '%-40s %-8s %-9s import = %7.3f sec %s %s' %(result['name'], result['mode'], source, result['import'],\
+                result['status'], result['message'])
+        if result['status'] != 'ok':
+            nfail   += 1
+    if args.numba_src:
+        t0      = time.time()
+        retcode = subprocess.call([sys.executable, '-c', 'import '+', '.join(NUMBA_SRC_MODULES)], cwd=os.path.join(srcdir, 'numba_src'))
+        print '%-40s import = %7.3f sec %s' %('numba_src ('+', '.join(NUMBA_SRC_MODULES)+')', time.time() - t0,\
+                'ok' if retcode == 0 else 'FAIL')
+        if retcode != 0:
+            nfail   += 1
+    print '--- '+str(nfail)+' failure(s)'
+    return 1 if nfail > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())